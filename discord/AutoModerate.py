@@ -1,11 +1,10 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
-from globalenv import bot, start_bot, get_user_data, set_user_data, get_all_user_data, get_server_config, set_server_config, modules, config, get_command_mention
+from globalenv import bot, start_bot, get_user_data, set_user_data, get_all_user_data, get_server_config, get_server_config_snapshot, set_server_config, modules, config, get_command_mention
 from datetime import datetime, timezone, timedelta
 import asyncio
 from typing import Optional
-from difflib import SequenceMatcher
 import re
 import emoji
 import sqlite3
@@ -14,6 +13,8 @@ import json
 from logger import log
 import logging
 import sys
+import time
+from spam_tracker import SpamTracker
 
 if "Moderate" in modules:
     import Moderate
@@ -74,9 +75,9 @@ _uispam_tracker: dict[int, dict[int, list[datetime]]] = {}
 # 結構: {guild_id: [(member, join_time), ...]}
 _raid_tracker: dict[int, list[tuple[discord.Member, datetime]]] = {}
 
-# 用於追蹤用戶刷頻的記憶體字典
-# 結構: {guild_id: {user_id: [(content, timestamp), ...]}}
-_spam_tracker: dict[int, dict[int, list[tuple[str, datetime]]]] = {}
+# 用於追蹤用戶刷頻的記憶體字典，每個伺服器一個 SpamTracker（每位用戶一個環形緩衝區）
+# 結構: {guild_id: SpamTracker}
+_spam_tracker: dict[int, SpamTracker] = {}
 
 INVITE_LINK_RE = re.compile(
     r"(?:https?://)?(?:www\.)?(?:discord\.gg|discord(?:app)?\.com/invite)/([A-Za-z0-9-]+)",
@@ -187,12 +188,6 @@ async def _get_external_invite_codes(message: discord.Message, guild_id: int, al
             external_codes.append(invite_code)
     return external_codes
 
-def _text_similarity(a: str, b: str) -> float:
-    """計算兩個字串的相似度 (0.0 ~ 1.0)"""
-    if not a or not b:
-        return 0.0
-    return SequenceMatcher(None, a, b).ratio()
-
 async def settings_autocomplete(interaction: discord.Interaction, current: str):
     return [
         app_commands.Choice(name=app_commands.locale_str(key), value=key)
@@ -748,6 +743,22 @@ class AutoModerate(commands.GroupCog, name=app_commands.locale_str("automod")):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
         super().__init__()
+
+    async def cog_load(self):
+        if not self.expire_spam_history_task.is_running():
+            self.expire_spam_history_task.start()
+
+    async def cog_unload(self):
+        self.expire_spam_history_task.cancel()
+
+    @tasks.loop(minutes=1)
+    async def expire_spam_history_task(self):
+        # 清除已超出時間窗口的閒置用戶，避免刷頻紀錄無限增長
+        now = time.monotonic()
+        for guild_id, tracker in list(_spam_tracker.items()):
+            tracker.expire_idle(now)
+            if not tracker:
+                _spam_tracker.pop(guild_id, None)
         
     @app_commands.command(name=app_commands.locale_str("view"), description="查看自動管理設定")
     async def view_automod_settings(self, interaction: discord.Interaction):
@@ -1369,7 +1380,7 @@ class AutoModerate(commands.GroupCog, name=app_commands.locale_str("automod")):
             return
         guild_id = message.guild.id
         message_channel_id = message.channel.id
-        automod_settings = get_server_config(guild_id, "automod", {})
+        automod_settings = get_server_config_snapshot(guild_id).get("automod", {})
         
         # 用戶安裝應用程式濫用檢查（需在 bot 訊息過濾之前，因為 user install 的訊息作者是 bot）
         is_user_install_message = (
@@ -1510,32 +1521,22 @@ class AutoModerate(commands.GroupCog, name=app_commands.locale_str("automod")):
             similarity_threshold = int(anti_spam_settings.get("similarity", 75)) / 100.0
             action = anti_spam_settings.get("action", "mute 10m 刷頻自動禁言, delete {user}，請勿刷頻。")
             
-            now = datetime.now(timezone.utc)
             content = message.content.strip()
-            guild_spam = _spam_tracker.setdefault(guild_id, {})
-            user_history = guild_spam.setdefault(message.author.id, [])
+            guild_spam = _spam_tracker.get(guild_id)
+            if guild_spam is None:
+                guild_spam = _spam_tracker[guild_id] = SpamTracker()
             
-            # 清除過期的記錄
-            user_history[:] = [(c, t) for c, t in user_history if (now - t).total_seconds() < time_window]
-            
-            # 記錄本次訊息
-            user_history.append((content, now))
+            # 記錄本次訊息並清除過期的記錄；訊息數達到 max_messages 時回傳與最新訊息相似的舊訊息數量
+            similar_count = guild_spam.record(message.author.id, content, time.monotonic(), time_window, max_messages, similarity_threshold)
             
-            # 檢查是否有足夠多的相似訊息
-            if len(user_history) >= max_messages:
-                # 計算相似訊息數量：與最新訊息比較
-                similar_count = 0
-                for old_content, _ in user_history[:-1]:
-                    if content == old_content or _text_similarity(content, old_content) >= similarity_threshold:
-                        similar_count += 1
-                
+            if similar_count is not None:
                 # 如果相似訊息數 >= max_messages - 1（加上自身就是 >= max_messages）
                 if similar_count >= max_messages - 1:
                     try:
                         await do_action_str(action, guild=message.guild, user=message.author, message=message)
                         log(f"用戶 {message.author} 因刷頻被處理 (在 {time_window}秒內發送 {similar_count + 1} 條相似訊息): {action}", module_name="AutoModerate", user=message.author, guild=message.guild)
                         # 重置計數器避免重複處罰
-                        user_history.clear()
+                        guild_spam.reset(message.author.id)
                     except Exception as e:
                         log(f"無法對用戶 {message.author} 執行刷頻的處理: {e}", level=logging.ERROR, module_name="AutoModerate", user=message.author, guild=message.guild)
 
@@ -1,5 +1,5 @@
 import discord
-from globalenv import bot, start_bot, set_server_config, get_server_config, get_user_data, set_user_data, get_db_connection, config, get_command_mention
+from globalenv import bot, start_bot, set_server_config, get_server_config, get_server_config_snapshot, get_user_data, set_user_data, get_db_connection, config, get_command_mention
 from discord.ext import commands
 from discord import app_commands
 import asyncio
@@ -15,6 +15,33 @@ import logging
 import re
 import sys
 from datetime import datetime
+from autoreply_matcher import CompiledTriggerMatcher
+from autoreply_template import (
+    EFFECT_MARKER,
+    EMBED_DIRECTIVES,
+    CompiledTemplate,
+    TemplateBlock,
+    TemplateCache,
+    TemplateComparison,
+    TemplateCondition,
+    TemplateContentSplit,
+    TemplateDelay,
+    TemplateEmbed,
+    TemplateEmbedField,
+    TemplateIf,
+    TemplateLiteral,
+    TemplateMath,
+    TemplateMention,
+    TemplatePlaceholder,
+    TemplateRandInt,
+    TemplateReact,
+    TemplateStateVar,
+    TemplateSticker,
+    TemplateText,
+    TemplateTimeMD,
+    join_template_pieces,
+    nodes_are_static,
+)
 
 DEFAULT_AUTOREPLY_CONFIG_LIMIT = 50
 AUTOREPLY_RATE_LIMIT_COUNT = 3
@@ -30,6 +57,14 @@ AUTOREPLY_MATH_EXPRESSION_MAX_LENGTH = 300
 AUTOREPLY_MATH_AST_MAX_DEPTH = 64
 AUTOREPLY_MATH_AST_MAX_NODES = 256
 AUTOREPLY_VAR_KEY_PREFIX = "autoreply_var_"
+AUTOREPLY_TEMPLATE_CACHE_SIZE = 2048
+AUTOREPLY_TEMPLATE_PLACEHOLDERS = frozenset({
+    "user", "content", "guild", "server", "guildid", "guildicon", "guildowner", "guildownerid",
+    "guildmembers", "guildroles", "guildbanner", "guildboosts", "channel", "author", "member",
+    "authorid", "authoravatar", "authorbanner", "authorcreated", "role", "id", "date", "year",
+    "month", "day", "time", "time24", "hour", "minute", "second", "null", "random", "random_user",
+})
+AUTOREPLY_CONTENTSPLIT_RENDER_PATTERN = re.compile(r"contentsplit:[^{}]+|contentsplit\(-?\d+\)")
 AUTOREPLY_TEMPLATE_PACKS = {
     "daily_greetings": {
         "display_name": "日常問候包",
@@ -234,6 +269,9 @@ class TemplateSyntaxError(ValueError):
     pass
 
 
+_TEMPLATE_CACHE = TemplateCache(AUTOREPLY_TEMPLATE_CACHE_SIZE)
+
+
 def percent_random(percent: int) -> bool:
     if percent == 100:
         return True
@@ -694,6 +732,18 @@ class AutoReply(commands.GroupCog, name="autoreply"):
             AUTOREPLY_RATE_LIMIT_WINDOW,
             commands.BucketType.guild
         )
+        # guild_id -> (autoreplies list it was built from, matcher)
+        self._trigger_matchers: dict[int, tuple[list, CompiledTriggerMatcher]] = {}
+
+    def _get_trigger_matcher(self, guild_id: int, autoreplies: list) -> CompiledTriggerMatcher:
+        # 快照在 autoreplies 變更時才會換成新物件，因此只在變更時重新編譯
+        cached = self._trigger_matchers.get(guild_id)
+        if cached is not None and cached[0] is autoreplies:
+            return cached[1]
+        matcher = CompiledTriggerMatcher(autoreplies, self._parse_message_type_trigger)
+        self._warm_template_cache(autoreplies)
+        self._trigger_matchers[guild_id] = (autoreplies, matcher)
+        return matcher
 
     def _is_rate_limited(self, message: discord.Message) -> bool:
         bucket = self.autoreply_rate_limit.get_bucket(message)
@@ -1035,17 +1085,6 @@ class AutoReply(commands.GroupCog, name="autoreply"):
             replied_user=True,
         )
 
-    def _extract_mention_directive(self, response: str) -> tuple[str, discord.AllowedMentions]:
-        allow_everyone_and_roles = False
-
-        def mention_replacer(match):
-            nonlocal allow_everyone_and_roles
-            allow_everyone_and_roles = match.group(1).strip().lower() == "true"
-            return ""
-
-        cleaned_response = re.sub(r"\{mention:(true|false)\}", mention_replacer, response, flags=re.IGNORECASE)
-        return cleaned_response, self._build_allowed_mentions(allow_everyone_and_roles)
-
     def _split_top_level(self, value: str, separator: str = ":"):
         depth = 0
         for index, char in enumerate(value):
@@ -1139,12 +1178,12 @@ class AutoReply(commands.GroupCog, name="autoreply"):
 
         raise TemplateSyntaxError("Invalid contentsplit syntax")
 
-    def _resolve_contentsplit_token(self, token: str, content_parts: list[str]) -> str:
-        try:
-            split_type, start_value, end_value = self._parse_contentsplit_token(token)
-        except TemplateSyntaxError:
+    def _resolve_contentsplit_spec(self, spec: tuple | None, content_parts: list[str]) -> str:
+        if spec is None:
             return ""
 
+        split_type, start_value, end_value = spec
+
         if split_type == "index":
             try:
                 return content_parts[start_value]
@@ -1410,138 +1449,244 @@ class AutoReply(commands.GroupCog, name="autoreply"):
 
         return bool(set_server_config(guild_id, storage_key, value))
 
-    def _validate_condition_expression(self, expression: str):
-        or_parts = self._split_top_level_all(expression, "||")
-        if len(or_parts) > 1:
-            for part in or_parts:
-                if not part.strip():
-                    raise TemplateSyntaxError("Invalid if condition")
-                self._validate_condition_expression(part)
-            return
+    def _compile_template(self, response: str) -> CompiledTemplate:
+        """Parse ``response`` once and cache the tree by its text; syntax errors are cached as well."""
+        cached = _TEMPLATE_CACHE.get(response)
+        if cached is None:
+            try:
+                cached = CompiledTemplate(self._parse_template_nodes(response, strict=True), response)
+            except TemplateSyntaxError as e:
+                cached = str(e)
+            _TEMPLATE_CACHE.put(response, cached)
 
-        and_parts = self._split_top_level_all(expression, "&&")
-        if len(and_parts) > 1:
-            for part in and_parts:
-                if not part.strip():
-                    raise TemplateSyntaxError("Invalid if condition")
-                self._validate_condition_expression(part)
-            return
+        if isinstance(cached, str):
+            raise TemplateSyntaxError(cached)
+        return cached
 
-        left_text, operator, right_text = self._split_condition_expression(expression)
-        if operator is None or not left_text.strip() or not right_text.strip():
-            raise TemplateSyntaxError("Invalid if condition")
+    def _warm_template_cache(self, autoreplies: list):
+        for autoreply in autoreplies:
+            for template in autoreply.get("response", []) or []:
+                if not isinstance(template, str):
+                    continue
+                try:
+                    self._compile_template(template)
+                except TemplateSyntaxError:
+                    pass
 
-        self._validate_template_syntax(left_text)
-        self._validate_template_syntax(right_text)
+    def _parse_template_nodes(self, text: str, strict: bool) -> list:
+        # strict 模式與舊的語法驗證拋出相同錯誤；非 strict 用於未知 token 內部，對應渲染時的寬鬆行為
+        nodes = []
+        buffer = []
+        index = 0
+        text_length = len(text)
+
+        def flush_text():
+            if buffer:
+                raw_text = "".join(buffer)
+                nodes.append(TemplateText(raw_text.replace("\\n", "\n").replace("\\t", "\t"), raw_text))
+                buffer.clear()
+
+        while index < text_length:
+            brace_index = text.find("{", index)
+            chunk_end = text_length if brace_index == -1 else brace_index
+            if strict and "}" in text[index:chunk_end]:
+                raise TemplateSyntaxError("Unexpected closing brace")
+            if chunk_end > index:
+                buffer.append(text[index:chunk_end])
+            if brace_index == -1:
+                break
 
-    async def _evaluate_condition_expression(self, expression: str, message: discord.Message, context: dict) -> bool:
-        or_parts = self._split_top_level_all(expression, "||")
-        if len(or_parts) > 1:
-            for part in or_parts:
-                if await self._evaluate_condition_expression(part, message, context):
-                    return True
-            return False
+            closing_index = self._find_matching_brace(text, brace_index)
+            if closing_index == -1:
+                if strict:
+                    raise TemplateSyntaxError("Unclosed brace")
+                buffer.append("{")
+                index = brace_index + 1
+                continue
 
-        and_parts = self._split_top_level_all(expression, "&&")
-        if len(and_parts) > 1:
-            for part in and_parts:
-                if not await self._evaluate_condition_expression(part, message, context):
-                    return False
-            return True
+            flush_text()
+            nodes.append(self._parse_template_token(text[brace_index + 1:closing_index], strict))
+            index = closing_index + 1
 
-        left_text, operator, right_text = self._split_condition_expression(expression)
-        if operator is None:
-            return False
+        flush_text()
+        return nodes
 
-        resolved_left = await self._resolve_response_variables(left_text.strip(), message, context)
-        resolved_right = await self._resolve_response_variables(right_text.strip(), message, context)
-        return self._compare_condition_values(resolved_left, operator, resolved_right)
+    def _template_literal(self, token: str) -> TemplateLiteral:
+        return TemplateLiteral("", self._parse_template_nodes(token, strict=False))
 
-    def _validate_if_payload(self, payload: str):
-        condition_text, branch_block = self._split_top_level(payload)
-        if branch_block is None:
-            raise TemplateSyntaxError("Invalid if syntax")
+    def _parse_template_token(self, token: str, strict: bool):
+        if token in AUTOREPLY_TEMPLATE_PLACEHOLDERS:
+            return TemplatePlaceholder(token)
 
-        self._validate_condition_expression(condition_text)
-        true_branch, false_branch = self._split_if_branches(branch_block)
+        lowered = token.lower()
 
-        self._validate_template_syntax(true_branch)
-        self._validate_template_syntax(false_branch)
+        if lowered.startswith("if:"):
+            return self._parse_template_if(token, strict)
+
+        if lowered.startswith("embedfield:"):
+            head = token[:len("embedfield:")]
+            field_name, field_value = self._split_top_level(token[len("embedfield:"):])
+            if field_value is None and strict:
+                raise TemplateSyntaxError("Invalid embed field syntax")
+            name_nodes = self._parse_template_nodes(field_name, strict)
+            value_nodes = None if field_value is None else self._parse_template_nodes(field_value, strict)
+            return TemplateEmbedField(head, name_nodes, value_nodes)
+
+        for prefix in EMBED_DIRECTIVES:
+            if lowered.startswith(prefix):
+                payload = token[len(prefix):]
+                if not payload and strict:
+                    raise TemplateSyntaxError(f"Empty {token[:len(prefix) - 1]} payload")
+                return TemplateEmbed(token[:len(prefix)], self._parse_template_nodes(payload, strict))
+
+        if lowered.startswith("contentsplit"):
+            try:
+                spec = self._parse_contentsplit_token(token)
+            except TemplateSyntaxError:
+                if strict:
+                    raise
+                spec = None
+            # 渲染時 contentsplit 區分大小寫
+            if AUTOREPLY_CONTENTSPLIT_RENDER_PATTERN.fullmatch(token):
+                return TemplateContentSplit(token, spec)
+            return self._template_literal(token)
+
+        if lowered.startswith("newmsg:") or lowered.startswith("edit:"):
+            try:
+                directive_name, delay_seconds = self._parse_delay_directive_token(token)
+            except TemplateSyntaxError:
+                if strict:
+                    raise
+                return self._template_literal(token)
+            return TemplateDelay(token, directive_name, delay_seconds)
 
-    def _validate_template_syntax(self, response: str):
-        if not response:
-            return
+        if lowered.startswith("uservar:") or lowered.startswith("guildvar:"):
+            try:
+                scope, key_text, value_text = self._parse_state_var_token(token)
+            except TemplateSyntaxError:
+                if strict:
+                    raise
+                return TemplateText("", "{" + token + "}")
+            key_nodes = self._parse_template_nodes(key_text, strict)
+            value_nodes = None if value_text is None else self._parse_template_nodes(value_text, strict)
+            return TemplateStateVar(token[:token.index(":") + 1], scope, key_nodes, value_nodes)
+
+        if lowered.startswith("math:"):
+            return self._parse_template_math(token, strict)
+
+        if lowered.startswith("randint:"):
+            randint_match = re.fullmatch(r"randint:(\d+)-(\d+)", token, re.IGNORECASE)
+            if randint_match is None and strict:
+                raise TemplateSyntaxError("Invalid randint syntax")
+            if randint_match is None or not token.startswith("randint:"):
+                return self._template_literal(token)
+            return TemplateRandInt(token, int(randint_match.group(1)), int(randint_match.group(2)))
 
-        index = 0
-        response_length = len(response)
-        embed_prefixes = (
-            "embedtitle:",
-            "embeddescription:",
-            "embedurl:",
-            "embedimage:",
-            "embedcolor:",
-            "embedthumbnail:",
-            "embedfooter:",
-            "embedfooterimage:",
-            "embedauthor:",
-            "embedauthorurl:",
-            "embedauthorimage:",
-            "embedtime:",
-            "embedfield:",
-        )
+        if lowered.startswith("timemd:"):
+            timemd_match = re.fullmatch(r"timemd:([tTdDfFrR])", token, re.IGNORECASE)
+            if timemd_match is None and strict:
+                raise TemplateSyntaxError("Invalid timemd syntax")
+            if timemd_match is None or not token.startswith("timemd:"):
+                return self._template_literal(token)
+            return TemplateTimeMD(token, timemd_match.group(1))
 
-        while index < response_length:
-            if response[index] == "}":
-                raise TemplateSyntaxError("Unexpected closing brace")
+        if lowered.startswith("sticker:"):
+            sticker_match = re.fullmatch(r"sticker:(\d+)", token, re.IGNORECASE)
+            if sticker_match is None and strict:
+                raise TemplateSyntaxError("Invalid sticker syntax")
+            if sticker_match is None or not token.startswith("sticker:"):
+                return self._template_literal(token)
+            return TemplateSticker(token, int(sticker_match.group(1)))
+
+        if lowered.startswith("mention:"):
+            mention_match = re.fullmatch(r"mention:(true|false)", token, re.IGNORECASE)
+            if mention_match is None:
+                if strict:
+                    raise TemplateSyntaxError("Invalid mention syntax")
+                return self._template_literal(token)
+            return TemplateMention(token, mention_match.group(1).lower() == "true")
+
+        if lowered.startswith("react:"):
+            payload = token[len("react:"):]
+            if not payload.strip():
+                if strict:
+                    raise TemplateSyntaxError("Empty react payload")
+                return self._template_literal(token)
+            if not token.startswith("react:"):
+                return self._template_literal(token)
+            return TemplateReact(token[:len("react:")], self._parse_template_nodes(payload, strict=False))
+
+        return self._template_literal(token)
+
+    def _parse_template_if(self, token: str, strict: bool):
+        condition_text, branch_block = self._split_top_level(token[len("if:"):])
+        if branch_block is None:
+            if strict:
+                raise TemplateSyntaxError("Invalid if syntax")
+            return self._template_literal(token)
+
+        condition = self._parse_template_condition(condition_text, strict)
+        true_text, false_text = self._split_if_branches(branch_block)
+        true_branch = self._parse_template_nodes(true_text, strict)
+        false_branch = self._parse_template_nodes(false_text, strict)
+
+        # 渲染時只處理小寫的 {if:}
+        if not token.startswith("if:"):
+            return self._template_literal(token)
+        return TemplateIf(token, condition, true_branch, false_branch)
+
+    def _parse_template_condition(self, expression: str, strict: bool):
+        for operator in ("||", "&&"):
+            parts = self._split_top_level_all(expression, operator)
+            if len(parts) > 1:
+                conditions = []
+                for part in parts:
+                    if strict and not part.strip():
+                        raise TemplateSyntaxError("Invalid if condition")
+                    conditions.append(self._parse_template_condition(part, strict))
+                return TemplateCondition(operator, conditions)
 
-            if response[index] != "{":
-                index += 1
-                continue
+        left_text, operator, right_text = self._split_condition_expression(expression)
+        if operator is None or not left_text.strip() or not right_text.strip():
+            if strict:
+                raise TemplateSyntaxError("Invalid if condition")
+            if operator is None:
+                return None
 
-            closing_index = self._find_matching_brace(response, index)
-            if closing_index == -1:
-                raise TemplateSyntaxError("Unclosed brace")
-
-            token = response[index + 1:closing_index]
-            lowered = token.lower()
-
-            if lowered.startswith("if:"):
-                self._validate_if_payload(token[3:])
-            elif lowered.startswith("embedfield:"):
-                field_name, field_value = self._split_top_level(token[len("embedfield:"):])
-                if field_value is None:
-                    raise TemplateSyntaxError("Invalid embed field syntax")
-                self._validate_template_syntax(field_name)
-                self._validate_template_syntax(field_value)
-            elif lowered.startswith(embed_prefixes):
-                prefix, payload = token.split(":", 1)
-                if not payload:
-                    raise TemplateSyntaxError(f"Empty {prefix} payload")
-                self._validate_template_syntax(payload)
-            elif lowered.startswith("contentsplit"):
-                self._parse_contentsplit_token(token)
-            elif lowered.startswith("newmsg:") or lowered.startswith("edit:"):
-                self._parse_delay_directive_token(token)
-            elif lowered.startswith("uservar:") or lowered.startswith("guildvar:"):
-                _, key_text, value_text = self._parse_state_var_token(token)
-                self._validate_template_syntax(key_text)
-                if value_text is not None:
-                    self._validate_template_syntax(value_text)
-            elif lowered.startswith("math:"):
-                expression = self._parse_math_token(token)
-                self._evaluate_math_expression(expression, allow_template_placeholders=True)
-            elif lowered.startswith("randint:") and not re.fullmatch(r"randint:(\d+)-(\d+)", token, re.IGNORECASE):
-                raise TemplateSyntaxError("Invalid randint syntax")
-            elif lowered.startswith("timemd:") and not re.fullmatch(r"timemd:[tTdDfFrR]", token, re.IGNORECASE):
-                raise TemplateSyntaxError("Invalid timemd syntax")
-            elif lowered.startswith("sticker:") and not re.fullmatch(r"sticker:\d+", token, re.IGNORECASE):
-                raise TemplateSyntaxError("Invalid sticker syntax")
-            elif lowered.startswith("mention:") and not re.fullmatch(r"mention:(true|false)", token, re.IGNORECASE):
-                raise TemplateSyntaxError("Invalid mention syntax")
-            elif lowered.startswith("react:") and not token[len("react:"):].strip():
-                raise TemplateSyntaxError("Empty react payload")
+        return TemplateComparison(
+            self._parse_template_nodes(left_text.strip(), strict),
+            operator,
+            self._parse_template_nodes(right_text.strip(), strict),
+        )
 
-            index = closing_index + 1
+    def _parse_template_math(self, token: str, strict: bool):
+        try:
+            expression = self._parse_math_token(token)
+            validated_result = None
+            if strict:
+                validated_result = self._evaluate_math_expression(expression, allow_template_placeholders=True)
+            children = self._parse_template_nodes(expression, strict)
+        except TemplateSyntaxError:
+            if strict:
+                raise
+            return TemplateText("", "{" + token + "}")
+
+        result = None
+        if nodes_are_static(children):
+            if validated_result is not None:
+                result = validated_result
+            else:
+                try:
+                    result = self._evaluate_math_expression("".join(node.text for node in children))
+                except TemplateSyntaxError:
+                    result = ""
+        return TemplateMath(token[:len("math:")] + "(", children, result)
+
+    def _validate_template_syntax(self, response: str):
+        if not response:
+            return
+
+        self._compile_template(response)
 
     def _split_condition_expression(self, expression: str):
         operators = ("==", "!=", "<=", ">=")
@@ -1593,220 +1738,59 @@ class AutoReply(commands.GroupCog, name="autoreply"):
             return left_value >= right_value
         return False
 
-    async def _resolve_if_expressions(self, response: str, message: discord.Message, context: dict) -> str:
-        if not response or "{if:" not in response:
-            return response
-
-        output = []
-        index = 0
-        response_length = len(response)
-
-        while index < response_length:
-            if response[index] != "{" or not response.startswith("{if:", index):
-                output.append(response[index])
-                index += 1
-                continue
-
-            payload_start = index + 4
-            cursor = payload_start
-            depth = 1
-            while cursor < response_length:
-                if response[cursor] == "{":
-                    depth += 1
-                elif response[cursor] == "}":
-                    depth -= 1
-                    if depth == 0:
-                        break
-                cursor += 1
-
-            if cursor >= response_length or depth != 0:
-                output.append(response[index])
-                index += 1
-                continue
-
-            payload = response[payload_start:cursor]
-            condition_text, branch_block = self._split_top_level(payload)
-            if branch_block is None:
-                output.append(response[index:cursor + 1])
-                index = cursor + 1
-                continue
-
-            true_branch, false_branch = self._split_if_branches(branch_block)
-
-            condition_result = await self._evaluate_condition_expression(condition_text, message, context)
-            chosen_branch = true_branch if condition_result else false_branch
-            chosen_branch = await self._resolve_if_expressions(chosen_branch, message, context)
-            output.append(chosen_branch)
-            index = cursor + 1
-
-        return "".join(output)
-
-    def _extract_embed_tokens(self, response: str):
-        directives = {
-            "embedtitle:": "title",
-            "embeddescription:": "description",
-            "embedurl:": "url",
-            "embedimage:": "image",
-            "embedcolor:": "color",
-            "embedthumbnail:": "thumbnail",
-            "embedfooter:": "footer",
-            "embedfooterimage:": "footer_image",
-            "embedauthor:": "author",
-            "embedauthorurl:": "author_url",
-            "embedauthorimage:": "author_image",
-            "embedtime:": "time",
-            "embedfield:": "field",
-        }
-        extracted = {
-            "title": None,
-            "description": None,
-            "url": None,
-            "image": None,
-            "color": None,
-            "thumbnail": None,
-            "footer": None,
-            "footer_image": None,
-            "author": None,
-            "author_url": None,
-            "author_image": None,
-            "time": None,
-            "fields": [],
-        }
-        output = []
-        index = 0
-        response_length = len(response)
-
-        while index < response_length:
-            if response[index] != "{":
-                output.append(response[index])
-                index += 1
-                continue
-
-            matched_prefix = None
-            matched_key = None
-            remaining = response[index + 1:].lower()
-            for prefix, key in directives.items():
-                if remaining.startswith(prefix):
-                    matched_prefix = prefix
-                    matched_key = key
-                    break
-
-            if matched_prefix is None:
-                output.append(response[index])
-                index += 1
-                continue
-
-            value_start = index + 1 + len(matched_prefix)
-            cursor = value_start
-            depth = 1
-            while cursor < response_length:
-                if response[cursor] == "{":
-                    depth += 1
-                elif response[cursor] == "}":
-                    depth -= 1
-                    if depth == 0:
-                        break
-                cursor += 1
-
-            if cursor >= response_length or depth != 0:
-                output.append(response[index])
-                index += 1
-                continue
-
-            payload = response[value_start:cursor]
-            if matched_key == "field":
-                field_name, field_value = self._split_top_level(payload)
-                if field_value is not None:
-                    extracted["fields"].append((field_name, field_value))
-            else:
-                extracted[matched_key] = payload
-            index = cursor + 1
-
-        return "".join(output), extracted
-
-    async def _resolve_response_variables(self, response: str, message: discord.Message, context: dict) -> str:
-        if not response:
-            return response
-
-        response = await self._resolve_if_expressions(response, message, context)
-
+    def _build_template_placeholders(self, message: discord.Message, context: dict) -> dict:
         guild = message.guild
         author = message.author
         channel = message.channel
         now = context["now"]
         am_pm = "上午" if now.hour < 12 else "下午"
         hour_12 = now.hour % 12 or 12
-        content_parts = message.content.split()
         role_name = getattr(getattr(author, "top_role", None), "name", "")
         channel_name = getattr(channel, "name", "")
 
-        replacements = {
-            "{user}": author.mention,
-            "{content}": message.content,
-            "{guild}": guild.name,
-            "{server}": guild.name,
-            "{guildid}": str(guild.id),
-            "{guildicon}": guild.icon.url if guild.icon else "",
-            "{guildowner}": guild.owner.name if guild.owner else "",
-            "{guildownerid}": str(guild.owner.id) if guild.owner else "",
-            "{guildmembers}": str(guild.member_count),
-            "{guildroles}": str(len(guild.roles)),
-            "{guildbanner}": guild.banner.url if guild.banner else "",
-            "{guildboosts}": str(guild.premium_subscription_count) if guild.premium_subscription_count is not None else "0",
-            "{channel}": channel_name,
-            "{author}": author.name,
-            "{member}": author.name,
-            "{authorid}": str(author.id),
-            "{authoravatar}": author.display_avatar.url if author.display_avatar else "",
-            "{authorbanner}": author.banner.url if getattr(author, "banner", None) else "",
-            "{authorcreated}": author.created_at.strftime("%Y/%m/%d %H:%M:%S"),
-            "{role}": role_name,
-            "{id}": str(author.id),
-            "{date}": now.strftime("%Y/%m/%d"),
-            "{year}": now.strftime("%Y"),
-            "{month}": now.strftime("%m"),
-            "{day}": now.strftime("%d"),
-            "{time}": f"{am_pm} {hour_12:02d}:{now.minute:02d}",
-            "{time24}": now.strftime("%H:%M"),
-            "{hour}": now.strftime("%H"),
-            "{minute}": now.strftime("%M"),
-            "{second}": now.strftime("%S"),
-            "{null}": "",
-            "\\n": "\n",
-            "\\t": "\t"
+        return {
+            "user": author.mention,
+            "content": message.content,
+            "guild": guild.name,
+            "server": guild.name,
+            "guildid": str(guild.id),
+            "guildicon": guild.icon.url if guild.icon else "",
+            "guildowner": guild.owner.name if guild.owner else "",
+            "guildownerid": str(guild.owner.id) if guild.owner else "",
+            "guildmembers": str(guild.member_count),
+            "guildroles": str(len(guild.roles)),
+            "guildbanner": guild.banner.url if guild.banner else "",
+            "guildboosts": str(guild.premium_subscription_count) if guild.premium_subscription_count is not None else "0",
+            "channel": channel_name,
+            "author": author.name,
+            "member": author.name,
+            "authorid": str(author.id),
+            "authoravatar": author.display_avatar.url if author.display_avatar else "",
+            "authorbanner": author.banner.url if getattr(author, "banner", None) else "",
+            "authorcreated": author.created_at.strftime("%Y/%m/%d %H:%M:%S"),
+            "role": role_name,
+            "id": str(author.id),
+            "date": now.strftime("%Y/%m/%d"),
+            "year": now.strftime("%Y"),
+            "month": now.strftime("%m"),
+            "day": now.strftime("%d"),
+            "time": f"{am_pm} {hour_12:02d}:{now.minute:02d}",
+            "time24": now.strftime("%H:%M"),
+            "hour": now.strftime("%H"),
+            "minute": now.strftime("%M"),
+            "second": now.strftime("%S"),
+            "null": "",
         }
 
-        for key, value in replacements.items():
-            response = response.replace(key, value)
-
-        def content_split_replacer(match):
-            token = match.group(1)
-            return self._resolve_contentsplit_token(token, content_parts)
+    async def _resolve_template_placeholder(self, name: str, message: discord.Message, context: dict) -> str:
+        if name == "random":
+            return context["random"]
 
-        response = re.sub(r"\{(contentsplit:[^{}]+|contentsplit\(-?\d+\))\}", content_split_replacer, response)
-
-        if "{random}" in response:
-            response = response.replace("{random}", context["random"])
-
-        randint_pattern = re.compile(r"\{randint:(\d+)-(\d+)\}")
-
-        def randint_replacer(match):
-            try:
-                min_val = int(match.group(1))
-                max_val = int(match.group(2))
-                if min_val > max_val:
-                    min_val, max_val = max_val, min_val
-                return str(random.randint(min_val, max_val))
-            except (ValueError, IndexError):
-                return match.group(0)
-
-        response = randint_pattern.sub(randint_replacer, response)
-
-        if "{random_user}" in response:
+        if name == "random_user":
             if context["random_user"] is None:
                 try:
                     users = set()
-                    async for history_message in channel.history(limit=50):
+                    async for history_message in message.channel.history(limit=50):
                         if not history_message.author.bot:
                             users.add(history_message.author)
                     if users:
@@ -1816,88 +1800,221 @@ class AutoReply(commands.GroupCog, name="autoreply"):
                 except Exception as e:
                     log(f"處理 {{random_user}} 時發生錯誤: {e}", module_name="AutoReply", level=logging.ERROR)
                     context["random_user"] = "無法取得使用者"
-            response = response.replace("{random_user}", context["random_user"])
-
-        current_timestamp = str(int(now.timestamp()))
+            return context["random_user"]
 
-        def timemd_replacer(match):
-            style = match.group(1)
-            if style == "r":
-                style = "R"
-            return f"<t:{current_timestamp}:{style}>"
+        placeholders = context.get("placeholders")
+        if placeholders is None:
+            placeholders = context["placeholders"] = self._build_template_placeholders(message, context)
+        return placeholders[name]
 
-        response = re.sub(r"\{timemd:([tTdDfFrR])\}", timemd_replacer, response)
-
-        def state_var_replacer(match):
-            token = match.group(1)
-            try:
-                scope, key_text, value_text = self._parse_state_var_token(token)
-            except TemplateSyntaxError:
-                return ""
+    async def _evaluate_template_condition(self, condition, message: discord.Message, context: dict) -> bool:
+        if condition is None:
+            return False
 
-            key_text = key_text.strip()
-            if not key_text or len(key_text) > AUTOREPLY_VAR_MAX_LENGTH:
-                return ""
+        if isinstance(condition, TemplateCondition):
+            if condition.operator == "||":
+                for part in condition.parts:
+                    if await self._evaluate_template_condition(part, message, context):
+                        return True
+                return False
+            for part in condition.parts:
+                if not await self._evaluate_template_condition(part, message, context):
+                    return False
+            return True
 
-            storage_key = self._get_autoreply_var_storage_key(key_text)
-            if value_text is None:
-                if scope == "user":
-                    stored_value = get_user_data(guild.id, author.id, storage_key, "")
-                else:
-                    stored_value = get_server_config(guild.id, storage_key, "")
-                stored_value = "" if stored_value is None else str(stored_value)
-                return stored_value[:AUTOREPLY_VAR_MAX_LENGTH]
+        resolved_left = await self._render_template_text(condition.left, message, context)
+        resolved_right = await self._render_template_text(condition.right, message, context)
+        return self._compare_condition_values(resolved_left, condition.operator, resolved_right)
 
-            raw_value = str(value_text)
-            if len(raw_value) > AUTOREPLY_VAR_MAX_LENGTH:
-                return ""
+    async def _render_template_state_var(self, node: TemplateStateVar, message: discord.Message, context: dict) -> str:
+        key_text = (await self._render_template_text(node.key, message, context)).strip()
+        if not key_text or len(key_text) > AUTOREPLY_VAR_MAX_LENGTH:
+            return ""
 
-            if scope == "user":
-                self._set_autoreply_user_var(guild.id, author.id, key_text, raw_value)
+        guild = message.guild
+        author = message.author
+        storage_key = self._get_autoreply_var_storage_key(key_text)
+        if node.value is None:
+            if node.scope == "user":
+                stored_value = get_user_data(guild.id, author.id, storage_key, "")
             else:
-                self._set_autoreply_guild_var(guild.id, key_text, raw_value)
+                stored_value = get_server_config(guild.id, storage_key, "")
+            stored_value = "" if stored_value is None else str(stored_value)
+            return stored_value[:AUTOREPLY_VAR_MAX_LENGTH]
+
+        raw_value = await self._render_template_text(node.value, message, context)
+        if len(raw_value) > AUTOREPLY_VAR_MAX_LENGTH:
             return ""
 
-        response = re.sub(r"\{((?:user|guild)var:[^{}]+)\}", state_var_replacer, response, flags=re.IGNORECASE)
-        response = self._resolve_math_tokens(response)
+        if node.scope == "user":
+            self._set_autoreply_user_var(guild.id, author.id, key_text, raw_value)
+        else:
+            self._set_autoreply_guild_var(guild.id, key_text, raw_value)
+        return ""
 
-        return response
+    async def _render_template_math(self, node: TemplateMath, message: discord.Message, context: dict) -> str:
+        if node.result is not None:
+            return node.result
 
-    def _resolve_math_tokens(self, response: str) -> str:
-        if not response or "{math:" not in response.lower():
-            return response
+        expression = await self._render_template_text(node.children, message, context)
+        try:
+            return self._evaluate_math_expression(expression)
+        except TemplateSyntaxError:
+            return ""
 
-        output = []
-        index = 0
-        response_length = len(response)
+    def _queue_template_reaction(self, message: discord.Message, emoji_str: str):
+        try:
+            if emoji_str.isdigit():
+                emoji = discord.utils.get(message.guild.emojis, id=int(emoji_str))
+                if emoji:
+                    asyncio.create_task(message.add_reaction(emoji))
+            else:
+                asyncio.create_task(message.add_reaction(emoji_str))
+            log(f"自動回覆觸發，對訊息添加反應：{emoji_str}", module_name="AutoReply", level=logging.INFO)
+        except Exception as e:
+            log(f"處理 {{react:{emoji_str}}} 時發生錯誤: {e}", module_name="AutoReply", level=logging.ERROR)
 
-        while index < response_length:
-            if response[index] != "{" or not response[index:index + 6].lower() == "{math:":
-                output.append(response[index])
-                index += 1
-                continue
+    def _select_template_sticker(self, message: discord.Message, sticker_id: int):
+        try:
+            return discord.utils.get(message.guild.stickers, id=sticker_id)
+        except Exception as e:
+            log(f"處理 {{sticker:{sticker_id}}} 時發生錯誤: {e}", module_name="AutoReply", level=logging.ERROR)
+            return None
 
-            closing_index = self._find_matching_brace(response, index)
-            if closing_index == -1:
-                output.append(response[index])
-                index += 1
-                continue
+    async def _render_template_text(self, nodes: list, message: discord.Message, context: dict, mode: str = "plain", state: dict | None = None) -> str:
+        pieces = []
+        await self._render_template_nodes(nodes, message, context, mode, pieces, state)
+        return "".join(piece for piece in pieces if piece is not EFFECT_MARKER)
+
+    async def _render_template_nodes(self, nodes: list, message: discord.Message, context: dict, mode: str, out: list, state: dict | None = None):
+        """Render ``nodes`` into ``out``.
+
+        ``mode`` is ``"segment"`` for a message body (effects and embed directives are applied),
+        ``"embed"`` for an embed payload (effects applied, nested embeds kept literal) or
+        ``"plain"`` for conditions and token arguments (everything but values kept literal).
+        """
+        for node in nodes:
+            node_type = type(node)
+
+            if node_type is TemplateText:
+                if node.text:
+                    out.append(node.text)
+            elif node_type is TemplatePlaceholder:
+                out.append(await self._resolve_template_placeholder(node.raw, message, context))
+            elif node_type is TemplateIf:
+                condition_result = await self._evaluate_template_condition(node.condition, message, context)
+                branch = node.true_branch if condition_result else node.false_branch
+                await self._render_template_nodes(branch, message, context, mode, out, state)
+            elif node_type is TemplateRandInt:
+                out.append(str(random.randint(node.low, node.high)))
+            elif node_type is TemplateTimeMD:
+                out.append(f"<t:{int(context['now'].timestamp())}:{node.style}>")
+            elif node_type is TemplateContentSplit:
+                content_parts = context.get("content_parts")
+                if content_parts is None:
+                    content_parts = context["content_parts"] = message.content.split()
+                out.append(self._resolve_contentsplit_spec(node.spec, content_parts))
+            elif node_type is TemplateStateVar:
+                out.append(await self._render_template_state_var(node, message, context))
+            elif node_type is TemplateMath:
+                out.append(await self._render_template_math(node, message, context))
+            elif node_type is TemplateLiteral:
+                out.append("{" + node.head)
+                await self._render_template_nodes(node.children, message, context, mode, out, state)
+                out.append("}")
+            elif mode == "plain" or node_type is TemplateDelay:
+                await self._render_template_literal_node(node, message, context, mode, out, state)
+            elif node_type is TemplateMention:
+                state["allow_everyone_and_roles"] = node.allow
+                if mode == "segment":
+                    out.append(EFFECT_MARKER)
+            elif node_type is TemplateReact:
+                emoji_str = (await self._render_template_text(node.children, message, context)).strip()
+                self._queue_template_reaction(message, emoji_str)
+                if mode == "segment":
+                    out.append(EFFECT_MARKER)
+            elif node_type is TemplateSticker:
+                state["sticker"] = self._select_template_sticker(message, node.sticker_id)
+                if mode == "segment":
+                    out.append(EFFECT_MARKER)
+            elif mode == "embed":
+                await self._render_template_literal_node(node, message, context, mode, out, state)
+            elif node_type is TemplateEmbed:
+                embed_values = self._get_template_embed_values(state)
+                embed_values[node.key] = (await self._render_template_text(node.children, message, context, "embed", state)).strip()
+                out.append(EFFECT_MARKER)
+            elif node_type is TemplateEmbedField:
+                if node.value is not None:
+                    field_name = (await self._render_template_text(node.name, message, context, "embed", state)).strip()
+                    field_value = (await self._render_template_text(node.value, message, context, "embed", state)).strip()
+                    self._get_template_embed_values(state)["fields"].append((field_name, field_value))
+                out.append(EFFECT_MARKER)
+
+    async def _render_template_literal_node(self, node, message: discord.Message, context: dict, mode: str, out: list, state: dict | None):
+        if isinstance(node, TemplateBlock):
+            out.append("{" + node.head)
+            await self._render_template_nodes(node.children, message, context, mode, out, state)
+            out.append(")}" if type(node) is TemplateMath else "}")
+        elif isinstance(node, (TemplateEmbedField, TemplateStateVar)):
+            first, second = (node.name, node.value) if type(node) is TemplateEmbedField else (node.key, node.value)
+            out.append("{" + node.head)
+            await self._render_template_nodes(first, message, context, mode, out, state)
+            if second is not None:
+                out.append(":")
+                await self._render_template_nodes(second, message, context, mode, out, state)
+            out.append("}")
+        else:
+            out.append(node.source)
+
+    def _get_template_embed_values(self, state: dict) -> dict:
+        if state["embed"] is None:
+            state["embed"] = {
+                "title": None,
+                "description": None,
+                "url": None,
+                "image": None,
+                "color": None,
+                "thumbnail": None,
+                "footer": None,
+                "footer_image": None,
+                "author": None,
+                "author_url": None,
+                "author_image": None,
+                "time": None,
+                "fields": [],
+            }
+        return state["embed"]
 
-            token = response[index + 1:closing_index]
-            try:
-                expression = self._parse_math_token(token)
-                expression = self._resolve_math_tokens(expression)
-                output.append(self._evaluate_math_expression(expression))
-            except TemplateSyntaxError:
-                output.append("")
+    async def _resolve_template_ifs(self, nodes: list, message: discord.Message, context: dict) -> list:
+        resolved = []
+        for node in nodes:
+            if not node.has_if:
+                resolved.append(node)
+                continue
 
-            index = closing_index + 1
+            node_type = type(node)
+            if node_type is TemplateIf:
+                condition_result = await self._evaluate_template_condition(node.condition, message, context)
+                branch = node.true_branch if condition_result else node.false_branch
+                resolved.extend(await self._resolve_template_ifs(branch, message, context))
+            elif isinstance(node, TemplateBlock):
+                resolved.append(node.with_children(await self._resolve_template_ifs(node.children, message, context)))
+            else:
+                first = node.name if node_type is TemplateEmbedField else node.key
+                first = await self._resolve_template_ifs(first, message, context)
+                second = None if node.value is None else await self._resolve_template_ifs(node.value, message, context)
+                if node_type is TemplateEmbedField:
+                    resolved.append(TemplateEmbedField(node.head, first, second))
+                else:
+                    resolved.append(TemplateStateVar(node.head, node.scope, first, second))
+        return resolved
 
-        return "".join(output)
+    def _build_embed_from_values(self, values: dict | None, context: dict):
+        if values is None:
+            return None
 
-    async def _build_embed_from_tokens(self, extracted: dict, message: discord.Message, context: dict):
         embed_requested = any(
-            extracted[key] is not None
+            values[key] is not None
             for key in (
                 "title",
                 "description",
@@ -1912,65 +2029,35 @@ class AutoReply(commands.GroupCog, name="autoreply"):
                 "author_image",
                 "time",
             )
-        ) or bool(extracted["fields"])
+        ) or bool(values["fields"])
         if not embed_requested:
             return None
 
         embed = discord.Embed()
 
-        if extracted["title"] is not None:
-            title = (await self._resolve_response_variables(extracted["title"], message, context)).strip()
-            if title:
-                embed.title = title
-
-        if extracted["description"] is not None:
-            description = (await self._resolve_response_variables(extracted["description"], message, context)).strip()
-            if description:
-                embed.description = description
-
-        if extracted["url"] is not None:
-            embed_url = (await self._resolve_response_variables(extracted["url"], message, context)).strip()
-            if embed_url:
-                embed.url = embed_url
-
-        if extracted["image"] is not None:
-            image_url = (await self._resolve_response_variables(extracted["image"], message, context)).strip()
-            if image_url:
-                embed.set_image(url=image_url)
-
-        if extracted["thumbnail"] is not None:
-            thumbnail_url = (await self._resolve_response_variables(extracted["thumbnail"], message, context)).strip()
-            if thumbnail_url:
-                embed.set_thumbnail(url=thumbnail_url)
-
-        if extracted["footer"] is not None:
-            footer_text = (await self._resolve_response_variables(extracted["footer"], message, context)).strip()
-        else:
-            footer_text = ""
+        if values["title"]:
+            embed.title = values["title"]
 
-        if extracted["footer_image"] is not None:
-            footer_image_url = (await self._resolve_response_variables(extracted["footer_image"], message, context)).strip()
-        else:
-            footer_image_url = ""
+        if values["description"]:
+            embed.description = values["description"]
 
-        if footer_text or footer_image_url:
-            embed.set_footer(text=footer_text or "\u200b", icon_url=footer_image_url or None)
+        if values["url"]:
+            embed.url = values["url"]
 
-        if extracted["author"] is not None:
-            author_name = (await self._resolve_response_variables(extracted["author"], message, context)).strip()
-        else:
-            author_name = ""
+        if values["image"]:
+            embed.set_image(url=values["image"])
 
-        if extracted["author_url"] is not None:
-            author_url = (await self._resolve_response_variables(extracted["author_url"], message, context)).strip()
-        else:
-            author_url = ""
+        if values["thumbnail"]:
+            embed.set_thumbnail(url=values["thumbnail"])
 
-        if extracted["author_image"] is not None:
-            author_icon_url = (await self._resolve_response_variables(extracted["author_image"], message, context)).strip()
-        else:
-            author_icon_url = ""
+        footer_text = values["footer"] or ""
+        footer_image_url = values["footer_image"] or ""
+        if footer_text or footer_image_url:
+            embed.set_footer(text=footer_text or "\u200b", icon_url=footer_image_url or None)
 
+        author_name = values["author"] or ""
+        author_url = values["author_url"] or ""
+        author_icon_url = values["author_image"] or ""
         if author_name or author_url or author_icon_url:
             embed.set_author(
                 name=author_name or "\u200b",
@@ -1978,22 +2065,17 @@ class AutoReply(commands.GroupCog, name="autoreply"):
                 icon_url=author_icon_url or None,
             )
 
-        if extracted["color"] is not None:
-            color_value = (await self._resolve_response_variables(extracted["color"], message, context)).strip()
-            parsed_color = self._parse_embed_color(color_value)
+        if values["color"] is not None:
+            parsed_color = self._parse_embed_color(values["color"])
             if parsed_color is not None:
                 embed.color = discord.Colour(parsed_color)
 
-        if extracted["time"] is not None:
-            time_value = (await self._resolve_response_variables(extracted["time"], message, context)).strip()
-            if self._parse_bool(time_value):
-                embed.timestamp = context["now"]
+        if values["time"] is not None and self._parse_bool(values["time"]):
+            embed.timestamp = context["now"]
 
-        for field_name, field_value in extracted["fields"][:25]:
-            resolved_name = (await self._resolve_response_variables(field_name, message, context)).strip()
-            resolved_value = (await self._resolve_response_variables(field_value, message, context)).strip()
-            if resolved_name and resolved_value:
-                embed.add_field(name=resolved_name, value=resolved_value, inline=False)
+        for field_name, field_value in values["fields"][:25]:
+            if field_name and field_value:
+                embed.add_field(name=field_name, value=field_value, inline=False)
 
         return embed
 
@@ -2004,107 +2086,56 @@ class AutoReply(commands.GroupCog, name="autoreply"):
             "random_user": None,
         }
 
-    def _extract_timed_response_plan(self, response: str):
-        stages = [{"send_delay": 0, "template": "", "edits": []}]
-        current_stage = stages[0]
-        current_target = "template"
-        buffer = []
+    def _build_template_stages(self, nodes: list):
+        stages = [{"send_delay": 0, "template": [], "edits": []}]
+        current_target = stages[0]["template"]
         newmsg_count = 0
         edit_count = 0
-        index = 0
-
-        while index < len(response):
-            if response[index] != "{":
-                buffer.append(response[index])
-                index += 1
-                continue
-
-            closing_index = self._find_matching_brace(response, index)
-            if closing_index == -1:
-                buffer.append(response[index])
-                index += 1
-                continue
-
-            token = response[index + 1:closing_index]
-            lowered = token.lower()
-            if lowered.startswith("newmsg:") or lowered.startswith("edit:"):
-                directive_name, delay_seconds = self._parse_delay_directive_token(token)
-                current_chunk = "".join(buffer)
-                buffer = []
 
-                if current_target == "template":
-                    current_stage["template"] += current_chunk
-                else:
-                    current_stage["edits"][-1]["template"] += current_chunk
-
-                if directive_name == "newmsg":
-                    newmsg_count += 1
-                    if newmsg_count > AUTOREPLY_NEWMESSAGE_LIMIT:
-                        raise TemplateSyntaxError(f"newmsg limit exceeded ({AUTOREPLY_NEWMESSAGE_LIMIT})")
-                    current_stage = {"send_delay": delay_seconds, "template": "", "edits": []}
-                    stages.append(current_stage)
-                    current_target = "template"
-                else:
-                    edit_count += 1
-                    if edit_count > AUTOREPLY_EDIT_LIMIT:
-                        raise TemplateSyntaxError(f"edit limit exceeded ({AUTOREPLY_EDIT_LIMIT})")
-                    current_stage["edits"].append({"delay": delay_seconds, "template": ""})
-                    current_target = "edit"
-
-                index = closing_index + 1
+        for node in nodes:
+            if type(node) is not TemplateDelay:
+                current_target.append(node)
                 continue
 
-            buffer.append(response[index:closing_index + 1])
-            index = closing_index + 1
-
-        remaining_chunk = "".join(buffer)
-        if current_target == "template":
-            current_stage["template"] += remaining_chunk
-        else:
-            current_stage["edits"][-1]["template"] += remaining_chunk
-
+            if node.directive == "newmsg":
+                newmsg_count += 1
+                if newmsg_count > AUTOREPLY_NEWMESSAGE_LIMIT:
+                    raise TemplateSyntaxError(f"newmsg limit exceeded ({AUTOREPLY_NEWMESSAGE_LIMIT})")
+                stages.append({"send_delay": node.seconds, "template": [], "edits": []})
+                current_target = stages[-1]["template"]
+            else:
+                edit_count += 1
+                if edit_count > AUTOREPLY_EDIT_LIMIT:
+                    raise TemplateSyntaxError(f"edit limit exceeded ({AUTOREPLY_EDIT_LIMIT})")
+                stages[-1]["edits"].append({"delay": node.seconds, "template": []})
+                current_target = stages[-1]["edits"][-1]["template"]
+
+        for stage in stages:
+            stage["template"] = CompiledTemplate(stage["template"])
+            for edit_action in stage["edits"]:
+                edit_action["template"] = CompiledTemplate(edit_action["template"])
         return stages
 
-    async def _render_response_segment(self, response: str, message: discord.Message, context: dict | None = None) -> tuple:
+    async def _render_response_segment(self, response, message: discord.Message, context: dict | None = None) -> tuple:
         if context is None:
             context = self._build_template_context()
 
-        response = (await self._resolve_response_variables(response, message, context)).strip()
-        response, allowed_mentions = self._extract_mention_directive(response)
-
-        react_pattern = re.compile(r"\{react:([^\}]+)\}")
-
-        def react_replacer(match):
-            emoji_str = match.group(1).strip()
+        if isinstance(response, CompiledTemplate):
+            nodes = response.nodes
+        else:
             try:
-                if emoji_str.isdigit():
-                    emoji = discord.utils.get(message.guild.emojis, id=int(emoji_str))
-                    if emoji:
-                        asyncio.create_task(message.add_reaction(emoji))
-                else:
-                    asyncio.create_task(message.add_reaction(emoji_str))
-                log(f"自動回覆觸發，對訊息添加反應：{emoji_str}", module_name="AutoReply", level=logging.INFO)
-            except Exception as e:
-                log(f"處理 {{react:{emoji_str}}} 時發生錯誤: {e}", module_name="AutoReply", level=logging.ERROR)
-            return ""
-
-        response = react_pattern.sub(react_replacer, response)
-
-        sticker = None
-        sticker_pattern = re.compile(r"\{sticker:(\d+)\}")
+                nodes = self._compile_template(response or "").nodes
+            except TemplateSyntaxError:
+                nodes = self._parse_template_nodes(response or "", strict=False)
 
-        def sticker_replacer(match):
-            sticker_id = int(match.group(1))
-            try:
-                nonlocal sticker
-                sticker = discord.utils.get(message.guild.stickers, id=sticker_id)
-            except Exception as e:
-                log(f"處理 {{sticker:{sticker_id}}} 時發生錯誤: {e}", module_name="AutoReply", level=logging.ERROR)
-            return ""
+        state = {"allow_everyone_and_roles": False, "sticker": None, "embed": None}
+        pieces = []
+        await self._render_template_nodes(nodes, message, context, "segment", pieces, state)
 
-        response = sticker_pattern.sub(sticker_replacer, response)
-        response, extracted_embed = self._extract_embed_tokens(response)
-        embed = await self._build_embed_from_tokens(extracted_embed, message, context)
+        response = join_template_pieces(pieces)
+        allowed_mentions = self._build_allowed_mentions(state["allow_everyone_and_roles"])
+        sticker = state["sticker"]
+        embed = self._build_embed_from_values(state["embed"], context)
 
         if not response and not sticker and embed is None:
             return "", None, None, allowed_mentions
@@ -2178,21 +2209,26 @@ class AutoReply(commands.GroupCog, name="autoreply"):
         """Process autoreply response text and return the immediate result plus delayed actions."""
 
         try:
-            self._validate_template_syntax(response)
+            compiled = self._compile_template(response)
         except TemplateSyntaxError as e:
             log(f"自動回覆模板語法錯誤: {e}", module_name="AutoReply", level=logging.WARNING)
             return "", None, None, self._build_allowed_mentions(), {"initial_edits": [], "followups": []}
 
-        planning_context = self._build_template_context()
-        resolved_response = await self._resolve_if_expressions(response, message, planning_context)
+        if compiled.has_if or compiled.has_delay:
+            planning_context = self._build_template_context()
+            resolved_nodes = compiled.nodes
+            if compiled.has_if:
+                resolved_nodes = await self._resolve_template_ifs(compiled.nodes, message, planning_context)
 
-        try:
-            response_stages = self._extract_timed_response_plan(resolved_response)
-        except TemplateSyntaxError as e:
-            log(f"自動回覆模板語法錯誤: {e}", module_name="AutoReply", level=logging.WARNING)
-            return "", None, None, self._build_allowed_mentions(), {"initial_edits": [], "followups": []}
+            try:
+                response_stages = self._build_template_stages(resolved_nodes)
+            except TemplateSyntaxError as e:
+                log(f"自動回覆模板語法錯誤: {e}", module_name="AutoReply", level=logging.WARNING)
+                return "", None, None, self._build_allowed_mentions(), {"initial_edits": [], "followups": []}
+        else:
+            response_stages = [{"send_delay": 0, "template": compiled, "edits": []}]
 
-        initial_stage = response_stages[0] if response_stages else {"template": "", "edits": []}
+        initial_stage = response_stages[0]
         final_response, sticker, embed, allowed_mentions = await self._render_response_segment(initial_stage["template"], message)
         delayed_actions = {
             "initial_edits": initial_stage["edits"],
@@ -3082,95 +3118,83 @@ class AutoReply(commands.GroupCog, name="autoreply"):
         if not message.channel.permissions_for(message.guild.me).send_messages:
             return
         
-        ignore_mode = get_server_config(message.guild.id, "autoreply_ignore_mode", "blacklist")
-        ignore_channels = get_server_config(message.guild.id, "autoreply_ignore_channels", [])
+        # 使用快取的唯讀設定快照，避免每則訊息都查詢資料庫
+        server_config = get_server_config_snapshot(message.guild.id)
+        ignore_mode = server_config.get("autoreply_ignore_mode", "blacklist")
+        ignore_channels = server_config.get("autoreply_ignore_channels", [])
         if ignore_mode == "blacklist" and message.channel.id in ignore_channels:
             return
         elif ignore_mode == "whitelist" and message.channel.id not in ignore_channels:
             return
 
         guild_id = message.guild.id
-        autoreplies = get_server_config(guild_id, "autoreplies", [])
+        autoreplies = server_config.get("autoreplies", [])
         
         # 預先取得 channel_id 避免在迴圈中重複存取
         channel_id = message.channel.id
-        content = message.content
 
-        for ar in autoreplies:
-            # check channel mode
-            channel_mode = ar.get("channel_mode", "all")
-            # 確保 ar['channels'] 存在，避免 KeyError
-            channels = ar.get("channels", [])
-            
-            if channel_mode == "whitelist" and channel_id not in channels:
-                continue
-            elif channel_mode == "blacklist" and channel_id in channels:
-                continue
+        # 已編譯的觸發器比對器會回傳與逐條檢查相同順序的第一個符合規則
+        matched = self._get_trigger_matcher(guild_id, autoreplies).first_match(message, channel_id)
+        if matched is None:
+            return
 
-            match_found = False
-            mode = ar.get("mode")
-            triggers = ar.get("trigger", [])
+        ar = matched[1]
+        triggers = ar.get("trigger", [])
+        if not percent_random(ar.get("random_chance", 100)):
+            # 雖然匹配但隨機機率未中，繼續檢查下一個設定嗎？
+            # 原始邏輯是 return，表示同一個訊息只會有一次自動回覆機會(或該次判定結束)
+            # 依照原始邏輯保留 return
+            return
 
-            match_found = self._message_matches_autoreply_triggers(message, mode, triggers)
-            
-            if match_found:
-                if not percent_random(ar.get("random_chance", 100)):
-                    # 雖然匹配但隨機機率未中，繼續檢查下一個設定嗎？
-                    # 原始邏輯是 return，表示同一個訊息只會有一次自動回覆機會(或該次判定結束)
-                    # 依照原始邏輯保留 return
-                    return
+        responses = ar.get("response", [])
+        if not responses:
+            return
 
-                responses = ar.get("response", [])
-                if not responses:
-                    return
+        raw_response = random.choice(responses)
 
-                raw_response = random.choice(responses)
-                
-                # 使用新的處理方法
-                final_response, sticker, embed, allowed_mentions, delayed_actions = await self._process_response_v2(raw_response, message)
+        # 使用新的處理方法
+        final_response, sticker, embed, allowed_mentions, delayed_actions = await self._process_response_v2(raw_response, message)
 
-                has_immediate_output = bool(final_response or sticker or embed is not None)
-                has_followups = bool(delayed_actions["followups"])
-                if not has_immediate_output and not has_followups:
+        has_immediate_output = bool(final_response or sticker or embed is not None)
+        has_followups = bool(delayed_actions["followups"])
+        if not has_immediate_output and not has_followups:
+            return
+
+        try:
+            sent_message = None
+            if has_immediate_output:
+                if self._is_rate_limited(message):
                     return
-                
-                try:
-                    sent_message = None
-                    if has_immediate_output:
-                        if self._is_rate_limited(message):
-                            return
-                        sent_message = await self._send_autoreply_message(
-                            message,
-                            ar.get("reply", False),
-                            final_response,
-                            embed,
-                            sticker,
-                            allowed_mentions,
-                        )
+                sent_message = await self._send_autoreply_message(
+                    message,
+                    ar.get("reply", False),
+                    final_response,
+                    embed,
+                    sticker,
+                    allowed_mentions,
+                )
 
-                    if sent_message and delayed_actions["initial_edits"]:
-                        asyncio.create_task(self._execute_autoreply_edits(sent_message, message, delayed_actions["initial_edits"]))
-
-                    for followup_stage in delayed_actions["followups"]:
-                        asyncio.create_task(self._execute_autoreply_followup_stage(message, ar.get("reply", False), followup_stage))
-                    
-                    # 記錄日誌
-                    # 避免 trigger 太長
-                    trigger_used = triggers[0] if triggers else "unknown"
-                    if final_response:
-                        response_preview = final_response
-                    elif embed and embed.title:
-                        response_preview = embed.title
-                    elif has_followups:
-                        response_preview = "[delayed]"
-                    else:
-                        response_preview = "[embed]"
-                    log(f"自動回覆觸發：`{trigger_used[:10]}...` 回覆內容：`{response_preview[:10]}...`。", 
-                        module_name="AutoReply", level=logging.INFO, user=message.author, guild=message.guild)
-                except discord.HTTPException as e:
-                    log(f"自動回覆發送失敗: {e}", module_name="AutoReply", level=logging.ERROR)
-                
-                return
+            if sent_message and delayed_actions["initial_edits"]:
+                asyncio.create_task(self._execute_autoreply_edits(sent_message, message, delayed_actions["initial_edits"]))
+
+            for followup_stage in delayed_actions["followups"]:
+                asyncio.create_task(self._execute_autoreply_followup_stage(message, ar.get("reply", False), followup_stage))
+
+            # 記錄日誌
+            # 避免 trigger 太長
+            trigger_used = triggers[0] if triggers else "unknown"
+            if final_response:
+                response_preview = final_response
+            elif embed and embed.title:
+                response_preview = embed.title
+            elif has_followups:
+                response_preview = "[delayed]"
+            else:
+                response_preview = "[embed]"
+            log(f"自動回覆觸發：`{trigger_used[:10]}...` 回覆內容：`{response_preview[:10]}...`。", 
+                module_name="AutoReply", level=logging.INFO, user=message.author, guild=message.guild)
+        except discord.HTTPException as e:
+            log(f"自動回覆發送失敗: {e}", module_name="AutoReply", level=logging.ERROR)
 
 
 asyncio.run(bot.add_cog(AutoReply(bot)))
@@ -1,7 +1,7 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-from globalenv import bot, get_user_data, set_user_data, config, modules
+from globalenv import bot, get_user_data, set_user_data, config, modules, on_close_tasks
 from datetime import datetime, timezone
 if "Website" not in modules:
     raise Exception("依賴模組 Website 未加載，無法加載 Contribute 模組。")
@@ -11,6 +11,7 @@ import requests
 from logger import log
 import logging
 import time
+from rate_limiter import format_retry_after, get_limiter, load_limiters, save_limiters
 import base64
 import uuid
 import json
@@ -58,7 +59,15 @@ def oauth_code_to_id(code, redirect_uri=None):
         return None
 
 auth_tokens = {}
-contribution_cooldowns = {} # user_id: timestamp
+# 投稿冷卻 5 分鐘，重啟後仍然有效
+contribution_limiter = get_limiter("contribute", 1, 300, persist=True)
+load_limiters()
+
+
+async def _save_rate_limits():
+    save_limiters()
+
+on_close_tasks.add(_save_rate_limits)
 GLOBAL_GUILD_ID = 0
 APPROVAL_REWARD_GLOBAL = 200
 WHATTISTHISGUYTALKING_STATIC_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp"}
@@ -784,12 +793,10 @@ def contribute_feed_grass():
         user_id = auth_tokens[token]["user_id"]
 
         # Rate Limit Check
-        current_time = time.time()
-        if user_id in contribution_cooldowns:
-            last_time = contribution_cooldowns[user_id]
-            if current_time - last_time < 300: # 5 minutes
-                remaining = int(300 - (current_time - last_time))
-                return f"投稿過於頻繁，請等待 {remaining} 秒後再試。", 429
+        retry_after = contribution_limiter.retry_after(user_id)
+        if retry_after:
+            remaining = format_retry_after(retry_after)
+            return f"投稿過於頻繁，請等待 {remaining} 秒後再試。", 429
         
         # Prepare Data
         try:
@@ -837,7 +844,7 @@ def contribute_feed_grass():
                 await channel.send(embed=embed, files=[img_file, json_file, preview_file], view=view)
 
             bot.loop.create_task(send_contribution())
-            contribution_cooldowns[user_id] = time.time()
+            contribution_limiter.hit(user_id)
             return "投稿已送出！"
 
         except Exception as e:
@@ -864,14 +871,12 @@ class Contribute(commands.GroupCog, description="投稿圖片"):
     @app_commands.command(name="what-is-this-guy-talking-about", description="投稿「這傢伙在說什麼呢」圖片")
     async def what_is_this_guy_talking_about(self, interaction: discord.Interaction, image: discord.Attachment):
         # Rate Limit Check
-        current_time = time.time()
         user_id = interaction.user.id
-        if user_id in contribution_cooldowns:
-            last_time = contribution_cooldowns[user_id]
-            if current_time - last_time < 300:
-                remaining = int(300 - (current_time - last_time))
-                await interaction.response.send_message(f"投稿過於頻繁，請等待 {remaining} 秒後再試。", ephemeral=True)
-                return
+        retry_after = contribution_limiter.retry_after(user_id)
+        if retry_after:
+            remaining = format_retry_after(retry_after)
+            await interaction.response.send_message(f"投稿過於頻繁，請等待 {remaining} 秒後再試。", ephemeral=True)
+            return
 
         media_type = classify_whatisthisguytalking_attachment(image)
         if media_type is None:
@@ -910,21 +915,19 @@ class Contribute(commands.GroupCog, description="投稿圖片"):
         
         view = ContributionReviewView("whatisthisguytalking")
         await contribute_channel.send(embed=embed, file=file, view=view)
-        contribution_cooldowns[user_id] = time.time()
+        contribution_limiter.hit(user_id)
         await interaction.response.send_message("感謝您的投稿！我們會盡快審核您的圖片。", ephemeral=True)
     
     @app_commands.command(name="dynamic-voice-audio", description="投稿動態語音頻道的進入音效")
     @app_commands.describe(audio="音檔（MP3、WAV、OGG 格式，最大 5MB，建議 3-10 秒）")
     async def dynamic_voice_audio(self, interaction: discord.Interaction, audio: discord.Attachment):
         # Rate Limit Check
-        current_time = time.time()
         user_id = interaction.user.id
-        if user_id in contribution_cooldowns:
-            last_time = contribution_cooldowns[user_id]
-            if current_time - last_time < 300:
-                remaining = int(300 - (current_time - last_time))
-                await interaction.response.send_message(f"投稿過於頻繁，請等待 {remaining} 秒後再試。", ephemeral=True)
-                return
+        retry_after = contribution_limiter.retry_after(user_id)
+        if retry_after:
+            remaining = format_retry_after(retry_after)
+            await interaction.response.send_message(f"投稿過於頻繁，請等待 {remaining} 秒後再試。", ephemeral=True)
+            return
         
         # 檢查檔案類型
         if not audio.filename.lower().endswith(('.mp3', '.wav', '.ogg')):
@@ -963,7 +966,7 @@ class Contribute(commands.GroupCog, description="投稿圖片"):
         
         view = ContributionReviewView("dynamic_voice_audio", audio_filename=audio_filename)
         await contribute_channel.send(embed=embed, file=file, view=view)
-        contribution_cooldowns[user_id] = time.time()
+        contribution_limiter.hit(user_id)
         await interaction.response.send_message("感謝您的投稿！我們會盡快審核您的音檔。\n-# 審核通過後會通知你。", ephemeral=True)
 
 
@@ -1,6 +1,7 @@
 ﻿from globalenv import (
     bot, config, get_server_config, set_server_config, get_user_data, set_user_data,
     get_all_user_data, get_all_server_config_key, interaction_uses_guild_scope, ECONOMY_GLOBAL_MODE_CONFIG_KEY, db,
+    on_ready_tasks, on_close_tasks,
 )
 import discord
 from discord.ext import commands
@@ -18,6 +19,9 @@ from ItemSystem import (
     admin_action_callbacks, get_item_by_id, get_all_items_for_guild
 )
 from OwnerTools import is_owner
+from economy_aggregates import (
+    EconomyAggregates, SUPPLY_KEY, ADMIN_INJECTED_KEY, TRANSACTION_COUNT_KEY, EXCHANGE_RATE_KEY,
+)
 
 
 # ==================== Constants ====================
@@ -32,6 +36,8 @@ EXCHANGE_RATE_MIN = 0.01
 EXCHANGE_RATE_MAX = 100.0
 MAX_GLOBAL_BALANCE = 10_000_000.0  # 全域幣上限：1000萬
 MIN_GLOBAL_FLOW_HUMAN_MEMBERS = 15
+HISTORY_PAGE_SIZE = 10
+LEDGER_COMPACT_INTERVAL = 6 * 60 * 60  # 每 6 小時壓縮一次舊交易紀錄
 
 # 通膨/通縮權重
 ADMIN_INJECTION_WEIGHT = 0.015   # 管理員注入造成的貶值權重
@@ -70,7 +76,7 @@ def get_balance(guild_id: int, user_id: int) -> float:
 
 def set_balance(guild_id: int, user_id: int, amount: float):
     """設定用戶在特定伺服器的餘額"""
-    set_user_data(guild_id, user_id, "economy_balance", round(amount, 2))
+    set_user_data(guild_id, user_id, "economy_balance", round(amount, 2), durable=True)
 
 
 def get_global_balance(user_id: int) -> float:
@@ -84,18 +90,18 @@ def set_global_balance(user_id: int, amount: float):
         log(f"Global balance cap applied for user {user_id}: {amount:.2f} -> {MAX_GLOBAL_BALANCE:.2f}",
             module_name="Economy", level=logging.WARNING)
         amount = MAX_GLOBAL_BALANCE
-    set_user_data(GLOBAL_GUILD_ID, user_id, "economy_balance", round(amount, 2))
+    set_user_data(GLOBAL_GUILD_ID, user_id, "economy_balance", round(amount, 2), durable=True)
 
 
 def get_exchange_rate(guild_id: int) -> float:
     """取得伺服器匯率（1 伺服幣 = X 全域幣）"""
-    return get_server_config(guild_id, "economy_exchange_rate", DEFAULT_EXCHANGE_RATE)
+    return get_server_config(guild_id, EXCHANGE_RATE_KEY, DEFAULT_EXCHANGE_RATE)
 
 
 def set_exchange_rate(guild_id: int, rate: float):
     """設定伺服器匯率"""
     rate = max(EXCHANGE_RATE_MIN, min(EXCHANGE_RATE_MAX, round(rate, 6)))
-    set_server_config(guild_id, "economy_exchange_rate", rate)
+    set_server_config(guild_id, EXCHANGE_RATE_KEY, rate)
 
 
 def get_currency_name(guild_id: int) -> str:
@@ -265,31 +271,33 @@ def get_global_flow_block_notice(guild_id: int, guild: discord.Guild | None = No
 
 
 def get_total_supply(guild_id: int) -> float:
-    """取得伺服器的貨幣總供給"""
-    return get_server_config(guild_id, "economy_total_supply", 0.0)
+    """取得伺服器的貨幣總供給（含尚未寫入的增量）"""
+    return economy_aggregates.get(guild_id, SUPPLY_KEY, 0.0)
 
 
 def adjust_supply(guild_id: int, delta: float):
-    """調整貨幣總供給"""
-    current = get_total_supply(guild_id)
-    set_server_config(guild_id, "economy_total_supply", max(0, round(current + delta, 2)))
+    """調整貨幣總供給（累積在記憶體，定期以 SQL 增量寫入）"""
+    economy_aggregates.add(guild_id, SUPPLY_KEY, delta)
 
 
 def get_admin_injected(guild_id: int) -> float:
     """取得管理員注入的總金額"""
-    return get_server_config(guild_id, "economy_admin_injected", 0.0)
+    return economy_aggregates.get(guild_id, ADMIN_INJECTED_KEY, 0.0)
 
 
 def get_transaction_count(guild_id: int) -> int:
     """取得交易次數"""
-    return get_server_config(guild_id, "economy_transaction_count", 0)
+    return economy_aggregates.get(guild_id, TRANSACTION_COUNT_KEY, 0)
 
 
 # ==================== Exchange Rate Mechanics ====================
+# apply_* 只把壓力排進佇列，匯率在每次寫入時依當下的供給量一次重算；
+# 同一批裡的壓力照排入的順序逐筆套用公式，不會先加總（公式不是線性的）
 
-def apply_inflation(guild_id: int, amount: float, weight: float = ADMIN_INJECTION_WEIGHT):
+def inflation_impact(amount: float, supply: float, admin_injected: float, daily_amount: float,
+                     weight: float = ADMIN_INJECTION_WEIGHT) -> float:
     """
-    對伺服器貨幣施加通膨效果（匯率下降）
+    通膨造成的匯率降幅（0 ~ 0.6）
 
     使用「有機經濟基準」+ 對數縮放 + 濫權複利懲罰：
     - 小額注入（≈每日獎勵）= 幾乎無感
@@ -297,11 +305,6 @@ def apply_inflation(guild_id: int, amount: float, weight: float = ADMIN_INJECTIO
     - 大額注入（1000倍+）= 嚴重貶值
     - 重複濫權 = 複利懲罰，經濟加速崩潰
     """
-    rate = get_exchange_rate(guild_id)
-    supply = get_total_supply(guild_id)
-    admin_injected = get_admin_injected(guild_id)
-    daily_amount = get_daily_amount(guild_id)
-
     # 有機經濟規模 = 總供給 - 管理員注入，至少為 daily*100
     # 這樣管理員注入不會「稀釋」自己的影響
     organic = max(supply - admin_injected, daily_amount * 100, 1)
@@ -323,80 +326,79 @@ def apply_inflation(guild_id: int, amount: float, weight: float = ADMIN_INJECTIO
     abuse_penalty = 1 + (abuse_fraction ** 2) * 8
 
     # 最終影響：單次最多 60% 貶值（不再是 10%）
-    impact = min(base_impact * abuse_penalty, 0.6)
+    return min(base_impact * abuse_penalty, 0.6)
+
+
+def market_impact(amount: float, supply: float, weight: float) -> float:
+    """買賣物品造成的匯率變動幅度，與金額相對於供給量的比例成正比（單次最多 5%）"""
+    if supply <= 0:
+        return 0.0
+    ratio = abs(amount) / supply
+    return min(math.log2(1 + ratio) * weight, 0.05)
+
+
+def recompute_exchange_rate(guild_id: int, values: dict, pressure: list) -> float:
+    """依一批累積的壓力重算匯率；values 是寫入增量後的供給、管理員注入與匯率，pressure 是依序的 (種類, 權重, 金額)"""
+    rate = values.get(EXCHANGE_RATE_KEY, DEFAULT_EXCHANGE_RATE)
+    supply = values.get(SUPPLY_KEY, 0.0)
+    admin_injected = values.get(ADMIN_INJECTED_KEY, 0.0)
+    for kind, weight, amount in pressure:
+        if kind == "inflation":
+            rate *= 1 - inflation_impact(amount, supply, admin_injected, get_daily_amount(guild_id), weight)
+        elif kind == "deflation":
+            rate *= (1 + weight) ** amount
+        elif kind == "market_deflation":
+            rate *= 1 + market_impact(amount, supply, weight)
+        elif kind == "market_inflation":
+            rate *= 1 - market_impact(amount, supply, weight)
+    return max(EXCHANGE_RATE_MIN, min(EXCHANGE_RATE_MAX, round(rate, 6)))
+
 
-    rate *= (1 - impact)
-    set_exchange_rate(guild_id, rate)
-    return rate
+economy_aggregates = EconomyAggregates(db, recompute_exchange_rate)
+
+
+def apply_inflation(guild_id: int, amount: float, weight: float = ADMIN_INJECTION_WEIGHT):
+    """對伺服器貨幣施加通膨效果（匯率下降），下次寫入時生效"""
+    economy_aggregates.press(guild_id, "inflation", weight, abs(amount))
 
 
 def apply_deflation(guild_id: int, weight: float = TRADE_HEALTH_WEIGHT):
     """
-    對伺服器貨幣施加通縮效果（匯率上升）
+    對伺服器貨幣施加通縮效果（匯率上升），下次寫入時生效
 
     通縮因素：
     - 玩家間交易（手續費銷毀貨幣）
     - 兌換貨幣（手續費銷毀）
     """
-    rate = get_exchange_rate(guild_id)
-    rate *= (1 + weight)
-    set_exchange_rate(guild_id, rate)
-    return rate
+    economy_aggregates.press(guild_id, "deflation", weight)
 
 
 def apply_market_deflation(guild_id: int, amount: float, weight: float = PURCHASE_DEFLATION_WEIGHT):
-    """
-    購買物品導致貨幣離開流通 → 通縮（匯率上升）
-    影響程度與金額相對於供給量的比例成正比
-    """
-    rate = get_exchange_rate(guild_id)
-    supply = get_total_supply(guild_id)
-    if supply <= 0:
-        return rate
-    ratio = abs(amount) / supply
-    impact = math.log2(1 + ratio) * weight
-    impact = min(impact, 0.05)  # 單次最多 5% 升值
-    rate *= (1 + impact)
-    set_exchange_rate(guild_id, rate)
-    return rate
+    """購買物品導致貨幣離開流通 → 通縮（匯率上升）"""
+    economy_aggregates.press(guild_id, "market_deflation", weight, abs(amount))
 
 
 def apply_market_inflation(guild_id: int, amount: float, weight: float = SALE_INFLATION_WEIGHT):
-    """
-    賣出物品導致新貨幣進入流通 → 通膨（匯率下降）
-    影響程度與金額相對於供給量的比例成正比
-    """
-    rate = get_exchange_rate(guild_id)
-    supply = get_total_supply(guild_id)
-    if supply <= 0:
-        return rate
-    ratio = abs(amount) / supply
-    impact = math.log2(1 + ratio) * weight
-    impact = min(impact, 0.05)  # 單次最多 5% 貶值
-    rate *= (1 - impact)
-    set_exchange_rate(guild_id, rate)
-    return rate
+    """賣出物品導致新貨幣進入流通 → 通膨（匯率下降）"""
+    economy_aggregates.press(guild_id, "market_inflation", weight, abs(amount))
 
 
 def record_admin_injection(guild_id: int, amount: float):
     """記錄管理員注入並觸發通膨"""
-    current = get_admin_injected(guild_id)
-    set_server_config(guild_id, "economy_admin_injected", round(current + abs(amount), 2))
-    new_rate = apply_inflation(guild_id, amount)
-    log(f"Admin injection of {amount} in guild {guild_id}, rate now {new_rate:.6f}", module_name="Economy")
+    economy_aggregates.add(guild_id, ADMIN_INJECTED_KEY, abs(amount))
+    apply_inflation(guild_id, amount)
+    log(f"Admin injection of {amount} in guild {guild_id}", module_name="Economy")
 
 
 def record_transaction(guild_id: int):
     """記錄一筆交易並增加交易次數（手續費銷毀 → 通縮）"""
-    count = get_transaction_count(guild_id)
-    set_server_config(guild_id, "economy_transaction_count", count + 1)
+    economy_aggregates.add(guild_id, TRANSACTION_COUNT_KEY, 1)
     apply_deflation(guild_id, TRADE_HEALTH_WEIGHT)
 
 
 def record_purchase(guild_id: int, amount: float):
     """記錄一筆購買（貨幣被銷毀 → 通縮，按金額比例計算）"""
-    count = get_transaction_count(guild_id)
-    set_server_config(guild_id, "economy_transaction_count", count + 1)
+    economy_aggregates.add(guild_id, TRANSACTION_COUNT_KEY, 1)
     apply_market_deflation(guild_id, amount, PURCHASE_DEFLATION_WEIGHT)
 
 
@@ -408,20 +410,23 @@ def record_sale(guild_id: int, amount: float, is_admin_item: bool = False):
         amount: 賣出金額
         is_admin_item: 是否為管理員給予的物品（會觸發更嚴重的通膨）
     """
-    count = get_transaction_count(guild_id)
-    set_server_config(guild_id, "economy_transaction_count", count + 1)
+    economy_aggregates.add(guild_id, TRANSACTION_COUNT_KEY, 1)
 
     # 如果是管理員給予的物品被賣出，視為嚴重的經濟漏洞，使用管理員注入的懲罰
     if is_admin_item:
-        apply_inflation(guild_id, amount, ADMIN_INJECTION_WEIGHT)
         # 額外記錄為管理員注入（因為這等同於管理員直接給錢）
-        current = get_admin_injected(guild_id)
-        set_server_config(guild_id, "economy_admin_injected", round(current + abs(amount), 2))
+        economy_aggregates.add(guild_id, ADMIN_INJECTED_KEY, abs(amount))
+        apply_inflation(guild_id, amount, ADMIN_INJECTION_WEIGHT)
         log(f"Admin-sourced item sold for {amount}, treated as admin injection in guild {guild_id}", module_name="Economy")
     else:
         apply_market_inflation(guild_id, amount, SALE_INFLATION_WEIGHT)
 
 
+async def flush_economy_aggregates():
+    await asyncio.to_thread(economy_aggregates.close)
+on_close_tasks.add(flush_economy_aggregates)
+
+
 # ==================== Transaction Log ====================
 
 ECONOMY_WEBHOOK_CONFIG_KEY = "economy_log_webhook_url"
@@ -742,9 +747,13 @@ async def migrate_guild_economy_to_global(guild_id: int) -> dict:
         total_server_item_value += round(sell_total, 2)
         sold_item_units += user_sold_units
 
-    set_server_config(guild_id, "economy_total_supply", 0.0)
-    set_server_config(guild_id, "economy_admin_injected", 0.0)
-    set_server_config(guild_id, "economy_transaction_count", 0)
+    def reset_counters():
+        set_server_config(guild_id, SUPPLY_KEY, 0.0)
+        set_server_config(guild_id, ADMIN_INJECTED_KEY, 0.0)
+        set_server_config(guild_id, TRANSACTION_COUNT_KEY, 0)
+
+    # 在寫入鎖內清掉排隊的增量並歸零，正在寫入的那批不會蓋在歸零之後；等鎖時不卡住事件迴圈
+    await asyncio.to_thread(economy_aggregates.discard, guild_id, reset_counters)
 
     return {
         "affected_users": len(affected_user_ids),
@@ -755,24 +764,42 @@ async def migrate_guild_economy_to_global(guild_id: int) -> dict:
         "exchange_rate": rate,
     }
 
-def log_transaction(guild_id: int, user_id: int, tx_type: str, amount: float, currency: str, detail: str = ""):
-    """記錄一筆交易到用戶的交易紀錄"""
-    history = get_user_data(guild_id, user_id, "economy_history", [])
-    history.append({
-        "type": tx_type,
-        "amount": amount,
-        "currency": currency,
-        "detail": detail,
-        "time": datetime.now(timezone.utc).isoformat(),
-        "balance_after": get_balance(guild_id, user_id),
-    })
-    # 只保留最近 50 筆
-    if len(history) > 50:
-        history = history[-50:]
-    set_user_data(guild_id, user_id, "economy_history", history)
+def log_transaction(guild_id: int, user_id: int, tx_type: str, amount: float, currency: str, detail: str = "",
+                    *, balance_after: float | None = None, connection=None):
+    """記錄一筆交易到 economy_transactions（只新增一列，不會重寫整份紀錄）
+
+    有傳 ``connection`` 時會跟呼叫者的交易一起提交。
+    """
+    if balance_after is None:
+        balance_after = get_balance(guild_id, user_id)
+    db.ledger.append(guild_id, user_id, tx_type, amount, currency, detail, balance_after, connection=connection)
+
 
+def get_transaction_history(guild_id: int, user_id: int, limit: int = HISTORY_PAGE_SIZE, offset: int = 0) -> list[dict]:
+    """由新到舊取得交易紀錄的一段"""
+    return db.ledger.page(guild_id, user_id, limit, offset)
+
+
+def get_transaction_history_count(guild_id: int, user_id: int) -> int:
+    return db.ledger.count(guild_id, user_id)
+
+
+async def compact_transaction_history():
+    try:
+        while True:
+            try:
+                removed = await asyncio.to_thread(db.ledger.compact)
+                if removed:
+                    log(f"Compacted {removed} old economy transaction(s)", module_name="Economy")
+            except Exception as e:
+                log(f"Failed to compact economy transactions: {e}", level=logging.ERROR, module_name="Economy")
+            await asyncio.sleep(LEDGER_COMPACT_INTERVAL)
+    except asyncio.CancelledError:
+        pass
+on_ready_tasks.append(compact_transaction_history)
 
-OWNER_ECONOMY_SCOPE_KEYS = ("economy_balance", "economy_history", "items", "admin_items")
+
+OWNER_ECONOMY_SCOPE_KEYS = ("economy_balance", "items", "admin_items")
 
 
 def _owner_scope_label(guild_id: int) -> str:
@@ -785,25 +812,34 @@ def _owner_scope_label(guild_id: int) -> str:
 
 
 def _owner_get_user_scope_ids(user_id: int) -> list[int]:
+    db.flush()
+    # economy_balance and items live in their own tables
+    user_data_keys = [key for key in OWNER_ECONOMY_SCOPE_KEYS if key not in ("economy_balance", "items")]
     with sqlite3.connect(db.db_path) as conn:
         cursor = conn.cursor()
-        placeholders = ",".join("?" for _ in OWNER_ECONOMY_SCOPE_KEYS)
+        placeholders = ",".join("?" for _ in user_data_keys)
         cursor.execute(
             f"""
-            SELECT DISTINCT guild_id
+            SELECT guild_id
             FROM user_data
             WHERE user_id = ?
               AND data_key IN ({placeholders})
+            UNION
+            SELECT guild_id FROM user_balances WHERE user_id = ?
+            UNION
+            SELECT guild_id FROM user_items WHERE user_id = ?
+            UNION
+            SELECT guild_id FROM economy_transactions WHERE user_id = ?
             ORDER BY guild_id
             """,
-            (user_id, *OWNER_ECONOMY_SCOPE_KEYS),
+            (user_id, *user_data_keys, user_id, user_id, user_id),
         )
         return [int(row[0]) for row in cursor.fetchall()]
 
 
 def _owner_get_scope_snapshot(guild_id: int, user_id: int) -> dict:
     balance = get_balance(guild_id, user_id)
-    history = get_user_data(guild_id, user_id, "economy_history", []) or []
+    history_count = get_transaction_history_count(guild_id, user_id)
     items_data = get_user_data(guild_id, user_id, "items", {}) or {}
     admin_items = get_user_data(guild_id, user_id, "admin_items", {}) or {}
     item_units = sum(count for count in items_data.values() if isinstance(count, (int, float)) and count > 0)
@@ -812,8 +848,7 @@ def _owner_get_scope_snapshot(guild_id: int, user_id: int) -> dict:
         "guild_id": guild_id,
         "label": _owner_scope_label(guild_id),
         "balance": float(balance or 0.0),
-        "history": history,
-        "history_count": len(history),
+        "history_count": history_count,
         "items": items_data,
         "item_units": int(item_units),
         "admin_items": admin_items,
@@ -904,10 +939,9 @@ def _owner_preview_line(title: str, entries: dict, limit: int = 8) -> str:
 
 
 def _owner_history_lines_for_scope(user_id: int, guild_id: int, limit: int = 20) -> list[str]:
-    history_data = get_user_data(guild_id, user_id, "economy_history", []) or []
-    if not history_data:
+    recent_entries = get_transaction_history(guild_id, user_id, limit)
+    if not recent_entries:
         return []
-    recent_entries = list(reversed(history_data[-limit:]))
     lines = []
     for entry in recent_entries:
         tx_type = entry.get("type", "未知")
@@ -1058,16 +1092,16 @@ def _owner_build_history_detail_view(target_user: discord.User, guild_id: int, l
 
     return view
 
-def add_balance(guild_id: int, user_id: int, amount: float):
+def add_balance(guild_id: int, user_id: int, amount: float, record: tuple[str, str, str] | None = None):
     """增加用戶餘額並追蹤供給量"""
-    success, _, _ = mutate_balance_atomic(guild_id, user_id, amount)
+    success, _, _ = mutate_balance_atomic(guild_id, user_id, amount, record=record)
     if success and guild_id != GLOBAL_GUILD_ID:
         adjust_supply(guild_id, amount)
 
 
-def remove_balance(guild_id: int, user_id: int, amount: float) -> bool:
+def remove_balance(guild_id: int, user_id: int, amount: float, record: tuple[str, str, str] | None = None) -> bool:
     """扣除用戶餘額，餘額不足時回傳 False"""
-    success, _, _ = mutate_balance_atomic(guild_id, user_id, -amount)
+    success, _, _ = mutate_balance_atomic(guild_id, user_id, -amount, record=record)
     if success and guild_id != GLOBAL_GUILD_ID:
         adjust_supply(guild_id, -amount)
     return success
@@ -1079,28 +1113,33 @@ def mutate_balance_atomic(
     delta: float,
     *,
     connection=None,
+    record: tuple[str, str, str] | None = None,
 ) -> tuple[bool, float, float]:
     """Atomically change a balance, optionally inside the caller's transaction.
 
     Returns ``(success, balance_before, balance_after)``. A negative result is
     rejected without modifying the row. Passing ``connection`` lets callers
     update game state and balance in the same SQLite transaction.
+    ``record=(tx_type, currency, detail)`` appends the matching
+    economy_transactions row in that same transaction.
     """
     guild_id = int(guild_id or GLOBAL_GUILD_ID)
     user_id = int(user_id)
     delta = round(float(delta), 2)
     owns_connection = connection is None
+    # Commit queued set_user_data writes first so the raw read below is current.
+    db.flush()
     conn = connection or sqlite3.connect(db.db_path, timeout=30)
     try:
         if owns_connection:
             conn.execute("BEGIN IMMEDIATE")
         row = conn.execute(
             """
-            SELECT data_value
-            FROM user_data
-            WHERE user_id = ? AND guild_id = ? AND data_key = 'economy_balance'
+            SELECT balance
+            FROM user_balances
+            WHERE guild_id = ? AND user_id = ?
             """,
-            (user_id, guild_id),
+            (guild_id, user_id),
         ).fetchone()
         try:
             balance_before = float(row[0]) if row else 0.0
@@ -1124,13 +1163,19 @@ def mutate_balance_atomic(
 
         conn.execute(
             """
-            INSERT INTO user_data (user_id, guild_id, data_key, data_value)
-            VALUES (?, ?, 'economy_balance', ?)
-            ON CONFLICT(user_id, guild_id, data_key)
-            DO UPDATE SET data_value = excluded.data_value
+            INSERT INTO user_balances (user_id, guild_id, balance)
+            VALUES (?, ?, ?)
+            ON CONFLICT(guild_id, user_id)
+            DO UPDATE SET balance = excluded.balance
             """,
-            (user_id, guild_id, str(round(balance_after, 2))),
+            (user_id, guild_id, round(balance_after, 2)),
         )
+        if record is not None:
+            tx_type, currency, detail = record
+            log_transaction(
+                guild_id, user_id, tx_type, delta, currency, detail,
+                balance_after=balance_after, connection=conn,
+            )
         if owns_connection:
             conn.commit()
         return True, balance_before, balance_after
@@ -1960,7 +2005,7 @@ class Economy(commands.GroupCog, name="economy", description="經濟系統指令
                 target_balance_before=get_global_balance(user_id) - received,
                 target_balance_after=get_global_balance(user_id),
                 rate_before=rate,
-                rate_after=get_exchange_rate(guild_id),
+                rate_after=economy_aggregates.projected_rate(guild_id, DEFAULT_EXCHANGE_RATE),
                 detail=f"Server currency exchanged to global. Received {received:,.2f} {GLOBAL_CURRENCY_NAME}.",
                 color=0x3498DB,
             )
@@ -1978,7 +2023,7 @@ class Economy(commands.GroupCog, name="economy", description="經濟系統指令
                 target_balance_before=global_bal,
                 target_balance_after=global_bal - amount,
                 rate_before=rate,
-                rate_after=get_exchange_rate(guild_id),
+                rate_after=economy_aggregates.projected_rate(guild_id, DEFAULT_EXCHANGE_RATE),
                 detail=f"Global currency exchanged to server. Spent {amount:,.2f} {GLOBAL_CURRENCY_NAME}.",
                 color=0x3498DB,
             )
@@ -2522,44 +2567,20 @@ class Economy(commands.GroupCog, name="economy", description="經濟系統指令
         rate = get_exchange_rate(guild_id)
 
         if currency == "server":
-            all_users = get_all_user_data(guild_id, "economy_balance")
-            sorted_users = sorted(
-                all_users.items(),
-                key=lambda x: x[1].get("economy_balance", 0),
-                reverse=True
-            )
+            sorted_users = db.get_top_balances(guild_id, 10)
             title = f"🏆 {currency_name} 排行榜"
-            key_name = "economy_balance"
         elif currency == "global":
-            all_users = get_all_user_data(GLOBAL_GUILD_ID, "economy_balance")
-            sorted_users = sorted(
-                all_users.items(),
-                key=lambda x: x[1].get("economy_balance", 0),
-                reverse=True
-            )
+            sorted_users = db.get_top_balances(GLOBAL_GUILD_ID, 10)
             title = f"🏆 {GLOBAL_CURRENCY_NAME} 排行榜"
-            key_name = "economy_balance"
         else:
-            all_server = get_all_user_data(guild_id, "economy_balance")
-            all_global = get_all_user_data(GLOBAL_GUILD_ID, "economy_balance")
-            combined = {}
-            all_ids = set(all_server.keys()) | set(all_global.keys())
-            for uid in all_ids:
-                s_bal = all_server.get(uid, {}).get("economy_balance", 0)
-                g_bal = all_global.get(uid, {}).get("economy_balance", 0)
-                combined[uid] = {"total": s_bal * rate + g_bal}
-            sorted_users = sorted(combined.items(), key=lambda x: x[1].get("total", 0), reverse=True)
+            sorted_users = db.get_top_combined_balances(guild_id, rate, 10)
             title = "🏆 總資產排行榜"
-            key_name = "total"
 
         embed = discord.Embed(title=title, color=0xf1c40f)
         medals = ["🥇", "🥈", "🥉"]
 
         displayed = 0
-        for i, (user_id, data) in enumerate(sorted_users[:15]):
-            bal = data.get(key_name, 0)
-            if bal <= 0:
-                continue
+        for user_id, bal in sorted_users:
 
             if currency == "server":
                 display = f"{bal:,.2f} {currency_name}"
@@ -2749,19 +2770,16 @@ class Economy(commands.GroupCog, name="economy", description="經濟系統指令
             guild_id = interaction.guild.id
             scope_name = interaction.guild.name
 
-        history_data = get_user_data(guild_id, user_id, "economy_history", [])
-        if not history_data:
+        total = get_transaction_history_count(guild_id, user_id)
+        if not total:
             await interaction.response.send_message(f"📜 你在 {scope_name} 沒有任何交易紀錄。", ephemeral=True)
             return
 
-        # 由新到舊排序
-        history_data = list(reversed(history_data))
-        per_page = 10
-        total_pages = max(1, (len(history_data) + per_page - 1) // per_page)
+        # 由新到舊，只讀這一頁
+        per_page = HISTORY_PAGE_SIZE
+        total_pages = max(1, (total + per_page - 1) // per_page)
         page = max(1, min(page, total_pages))
-        start = (page - 1) * per_page
-        end = start + per_page
-        page_data = history_data[start:end]
+        page_data = get_transaction_history(guild_id, user_id, per_page, (page - 1) * per_page)
 
         embed = discord.Embed(
             title=f"📜 {interaction.user.display_name} 的交易紀錄（{scope_name}）",
@@ -2799,7 +2817,7 @@ class Economy(commands.GroupCog, name="economy", description="經濟系統指令
 
             embed.add_field(name=name, value=value, inline=False)
 
-        embed.set_footer(text=f"第 {page}/{total_pages} 頁 · 共 {len(history_data)} 筆紀錄")
+        embed.set_footer(text=f"第 {page}/{total_pages} 頁 · 共 {total} 筆紀錄")
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
 
@@ -3135,13 +3153,12 @@ class EconomyMod(commands.GroupCog, name="economymod", description="經濟系統
         tx_count = get_transaction_count(guild_id)
 
         # 計算所有用戶的餘額總和
-        all_users = get_all_user_data(guild_id, "economy_balance")
-        actual_supply = sum(d.get("economy_balance", 0) for d in all_users.values())
+        balance_holders, actual_supply = db.get_balance_summary(guild_id)
 
         # 計算管理員物品的總價值
         admin_item_value = 0
-        for uid in all_users.keys():
-            admin_items = get_user_data(guild_id, uid, "admin_items", {})
+        for admin_data in get_all_user_data(guild_id, "admin_items").values():
+            admin_items = admin_data.get("admin_items") or {}
             for item_id, count in admin_items.items():
                 item = get_item_by_id(item_id, guild_id)
                 if item:
@@ -3157,7 +3174,7 @@ class EconomyMod(commands.GroupCog, name="economymod", description="經濟系統
         embed.add_field(name="管理員注入（貨幣）", value=f"{admin_injected:,.2f}", inline=True)
         embed.add_field(name="管理員物品價值", value=f"{admin_item_value:,.2f}", inline=True)
         embed.add_field(name="交易次數", value=f"{tx_count:,}", inline=True)
-        embed.add_field(name="用戶數", value=f"{len(all_users):,}", inline=True)
+        embed.add_field(name="用戶數", value=f"{balance_holders:,}", inline=True)
         allow_flow = get_allow_global_flow(guild_id)
         embed.add_field(name="全域幣流通", value="🔓 已開啟" if allow_flow else "🔒 已關閉", inline=True)
         embed.add_field(name="全域模式", value="🌐 已啟用" if is_global_mode_enabled(guild_id) else "🏦 已關閉", inline=True)
@@ -3264,12 +3281,11 @@ async def dev_economy_history(ctx, user: discord.User, scope: str = "server", se
         await ctx.send("❌ 範圍必須是 'server' 或 'global'。")
         return
 
-    history_data = get_user_data(guild_id, user.id, "economy_history", [])
+    history_data = get_transaction_history(guild_id, user.id, 50)
     if not history_data:
         await ctx.send(f"📜 用戶 {user} 在 {scope} 沒有任何交易紀錄。")
         return
 
-    history_data = list(reversed(history_data))
     lines = []
     for entry in history_data:
         tx_type = entry.get("type", "未知")
@@ -3707,15 +3723,12 @@ async def dev_economy_history_plus(ctx, user: discord.User, scope: str = "all",
     rows = []
     if scope == "all":
         for current_guild_id in _owner_get_user_scope_ids(user.id):
-            history_data = get_user_data(current_guild_id, user.id, "economy_history", []) or []
-            for index, entry in enumerate(history_data):
-                rows.append((entry.get("time", ""), index, current_guild_id, entry))
+            for entry in get_transaction_history(current_guild_id, user.id, limit):
+                rows.append((entry["time"], entry["id"], current_guild_id, entry))
         rows.sort(key=lambda item: (item[0], item[1]), reverse=True)
         rows = rows[:limit]
     else:
-        history_data = get_user_data(guild_id, user.id, "economy_history", []) or []
-        rows = [(entry.get("time", ""), index, guild_id, entry) for index, entry in enumerate(reversed(history_data[:]))]
-        rows = rows[:limit]
+        rows = [(entry["time"], entry["id"], guild_id, entry) for entry in get_transaction_history(guild_id, user.id, limit)]
 
     if not rows:
         await ctx.send(f"📜 用戶 {user} 在 {scope} 沒有任何交易紀錄。")
@@ -3769,48 +3782,20 @@ async def dev_leaderboard(ctx: commands.Context, currency: str = "server", guild
         rate = None
 
     if currency == "server":
-        all_users = get_all_user_data(guild_id, "economy_balance")
-        sorted_users = sorted(
-            all_users.items(),
-            key=lambda x: x[1].get("economy_balance", 0),
-            reverse=True
-        )
+        sorted_users = db.get_top_balances(guild_id, 10)
         title = f"🏆 {currency_name} 排行榜"
-        key_name = "economy_balance"
     elif currency == "global":
-        all_users = get_all_user_data(GLOBAL_GUILD_ID, "economy_balance")
-        sorted_users = sorted(
-            all_users.items(),
-            key=lambda x: x[1].get("economy_balance", 0),
-            reverse=True
-        )
+        sorted_users = db.get_top_balances(GLOBAL_GUILD_ID, 10)
         title = f"🏆 {GLOBAL_CURRENCY_NAME} 排行榜"
-        key_name = "economy_balance"
     else:
-        all_server = get_all_user_data(guild_id, "economy_balance")
-        all_global = get_all_user_data(GLOBAL_GUILD_ID, "economy_balance")
-        combined = {}
-        all_ids = set(all_server.keys()) | set(all_global.keys())
-        for uid in all_ids:
-            s_bal = all_server.get(uid, {}).get("economy_balance", 0)
-            g_bal = all_global.get(uid, {}).get("economy_balance", 0)
-            combined[uid] = {"total": s_bal * rate + g_bal}
-        sorted_users = sorted(
-            combined.items(),
-            key=lambda x: x[1].get("total", 0),
-            reverse=True
-        )
+        sorted_users = db.get_top_combined_balances(guild_id, rate, 10)
         title = "🏆 總資產排行榜"
-        key_name = "total"
 
     embed = discord.Embed(title=title, color=0xf1c40f)
     medals = ["🥇", "🥈", "🥉"]
 
     displayed = 0
-    for user_id, data in sorted_users[:15]:
-        bal = data.get(key_name, 0)
-        if bal <= 0:
-            continue
+    for user_id, bal in sorted_users:
 
         if currency == "server":
             display = f"{bal:,.2f} {currency_name}"
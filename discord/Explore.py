@@ -1523,17 +1523,14 @@ def explore_buy_skin():
         _economy_mod.GLOBAL_GUILD_ID,
         user_id,
         -price,
+        record=(
+            'explore_skin',
+            getattr(_economy_mod, 'GLOBAL_CURRENCY_NAME', '全域幣'),
+            f"購買 Explore 皮膚 {skin['name']} ({skin_id})",
+        ),
     )
     if not success:
         return jsonify({'error': f'全域幣不足(需要 {price},你有 {balance_before:.0f})', 'balance': balance_before}), 400
-    try:
-        _economy_mod.log_transaction(
-            _economy_mod.GLOBAL_GUILD_ID, user_id, 'explore_skin',
-            -price, getattr(_economy_mod, 'GLOBAL_CURRENCY_NAME', '全域幣'),
-            f"購買 Explore 皮膚 {skin['name']} ({skin_id})",
-        )
-    except Exception:
-        pass
     add_user_owned_skin(user_id, skin_id)
     return jsonify({
         'success': True,
@@ -1,10 +1,10 @@
 from __future__ import annotations
 
 import asyncio
+import copy
 import ipaddress
 import logging
 import re
-import time
 import uuid
 from dataclasses import dataclass
 from typing import Any, Callable
@@ -15,14 +15,24 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 
-from globalenv import bot, get_emoji_by_name, get_server_config, set_server_config, start_bot
+from attachment_relay import AttachmentRelay, declared_size
+from globalenv import bot, config as bot_config, db, get_emoji_by_name, get_server_config, get_server_config_snapshot, modules, on_close_tasks, on_ready_tasks, set_server_config, start_bot
 from logger import log
+from resolution_cache import ResolutionCache
+
+if "OwnerTools" in modules:
+    import OwnerTools
 
 
 FIXLINK_CONFIG_KEY = "fixlink"
 FIXLINK_WEBHOOKS_KEY = "fixlink_webhooks"
 FIXEMBED_REVISION = "154"
 SHARE_CACHE_SECONDS = 600
+SHARE_FAILURE_CACHE_SECONDS = 60
+SHARE_CACHE_SIZE = 2048
+REDIRECT_CONNECTIONS_PER_HOST = 4
+ATTACHMENT_RELAY_MAX_BYTES = 100 * 1024 * 1024
+ATTACHMENT_SPOOL_BYTES = 4 * 1024 * 1024
 MAX_CUSTOM_PLATFORMS = 10
 MAX_GENERATED_URL_LENGTH = 1800
 MAX_REPLY_CHUNK_LENGTH = 1900
@@ -319,6 +329,39 @@ DEFAULT_FIXLINK_CONFIG = {
 }
 
 
+@dataclass(frozen=True)
+class CompiledRule:
+    hosts: frozenset[str] | None
+    path: re.Pattern
+    query_keys: frozenset[str]
+    query_any: frozenset[str]
+
+
+def _compile_builtin_routes() -> tuple[dict[str, str], dict[str, str], dict[str, tuple[CompiledRule, ...]]]:
+    hosts: dict[str, str] = {}
+    suffixes: dict[str, str] = {}
+    rules: dict[str, tuple[CompiledRule, ...]] = {}
+    for name, platform in supported_platforms.items():
+        for origin in platform.get("origins", []):
+            hosts.setdefault(origin, name)
+        for suffix in platform.get("origin_suffixes", []):
+            suffixes.setdefault(suffix, name)
+        rules[name] = tuple(
+            CompiledRule(
+                hosts=frozenset(rule["hosts"]) if rule.get("hosts") else None,
+                path=re.compile(rule["path"], re.IGNORECASE),
+                query_keys=frozenset(rule.get("query_keys", [])),
+                query_any=frozenset(rule.get("query_any", [])),
+            )
+            for rule in platform.get("rules", [])
+        )
+    return hosts, suffixes, rules
+
+
+# hostname -> 平台名稱、網域後綴 -> 平台名稱、平台名稱 -> 預先編譯的規則
+BUILTIN_HOSTS, BUILTIN_HOST_SUFFIXES, BUILTIN_RULES = _compile_builtin_routes()
+
+
 @dataclass(frozen=True)
 class ExtractedURL:
     url: str
@@ -511,14 +554,15 @@ def builtin_platform_for_hostname(hostname: str) -> str | None:
     normalized = str(hostname or "").casefold().rstrip(".")
     if normalized.startswith("www."):
         normalized = normalized[4:]
-    for name, platform in supported_platforms.items():
-        if normalized in platform.get("origins", []):
-            return name
-        if any(
-            normalized == suffix or normalized.endswith(f".{suffix}")
-            for suffix in platform.get("origin_suffixes", [])
-        ):
+    name = BUILTIN_HOSTS.get(normalized)
+    if name is not None:
+        return name
+    domain = normalized
+    while domain:
+        name = BUILTIN_HOST_SUFFIXES.get(domain)
+        if name is not None:
             return name
+        _, _, domain = domain.partition(".")
     return None
 
 
@@ -632,14 +676,23 @@ def _normalized_host(url: str, *, strip_www: bool = False) -> str:
 def match_builtin_platform(url: str) -> tuple[str, dict, Any, str] | None:
     try:
         parsed = urlsplit(url)
-        port = parsed.port
     except ValueError:
         return None
-    if parsed.scheme.casefold() not in {"http", "https"} or parsed.username or parsed.password:
+    if parsed.scheme.casefold() not in {"http", "https"}:
         return None
-    if port not in (None, 80, 443):
+    return _match_builtin_parsed(parsed)
+
+
+def _match_builtin_parsed(parsed) -> tuple[str, dict, Any, str] | None:
+    try:
+        port = parsed.port
+    except ValueError:
         return None
-    hostname = _normalized_host(url, strip_www=True)
+    if parsed.username or parsed.password or port not in (None, 80, 443):
+        return None
+    hostname = (parsed.hostname or "").casefold().rstrip(".")
+    if hostname.startswith("www."):
+        hostname = hostname[4:]
     platform_name = builtin_platform_for_hostname(hostname)
     if platform_name is None:
         return None
@@ -647,18 +700,19 @@ def match_builtin_platform(url: str) -> tuple[str, dict, Any, str] | None:
     if platform.get("special_handler"):
         return None
     decoded_path = unquote(parsed.path or "/")
-    query_keys = {key for key, _ in parse_qsl(parsed.query, keep_blank_values=True)}
-    for rule in platform.get("rules", []):
-        rule_hosts = rule.get("hosts")
-        if rule_hosts and hostname not in rule_hosts:
-            continue
-        if re.fullmatch(rule["path"], decoded_path, flags=re.IGNORECASE) is None:
-            continue
-        if not set(rule.get("query_keys", [])).issubset(query_keys):
+    query_keys = None
+    for rule in BUILTIN_RULES[platform_name]:
+        if rule.hosts is not None and hostname not in rule.hosts:
             continue
-        query_any = set(rule.get("query_any", []))
-        if query_any and query_any.isdisjoint(query_keys):
+        if rule.path.fullmatch(decoded_path) is None:
             continue
+        if rule.query_keys or rule.query_any:
+            if query_keys is None:
+                query_keys = {key for key, _ in parse_qsl(parsed.query, keep_blank_values=True)}
+            if not rule.query_keys.issubset(query_keys):
+                continue
+            if rule.query_any and rule.query_any.isdisjoint(query_keys):
+                continue
         return platform_name, platform, parsed, hostname
     return None
 
@@ -832,26 +886,77 @@ def build_custom_fixer_url(platform: dict, source_url: str) -> str:
     return urlunsplit((endpoint.scheme, endpoint.netloc, endpoint.path, urlencode(query_items), ""))
 
 
+class CustomPlatformTrie:
+    """Custom platforms by origin, then a character trie of their path prefixes; the longest prefix wins"""
+
+    def __init__(self, platforms: list[dict]):
+        self._origins: dict[str, dict] = {}
+        for platform in platforms:
+            for origin in platform.get("origins", []):
+                root = self._origins.setdefault(origin, {})
+                for prefix in platform.get("path_prefixes", []):
+                    node = root
+                    for character in prefix:
+                        node = node.setdefault(character, {})
+                    # None 代表有前綴在這裡結束；長度相同時保留先設定的平台
+                    node.setdefault(None, platform)
+
+    def find(self, hostname: str, decoded_path: str) -> dict | None:
+        node = self._origins.get(hostname)
+        if node is None:
+            return None
+        found = node.get(None)
+        for character in decoded_path:
+            node = node.get(character)
+            if node is None:
+                break
+            found = node.get(None, found)
+        return found
+
+
 def find_custom_platform(url: str, platforms: list[dict]) -> dict | None:
-    try:
-        parsed = urlsplit(url)
-    except ValueError:
-        return None
-    if parsed.scheme.casefold() not in {"http", "https"}:
-        return None
-    hostname = (parsed.hostname or "").casefold().rstrip(".")
-    decoded_path = unquote(parsed.path or "/")
-    candidates: list[tuple[int, dict]] = []
-    for platform in platforms:
-        if hostname not in platform.get("origins", []):
-            continue
-        for prefix in platform.get("path_prefixes", []):
-            if decoded_path.startswith(prefix):
-                candidates.append((len(prefix), platform))
-    if not candidates:
+    return FixLinkRouter({"custom_platforms": platforms}).find_custom(url)
+
+
+class FixLinkRouter:
+    """A guild's normalized config with its URL matchers compiled; built once per config change"""
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.custom = CustomPlatformTrie(config.get("custom_platforms", []))
+
+    @staticmethod
+    def _parse(url: str):
+        try:
+            parsed = urlsplit(url)
+        except ValueError:
+            return None
+        if parsed.scheme.casefold() not in {"http", "https"}:
+            return None
+        return parsed
+
+    def route(self, url: str) -> tuple[str, Any] | None:
+        """("threads", None), ("builtin", match_builtin_platform result), ("custom", platform) or None, parsing the URL once"""
+        parsed = self._parse(url)
+        if parsed is None:
+            return None
+        hostname = (parsed.hostname or "").casefold().rstrip(".")
+        if (hostname[4:] if hostname.startswith("www.") else hostname) in THREADS_HOSTS:
+            return "threads", None
+        builtin = _match_builtin_parsed(parsed)
+        if builtin is not None:
+            return "builtin", builtin
+        if self.custom._origins:
+            custom = self.custom.find(hostname, unquote(parsed.path or "/"))
+            if custom is not None:
+                return "custom", custom
         return None
-    candidates.sort(key=lambda item: item[0], reverse=True)
-    return candidates[0][1]
+
+    def find_custom(self, url: str) -> dict | None:
+        parsed = self._parse(url)
+        if parsed is None:
+            return None
+        return self.custom.find((parsed.hostname or "").casefold().rstrip("."), unquote(parsed.path or "/"))
 
 
 def chunk_lines(lines: list[str], *, max_length: int = MAX_REPLY_CHUNK_LENGTH) -> list[str]:
@@ -1507,13 +1612,27 @@ class FixLink(commands.GroupCog, name="fixlink", description="\u9023\u7d50\u4fee
         super().__init__()
         self.bot = client
         self.default_config = DEFAULT_FIXLINK_CONFIG
-        self._share_cache: dict[str, tuple[float, str | None]] = {}
-        self._share_inflight: dict[str, asyncio.Task] = {}
+        self.share_cache = ResolutionCache(
+            "fixlink_share_cache",
+            max_size=SHARE_CACHE_SIZE,
+            ttl=SHARE_CACHE_SECONDS,
+            negative_ttl=SHARE_FAILURE_CACHE_SECONDS,
+        )
+        self._http: aiohttp.ClientSession | None = None
         self._webhook_locks: dict[int, asyncio.Lock] = {}
         self._invalid_config_counts: dict[int, int] = {}
+        # guild_id -> (設定的原始 JSON, 編譯好的 router)
+        self._routers: dict[int, tuple[str | None, FixLinkRouter]] = {}
+
+    def get_router(self, guild_id: int) -> FixLinkRouter:
+        """The guild's compiled router; its ``config`` is shared and must not be modified"""
+        snapshot = get_server_config_snapshot(guild_id)
+        raw_value = snapshot.raw(FIXLINK_CONFIG_KEY)
+        cached = self._routers.get(guild_id)
+        if cached is not None and cached[0] == raw_value:
+            return cached[1]
 
-    def get_config(self, guild_id: int) -> dict:
-        raw = get_server_config(guild_id, FIXLINK_CONFIG_KEY, DEFAULT_FIXLINK_CONFIG)
+        raw = snapshot.get(FIXLINK_CONFIG_KEY, DEFAULT_FIXLINK_CONFIG)
         config = normalize_fixlink_config(raw)
         raw_custom_count = len(raw.get("custom_platforms", [])) if isinstance(raw, dict) and isinstance(raw.get("custom_platforms"), list) else 0
         invalid_count = max(0, raw_custom_count - len(config["custom_platforms"]))
@@ -1524,10 +1643,18 @@ class FixLink(commands.GroupCog, name="fixlink", description="\u9023\u7d50\u4fee
                 module_name="FixLink",
             )
         self._invalid_config_counts[guild_id] = invalid_count
-        return config
+        router = FixLinkRouter(config)
+        self._routers[guild_id] = (raw_value, router)
+        return router
+
+    def get_config(self, guild_id: int) -> dict:
+        """A copy of the guild's normalized config that the caller may modify and pass to ``save_config``"""
+        return copy.deepcopy(self.get_router(guild_id).config)
 
     def save_config(self, guild_id: int, config: dict) -> bool:
-        return bool(set_server_config(guild_id, FIXLINK_CONFIG_KEY, normalize_fixlink_config(config)))
+        saved = bool(set_server_config(guild_id, FIXLINK_CONFIG_KEY, normalize_fixlink_config(config)))
+        self._routers.pop(guild_id, None)
+        return saved
 
     @app_commands.command(name="settings", description="\u958b\u555f FixLink \u4e92\u52d5\u5f0f\u8a2d\u5b9a\u9762\u677f")
     async def settings(self, interaction: discord.Interaction):
@@ -1538,23 +1665,36 @@ class FixLink(commands.GroupCog, name="fixlink", description="\u9023\u7d50\u4fee
         await interaction.response.send_message(embed=view.build_embed(), view=view, ephemeral=True)
         view.message = await interaction.original_response()
 
+    def _http_session(self) -> aiohttp.ClientSession:
+        # 所有轉址查詢共用一組 keep-alive 連線，並限制對同一個 host 的同時連線數
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=5),
+                headers={"User-Agent": "Mozilla/5.0 (compatible; FixLink/1.0)"},
+                connector=aiohttp.TCPConnector(limit_per_host=REDIRECT_CONNECTIONS_PER_HOST, keepalive_timeout=60),
+            )
+        return self._http
+
+    async def close_http(self):
+        if self._http is not None and not self._http.closed:
+            await self._http.close()
+        self._http = None
+
     async def _fetch_threads_redirect(self, url: str) -> str | None:
-        timeout = aiohttp.ClientTimeout(total=5)
-        headers = {"User-Agent": "Mozilla/5.0 (compatible; FixLink/1.0)"}
+        session = self._http_session()
 
         async def request_redirect():
-            async with aiohttp.ClientSession(timeout=timeout, headers=headers) as session:
-                async with session.head(url, allow_redirects=True, max_redirects=5) as response:
-                    final_url = str(response.url)
-                    if response.status not in {405, 501} and parse_threads_url(final_url):
-                        return final_url
-                async with session.get(
-                    url,
-                    allow_redirects=True,
-                    max_redirects=5,
-                    headers={"Range": "bytes=0-0"},
-                ) as response:
-                    return str(response.url)
+            async with session.head(url, allow_redirects=True, max_redirects=5) as response:
+                final_url = str(response.url)
+                if response.status not in {405, 501} and parse_threads_url(final_url):
+                    return final_url
+            async with session.get(
+                url,
+                allow_redirects=True,
+                max_redirects=5,
+                headers={"Range": "bytes=0-0"},
+            ) as response:
+                return str(response.url)
 
         try:
             return await asyncio.wait_for(request_redirect(), timeout=5)
@@ -1565,34 +1705,24 @@ class FixLink(commands.GroupCog, name="fixlink", description="\u9023\u7d50\u4fee
         parts = parse_threads_url(url)
         if not parts or parts["kind"] != "share":
             return None
-        cache_key = parts["path"]
-        cached = self._share_cache.get(cache_key)
-        now = time.monotonic()
-        if cached and cached[0] > now:
-            return cached[1]
-        inflight = self._share_inflight.get(cache_key)
-        if inflight is None:
-            async def resolve_uncached():
-                resolved_url = await self._fetch_threads_redirect(
-                    urlunsplit(("https", "www.threads.com", parts["path"], "", ""))
-                )
-                resolved_parts = parse_threads_url(resolved_url) if resolved_url else None
-                if not resolved_parts or resolved_parts["kind"] != "post":
-                    resolved_url = None
-                cache_seconds = SHARE_CACHE_SECONDS if resolved_url else 60
-                self._share_cache[cache_key] = (time.monotonic() + cache_seconds, resolved_url)
-                return resolved_url
-
-            inflight = asyncio.create_task(resolve_uncached())
-            self._share_inflight[cache_key] = inflight
-        try:
-            return await inflight
-        finally:
-            if self._share_inflight.get(cache_key) is inflight and inflight.done():
-                self._share_inflight.pop(cache_key, None)
 
-    async def _match_url(self, extracted: ExtractedURL, config: dict) -> LinkMatch | None:
-        threads = parse_threads_url(extracted.url)
+        async def resolve_uncached():
+            resolved_url = await self._fetch_threads_redirect(
+                urlunsplit(("https", "www.threads.com", parts["path"], "", ""))
+            )
+            resolved_parts = parse_threads_url(resolved_url) if resolved_url else None
+            if not resolved_parts or resolved_parts["kind"] != "post":
+                return None
+            return resolved_url
+
+        return await self.share_cache.resolve(parts["path"], resolve_uncached)
+
+    async def _match_url(self, extracted: ExtractedURL, config: dict, router: FixLinkRouter) -> LinkMatch | None:
+        route = router.route(extracted.url)
+        if route is None:
+            return None
+        kind, target = route
+        threads = parse_threads_url(extracted.url) if kind == "threads" else None
         if threads:
             if "Threads" in config["disabled_platforms"]:
                 return None
@@ -1636,9 +1766,8 @@ class FixLink(commands.GroupCog, name="fixlink", description="\u9023\u7d50\u4fee
                 profile_url=f"https://www.threads.com/@{username}" if username else None,
             )
 
-        builtin = match_builtin_platform(extracted.url)
-        if builtin:
-            platform_name, platform, parsed, hostname = builtin
+        if kind == "builtin":
+            platform_name, platform, parsed, hostname = target
             if platform_name in config["disabled_platforms"]:
                 return None
             source_url, fixers = build_builtin_match_urls(
@@ -1669,8 +1798,10 @@ class FixLink(commands.GroupCog, name="fixlink", description="\u9023\u7d50\u4fee
                 profile_url=profile_url,
             )
 
-        custom = find_custom_platform(extracted.url, config["custom_platforms"])
-        if custom is None or f"custom:{custom['id']}" in config["disabled_platforms"]:
+        if kind != "custom":
+            return None
+        custom = target
+        if f"custom:{custom['id']}" in config["disabled_platforms"]:
             return None
         source_url = build_custom_source_url(
             extracted.url,
@@ -1691,11 +1822,13 @@ class FixLink(commands.GroupCog, name="fixlink", description="\u9023\u7d50\u4fee
             has_tracker=custom_url_has_tracker(extracted.url, custom["keep_query_keys"]),
         )
 
-    async def match_message(self, content: str, config: dict) -> list[LinkMatch]:
+    async def match_message(self, content: str, config: dict, router: FixLinkRouter | None = None) -> list[LinkMatch]:
         extracted = extract_urls(content)
         if not extracted:
             return []
-        matches = await asyncio.gather(*(self._match_url(item, config) for item in extracted))
+        if router is None:
+            router = FixLinkRouter(config)
+        matches = await asyncio.gather(*(self._match_url(item, config, router) for item in extracted))
         return sorted((match for match in matches if match is not None), key=lambda item: item.start)
 
     def _can_send(self, message: discord.Message) -> bool:
@@ -1801,9 +1934,15 @@ class FixLink(commands.GroupCog, name="fixlink", description="\u9023\u7d50\u4fee
             and can_send
             and channel_permissions.manage_messages
             and (not message.attachments or channel_permissions.attach_files)
+            and declared_size(message.attachments) <= self._attachment_limit(guild)
             and parent_permissions.manage_webhooks
         )
 
+    @staticmethod
+    def _attachment_limit(guild: discord.Guild) -> int:
+        # Nitro 使用者可以傳比伺服器上限更大的檔案，webhook 只能用伺服器的上限
+        return min(guild.filesize_limit, ATTACHMENT_RELAY_MAX_BYTES)
+
     def _webhook_mapping(self, guild_id: int) -> dict[str, str]:
         value = get_server_config(guild_id, FIXLINK_WEBHOOKS_KEY, {})
         if not isinstance(value, dict):
@@ -1839,16 +1978,14 @@ class FixLink(commands.GroupCog, name="fixlink", description="\u9023\u7d50\u4fee
             if mapping.pop(str(parent_id), None) is not None:
                 set_server_config(guild_id, FIXLINK_WEBHOOKS_KEY, mapping)
 
-    async def _attachment_files(self, message: discord.Message) -> list[discord.File]:
-        files: list[discord.File] = []
-        try:
-            for attachment in message.attachments:
-                files.append(await attachment.to_file(use_cached=True))
-        except Exception:
-            for file in files:
-                file.close()
-            raise
-        return files
+    async def _relay_attachments(self, message: discord.Message) -> AttachmentRelay:
+        relay = AttachmentRelay(
+            max_total_bytes=self._attachment_limit(message.guild),
+            spool_bytes=ATTACHMENT_SPOOL_BYTES,
+        )
+        if message.attachments:
+            await relay.fetch(self._http_session(), message.attachments, use_cached=True)
+        return relay
 
     async def _send_webhook_clone(
         self,
@@ -1860,38 +1997,40 @@ class FixLink(commands.GroupCog, name="fixlink", description="\u9023\u7d50\u4fee
         if guild is None or parent is None:
             raise RuntimeError("Missing guild or webhook parent")
         last_error: Exception | None = None
-        for attempt in range(2):
-            webhook = await self._get_or_create_webhook(guild, parent)
-            files: list[discord.File] = []
-            try:
-                files = await self._attachment_files(message)
-                send_kwargs = {
-                    "content": content,
-                    "username": message.author.display_name[:80],
-                    "avatar_url": str(message.author.display_avatar.url),
-                    "allowed_mentions": discord.AllowedMentions.none(),
-                    "wait": True,
-                }
-                if files:
-                    send_kwargs["files"] = files
-                if isinstance(message.channel, discord.Thread):
-                    send_kwargs["thread"] = message.channel
-                sent = await webhook.send(**send_kwargs)
-                if sent is None:
-                    raise RuntimeError("Webhook did not return a message")
-                return webhook, sent
-            except (discord.NotFound, discord.Forbidden, discord.HTTPException, RuntimeError) as error:
-                last_error = error
-                retryable = isinstance(error, discord.NotFound) or (
-                    isinstance(error, discord.HTTPException) and getattr(error, "status", None) in {401, 404}
-                )
-                if attempt == 0 and retryable:
-                    await self._invalidate_webhook(guild.id, parent.id)
-                    continue
-                raise
-            finally:
-                for file in files:
-                    file.close()
+        # 附件只下載一次，重試時直接從同一份暫存重新上傳
+        with await self._relay_attachments(message) as relay:
+            for attempt in range(2):
+                webhook = await self._get_or_create_webhook(guild, parent)
+                files: list[discord.File] = []
+                try:
+                    files = relay.files()
+                    send_kwargs = {
+                        "content": content,
+                        "username": message.author.display_name[:80],
+                        "avatar_url": str(message.author.display_avatar.url),
+                        "allowed_mentions": discord.AllowedMentions.none(),
+                        "wait": True,
+                    }
+                    if files:
+                        send_kwargs["files"] = files
+                    if isinstance(message.channel, discord.Thread):
+                        send_kwargs["thread"] = message.channel
+                    sent = await webhook.send(**send_kwargs)
+                    if sent is None:
+                        raise RuntimeError("Webhook did not return a message")
+                    return webhook, sent
+                except (discord.NotFound, discord.Forbidden, discord.HTTPException, RuntimeError) as error:
+                    last_error = error
+                    retryable = isinstance(error, discord.NotFound) or (
+                        isinstance(error, discord.HTTPException) and getattr(error, "status", None) in {401, 404}
+                    )
+                    if attempt == 0 and retryable:
+                        await self._invalidate_webhook(guild.id, parent.id)
+                        continue
+                    raise
+                finally:
+                    for file in files:
+                        file.close()
         raise last_error or RuntimeError("Webhook send failed")
 
     async def replace_with_webhook(self, message: discord.Message, matches: list[LinkMatch]) -> bool:
@@ -1957,10 +2096,11 @@ class FixLink(commands.GroupCog, name="fixlink", description="\u9023\u7d50\u4fee
     async def on_message(self, message: discord.Message):
         if message.guild is None or message.author.bot or message.webhook_id is not None or not message.content:
             return
-        config = self.get_config(message.guild.id)
+        router = self.get_router(message.guild.id)
+        config = router.config
         if not config["enabled"]:
             return
-        matches = await self.match_message(message.content, config)
+        matches = await self.match_message(message.content, config, router)
         if not matches:
             return
         should_use_webhook = config["webhook_mode"] and (
@@ -1973,7 +2113,39 @@ class FixLink(commands.GroupCog, name="fixlink", description="\u9023\u7d50\u4fee
 
 
 bot.add_dynamic_items(FixLinkDeleteButton)
-asyncio.run(bot.add_cog(FixLink(bot)))
+fixlink_cog = FixLink(bot)
+asyncio.run(bot.add_cog(fixlink_cog))
+
+
+async def load_share_cache():
+    if not bot_config("fixlink_share_cache_persist", True):
+        return
+    try:
+        await asyncio.to_thread(fixlink_cog.share_cache.attach, db.pool)
+        loaded = await asyncio.to_thread(fixlink_cog.share_cache.load)
+        log(f"Loaded {loaded} cached Threads share link(s).", module_name="FixLink")
+    except Exception as e:
+        log(f"Failed to load the Threads share link cache: {e}", level=logging.WARNING, module_name="FixLink")
+
+
+async def close_share_cache():
+    await asyncio.to_thread(fixlink_cog.share_cache.close)
+
+
+on_ready_tasks.append(load_share_cache)
+on_close_tasks.add(fixlink_cog.close_http)
+on_close_tasks.add(close_share_cache)
+
+
+@bot.command(aliases=["fls"])
+@((OwnerTools.is_owner()) if "OwnerTools" in modules else commands.check(lambda ctx: False))
+async def fixlinkstats(ctx: commands.Context):
+    stats = fixlink_cog.share_cache.stats()
+    await ctx.reply(
+        f"Threads \u5206\u4eab\u9023\u7d50\u5feb\u53d6 {stats['size']}/{stats['max_size']} \u9805\uff1a"
+        f"\u547d\u4e2d {stats['hits']}\u3001\u672a\u547d\u4e2d {stats['misses']}\u3001\u5408\u4f75 {stats['coalesced']}\u3001"
+        f"\u67e5\u8a62\u4e2d {stats['inflight']}\u3001\u6dd8\u6c70 {stats['evictions']}"
+    )
 
 
 if __name__ == "__main__":
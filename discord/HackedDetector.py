@@ -11,8 +11,8 @@ from pyfiglet import Figlet
 import re
 import random
 import asyncio
-import json
 from OwnerTools import is_owner
+from gateway_prefilter import decode_payload, may_match
 
 fonts = [
     "6x9",
@@ -645,18 +645,11 @@ class HackedDetector(commands.Cog):
 
     @commands.Cog.listener()
     async def on_socket_raw_receive(self, payload):
-        if isinstance(payload, bytes):
-            try:
-                payload = payload.decode("utf-8")
-            except Exception:
-                return
-        if not isinstance(payload, str):
-            return
-        try:
-            data = json.loads(payload)
-        except json.JSONDecodeError:
+        # skip the full JSON parse for every frame that cannot be a MESSAGE_CREATE with thumbhash attachments
+        if not sussy_thumbhashs or not may_match(payload, "MESSAGE_CREATE", '"placeholder"'):
             return
-        if data.get("t") != "MESSAGE_CREATE":
+        data = decode_payload(payload)
+        if data is None or data.get("t") != "MESSAGE_CREATE":
             return
 
         message = data.get("d", {})
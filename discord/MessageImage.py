@@ -1,4 +1,4 @@
-from PIL import Image, ImageDraw, ImageFont, ImageSequence
+from PIL import Image
 import io
 import os
 import sys
@@ -6,7 +6,7 @@ import discord
 import aiohttp
 from discord.ext import commands
 from discord import app_commands
-from globalenv import bot, start_bot, on_ready_tasks, modules, get_command_mention, config, get_server_config, set_server_config
+from globalenv import bot, start_bot, on_ready_tasks, on_close_tasks, modules, get_command_mention, config, get_server_config, set_server_config
 from playwright.async_api import async_playwright
 import asyncio
 import chat_exporter
@@ -14,10 +14,14 @@ from logger import log
 import logging
 import traceback
 import random
-import time
 import json
-import math
 import tempfile
+import multiprocessing
+import concurrent.futures
+from quote_render import EmojiCache, prepare_segments, render_quote
+from page_pool import PagePool, PagePoolFull
+from rate_limiter import format_retry_after, get_limiter, RateLimiter
+from media_jobs import MediaJobScheduler, MediaQueueFull, OutputCache, TemplateCache, compose_gif, load_gif_template, resize_screenshot
 if "OwnerTools" in modules:
     import OwnerTools
 
@@ -28,7 +32,6 @@ else:
     fontdir = os.path.join(os.path.dirname(__file__), 'assets')
 
 import re
-import emoji
 
 WHATTISTHISGUYTALKING_STATIC_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp"}
 WHATTISTHISGUYTALKING_GIF_EXTENSIONS = {".gif"}
@@ -36,11 +39,27 @@ WHATTISTHISGUYTALKING_VIDEO_EXTENSIONS = {".mp4", ".mov", ".webm", ".mkv"}
 WHATTISTHISGUYTALKING_GIF_COOLDOWN_SECONDS = 20
 WHATTISTHISGUYTALKING_VIDEO_COOLDOWN_SECONDS = 60
 DEFAULT_DISCORD_UPLOAD_LIMIT = 25 * 1024 * 1024
+MEDIA_COMMAND_TIMEOUT = 120
+QUOTE_RENDER_WORKERS = 2
+QUOTE_RENDER_TIMEOUT = 30
+SCREENSHOT_PAGES = 3
+SCREENSHOT_PAGE_MAX_USES = 50
+SCREENSHOT_QUEUE_LIMIT = 20
+# Force width to fit content so the screenshot isn't full width, and reveal spoilers
+SCREENSHOT_PAGE_SUFFIX = (
+    "<style>.chatlog__message-group { width: fit-content; } "
+    ".chatlog { padding: 0px 1rem 0px 0px !important; border-top: unset !important; width: fit-content; }</style>"
+    "<script>document.querySelectorAll('.spoiler--hidden').forEach(el => el.classList.remove('spoiler--hidden'));</script>"
+)
 
 whatisthisguytalking_media = {"static": [], "gif": [], "video": []}
-whatisthisguytalking_gif_cooldowns = {}
-whatisthisguytalking_video_cooldowns = {}
+whatisthisguytalking_gif_limiter = get_limiter("whatisthisguytalking_gif", 1, WHATTISTHISGUYTALKING_GIF_COOLDOWN_SECONDS)
+whatisthisguytalking_video_limiter = get_limiter("whatisthisguytalking_video", 1, WHATTISTHISGUYTALKING_VIDEO_COOLDOWN_SECONDS)
 whatisthisguytalking_images = []
+# GIF / 影片生成：限制同時執行的數量，依伺服器輪流處理，素材和成品都快取
+whatisthisguytalking_jobs = MediaJobScheduler()
+whatisthisguytalking_templates = TemplateCache()
+whatisthisguytalking_outputs = OutputCache()
 
 def resolve_mentions(text, message):
     guild = message.guild
@@ -67,413 +86,90 @@ def resolve_mentions(text, message):
     text = re.sub(r'<#(\d+)>', replace_channel, text)
     return text
 
-class Segment:
-    def __init__(self, type, content, url=None):
-        self.type = type # 'text' or 'emoji'
-        self.content = content
-        self.url = url
-        self.width = 0
-        self.height = 0
-        self.image = None
-
-async def prepare_segments(text, font):
-    segments = []
-    # Split by custom emojis <a:name:id> or <:name:id>
-    pattern = r'<(a?):(\w+):(\d+)>'
-    last_pos = 0
-    temp_segments = []
-    
-    for match in re.finditer(pattern, text):
-        if match.start() > last_pos:
-            temp_segments.append(Segment('text', text[last_pos:match.start()]))
-        
-        is_animated = match.group(1) == 'a'
-        name = match.group(2)
-        emoji_id = match.group(3)
-        ext = 'gif' if is_animated else 'png'
-        url = f"https://cdn.discordapp.com/emojis/{emoji_id}.{ext}"
-        
-        temp_segments.append(Segment('emoji', name, url))
-        last_pos = match.end()
-    
-    if last_pos < len(text):
-        temp_segments.append(Segment('text', text[last_pos:]))
-    
-    # Now process text segments for Unicode Emojis
-    final_segments = []
-    for seg in temp_segments:
-        if seg.type == 'text':
-             last_idx = 0
-             # emoji.analyze yields Token objects
-             for match in emoji.analyze(seg.content, non_emoji=False):
-                 start = match.value.start
-                 end = match.value.end
-                 char = match.chars
-                 
-                 if start > last_idx:
-                     final_segments.append(Segment('text', seg.content[last_idx:start]))
-                 
-                 final_segments.append(Segment('unicode_emoji', char))
-                 last_idx = end
-             
-             if last_idx < len(seg.content):
-                 final_segments.append(Segment('text', seg.content[last_idx:]))
+# 糟糕的 Make it a Quote：Pillow 的部分在 quote_render，這裡只負責下載和排程
+quote_emoji_cache = EmojiCache()
+_quote_session: aiohttp.ClientSession | None = None
+_quote_executor: concurrent.futures.Executor | None = None
+
+
+async def _get_quote_session() -> aiohttp.ClientSession:
+    """取得共用的 aiohttp session"""
+    global _quote_session
+    if _quote_session is None or _quote_session.closed:
+        _quote_session = aiohttp.ClientSession()
+    return _quote_session
+
+
+def _start_quote_executor() -> concurrent.futures.Executor | None:
+    """渲染用的 process pool；打包版或不支援的平台回傳 None 改用 thread"""
+    global _quote_executor
+    if _quote_executor is None and not getattr(sys, 'frozen', False):
+        # 不用 fork：機器人已經有別的 thread 在跑，fork 出來的子行程可能卡在別人持有的鎖上
+        # forkserver 只預先載入 quote_render，Windows 等沒有 forkserver 的平台改用 spawn
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(["quote_render"])
         else:
-             final_segments.append(seg)
-    
-    return final_segments
+            context = multiprocessing.get_context("spawn")
+        _quote_executor = concurrent.futures.ProcessPoolExecutor(max_workers=QUOTE_RENDER_WORKERS, mp_context=context)
+    return _quote_executor
 
-def get_text_size(text, font):
-    # 使用 getlength 來獲取正確的寬度（包含空格）
-    try:
-        width = font.getlength(text)
-    except AttributeError:
-        # 舊版 Pillow 備用方案
-        bbox = font.getmask(text).getbbox()
-        width = bbox[2] - bbox[0] if bbox else 0
-    
-    # 高度使用 getbbox 或 getmetrics
-    bbox = font.getmask(text).getbbox()
-    if bbox:
-        height = bbox[3] - bbox[1]
-    else:
-        # 對於純空格，使用字體的 metrics
-        ascent, descent = font.getmetrics()
-        height = ascent + descent
-    
-    return int(width), height
-
-def get_twemoji_url(emoji_char):
-    """將 Unicode emoji 轉換為 Twemoji CDN URL"""
-    # 將 emoji 轉換為 codepoints
-    codepoints = []
-    for char in emoji_char:
-        cp = ord(char)
-        # 跳過變體選擇器 (FE0E, FE0F)
-        if cp not in (0xFE0E, 0xFE0F):
-            codepoints.append(f"{cp:x}")
-    
-    filename = "-".join(codepoints)
-    return f"https://cdn.jsdelivr.net/gh/twitter/twemoji@latest/assets/72x72/{filename}.png"
-
-def render_sheared_text(text, font_path, font_size, fill="white", shear=0.2, scale=4):
-    """Render italic-like text at a higher resolution, then downsample for sharper output."""
-    hi_font = ImageFont.truetype(font_path, font_size * scale)
-    bbox = hi_font.getbbox(text)
-    text_w = max(bbox[2] - bbox[0], 1)
-    text_h = max(bbox[3] - bbox[1], 1)
-
-    padding = 12 * scale
-    canvas_w = text_w + padding * 2
-    canvas_h = text_h + padding * 2
-
-    text_img = Image.new("RGBA", (canvas_w, canvas_h), (0, 0, 0, 0))
-    text_draw = ImageDraw.Draw(text_img)
-    text_draw.text((padding - bbox[0], padding - bbox[1]), text, font=hi_font, fill=fill)
-
-    sheared = text_img.transform(
-        text_img.size,
-        Image.AFFINE,
-        (1, shear, 0, 0, 1, 0),
-        resample=Image.Resampling.BICUBIC,
-    )
 
-    downsampled = sheared.resize(
-        (max(sheared.width // scale, 1), max(sheared.height // scale, 1)),
-        Image.Resampling.LANCZOS,
-    )
-    cropped_bbox = downsampled.getbbox()
-    return downsampled.crop(cropped_bbox) if cropped_bbox else downsampled
-
-def draw_quote_signature(target_img, center_x, name_y, name):
-    """Draw the author name on the final opaque image to avoid fuzzy edges from later compositing."""
-    sheared_name = render_sheared_text(
-        f" - {name}",
-        os.path.join(fontdir, "notolight.ttf"),
-        25,
-        fill="white",
-        shear=0.2,
-        scale=4,
-    )
-    name_x = center_x - sheared_name.width // 2
-    target_img.paste(sheared_name, (name_x, int(name_y)), sheared_name)
-
-async def load_emojis(segments, size):
-    async with aiohttp.ClientSession() as session:
-        for seg in segments:
-            if seg.type == 'emoji' and seg.url:
-                try:
-                    async with session.get(seg.url) as resp:
-                        if resp.status == 200:
-                            data = await resp.read()
-                            img = Image.open(io.BytesIO(data)).convert("RGBA")
-                            img = img.resize((size, size), Image.Resampling.LANCZOS)
-                            seg.image = img
-                            seg.width = size
-                            seg.height = size
-                except Exception as e:
-                    print(f"Failed to load emoji {seg.url}: {e}")
-                    # Fallback to text representation
-                    seg.type = 'text'
-                    seg.content = f":{seg.content}:"
-            
-            # 處理 Unicode emoji - 從 Twemoji 下載圖片
-            elif seg.type == 'unicode_emoji':
-                url = get_twemoji_url(seg.content)
-                try:
-                    async with session.get(url) as resp:
-                        if resp.status == 200:
-                            data = await resp.read()
-                            img = Image.open(io.BytesIO(data)).convert("RGBA")
-                            img = img.resize((size, size), Image.Resampling.LANCZOS)
-                            seg.image = img
-                            seg.width = size
-                            seg.height = size
-                        else:
-                            # 如果下載失敗，保留為文字
-                            print(f"Failed to load unicode emoji {seg.content}, status: {resp.status}")
-                except Exception as e:
-                    print(f"Failed to load unicode emoji {seg.content}: {e}")
-
-def _is_cjk(char):
-    """判斷字元是否為 CJK（中日韓）字元，用於逐字換行"""
-    cp = ord(char)
-    return (
-        (0x4E00 <= cp <= 0x9FFF) or    # CJK Unified Ideographs
-        (0x3400 <= cp <= 0x4DBF) or    # CJK Unified Ideographs Extension A
-        (0x20000 <= cp <= 0x2A6DF) or  # CJK Unified Ideographs Extension B
-        (0x2A700 <= cp <= 0x2B73F) or  # CJK Unified Ideographs Extension C
-        (0x2B740 <= cp <= 0x2B81F) or  # CJK Unified Ideographs Extension D
-        (0xF900 <= cp <= 0xFAFF) or    # CJK Compatibility Ideographs
-        (0x3000 <= cp <= 0x303F) or    # CJK Symbols and Punctuation
-        (0xFF00 <= cp <= 0xFFEF) or    # Halfwidth and Fullwidth Forms
-        (0x3040 <= cp <= 0x309F) or    # Hiragana
-        (0x30A0 <= cp <= 0x30FF) or    # Katakana
-        (0xAC00 <= cp <= 0xD7AF)       # Hangul Syllables
-    )
+def _discard_quote_executor(executor: concurrent.futures.ProcessPoolExecutor):
+    global _quote_executor
+    if _quote_executor is executor:
+        _quote_executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+    # shutdown 不會停掉正在跑的工作，卡住的子行程要自己結束
+    for process in list((getattr(executor, "_processes", None) or {}).values()):
+        process.terminate()
+
+
+async def _render_quote(segments, name, avatar_data, animate_gif):
+    executor = _start_quote_executor()
+    if executor is not None:
+        try:
+            return await asyncio.wait_for(
+                asyncio.get_running_loop().run_in_executor(executor, render_quote, segments, name, avatar_data, animate_gif),
+                timeout=QUOTE_RENDER_TIMEOUT,
+            )
+        except concurrent.futures.BrokenExecutor:
+            log("渲染 process pool 損壞，改用 thread", module_name="MessageImage", level=logging.WARNING)
+            _discard_quote_executor(executor)
+        except asyncio.TimeoutError:
+            log(f"渲染超過 {QUOTE_RENDER_TIMEOUT} 秒沒有回應，重建 process pool 並改用 thread", module_name="MessageImage", level=logging.WARNING)
+            _discard_quote_executor(executor)
+    return await asyncio.to_thread(render_quote, segments, name, avatar_data, animate_gif)
 
-def _split_text_for_wrapping(text):
-    """將文字拆分為可換行的單位：CJK 字元逐字拆分，其他按空白分割"""
-    tokens = []
-    buffer = ""
-    for char in text:
-        if _is_cjk(char):
-            if buffer:
-                # 先把累積的非 CJK 文字按空白分割加入
-                tokens.extend(re.split(r'(\s+)', buffer))
-                buffer = ""
-            tokens.append(char)
-        else:
-            buffer += char
-    if buffer:
-        tokens.extend(re.split(r'(\s+)', buffer))
-    return [t for t in tokens if t]  # 過濾空字串
-
-def layout_segments(segments, font, max_width, emoji_size, emoji_font=None):
-    lines = []
-    current_line = []
-    current_width = 0
-    
-    space_width, _ = get_text_size(" ", font) # Measure space once
-
-    for seg in segments:
-        if seg.type == 'emoji':
-             seg.width = emoji_size
-             seg.height = emoji_size
-        elif seg.type == 'unicode_emoji':
-             # Unicode emoji 將會被下載為圖片，使用與自定義 emoji 相同的尺寸
-             seg.width = emoji_size
-             seg.height = emoji_size
-        else: # text
-             pass # width calculated below
-
-        if seg.type == 'text':
-            # Split text logic - 使用支援 CJK 逐字換行的拆分
-            words = _split_text_for_wrapping(seg.content)
-            for word in words:
-                word_w, word_h = get_text_size(word, font)
-                if current_width + word_w > max_width and current_line:
-                     lines.append(current_line)
-                     current_line = []
-                     current_width = 0
-                
-                word_seg = Segment('text', word)
-                word_seg.width = word_w
-                word_seg.height = word_h
-                current_line.append(word_seg)
-                current_width += word_w
-        else:
-             # Emoji or Unicode Emoji
-             if current_width + seg.width > max_width and current_line:
-                 lines.append(current_line)
-                 current_line = []
-                 current_width = 0
-             current_line.append(seg)
-             current_width += seg.width
-                
-    if current_line:
-        lines.append(current_line)
-    return lines
 
 async def create(message: discord.Message, animate_gif=False) -> tuple[io.BytesIO, str]:
     name = message.author.display_name
-    avatar_url = message.author.display_avatar.url if message.author.display_avatar else None
     content = message.content.strip()
-    
+
     # Resolve mentions
     content = resolve_mentions(content, message)
+    segments = prepare_segments(content)
+
+    # 頭像和 emoji 同時下載
+    avatar_data, _ = await asyncio.gather(
+        message.author.display_avatar.read(),
+        quote_emoji_cache.load(await _get_quote_session(), segments),
+    )
+    data, ext = await _render_quote(segments, name, avatar_data, animate_gif)
 
-    # 1. 載入頭像資料
-    async with aiohttp.ClientSession() as session:
-        async with session.get(avatar_url) as resp:
-            avatar_data = await resp.read()
-            avatar_img = Image.open(io.BytesIO(avatar_data))
-    
-    # 判斷是否為動態圖片
-    is_animated = getattr(avatar_img, "is_animated", False)
-
-    width, height = 1200, 630
-
-    # --- 2. 建立「前景層」(文字與遮罩) ---
-    # 建立一個完全透明的圖層，我們把所有文字和遮罩畫在這裡，只需畫一次以節省效能
-    foreground = Image.new("RGBA", (width, height), (0, 0, 0, 0))
-    draw_fg = ImageDraw.Draw(foreground)
-
-    # 畫漸層弧形遮罩
-    for i in range(51):
-        alpha = min((i+1) * 5, 255)  
-        draw_fg.arc([-300 + i, -200, 630 + i, 1030], 270, 90, fill=(0, 0, 0, alpha), width=150)
-
-    # 畫右側黑底區塊
-    draw_fg.rectangle([540, 0, 700, 300], fill="black")
-
-    # Area constraints
-    x_min, x_max = 560, 1150
-    y_min, y_max = 50, 580
-    max_w = x_max - x_min
-    max_h = y_max - y_min
-
-    # Font handling with auto-shrink
-    font_size = 55
-    min_font_size = 20
-    final_lines = []
-    final_font = None
-    final_emoji_font = None
-
-    base_segments = await prepare_segments(content, None) 
-    
-    while font_size >= min_font_size:
-        font_msg = ImageFont.truetype(os.path.join(fontdir, "notobold.ttf"), font_size)
-        try:
-            emoji_font_obj = ImageFont.truetype(os.path.join(fontdir, "twemoji.ttf"), font_size)
-        except Exception:
-            emoji_font_obj = font_msg
-
-        ascent, descent = font_msg.getmetrics()
-        line_height = ascent + descent + 10
-        emoji_size = ascent + descent
-        
-        lines = layout_segments(base_segments, font_msg, max_w, emoji_size, emoji_font=emoji_font_obj)
-        total_height = len(lines) * line_height
-        
-        if total_height <= max_h or font_size == min_font_size:
-            final_lines = lines
-            final_font = font_msg
-            final_emoji_font = emoji_font_obj
-            break
-        
-        font_size -= 2 
-
-    # Load custom emojis
-    ascent, descent = final_font.getmetrics()
-    emoji_size = ascent + descent
-    await load_emojis(base_segments, emoji_size)
-
-    # Calculate vertical position
-    total_text_height = len(final_lines) * (emoji_size + 10) 
-    
-    font_name = ImageFont.truetype(os.path.join(fontdir, "notoregular.ttf"), 25)
-    name_w, name_h = get_text_size(f" - {name}", font_name)
-    
-    total_content_height = total_text_height + 20 + name_h
-    start_y = y_min + (max_h - total_content_height) // 2
-    
-    current_y = start_y
-    center_x = (x_min + x_max) // 2
-
-    # Draw Text and Emojis (畫在 foreground 上)
-    for line in final_lines:
-        line_width = sum(seg.width for seg in line)
-        start_x = center_x - line_width // 2
-        cursor_x = start_x
-        
-        for seg in line:
-            if seg.type == 'emoji' and seg.image:
-                foreground.paste(seg.image, (int(cursor_x), int(current_y)), seg.image)
-            elif seg.type == 'unicode_emoji':
-                if seg.image:
-                    foreground.paste(seg.image, (int(cursor_x), int(current_y)), seg.image)
-                else:
-                    draw_fg.text((cursor_x, current_y), seg.content, font=final_font, fill="white")
-            else:
-                draw_fg.text((cursor_x, current_y), seg.content, font=final_font, fill="white")
-            
-            cursor_x += seg.width
-        
-        current_y += emoji_size + 10
-
-    # Draw Name (畫在 foreground 上)
-    name_y = current_y + 20
-
-    # --- 3. 合成最終圖片 (處理 GIF 幀數或靜態 PNG) ---
-    output_buffer = io.BytesIO()
-
-    if is_animated and animate_gif:
-        frames = []
-        durations = []
-        
-        for frame in ImageSequence.Iterator(avatar_img):
-            # 取得每一幀的持續時間 (預設 50 毫秒)
-            durations.append(frame.info.get('duration', 50))
-            
-            # 處理單幀背景
-            frame_rgba = frame.convert("RGBA").resize((630, 630), Image.Resampling.LANCZOS)
-            base = Image.new("RGBA", (width, height), (0, 0, 0, 255))
-            base.paste(frame_rgba, (0, 0), frame_rgba)
-            
-            # 將前面準備好的文字前景疊加上去
-            combined = Image.alpha_composite(base, foreground)
-            draw_quote_signature(combined, center_x, name_y, name)
-            
-            # 轉換為 RGB 以利 GIF 儲存 (去透明底)
-            frames.append(combined.convert("RGB"))
-            
-        # 儲存為動態 GIF
-        frames[0].save(
-            output_buffer, 
-            format="GIF", 
-            save_all=True, 
-            append_images=frames[1:], 
-            duration=durations, 
-            loop=0,
-            optimize=True
-        )
-        ext = "gif"
-    else:
-        # 靜態 PNG 處理
-        avatar_rgba = avatar_img.convert("RGBA").resize((630, 630), Image.Resampling.LANCZOS)
-        base = Image.new("RGBA", (width, height), (0, 0, 0, 255))
-        base.paste(avatar_rgba, (0, 0), avatar_rgba)
-        
-        combined = Image.alpha_composite(base, foreground)
-        draw_quote_signature(combined, center_x, name_y, name)
-        combined.save(output_buffer, format="PNG")
-        ext = "png"
-
-    output_buffer.seek(0)
-    
     # 回傳 buffer 和副檔名，讓外層可以決定檔案名稱
-    return output_buffer, ext
+    return io.BytesIO(data), ext
+
+
+async def _close_quote_resources():
+    if _quote_session is not None and not _quote_session.closed:
+        await _quote_session.close()
+    if _quote_executor is not None:
+        _quote_executor.shutdown(wait=False, cancel_futures=True)
+
+on_close_tasks.add(_close_quote_resources)
+# 模組載入時就建好 pool，不等第一次渲染
+_start_quote_executor()
 
 
 class UpvoteView(discord.ui.View):
@@ -606,87 +302,59 @@ async def badquote(ctx: commands.Context):
 
 
 async def screenshot(message: discord.Message):
-    # check browser alive
-    global browser
-    if browser is None:
+    if not screenshot_pool.started:
         raise Exception("瀏覽器尚未啟動，請稍後再試。")
-    if not browser.is_connected():
-        raise Exception("瀏覽器已關閉，請稍後再試。")
-    
-    # make a stopwatch for debugging
-    times = {"getting_messages": 0, "generating_html": 0, "taking_screenshot": 0}
-    start_time = time.perf_counter()
+    metrics = screenshot_pool.metrics
 
     # try to get previous message (group consecutive messages from same author)
     messages = [message]
     message_time = message.created_at
-    try:
-        # Logic to find previous messages from the same author within reason
-        # This logic was slightly different in the two commands, unifying to the more robust history check
-        # However, the provided snippet for `screenshot_cmd` had a weird while loop with `current_msg.next()` which isn't standard discord.py async iterator usage.
-        # The `screenshot_generator` logic using `async for` is cleaner. Let's use that logic but adapted for a helper.
-        
-        # Note: The original context menu code appended to `messages` then seemingly relied on `chat_exporter` handling order or `messages` being in reverse order?
-        # `chat_exporter` usually expects messages in chronological order.
-        # The context menu code: `messages.append(msg)` inside `history(oldest_first=False)` means `messages` is [target, target-1, target-2].
-        # Then it passes this list to chat_exporter.
-
-        async for msg in message.channel.history(limit=10, before=message.created_at, oldest_first=False):
-            if msg.author.id == message.author.id and (message_time - msg.created_at).total_seconds() < 300:  # 5 minutes threshold
-                messages.append(msg)
-            else:
-                break
-    except Exception:
-        # traceback.print_exc()
-        pass
-    times["getting_messages"] = time.perf_counter() - start_time
-    start_time = time.perf_counter()
-    
-    # chat_exporter expects chronological order usually, so reverse to [target-2, target-1, target]
-    # messages.reverse()
+    with metrics.timer("fetch_history"):
+        try:
+            # messages is [target, target-1, target-2]; chat_exporter handles the order
+            async for msg in message.channel.history(limit=10, before=message.created_at, oldest_first=False):
+                if msg.author.id == message.author.id and (message_time - msg.created_at).total_seconds() < 300:  # 5 minutes threshold
+                    messages.append(msg)
+                else:
+                    break
+        except Exception:
+            # traceback.print_exc()
+            pass
 
     try:
-        html_content = await chat_exporter.raw_export(
-            message.channel,
-            messages=messages,
-            tz_info="Asia/Taipei",
-            guild=message.channel.guild,
-            bot=bot,
-            raise_exceptions=True
-        )
+        with metrics.timer("export_html"):
+            html_content = await chat_exporter.raw_export(
+                message.channel,
+                messages=messages,
+                tz_info="Asia/Taipei",
+                guild=message.channel.guild,
+                bot=bot,
+                raise_exceptions=True
+            )
     except Exception as e:
         log(f"生成 HTML 失敗: {e}", module_name="MessageImage", level=logging.ERROR)
         traceback.print_exc()
         raise Exception(f"生成 HTML 失敗: {e}")
-    times["generating_html"] = time.perf_counter() - start_time
-    start_time = time.perf_counter()
 
     try:
-        page = await browser.new_page(viewport={"width": 1920, "height": 1080})
-        await page.set_content(html_content, wait_until="load")
-        # Force width to fit content so the screenshot isn't full width
-        await page.add_style_tag(content=".chatlog__message-group { width: fit-content; } .chatlog { padding: 0px 1rem 0px 0px !important; border-top: unset !important; width: fit-content; }")
-        # Remove spoiler hidden class
-        await page.evaluate("() => { document.querySelectorAll('.spoiler--hidden').forEach(el => el.classList.remove('spoiler--hidden')); }")
-        # Resize viewport to fit the actual content size so nothing gets clipped
-        chatlog = page.locator('.chatlog')
-        bounding_box = await chatlog.bounding_box()
-        if bounding_box:
-            new_width = max(int(bounding_box['width'] + bounding_box['x']) + 50, 800)
-            new_height = max(int(bounding_box['height'] + bounding_box['y']) + 50, 600)
-            await page.set_viewport_size({"width": new_width, "height": new_height})
-        # Locate the message group container
-        image_bytes = await chatlog.screenshot(type="png")
-        await page.close()
+        async with screenshot_pool.page() as page:
+            with metrics.timer("render"):
+                # 樣式和 spoiler 處理直接放進 HTML，省掉兩次來回
+                await page.set_content(html_content + SCREENSHOT_PAGE_SUFFIX, wait_until="load")
+                # Resize viewport to fit the actual content size so nothing gets clipped
+                chatlog = page.locator('.chatlog')
+                bounding_box = await chatlog.bounding_box()
+                if bounding_box:
+                    new_width = max(int(bounding_box['width'] + bounding_box['x']) + 50, 800)
+                    new_height = max(int(bounding_box['height'] + bounding_box['y']) + 50, 600)
+                    await page.set_viewport_size({"width": new_width, "height": new_height})
+                image_bytes = await chatlog.screenshot(type="png")
+    except PagePoolFull:
+        raise
     except Exception as e:
+        metrics.increment("failed")
         log(f"截圖失敗: {e}", module_name="MessageImage", level=logging.ERROR)
-        # traceback.print_exc()
-        # If screenshot fails, maybe we want to return the HTML for debugging? 
-        # The original code did this in one place. For simplicity in a shared function, let's just raise.
         raise Exception(f"截圖失敗: {e}")
-    times["taking_screenshot"] = time.perf_counter() - start_time
-    # log the times for debugging
-    log(f"截圖生成成功: 取得訊息時間={times['getting_messages']*1000:.2f}ms, 生成HTML時間={times['generating_html']*1000:.2f}ms, 截圖時間={times['taking_screenshot']*1000:.2f}ms", module_name="MessageImage")
 
     return io.BytesIO(image_bytes)
 
@@ -753,21 +421,12 @@ def _pick_whatisthisguytalking_media(media_type: str | None = None) -> tuple[str
     raise RuntimeError("目前沒有可用的「這傢伙在說什麼呢」素材")
 
 
-def _resize_whatisthisguytalking_screenshot(screenshot_bytes: bytes, target_width: int) -> Image.Image:
-    with Image.open(io.BytesIO(screenshot_bytes)) as screenshot_pil_image:
-        screenshot_rgb = screenshot_pil_image.convert("RGB")
-
-    screenshot_aspect_ratio = screenshot_rgb.width / screenshot_rgb.height
-    new_screenshot_height = max(int(target_width / screenshot_aspect_ratio), 1)
-    return screenshot_rgb.resize((target_width, new_screenshot_height), Image.Resampling.LANCZOS)
-
-
 def _compose_whatisthisguytalking_png(
     screenshot_bytes: bytes,
     template_image: Image.Image,
 ) -> io.BytesIO:
     template_rgba = template_image.convert("RGBA")
-    resized_screenshot = _resize_whatisthisguytalking_screenshot(
+    resized_screenshot = resize_screenshot(
         screenshot_bytes,
         template_rgba.width,
     )
@@ -783,13 +442,18 @@ def _compose_whatisthisguytalking_png(
     return image_bytes
 
 
-async def _run_media_command(command: list[str]) -> tuple[int, str, str]:
+async def _run_media_command(command: list[str], timeout: float = MEDIA_COMMAND_TIMEOUT) -> tuple[int, str, str]:
     process = await asyncio.create_subprocess_exec(
         *command,
         stdout=asyncio.subprocess.PIPE,
         stderr=asyncio.subprocess.PIPE,
     )
-    stdout, stderr = await process.communicate()
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise RuntimeError(f"{command[0]} 執行超過 {timeout} 秒")
     return (
         process.returncode,
         stdout.decode("utf-8", errors="ignore"),
@@ -845,85 +509,49 @@ async def _extract_video_preview_frame(file_path: str) -> Image.Image:
             return frame_image.convert("RGBA").copy()
 
 
+def _open_whatisthisguytalking_template(file_path: str) -> Image.Image:
+    with Image.open(file_path) as template_image:
+        return template_image.convert("RGBA").copy()
+
+
 async def _load_whatisthisguytalking_preview_template(
     file_path: str,
     media_type: str,
 ) -> Image.Image:
     if media_type == "video":
-        return await _extract_video_preview_frame(file_path)
-
-    with Image.open(file_path) as template_image:
-        return template_image.convert("RGBA").copy()
+        loader = _extract_video_preview_frame
+    else:
+        loader = lambda path: asyncio.to_thread(_open_whatisthisguytalking_template, path)
+    return await whatisthisguytalking_templates.get_or_load(file_path, "preview", loader)
 
 
 async def _build_whatisthisguytalking_preview(screenshot_bytes: bytes) -> io.BytesIO:
     file_path, media_type = _pick_whatisthisguytalking_media()
     template_image = await _load_whatisthisguytalking_preview_template(file_path, media_type)
-    return _compose_whatisthisguytalking_png(screenshot_bytes, template_image)
+    return await asyncio.to_thread(_compose_whatisthisguytalking_png, screenshot_bytes, template_image)
 
 
-async def generate_whatisthisguytalking_gif(screenshot_bytes: bytes) -> io.BytesIO:
-    file_path, _ = _pick_whatisthisguytalking_media("gif")
-
-    with Image.open(file_path) as template_image:
-        resized_screenshot = _resize_whatisthisguytalking_screenshot(
-            screenshot_bytes,
-            template_image.width,
-        )
-        frames = []
-        durations = []
-        loop = template_image.info.get("loop", 0)
-
-        for frame in ImageSequence.Iterator(template_image):
-            frame_rgba = frame.convert("RGBA")
-            if frame_rgba.width != template_image.width:
-                new_height = max(
-                    int(frame_rgba.height * (template_image.width / frame_rgba.width)),
-                    1,
-                )
-                frame_rgba = frame_rgba.resize(
-                    (template_image.width, new_height),
-                    Image.Resampling.LANCZOS,
-                )
-
-            combined = Image.new(
-                "RGBA",
-                (template_image.width, resized_screenshot.height + frame_rgba.height),
-                (0, 0, 0, 255),
-            )
-            combined.paste(resized_screenshot, (0, 0))
-            combined.paste(frame_rgba, (0, resized_screenshot.height), frame_rgba)
-            frames.append(combined.convert("RGB"))
-            durations.append(
-                frame.info.get("duration", template_image.info.get("duration", 80)) or 80
-            )
-
-    if not frames:
-        raise RuntimeError("GIF 素材沒有可用的影格")
-
-    output_buffer = io.BytesIO()
-    frames[0].save(
-        output_buffer,
-        format="GIF",
-        save_all=True,
-        append_images=frames[1:],
-        duration=durations,
-        loop=loop,
-        optimize=True,
+async def _render_whatisthisguytalking_gif(file_path: str, screenshot_bytes: bytes) -> bytes:
+    template = await whatisthisguytalking_templates.get_or_load(
+        file_path,
+        "gif",
+        lambda path: asyncio.to_thread(load_gif_template, path),
     )
-    output_buffer.seek(0)
-    return output_buffer
+    return await asyncio.to_thread(compose_gif, screenshot_bytes, template)
 
 
-async def generate_whatisthisguytalking_video(screenshot_bytes: bytes) -> io.BytesIO:
-    file_path, _ = _pick_whatisthisguytalking_media("video")
-    target_width, _ = await _probe_video_dimensions(file_path)
-    resized_screenshot = _resize_whatisthisguytalking_screenshot(screenshot_bytes, target_width)
+async def _render_whatisthisguytalking_video(file_path: str, screenshot_bytes: bytes) -> bytes:
+    target_width, _ = await whatisthisguytalking_templates.get_or_load(
+        file_path,
+        "size",
+        _probe_video_dimensions,
+    )
 
     with tempfile.TemporaryDirectory(prefix="whatisthisguytalking-video-") as temp_dir:
         screenshot_path = os.path.join(temp_dir, "screenshot.png")
         output_path = os.path.join(temp_dir, "whatisthisguytalking.mp4")
-        resized_screenshot.save(screenshot_path, "PNG")
+        resized_screenshot = await asyncio.to_thread(resize_screenshot, screenshot_bytes, target_width)
+        await asyncio.to_thread(resized_screenshot.save, screenshot_path, "PNG")
 
         return_code, stdout, stderr = await _run_media_command([
             "ffmpeg",
@@ -961,26 +589,37 @@ async def generate_whatisthisguytalking_video(screenshot_bytes: bytes) -> io.Byt
             raise RuntimeError(f"生成影片失敗: {stderr.strip() or stdout.strip()}")
 
         with open(output_path, "rb") as video_file:
-            video_bytes = io.BytesIO(video_file.read())
+            return video_file.read()
+
+
+async def _render_whatisthisguytalking_media(job_key, media_type: str, render, screenshot_bytes: bytes) -> io.BytesIO:
+    """排進媒體工作佇列生成；同一張截圖配同一個素材直接用快取的成品"""
+    file_path, _ = _pick_whatisthisguytalking_media(media_type)
+    cache_key = whatisthisguytalking_outputs.key(screenshot_bytes, media_type, file_path)
+    data = whatisthisguytalking_outputs.get(cache_key)
+    if data is None:
+        data = await whatisthisguytalking_jobs.submit(job_key, render, file_path, screenshot_bytes)
+        whatisthisguytalking_outputs.put(cache_key, data)
+    return io.BytesIO(data)
+
 
-    video_bytes.seek(0)
-    return video_bytes
+async def generate_whatisthisguytalking_gif(screenshot_bytes: bytes, job_key=None) -> io.BytesIO:
+    return await _render_whatisthisguytalking_media(job_key, "gif", _render_whatisthisguytalking_gif, screenshot_bytes)
 
 
-def _consume_whatisthisguytalking_cooldown(
-    cooldowns: dict[int, float],
-    user_id: int,
-    cooldown_seconds: int,
-) -> int:
-    now = time.monotonic()
-    last_used = cooldowns.get(user_id)
-    if last_used is not None:
-        remaining = cooldown_seconds - (now - last_used)
-        if remaining > 0:
-            return math.ceil(remaining)
+async def generate_whatisthisguytalking_video(screenshot_bytes: bytes, job_key=None) -> io.BytesIO:
+    return await _render_whatisthisguytalking_media(job_key, "video", _render_whatisthisguytalking_video, screenshot_bytes)
 
-    cooldowns[user_id] = now
-    return 0
+
+def _media_job_key(interaction: discord.Interaction):
+    """媒體工作依伺服器輪流；私訊則各自算一份"""
+    return interaction.guild_id or ("user", interaction.user.id)
+
+
+async def _close_whatisthisguytalking_jobs():
+    await whatisthisguytalking_jobs.close()
+
+on_close_tasks.add(_close_whatisthisguytalking_jobs)
 
 
 def _get_interaction_upload_limit(interaction: discord.Interaction) -> int:
@@ -1073,8 +712,7 @@ class EnhancedWhatIsThisGuyTalkingView(UpvoteView):
         interaction: discord.Interaction,
         button: discord.ui.Button,
         media_type: str,
-        cooldowns: dict[int, float],
-        cooldown_seconds: int,
+        limiter: RateLimiter,
     ) -> bool:
         if self.user and interaction.user.id != self.user.id:
             await interaction.response.send_message("只有原本產生這張圖的人可以按這個按鈕。", ephemeral=True)
@@ -1084,12 +722,9 @@ class EnhancedWhatIsThisGuyTalkingView(UpvoteView):
             await interaction.response.send_message(f"目前沒有可用的 {media_type} 素材。", ephemeral=True)
             return False
 
-        remaining = _consume_whatisthisguytalking_cooldown(
-            cooldowns,
-            interaction.user.id,
-            cooldown_seconds,
-        )
-        if remaining > 0:
+        retry_after = limiter.hit(interaction.user.id)
+        if retry_after:
+            remaining = format_retry_after(retry_after)
             await interaction.response.send_message(
                 f"你還要等 {remaining} 秒才能再生成 {media_type}。",
                 ephemeral=True,
@@ -1107,6 +742,20 @@ class EnhancedWhatIsThisGuyTalkingView(UpvoteView):
 
         return True
 
+    async def _release_media_button(
+        self,
+        interaction: discord.Interaction,
+        button: discord.ui.Button,
+        limiter: RateLimiter,
+        message: str,
+    ):
+        # 佇列滿了沒有真的生成，按鈕和冷卻都還給使用者
+        limiter.reset(interaction.user.id)
+        button.disabled = False
+        button.style = discord.ButtonStyle.gray
+        await interaction.edit_original_response(view=self)
+        await interaction.followup.send(message, ephemeral=True)
+
     @discord.ui.button(emoji="🔄", style=discord.ButtonStyle.blurple)
     async def refresh(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.defer()
@@ -1128,14 +777,16 @@ class EnhancedWhatIsThisGuyTalkingView(UpvoteView):
             interaction,
             button,
             "gif",
-            whatisthisguytalking_gif_cooldowns,
-            WHATTISTHISGUYTALKING_GIF_COOLDOWN_SECONDS,
+            whatisthisguytalking_gif_limiter,
         )
         if not allowed:
             return
 
         try:
-            output_buffer = await generate_whatisthisguytalking_gif(self.screenshot_bytes)
+            output_buffer = await generate_whatisthisguytalking_gif(
+                self.screenshot_bytes,
+                _media_job_key(interaction),
+            )
             if output_buffer.getbuffer().nbytes > _get_interaction_upload_limit(interaction):
                 await interaction.followup.send("生成出的 GIF 超過這個地方的上傳限制。", ephemeral=True)
                 return
@@ -1144,6 +795,8 @@ class EnhancedWhatIsThisGuyTalkingView(UpvoteView):
                 attachments=[discord.File(output_buffer, filename="whatisthisguytalking.gif")],
                 view=self,
             )
+        except MediaQueueFull as e:
+            await self._release_media_button(interaction, button, whatisthisguytalking_gif_limiter, str(e))
         except discord.HTTPException as e:
             await interaction.followup.send(f"GIF 生成失敗: {e}", ephemeral=True)
         except Exception as e:
@@ -1155,14 +808,16 @@ class EnhancedWhatIsThisGuyTalkingView(UpvoteView):
             interaction,
             button,
             "video",
-            whatisthisguytalking_video_cooldowns,
-            WHATTISTHISGUYTALKING_VIDEO_COOLDOWN_SECONDS,
+            whatisthisguytalking_video_limiter,
         )
         if not allowed:
             return
 
         try:
-            output_buffer = await generate_whatisthisguytalking_video(self.screenshot_bytes)
+            output_buffer = await generate_whatisthisguytalking_video(
+                self.screenshot_bytes,
+                _media_job_key(interaction),
+            )
             if output_buffer.getbuffer().nbytes > _get_interaction_upload_limit(interaction):
                 await interaction.followup.send("生成出的影片超過這個地方的上傳限制。", ephemeral=True)
                 return
@@ -1171,30 +826,49 @@ class EnhancedWhatIsThisGuyTalkingView(UpvoteView):
                 attachments=[discord.File(output_buffer, filename="whatisthisguytalking.mp4")],
                 view=self,
             )
+        except MediaQueueFull as e:
+            await self._release_media_button(interaction, button, whatisthisguytalking_video_limiter, str(e))
         except discord.HTTPException as e:
             await interaction.followup.send(f"影片生成失敗: {e}", ephemeral=True)
         except Exception as e:
             await interaction.followup.send(f"影片生成失敗: {e}", ephemeral=True)
 
 
-browser = None
+_playwright = None
+
+
+async def _launch_browser():
+    global _playwright
+    if _playwright is None:
+        _playwright = await async_playwright().start()
+    return await _playwright.chromium.launch()
+
+
+screenshot_pool = PagePool(
+    _launch_browser,
+    size=SCREENSHOT_PAGES,
+    max_uses=SCREENSHOT_PAGE_MAX_USES,
+    queue_limit=SCREENSHOT_QUEUE_LIMIT,
+)
+
 
 async def setup_browser():
-    global browser
-    playwright = await async_playwright().start()
+    # 瀏覽器斷線時 pool 會在下一次借用頁面時重新啟動
     try:
-        browser = await playwright.chromium.launch()
+        await screenshot_pool.start()
     except Exception as e:
         log(f"啟動瀏覽器失敗: {e}", module_name="MessageImage", level=logging.ERROR)
-    log("Playwright 瀏覽器已啟動", module_name="MessageImage")
-    while True:
-        await asyncio.sleep(60)
-        if not browser.is_connected():
-            log("Playwright 瀏覽器已關閉，重新啟動中...", module_name="MessageImage", level=logging.WARNING)
-            browser = await playwright.chromium.launch()
-            log("Playwright 瀏覽器已重新啟動", module_name="MessageImage")
+        return
+    log(f"Playwright 瀏覽器已啟動（{SCREENSHOT_PAGES} 個頁面）", module_name="MessageImage")
+
+
+async def close_browser():
+    await screenshot_pool.close()
+    if _playwright is not None:
+        await _playwright.stop()
 
 on_ready_tasks.append(setup_browser)
+on_close_tasks.add(close_browser)
 
 async def load_whatisthisguytalking_images():
     global whatisthisguytalking_media, whatisthisguytalking_images
@@ -1212,6 +886,7 @@ async def load_whatisthisguytalking_images():
             whatisthisguytalking_media[media_type].append(file_path)
             whatisthisguytalking_images.append(file_path)
             count += 1
+        whatisthisguytalking_templates.retain(whatisthisguytalking_images)
         log(f"載入了 {count} 張「這傢伙在說什麼呢？」的圖片", module_name="MessageImage")
         return count
     except Exception as e:
@@ -1230,5 +905,21 @@ async def reload_whatisthisguytalking_images(ctx: commands.Context):
         await ctx.reply(f"重新載入「這傢伙在說什麼呢？」的圖片完成，載入了 {count} 張圖片")
 
 
+@bot.command(aliases=["sss"])
+@((OwnerTools.is_owner()) if "OwnerTools" in modules else commands.check(lambda ctx: False))
+async def screenshotstats(ctx: commands.Context):
+    lines = [f"頁面 {screenshot_pool.size} 個，等待中 {screenshot_pool.waiting} 個請求"]
+    for stage, stats in screenshot_pool.metrics.summary().items():
+        if "p50" in stats:
+            lines.append(f"- {stage}: {stats['count']} 次，p50 {stats['p50']:.0f}ms，p95 {stats['p95']:.0f}ms，最大 {stats['max']:.0f}ms")
+        else:
+            lines.append(f"- {stage}: {stats['count']} 次")
+    jobs = whatisthisguytalking_jobs
+    lines.append(f"媒體生成：執行中 {jobs.running} 個，排隊 {jobs.queued} 個，完成 {jobs.completed} 個，拒絕 {jobs.rejected} 個")
+    templates = whatisthisguytalking_templates
+    lines.append(f"素材快取 {len(templates)} 項（{templates.total_bytes / 1024 / 1024:.1f} MB，命中 {templates.hits} / 未命中 {templates.misses}），成品快取 {len(whatisthisguytalking_outputs)} 項")
+    await ctx.reply("\n".join(lines))
+
+
 if __name__ == "__main__":
     start_bot()
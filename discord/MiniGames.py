@@ -7,6 +7,7 @@ from globalenv import (
     set_server_config,
     get_all_server_config_key,
     get_emoji_mention_by_name,
+    db,
 )
 import discord
 from Economy import (
@@ -1285,10 +1286,10 @@ class MiniGamesCog(commands.GroupCog, group_name="games", description="迷你遊
             guild_id,
             interaction.user.id,
             -bet,
+            record=(tx_label, currency, detail),
         )
         if not success:
             return False
-        self._log_economy_history(guild_id, interaction.user.id, tx_label, -bet, detail)
         queue_economy_audit_log(
             audit_event,
             guild_id=guild_id,
@@ -1320,8 +1321,9 @@ class MiniGamesCog(commands.GroupCog, group_name="games", description="迷你遊
         if amount <= 0:
             return
         currency = get_currency_name(guild_id)
-        _, balance_before, balance_after = mutate_balance_atomic(guild_id, user_id, amount)
-        self._log_economy_history(guild_id, user_id, tx_label, amount, detail)
+        _, balance_before, balance_after = mutate_balance_atomic(
+            guild_id, user_id, amount, record=(tx_label, currency, detail)
+        )
         queue_economy_audit_log(
             audit_event,
             guild_id=guild_id,
@@ -1373,14 +1375,7 @@ class MiniGamesCog(commands.GroupCog, group_name="games", description="迷你遊
 
     @staticmethod
     def _lottery_payout_recorded(guild_id: int, user_id: int, round_id: str) -> bool:
-        history = get_user_data(guild_id, user_id, "economy_history", []) or []
-        marker = f"彩票輪次 {round_id}"
-        return any(
-            isinstance(entry, dict)
-            and entry.get("type") == "彩票派彩"
-            and marker in str(entry.get("detail", ""))
-            for entry in history
-        )
+        return db.ledger.has(guild_id, user_id, "彩票派彩", f"彩票輪次 {round_id}")
 
     def _lottery_status_embed(self, guild_id: int, state: Dict[str, Any]) -> discord.Embed:
         currency = get_currency_name(guild_id)
@@ -2318,17 +2313,11 @@ class MiniGamesCog(commands.GroupCog, group_name="games", description="迷你遊
             guild_id,
             interaction.user.id,
             -bet,
+            record=("Tower 下注", currency, f"下注 {bet:,.0f} {currency}"),
         )
         if not success:
             await interaction.response.send_message(f"餘額不足 {bet:,.0f} {currency}。", ephemeral=True)
             return False
-        self._log_economy_history(
-            guild_id,
-            interaction.user.id,
-            "Tower 下注",
-            -bet,
-            f"下注 {bet:,.0f} {currency}",
-        )
         queue_economy_audit_log(
             "tower_bet",
             guild_id=guild_id,
@@ -2448,13 +2437,11 @@ class MiniGamesCog(commands.GroupCog, group_name="games", description="迷你遊
             mult = TOWER_MULTIPLIERS[TOWER_LEVELS]
             payout = round(game.bet * mult, 2)
             currency = get_currency_name(game.guild_id)
-            _, balance_before, balance_after = mutate_balance_atomic(game.guild_id, game.user_id, payout)
-            self._log_economy_history(
+            _, balance_before, balance_after = mutate_balance_atomic(
                 game.guild_id,
                 game.user_id,
-                "Tower 提現",
                 payout,
-                f"通關自動提現，倍率 x{mult:.2f}，下注 {game.bet:,.0f} {currency}",
+                record=("Tower 提現", currency, f"通關自動提現，倍率 x{mult:.2f}，下注 {game.bet:,.0f} {currency}"),
             )
             queue_economy_audit_log(
                 "tower_cashout",
@@ -2521,13 +2508,11 @@ class MiniGamesCog(commands.GroupCog, group_name="games", description="迷你遊
         mult = TOWER_MULTIPLIERS[safe]
         payout = round(game.bet * mult, 2)
         currency = get_currency_name(game.guild_id)
-        _, balance_before, balance_after = mutate_balance_atomic(game.guild_id, game.user_id, payout)
-        self._log_economy_history(
+        _, balance_before, balance_after = mutate_balance_atomic(
             game.guild_id,
             game.user_id,
-            "Tower 提現",
             payout,
-            f"手動提現，倍率 x{mult:.2f}，下注 {game.bet:,.0f} {currency}",
+            record=("Tower 提現", currency, f"手動提現，倍率 x{mult:.2f}，下注 {game.bet:,.0f} {currency}"),
         )
         queue_economy_audit_log(
             "tower_cashout",
@@ -11,7 +11,7 @@ import ModerationNotify
 from logger import log
 import logging
 import re
-import time
+from rate_limiter import get_limiter
 
 ignore_message_ids = set()  # 用於暫時忽略特定訊息的處理（例如剛剛被刪除的訊息）
 BUILTIN_ACTIONS = {
@@ -205,7 +205,7 @@ async def ban_user(guild: discord.Guild, user: Union[discord.Member, discord.Use
     try:
         if duration > 0:
             unban_time = datetime.now(timezone.utc) + timedelta(seconds=duration)
-            set_user_data(guild.id, user.id, "unban_time", unban_time.isoformat())
+            set_user_data(guild.id, user.id, "unban_time", unban_time.isoformat(), durable=True)
         ModerationNotify.ignore_user(user.id)  # 避免重複通知
         try:
             notifymsg = await ModerationNotify.notify_user(user, guild, "封禁", reason, end_time=unban_time if duration > 0 else None, moderator=moderator)
@@ -260,7 +260,7 @@ async def check_unban():
                 for user in to_unban:
                     try:
                         await guild.unban(user, reason="自動解封")
-                        set_user_data(guild_id, user.id, "unban_time", None)
+                        set_user_data(guild_id, user.id, "unban_time", None, durable=True)
                         log(f"已自動解封 {user} 在 {guild.name} 的封禁。", module_name="Moderate", guild=guild)
                     except Exception as e:
                         log(f"解封 {user} 時發生錯誤：{e}", level=logging.ERROR, module_name="Moderate", guild=guild)
@@ -746,7 +746,7 @@ async def do_action_str(action: str, guild: Optional[discord.Guild] = None, user
                 else:
                     try:
                         await guild.unban(user, reason=reason)
-                        set_user_data(guild.id, user.id, "unban_time", None)
+                        set_user_data(guild.id, user.id, "unban_time", None, durable=True)
                         logs.append(f"解封用戶，原因: {reason}")
                     except Exception as e:
                         logs.append(f"解封用戶失敗：{e}")
@@ -832,7 +832,7 @@ async def do_action_str(action: str, guild: Optional[discord.Guild] = None, user
                     duration_seconds = timestr_to_seconds(cmd[1]) if cmd[1] != "0" else 0
                     until_time = datetime.now(timezone.utc) + timedelta(seconds=duration_seconds)
                     logs.append(f"強制驗證持續秒數: {duration_seconds}秒")
-                    set_server_config(guild.id, "force_verify_until", until_time.timestamp())
+                    set_server_config(guild.id, "force_verify_until", until_time.timestamp(), durable=True)
             else:
                 logs.append("無法執行 force_verify，因為 ServerWebVerify 模組未找到")
     return logs
@@ -1355,7 +1355,7 @@ class Moderate(commands.Cog):
         # 執行解封
         try:
             await guild.unban(user, reason="手動解封")
-            set_user_data(guild.id, user_id, "unban_time", None)
+            set_user_data(guild.id, user_id, "unban_time", None, durable=True)
         except Exception as e:
             await interaction.followup.send(f"解封時發生錯誤：{e}")
             return
@@ -1852,8 +1852,8 @@ active_requests = set()            # (guild_id, target_id, action)
 active_votes = {}                  # (guild_id, target_id) -> VoteView（None 表示建立中佔位）
 active_request_initiators = set()  # (guild_id, requester_id)：無權限者同時只能有一個進行中的請求
 active_vote_initiators = set()     # (guild_id, initiator_id)：無權限者同時只能有一個進行中的投票
-mod_creation_cooldowns = {}        # (guild_id, user_id) -> monotonic 建立時間
 MOD_CREATE_COOLDOWN = 60
+mod_creation_limiter = get_limiter("moderate_create", 1, MOD_CREATE_COOLDOWN)  # key: (guild_id, user_id)
 
 REQUEST_MODERATION_KEY = "request_moderation"
 REQUEST_SETTING_DEFAULTS = {"enabled": False, "max_duration": 0}
@@ -1884,15 +1884,8 @@ def _has_mod_bypass(member: discord.Member, perm: str) -> bool:
 
 def _check_creation_cooldown(guild_id: int, user_id: int) -> int:
     """回傳剩餘冷卻秒數，0 表示可建立。"""
-    key = (guild_id, user_id)
-    last = mod_creation_cooldowns.get(key)
-    if last is None:
-        return 0
-    elapsed = time.monotonic() - last
-    if elapsed >= MOD_CREATE_COOLDOWN:
-        mod_creation_cooldowns.pop(key, None)
-        return 0
-    return int(MOD_CREATE_COOLDOWN - elapsed) + 1
+    retry_after = mod_creation_limiter.retry_after((guild_id, user_id))
+    return int(retry_after) + 1 if retry_after else 0
 
 
 def _check_duration_limit(action: str, duration_seconds: int, max_seconds: int) -> Optional[str]:
@@ -2146,7 +2139,7 @@ class ModerationRequest(commands.GroupCog, name=app_commands.locale_str("request
             return
         active_requests.add(key)
         active_request_initiators.add((guild.id, interaction.user.id))
-        mod_creation_cooldowns[(guild.id, interaction.user.id)] = time.monotonic()
+        mod_creation_limiter.hit((guild.id, interaction.user.id))
 
         title = f"{interaction.user.name} 請求{zh} {user.name}"
         if action == "timeout":
@@ -2424,7 +2417,7 @@ class ModerationVote(commands.GroupCog, name=app_commands.locale_str("vote")):
             return
         active_votes[key] = None  # 佔位，避免併發重複發起
         active_vote_initiators.add((guild.id, interaction.user.id))
-        mod_creation_cooldowns[(guild.id, interaction.user.id)] = time.monotonic()
+        mod_creation_limiter.hit((guild.id, interaction.user.id))
 
         try:
             await interaction.response.defer()
@@ -951,6 +951,35 @@ async def listservers(ctx, query: str = None):
         await ctx.send("\n".join(servers_info[i:i+30]))
 
 
+@bot.command(aliases=["startup", "modprofile"])
+@is_owner()
+async def startupprofile(ctx, module: str = None):
+    loader = globalenv.module_loader
+    if loader is None:
+        await ctx.send("模組不是透過 all.py 載入的，沒有啟動資料。")
+        return
+    if module:
+        if module not in loader.deferred:
+            await ctx.send(f"模組 {module} 沒有在延遲載入。")
+            return
+        await loader.ensure_loaded(module, f"!{ctx.invoked_with}")
+        stat = loader.stats[module]
+        await ctx.send(f"已載入模組 {module}，耗時 {stat.seconds * 1000:.0f}ms。")
+        return
+    lines = []
+    for stat in loader.report():
+        memory = f"{stat.memory_bytes / 1024 / 1024:+.1f} MiB" if stat.memory_bytes is not None else "-"
+        if stat.status == "deferred":
+            lines.append(f"- {stat.name}: 延遲載入中")
+        elif stat.status == "failed":
+            lines.append(f"- {stat.name}: 載入失敗 ({stat.error})")
+        else:
+            lines.append(f"- {stat.name}: {stat.seconds * 1000:.0f}ms, {memory} ({stat.trigger})")
+    await ctx.send(f"模組載入總耗時 {loader.startup_seconds:.2f}s，延遲載入 {len(loader.deferred)} 個。")
+    for i in range(0, len(lines), 30):
+        await ctx.send("\n".join(lines[i:i+30]))
+
+
 @bot.command(aliases=["send", "s", "msg"])
 @is_owner()
 async def sendmessage(ctx, channel_id: int, *, message: str):
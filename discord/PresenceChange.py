@@ -3,7 +3,7 @@ import asyncio
 import discord
 from discord.ext import commands
 import random
-from globalenv import bot, start_bot, config, on_ready_tasks, modules, get_global_config
+from globalenv import bot, start_bot, config, on_ready_tasks, modules, get_counter_totals
 from logger import log
 import logging
 if "UtilCommands" in modules:
@@ -59,7 +59,7 @@ def load_config():
         name = name.replace("{random_number_1_100}", str(random.randint(1, 100)))
         name = name.replace("{full_version}", UtilCommands.full_version if UtilCommands else "unknown")
         name = name.replace("{uptime}", uptime_str)
-        name = name.replace("{command_stats}", str(sum(get_global_config("command_usage_stats", {}).values()) + sum(get_global_config("app_command_usage_stats", {}).values()) + sum(get_global_config("command_error_stats", {}).values()) + sum(get_global_config("app_command_error_stats", {}).values())))
+        name = name.replace("{command_stats}", str(sum(get_counter_totals("command_usage_stats").values()) + sum(get_counter_totals("app_command_usage_stats").values()) + sum(get_counter_totals("command_error_stats").values()) + sum(get_counter_totals("app_command_error_stats").values())))
         type_str = act.get("type", "playing").lower()
         type_enum = activity_type_map.get(type_str, discord.ActivityType.playing)
         if name:
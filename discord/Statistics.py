@@ -1,27 +1,47 @@
-from globalenv import bot, get_global_config, set_global_config, add_app_command_error_handler, get_user_data
+from globalenv import bot, add_app_command_error_handler, get_user_data, increment_counter, get_counter_totals, get_counter_series
 import discord
 from discord.ext import commands
 from discord import app_commands
-from threading import Semaphore
+from datetime import datetime, timedelta
 import asyncio
 
-semaphore = Semaphore()
+STATS_NAMESPACES = ("command_usage_stats", "command_error_stats", "app_command_usage_stats", "app_command_error_stats")
+
+
+def load_command_trends():
+    """近 24 小時 / 近 7 天的使用與錯誤次數（讀資料庫，請在執行緒中呼叫）"""
+    now = datetime.now()
+    hour_start = now - timedelta(hours=23)
+    day_start = now - timedelta(days=6)
+    trends = {}
+    for namespace in STATS_NAMESPACES:
+        trends[namespace] = (
+            sum(get_counter_series(namespace, "hour", hour_start).values()),
+            get_counter_series(namespace, "day", day_start),
+        )
+    return trends
 
 class Statistics(commands.GroupCog, name="stats"):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
         super().__init__()
         add_app_command_error_handler(self.on_app_command_error)
+
+    async def cog_load(self):
+        # 先把總數載入記憶體，之後查詢不用碰資料庫
+        for namespace in STATS_NAMESPACES:
+            await asyncio.to_thread(get_counter_totals, namespace)
     
     @app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
     @app_commands.allowed_installs(guilds=True, users=True)
     @app_commands.command(name="command", description="查看指令使用統計")
     @app_commands.describe(full="是否顯示完整統計數據")
     async def command_stats(self, interaction: discord.Interaction, full: bool = False):
-        command_stats = get_global_config("command_usage_stats", {})
-        command_error_stats = get_global_config("command_error_stats", {})
-        app_command_stats = get_global_config("app_command_usage_stats", {})
-        app_command_error_stats = get_global_config("app_command_error_stats", {})
+        command_stats = get_counter_totals("command_usage_stats")
+        command_error_stats = get_counter_totals("command_error_stats")
+        app_command_stats = get_counter_totals("app_command_usage_stats")
+        app_command_error_stats = get_counter_totals("app_command_error_stats")
+        trends = await asyncio.to_thread(load_command_trends)
 
         embed = discord.Embed(title="指令使用統計", color=discord.Color.blue())
         
@@ -48,6 +68,19 @@ class Statistics(commands.GroupCog, name="stats"):
         embed.add_field(name="應用程式指令使用次數", value=app_command_stats_str, inline=False)
         embed.add_field(name="應用程式指令錯誤次數", value=app_command_error_stats_str, inline=False)
 
+        # 趨勢（文字指令 + 應用程式指令）
+        usage_24h = trends["command_usage_stats"][0] + trends["app_command_usage_stats"][0]
+        error_24h = trends["command_error_stats"][0] + trends["app_command_error_stats"][0]
+        embed.add_field(name="近 24 小時", value=f"{usage_24h} 次使用 / {error_24h} 次錯誤", inline=False)
+        today = datetime.now().date()
+        daily_lines = []
+        for offset in range(6, -1, -1):
+            day_key = (today - timedelta(days=offset)).isoformat()
+            usage = sum(trends[namespace][1].get(day_key, 0) for namespace in ("command_usage_stats", "app_command_usage_stats"))
+            errors = sum(trends[namespace][1].get(day_key, 0) for namespace in ("command_error_stats", "app_command_error_stats"))
+            daily_lines.append(f"{day_key[5:]}: {usage} 次使用 / {errors} 次錯誤")
+        embed.add_field(name="近 7 天", value="\n".join(daily_lines), inline=False)
+
         await interaction.response.send_message(embed=embed)
 
     @app_commands.command(name="petpet-stats", description="查看你使用 petpet 指令的次數")
@@ -63,33 +96,21 @@ class Statistics(commands.GroupCog, name="stats"):
     
     @commands.Cog.listener()
     async def on_command(self, ctx):
-        with semaphore:
-            command_name = ctx.command.qualified_name if ctx.command else "unknown"
-            stats = get_global_config("command_usage_stats", {})
-            stats[command_name] = stats.get(command_name, 0) + 1
-            set_global_config("command_usage_stats", stats)
+        command_name = ctx.command.qualified_name if ctx.command else "unknown"
+        increment_counter("command_usage_stats", command_name)
     
     @commands.Cog.listener()
     async def on_command_error(self, ctx, error):
-        with semaphore:
-            command_name = ctx.command.qualified_name if ctx.command else "unknown"
-            stats = get_global_config("command_error_stats", {})
-            stats[command_name] = stats.get(command_name, 0) + 1
-            set_global_config("command_error_stats", stats)
+        command_name = ctx.command.qualified_name if ctx.command else "unknown"
+        increment_counter("command_error_stats", command_name)
     
     @commands.Cog.listener()
     async def on_app_command_completion(self, interaction: discord.Interaction, application_command: discord.app_commands.Command):
-        with semaphore:
-            command_name = application_command.qualified_name if application_command else "unknown"
-            stats = get_global_config("app_command_usage_stats", {})
-            stats[command_name] = stats.get(command_name, 0) + 1
-            set_global_config("app_command_usage_stats", stats)
+        command_name = application_command.qualified_name if application_command else "unknown"
+        increment_counter("app_command_usage_stats", command_name)
 
     async def on_app_command_error(self, interaction: discord.Interaction, error):
-        with semaphore:
-            command_name = interaction.command.qualified_name if interaction.command else "unknown"
-            stats = get_global_config("app_command_error_stats", {})
-            stats[command_name] = stats.get(command_name, 0) + 1
-            set_global_config("app_command_error_stats", stats)
+        command_name = interaction.command.qualified_name if interaction.command else "unknown"
+        increment_counter("app_command_error_stats", command_name)
 
 asyncio.run(bot.add_cog(Statistics(bot)))
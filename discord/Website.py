@@ -4,7 +4,7 @@ import asyncio
 from pathlib import Path
 from hypercorn.config import Config
 from hypercorn.asyncio import serve
-from globalenv import bot, modules, config, on_ready_tasks, get_global_config, on_close_tasks
+from globalenv import bot, modules, config, on_ready_tasks, get_counter_totals, on_close_tasks
 from logger import log
 from PIL import Image
 import requests
@@ -45,7 +45,7 @@ def api_status():
         "server_count": len(bot.guilds),
         "user_count": len(set(bot.get_all_members())),
         "user_install_count": bot.application.approximate_user_install_count if bot.application else None,
-        "command_stats": sum(get_global_config("command_usage_stats", {}).values()) + sum(get_global_config("app_command_usage_stats", {}).values()) + sum(get_global_config("command_error_stats", {}).values()) + sum(get_global_config("app_command_error_stats", {}).values()),
+        "command_stats": sum(get_counter_totals("command_usage_stats").values()) + sum(get_counter_totals("app_command_usage_stats").values()) + sum(get_counter_totals("command_error_stats").values()) + sum(get_counter_totals("app_command_error_stats").values()),
         "latency_ms": bot_latency,
         "version": UtilCommands.full_version if UtilCommands else "N/A"
     }
@@ -1,8 +1,12 @@
 from globalenv import (
+    append_ai_conversation_message,
     bot,
+    clear_ai_conversation,
     config,
     get_all_user_data,
     get_command_mention,
+    get_counter_totals,
+    get_ai_conversation,
     get_emoji_mention_by_name,
     get_global_config,
     get_server_config,
@@ -61,7 +65,7 @@ from ai_provider import (
     set_ai_review_model as _set_ai_review_model,
 )
 
-from Economy import log_transaction, send_economy_audit_log
+from Economy import get_transaction_history, log_transaction, send_economy_audit_log
 
 # 全局允許提及設定（只允許提及用戶，禁止 @everyone 和 @here）
 SAFE_MENTIONS = discord.AllowedMentions(users=False, roles=False, everyone=False)
@@ -457,34 +461,21 @@ class ConversationManager:
     
     @classmethod
     def get_history(cls, user_id: int, guild_id: int = None) -> list:
-        """獲取對話歷史"""
+        """獲取對話歷史（每則訊息附帶快取的 tokens 估計）"""
         key = cls.get_conversation_key(user_id, guild_id)
-        history = get_user_data(guild_id or 0, user_id, key, [])
-        if not isinstance(history, list):
-            return []
+        history = get_ai_conversation(guild_id or 0, user_id, key)
         return history[-cls.MAX_HISTORY_LENGTH:]
     
     @classmethod
     def add_message(cls, user_id: int, role: str, content: str, guild_id: int = None):
-        """添加訊息到歷史"""
+        """添加訊息到歷史（只追加一筆，超過上限的舊訊息由背景清理）"""
         key = cls.get_conversation_key(user_id, guild_id)
-        history = cls.get_history(user_id, guild_id)
         
         # 截斷過長的訊息
         if len(content) > cls.MAX_MESSAGE_LENGTH:
             content = content[:cls.MAX_MESSAGE_LENGTH] + "..."
         
-        history.append({
-            "role": role,
-            "content": content,
-            "timestamp": time.time()
-        })
-        
-        # 保持歷史長度限制
-        if len(history) > cls.MAX_HISTORY_LENGTH:
-            history = history[-cls.MAX_HISTORY_LENGTH:]
-        
-        set_user_data(guild_id or 0, user_id, key, history)
+        append_ai_conversation_message(guild_id or 0, user_id, key, role, content, cls._estimate_tokens(content))
 
     @staticmethod
     def _estimate_tokens(text: str) -> int:
@@ -493,13 +484,20 @@ class ConversationManager:
             return 0
         return max(1, (len(raw) + 3) // 4)
 
+    @classmethod
+    def _message_tokens(cls, message: dict) -> int:
+        tokens = message.get("tokens")
+        if not isinstance(tokens, int):
+            tokens = cls._estimate_tokens(message.get("content", ""))
+        return tokens + 12
+
     @classmethod
     def _estimate_history_tokens(cls, history: list) -> int:
         total = 0
         for message in history:
             if not isinstance(message, dict):
                 continue
-            total += cls._estimate_tokens(message.get("content", "")) + 12
+            total += cls._message_tokens(message)
         return total
 
     @classmethod
@@ -507,8 +505,13 @@ class ConversationManager:
         if not history:
             return ""
 
+        header = "[Earlier conversation summary]\n"
         lines: list[str] = []
+        length = len(header) - 1
         for message in history:
+            # 摘要最後會截到 HISTORY_SUMMARY_MAX_CHARS，超過之後的訊息不必再處理
+            if length > cls.HISTORY_SUMMARY_MAX_CHARS:
+                break
             if not isinstance(message, dict):
                 continue
             role = str(message.get("role") or "unknown").strip().lower()
@@ -519,11 +522,12 @@ class ConversationManager:
             if len(content) > 220:
                 content = content[:217].rstrip() + "..."
             lines.append(f"- {label}: {content}")
+            length += len(lines[-1]) + 1
 
         if not lines:
             return ""
 
-        summary = "[Earlier conversation summary]\n" + "\n".join(lines)
+        summary = header + "\n".join(lines)
         if len(summary) > cls.HISTORY_SUMMARY_MAX_CHARS:
             summary = summary[: cls.HISTORY_SUMMARY_MAX_CHARS - 3].rstrip() + "..."
         return summary
@@ -532,12 +536,13 @@ class ConversationManager:
     def clear_history(cls, user_id: int, guild_id: int = None):
         """清除對話歷史"""
         key = cls.get_conversation_key(user_id, guild_id)
-        set_user_data(guild_id or 0, user_id, key, [])
+        clear_ai_conversation(guild_id or 0, user_id, key)
     
     @classmethod
     def format_for_api(cls, history: list) -> list:
         """格式化歷史記錄以供 API 使用"""
         normalized = []
+        costs = []
         for msg in history:
             if not isinstance(msg, dict):
                 continue
@@ -546,8 +551,9 @@ class ConversationManager:
             if role not in {"user", "assistant"} or not content:
                 continue
             normalized.append({"role": role, "content": content})
+            costs.append(cls._message_tokens(msg))
 
-        if cls._estimate_history_tokens(normalized) <= cls.API_MAX_CONTEXT_TOKENS:
+        if sum(costs) <= cls.API_MAX_CONTEXT_TOKENS:
             return normalized
 
         tail_count = min(cls.HISTORY_SUMMARY_TAIL_MESSAGES, len(normalized))
@@ -562,15 +568,20 @@ class ConversationManager:
         summary_text = cls._summarize_history_messages(summary_source)
 
         compressed = []
+        compressed_costs = []
         if summary_text:
             compressed.append({"role": "system", "content": summary_text})
+            compressed_costs.append(cls._message_tokens(compressed[0]))
         compressed.extend(tail)
+        compressed_costs.extend(costs[-tail_count:])
 
-        while len(compressed) > 1 and cls._estimate_history_tokens(compressed) > cls.API_MAX_CONTEXT_TOKENS:
+        total = sum(compressed_costs)
+        while len(compressed) > 1 and total > cls.API_MAX_CONTEXT_TOKENS:
             removable_index = 1 if compressed and compressed[0].get("role") == "system" else 0
             if removable_index >= len(compressed):
                 break
             del compressed[removable_index]
+            total -= compressed_costs.pop(removable_index)
 
         return compressed
 
@@ -1251,32 +1262,18 @@ class AICommands(commands.Cog):
 
     @classmethod
     def _log_economy_transaction(cls, user_id: int, tx_type: str, amount: float, detail: str = ""):
-        """寫入經濟交易紀錄；優先使用 Economy.log_transaction，失敗時使用同格式備援。"""
+        """寫入經濟交易紀錄（Economy.log_transaction）；失敗只記 log，不影響扣款。"""
         amount = round(float(amount or 0.0), 2)
         if amount == 0:
             return
 
         try:
-            log_transaction(GLOBAL_GUILD_ID, user_id, tx_type, amount, GLOBAL_CURRENCY_NAME, detail)
-            return
+            log_transaction(
+                GLOBAL_GUILD_ID, user_id, tx_type, amount, GLOBAL_CURRENCY_NAME, detail,
+                balance_after=cls._get_global_balance(user_id),
+            )
         except Exception as e:
-            log(f"AI 交易紀錄寫入 fallback: {e}", module_name="AI", level=logging.WARNING)
-
-        # fallback：與 Economy.log_transaction 相同欄位
-        from datetime import datetime, timezone
-
-        history = get_user_data(GLOBAL_GUILD_ID, user_id, "economy_history", [])
-        history.append({
-            "type": tx_type,
-            "amount": amount,
-            "currency": GLOBAL_CURRENCY_NAME,
-            "detail": detail,
-            "time": datetime.now(timezone.utc).isoformat(),
-            "balance_after": cls._get_global_balance(user_id),
-        })
-        if len(history) > 50:
-            history = history[-50:]
-        set_user_data(GLOBAL_GUILD_ID, user_id, "economy_history", history)
+            log(f"AI 交易紀錄寫入失敗: {e}", module_name="AI", level=logging.WARNING)
 
     @classmethod
     def _queue_economy_audit_log(
@@ -5329,10 +5326,9 @@ class AICommands(commands.Cog):
         guild = (tool_context or {}).get("guild")
 
         economy = importlib.import_module("Economy")
-        history = get_user_data(scope_id, target_user_id, "economy_history", []) or []
         recent_history = []
         if include_history:
-            for record in reversed(history[-5:]):
+            for record in get_transaction_history(scope_id, target_user_id, 5):
                 recent_history.append(
                     {
                         "time": record.get("time"),
@@ -5391,10 +5387,10 @@ class AICommands(commands.Cog):
 
         application = getattr(self.bot, "application", None)
         bot_user = getattr(self.bot, "user", None)
-        command_usage = get_global_config("command_usage_stats", {}) or {}
-        app_command_usage = get_global_config("app_command_usage_stats", {}) or {}
-        command_errors = get_global_config("command_error_stats", {}) or {}
-        app_command_errors = get_global_config("app_command_error_stats", {}) or {}
+        command_usage = get_counter_totals("command_usage_stats")
+        app_command_usage = get_counter_totals("app_command_usage_stats")
+        command_errors = get_counter_totals("command_error_stats")
+        app_command_errors = get_counter_totals("app_command_error_stats")
 
         return {
             "status": status_text,
@@ -5773,7 +5769,7 @@ class AICommands(commands.Cog):
                 return {"error": "route_key and stop_id are required for stop mode"}
             route_key = self._coerce_int(route_key, 0, minimum=1)
             stop_id = self._coerce_int(stop_id, 0, minimum=1)
-            stop_info = await asyncio.to_thread(twbus.fetch_stop_info, route_key, stop_id)
+            stop_info = await twbus.fetch_stop_info(route_key, stop_id)
             if not stop_info:
                 return {"error": "stop not found"}
             title, summary = twbus.make_bus_text(stop_info)
@@ -5846,8 +5842,7 @@ class AICommands(commands.Cog):
         for identifier in favorite_stops[:limit]:
             try:
                 route_key_raw, stop_id_raw = str(identifier).split(":", 1)
-                stop_info = await asyncio.to_thread(
-                    twbus.fetch_stop_info,
+                stop_info = await twbus.fetch_stop_info(
                     int(route_key_raw),
                     int(stop_id_raw),
                 )
@@ -5962,10 +5957,10 @@ class AICommands(commands.Cog):
             rows.sort(key=lambda item: item["count"], reverse=True)
             return rows[:limit]
 
-        command_usage = get_global_config("command_usage_stats", {}) or {}
-        app_command_usage = get_global_config("app_command_usage_stats", {}) or {}
-        command_errors = get_global_config("command_error_stats", {}) or {}
-        app_command_errors = get_global_config("app_command_error_stats", {}) or {}
+        command_usage = get_counter_totals("command_usage_stats")
+        app_command_usage = get_counter_totals("app_command_usage_stats")
+        command_errors = get_counter_totals("command_error_stats")
+        app_command_errors = get_counter_totals("app_command_error_stats")
 
         return {
             "query": query or None,
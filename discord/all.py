@@ -1,75 +1,75 @@
-import asyncio
 import json
-from datetime import datetime, timedelta
-import discord
-from discord import app_commands
-from discord.ext import commands
-import aiohttp
-import os
-import random
-from database import db
-from globalenv import bot, start_bot, config
-import globalenv
-import traceback
 
-# Load modules from modules.json
-try:
-    with open('modules.json', 'r', encoding='utf-8') as f:
-        modules = json.load(f)
-except FileNotFoundError:
-    print("[!] modules.json not found. Creating a default one.")
-    default_modules = [
-        "ReportSystem",
-        "ModerationNotify",
-        "dsize",
-        "PresenceChange",
-        "OwnerTools",
-        "Moderate",
-        "ItemSystem",
-        "AutoModerate",
-        "AutoPublish",
-        "UtilCommands",
-        "r34",
-        "DynamicVoice",
-        "twbus",
-        "AutoReply",
-        "logger"
-    ]
-    with open('modules.json', 'w', encoding='utf-8') as f:
-        json.dump(default_modules, f, indent=4)
-    modules = default_modules
-except json.JSONDecodeError:
-    print("[!] modules.json is not a valid JSON file. Please check its contents.")
-    modules = []
 
-for disabled_module in config("disable_modules", []):
-    if disabled_module in modules:
-        modules.remove(disabled_module)
+def main():
+    # 都放在 main 裡：渲染用的 process pool 以 spawn / forkserver 啟動子行程時會重新 import 這個檔案，
+    # 子行程不該再建資料庫、建 bot 或載入模組
+    from globalenv import bot, start_bot, config
+    from module_loader import ModuleLoader
+    import globalenv
 
-failed_modules = []
+    # Load modules from modules.json
+    try:
+        with open('modules.json', 'r', encoding='utf-8') as f:
+            modules = json.load(f)
+    except FileNotFoundError:
+        print("[!] modules.json not found. Creating a default one.")
+        default_modules = [
+            "ReportSystem",
+            "ModerationNotify",
+            "dsize",
+            "PresenceChange",
+            "OwnerTools",
+            "Moderate",
+            "ItemSystem",
+            "AutoModerate",
+            "AutoPublish",
+            "UtilCommands",
+            "r34",
+            "DynamicVoice",
+            "twbus",
+            "AutoReply",
+            "logger"
+        ]
+        with open('modules.json', 'w', encoding='utf-8') as f:
+            json.dump(default_modules, f, indent=4)
+        modules = default_modules
+    except json.JSONDecodeError:
+        print("[!] modules.json is not a valid JSON file. Please check its contents.")
+        modules = []
 
-globalenv.modules = modules
-globalenv.failed_modules = failed_modules
-from logger import log
-# print(f"[+] Loading {len(modules)} module(s)...")
-log(f"Loading {len(modules)} module(s)...", module_name="all")
+    for disabled_module in config("disable_modules", []):
+        if disabled_module in modules:
+            modules.remove(disabled_module)
 
-# Import all modules to register their events and commands
-for module in modules:
-    try:
-        __import__(module)
-        # print(f"[+] Module {module} loaded.")
-        log(f"Module {module} loaded.", module_name="all")
-    except Exception as e:
-        # print(f"[!] Failed to load module {module}: {e}")
-        log(f"Failed to load module {module}: {e}", module_name="all")
-        traceback.print_exc()
-        # modules.remove(module)
-        failed_modules.append(module)
+    failed_modules = []
 
-for module in failed_modules:
-    if module in modules:
-        modules.remove(module)
+    globalenv.modules = modules
+    globalenv.failed_modules = failed_modules
+    from logger import log
+    # print(f"[+] Loading {len(modules)} module(s)...")
+    log(f"Loading {len(modules)} module(s)...", module_name="all")
+
+    # Import all modules to register their events and commands
+    # lazy_modules 中的模組只要有 manifest 就延遲到第一次使用才載入
+    module_loader = ModuleLoader(bot, globalenv.on_ready_tasks, resync=globalenv.sync_commands)
+    globalenv.module_loader = module_loader
+    failed_modules.extend(module_loader.load_all(modules, config("lazy_modules", [])))
+    for stat in module_loader.report():
+        if stat.status == "loaded":
+            log(f"Module {stat.name} loaded in {stat.seconds * 1000:.0f}ms.", module_name="all")
+        elif stat.status == "deferred":
+            log(f"Module {stat.name} deferred until first use.", module_name="all")
+        else:
+            log(f"Failed to load module {stat.name}: {stat.error}", module_name="all")
+    log(f"Modules loaded in {module_loader.startup_seconds:.2f}s.", module_name="all")
+
+    for module in failed_modules:
+        if module in modules:
+            modules.remove(module)
 
-if __name__ == "__main__":
     start_bot()
+
+
+if __name__ == "__main__":
+    main()
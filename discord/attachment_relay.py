@@ -0,0 +1,93 @@
+"""Download message attachments once and upload them again from spooled buffers.
+
+``AttachmentRelay.fetch(session, attachments)`` streams each attachment into a
+``SpooledTemporaryFile``. A buffer stays in memory up to ``spool_bytes`` and
+rolls over to a temp file after that. ``files()`` hands out new
+``discord.File`` objects over the same buffers, rewound to the start, so a
+retried send uploads the attachments again without downloading them again.
+aiohttp reads file values in chunks while writing the multipart body, so the
+upload never holds a whole attachment in memory either.
+
+The declared total size is checked against ``max_total_bytes`` before
+anything is downloaded. The bytes actually received are checked again while
+streaming. ``close()`` releases the buffers.
+"""
+
+import tempfile
+from typing import Iterable
+
+import aiohttp
+import discord
+
+SPOOL_BYTES = 4 * 1024 * 1024
+CHUNK_BYTES = 64 * 1024
+MAX_TOTAL_BYTES = 100 * 1024 * 1024
+DOWNLOAD_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=30)
+
+
+class AttachmentTooLarge(Exception):
+    pass
+
+
+def declared_size(attachments: Iterable) -> int:
+    return sum(attachment.size or 0 for attachment in attachments)
+
+
+class AttachmentRelay:
+    def __init__(self, max_total_bytes: int = MAX_TOTAL_BYTES, spool_bytes: int = SPOOL_BYTES,
+                 chunk_bytes: int = CHUNK_BYTES):
+        self.max_total_bytes = max_total_bytes
+        self.spool_bytes = spool_bytes
+        self.chunk_bytes = chunk_bytes
+        self.total_bytes = 0
+        self._items: list[tuple] = []  # (buffer, filename, spoiler, description)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    async def fetch(self, session: aiohttp.ClientSession, attachments: Iterable,
+                    use_cached: bool = True):
+        attachments = list(attachments)
+        if declared_size(attachments) > self.max_total_bytes:
+            raise AttachmentTooLarge(f"{declared_size(attachments)} > {self.max_total_bytes} bytes")
+        try:
+            for attachment in attachments:
+                buffer = tempfile.SpooledTemporaryFile(max_size=self.spool_bytes)
+                self._items.append((buffer, attachment.filename, attachment.is_spoiler(), attachment.description))
+                url = attachment.proxy_url if use_cached and attachment.proxy_url else attachment.url
+                async with session.get(url, timeout=DOWNLOAD_TIMEOUT) as response:
+                    response.raise_for_status()
+                    async for chunk in response.content.iter_chunked(self.chunk_bytes):
+                        self.total_bytes += len(chunk)
+                        # 宣告的大小不一定可信，邊下載邊檢查
+                        if self.total_bytes > self.max_total_bytes:
+                            raise AttachmentTooLarge(f"more than {self.max_total_bytes} bytes received")
+                        buffer.write(chunk)
+        except BaseException:
+            self.close()
+            raise
+
+    def files(self) -> list[discord.File]:
+        """New File objects for one send; closing them leaves the buffers open"""
+        files = []
+        for buffer, filename, spoiler, description in self._items:
+            buffer.seek(0)
+            files.append(discord.File(buffer, filename, spoiler=spoiler, description=description))
+        return files
+
+    def on_disk(self) -> int:
+        """How many buffers have rolled over to a temp file"""
+        return sum(1 for buffer, *_ in self._items if getattr(buffer, "_rolled", False))
+
+    def close(self):
+        for buffer, *_ in self._items:
+            # discord.File 會暫時把 close 換成空函式，先拿掉以免有沒關到的 File 擋住
+            vars(buffer).pop("close", None)
+            buffer.close()
+        self._items.clear()
@@ -0,0 +1,223 @@
+"""Compiled, per-guild trigger matching for AutoReply.
+
+A guild's ``autoreplies`` list is compiled once into:
+
+* an Aho-Corasick automaton over every ``contains`` / ``starts_with`` /
+  ``ends_with`` trigger (anchored modes are filtered by match position),
+* a hash map for ``equals`` triggers,
+* precompiled regex triggers behind one combined alternation used as a
+  prefilter, and
+* a ``discord.MessageType`` index for ``type:`` triggers.
+
+``first_match`` returns the same rule the linear loop in
+``AutoReply.on_message`` would have picked: the lowest rule index whose
+channel filter allows the channel and whose triggers match.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+_CONTAINS = 0
+_STARTS_WITH = 1
+_ENDS_WITH = 2
+_LITERAL_MODES = {"contains": _CONTAINS, "starts_with": _STARTS_WITH, "ends_with": _ENDS_WITH}
+
+
+class AhoCorasick:
+    """Multi-pattern substring automaton; yields ``(end_index, value)`` per occurrence."""
+
+    __slots__ = ("_goto", "_fail", "_out", "_built")
+
+    def __init__(self):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[list[Any]] = [[]]
+        self._built = False
+
+    def __bool__(self) -> bool:
+        return len(self._goto) > 1
+
+    def add(self, pattern: str, value: Any):
+        if not pattern:
+            raise ValueError("empty patterns cannot be added to the automaton")
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = next_node
+        self._out[node].append(value)
+        self._built = False
+
+    def build(self):
+        queue = list(self._goto[0].values())
+        for node in queue:
+            self._fail[node] = 0
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                # Merge outputs of the fail chain so matching never walks it.
+                self._out[child].extend(self._out[self._fail[child]])
+        self._built = True
+
+    def iter_matches(self, text: str) -> Iterator[tuple[int, Any]]:
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if out[node]:
+                for value in out[node]:
+                    yield index, value
+
+
+class CompiledTriggerMatcher:
+    """All trigger rules of one guild, compiled for constant-ish per-message cost."""
+
+    def __init__(self, rules: Iterable[dict], parse_type_trigger: Callable[[str], tuple]):
+        self.rules = list(rules)
+        self._automaton = AhoCorasick()
+        self._equals: dict[str, set[int]] = {}
+        self._always: set[int] = set()          # empty contains/starts_with/ends_with triggers
+        self._type_index: dict[Any, set[int]] = {}
+        self._regex: dict[int, list[tuple[re.Pattern, bool]]] = {}
+        self._standalone_regex_rules: list[int] = []
+        self._combined_regex: Optional[re.Pattern] = None
+        self._channel_filters: list[tuple[str, Any]] = []
+
+        combinable: list[str] = []
+        for index, rule in enumerate(self.rules):
+            channel_mode = rule.get("channel_mode", "all")
+            self._channel_filters.append((channel_mode, _channel_set(rule.get("channels", []))))
+
+            mode = rule.get("mode")
+            for trigger in rule.get("trigger", []) or []:
+                is_type_trigger, message_type, _ = parse_type_trigger(trigger)
+                if is_type_trigger:
+                    if message_type is not None:
+                        self._type_index.setdefault(message_type, set()).add(index)
+                    continue
+
+                text = str(trigger)
+                if mode == "regex":
+                    try:
+                        compiled = re.compile(text)
+                    except re.error:
+                        continue
+                    in_combined = _can_combine(text, compiled)
+                    if in_combined:
+                        combinable.append(text)
+                    self._regex.setdefault(index, []).append((compiled, in_combined))
+                elif mode == "equals":
+                    self._equals.setdefault(text, set()).add(index)
+                elif mode in _LITERAL_MODES:
+                    if text:
+                        self._automaton.add(text, (_LITERAL_MODES[mode], index, len(text)))
+                    else:
+                        self._always.add(index)
+
+        if self._automaton:
+            self._automaton.build()
+
+        if combinable:
+            try:
+                self._combined_regex = re.compile("|".join(f"(?:{pattern})" for pattern in combinable))
+            except re.error:
+                for patterns in self._regex.values():
+                    patterns[:] = [(compiled, False) for compiled, _ in patterns]
+        self._standalone_regex_rules = sorted(
+            index for index, patterns in self._regex.items()
+            if any(not in_combined for _, in_combined in patterns)
+        )
+        self._regex_rules = sorted(self._regex)
+
+    def _literal_hits(self, content: str) -> set[int]:
+        hits = set(self._always)
+        equals = self._equals.get(content)
+        if equals:
+            hits |= equals
+        if self._automaton:
+            last = len(content) - 1
+            for end, (mode, index, length) in self._automaton.iter_matches(content):
+                if mode == _CONTAINS or (mode == _STARTS_WITH and end + 1 == length) or (mode == _ENDS_WITH and end == last):
+                    hits.add(index)
+        return hits
+
+    def _channel_allows(self, index: int, channel_id: int) -> bool:
+        channel_mode, channels = self._channel_filters[index]
+        if channel_mode == "whitelist" and channel_id not in channels:
+            return False
+        if channel_mode == "blacklist" and channel_id in channels:
+            return False
+        return True
+
+    def _regex_matches(self, index: int, content: str, combined_hit: bool) -> bool:
+        for compiled, in_combined in self._regex.get(index, ()):
+            if in_combined and not combined_hit:
+                continue
+            if compiled.search(content):
+                return True
+        return False
+
+    def first_match(self, message, channel_id: int) -> Optional[tuple[int, dict]]:
+        """Return ``(index, rule)`` of the first rule that fires for ``message``, if any."""
+        content = message.content
+        hits = self._literal_hits(content)
+        type_hits = self._type_index.get(message.type)
+        if type_hits:
+            hits |= type_hits
+
+        combined_hit = False
+        regex_candidates: list[int] = []
+        if self._regex_rules:
+            if self._combined_regex is not None and self._combined_regex.search(content):
+                combined_hit = True
+                regex_candidates = self._regex_rules
+            else:
+                regex_candidates = self._standalone_regex_rules
+
+        if regex_candidates:
+            ordered = sorted(hits.union(regex_candidates))
+        else:
+            ordered = sorted(hits)
+        for index in ordered:
+            if not self._channel_allows(index, channel_id):
+                continue
+            if index in hits or self._regex_matches(index, content, combined_hit):
+                return index, self.rules[index]
+        return None
+
+
+def _channel_set(channels):
+    try:
+        return frozenset(channels or ())
+    except TypeError:
+        return channels or ()
+
+
+def _can_combine(pattern: str, compiled: re.Pattern) -> bool:
+    """Patterns with groups or global inline flags keep their own search."""
+    if compiled.groups:
+        return False
+    try:
+        re.compile(f"(?:{pattern})")
+    except re.error:
+        return False
+    return True
@@ -0,0 +1,335 @@
+"""Compiled AutoReply response templates.
+
+A response string is parsed once into a small tree of nodes and cached by its
+text, so validation (``AutoReply._validate_template_syntax``) and rendering
+share one parser and a hot rule never re-scans its template.  Rendering walks
+the tree: plain text and placeholders are emitted directly, ``{if:}``
+conditions are stored pre-split, math without nested tokens is evaluated at
+compile time, and ``{newmsg:}`` / ``{edit:}`` directives become stage
+boundaries.
+
+Parsing and rendering live on the AutoReply cog (they reuse its token
+helpers); this module only holds the node types and the cache.
+"""
+
+from __future__ import annotations
+
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional
+
+EMBED_DIRECTIVES = {
+    "embedtitle:": "title",
+    "embeddescription:": "description",
+    "embedurl:": "url",
+    "embedimage:": "image",
+    "embedcolor:": "color",
+    "embedthumbnail:": "thumbnail",
+    "embedfooter:": "footer",
+    "embedfooterimage:": "footer_image",
+    "embedauthor:": "author",
+    "embedauthorurl:": "author_url",
+    "embedauthorimage:": "author_image",
+    "embedtime:": "time",
+}
+
+# Marks where a token that renders to nothing (an effect or embed directive)
+# sat in the output, so the final strip treats it as non-blank text the way
+# the old string pipeline did.
+EFFECT_MARKER = object()
+
+
+def nodes_source(nodes) -> str:
+    return "".join(node.source for node in nodes)
+
+
+def nodes_have_if(nodes) -> bool:
+    return any(node.has_if for node in nodes)
+
+
+def nodes_are_static(nodes) -> bool:
+    return all(type(node) is TemplateText for node in nodes)
+
+
+class TemplateNode(ABC):
+    __slots__ = ()
+    has_if = False
+
+    @property
+    @abstractmethod
+    def source(self) -> str:
+        ...
+
+
+class TemplateText(TemplateNode):
+    __slots__ = ("text", "raw")
+
+    def __init__(self, text: str, raw: Optional[str] = None):
+        self.text = text
+        self.raw = text if raw is None else raw
+
+    @property
+    def source(self) -> str:
+        return self.raw
+
+
+class TemplateToken(TemplateNode):
+    """A leaf token kept verbatim for preview output; ``raw`` excludes the braces."""
+
+    __slots__ = ("raw",)
+
+    def __init__(self, raw: str):
+        self.raw = raw
+
+    @property
+    def source(self) -> str:
+        return "{" + self.raw + "}"
+
+
+class TemplatePlaceholder(TemplateToken):
+    __slots__ = ()
+
+
+class TemplateRandInt(TemplateToken):
+    __slots__ = ("low", "high")
+
+    def __init__(self, raw: str, low: int, high: int):
+        super().__init__(raw)
+        self.low, self.high = (low, high) if low <= high else (high, low)
+
+
+class TemplateTimeMD(TemplateToken):
+    __slots__ = ("style",)
+
+    def __init__(self, raw: str, style: str):
+        super().__init__(raw)
+        self.style = "R" if style == "r" else style
+
+
+class TemplateContentSplit(TemplateToken):
+    __slots__ = ("spec",)
+
+    def __init__(self, raw: str, spec: Optional[tuple]):
+        super().__init__(raw)
+        self.spec = spec
+
+
+class TemplateDelay(TemplateToken):
+    __slots__ = ("directive", "seconds")
+
+    def __init__(self, raw: str, directive: str, seconds: int):
+        super().__init__(raw)
+        self.directive = directive
+        self.seconds = seconds
+
+
+class TemplateMention(TemplateToken):
+    __slots__ = ("allow",)
+
+    def __init__(self, raw: str, allow: bool):
+        super().__init__(raw)
+        self.allow = allow
+
+
+class TemplateSticker(TemplateToken):
+    __slots__ = ("sticker_id",)
+
+    def __init__(self, raw: str, sticker_id: int):
+        super().__init__(raw)
+        self.sticker_id = sticker_id
+
+
+class TemplateBlock(TemplateNode):
+    """A braced token with template children: ``{`` + head + children + ``}``."""
+
+    __slots__ = ("head", "children", "has_if")
+
+    def __init__(self, head: str, children: list):
+        self.head = head
+        self.children = children
+        self.has_if = nodes_have_if(children)
+
+    @property
+    def source(self) -> str:
+        return "{" + self.head + nodes_source(self.children) + "}"
+
+    def with_children(self, children: list):
+        return type(self)(self.head, children)
+
+
+class TemplateLiteral(TemplateBlock):
+    """Unknown token (or a directive the renderer ignores); rendered with its braces."""
+
+    __slots__ = ()
+
+
+class TemplateReact(TemplateBlock):
+    __slots__ = ()
+
+
+class TemplateEmbed(TemplateBlock):
+    __slots__ = ("key",)
+
+    def __init__(self, head: str, children: list, key: Optional[str] = None):
+        super().__init__(head, children)
+        self.key = key if key is not None else EMBED_DIRECTIVES[head.lower()]
+
+    def with_children(self, children: list):
+        return TemplateEmbed(self.head, children, self.key)
+
+
+class TemplateMath(TemplateBlock):
+    __slots__ = ("result",)
+
+    def __init__(self, head: str, children: list, result: Optional[str] = None):
+        super().__init__(head, children)
+        # Expressions without nested tokens are evaluated once at compile time.
+        self.result = result
+
+    @property
+    def source(self) -> str:
+        return "{" + self.head + nodes_source(self.children) + ")}"
+
+    def with_children(self, children: list):
+        return TemplateMath(self.head, children)
+
+
+class TemplateEmbedField(TemplateNode):
+    __slots__ = ("head", "name", "value", "has_if")
+
+    def __init__(self, head: str, name: list, value: Optional[list]):
+        self.head = head
+        self.name = name
+        self.value = value
+        self.has_if = nodes_have_if(name) or (value is not None and nodes_have_if(value))
+
+    @property
+    def source(self) -> str:
+        value = "" if self.value is None else ":" + nodes_source(self.value)
+        return "{" + self.head + nodes_source(self.name) + value + "}"
+
+
+class TemplateStateVar(TemplateNode):
+    __slots__ = ("head", "scope", "key", "value", "has_if")
+
+    def __init__(self, head: str, scope: str, key: list, value: Optional[list]):
+        self.head = head
+        self.scope = scope
+        self.key = key
+        self.value = value
+        self.has_if = nodes_have_if(key) or (value is not None and nodes_have_if(value))
+
+    @property
+    def source(self) -> str:
+        value = "" if self.value is None else ":" + nodes_source(self.value)
+        return "{" + self.head + nodes_source(self.key) + value + "}"
+
+
+class TemplateComparison:
+    __slots__ = ("left", "operator", "right")
+
+    def __init__(self, left: list, operator: str, right: list):
+        self.left = left
+        self.operator = operator
+        self.right = right
+
+
+class TemplateCondition:
+    """``||`` / ``&&`` of sub-conditions; ``None`` parts always evaluate to False."""
+
+    __slots__ = ("operator", "parts")
+
+    def __init__(self, operator: str, parts: list):
+        self.operator = operator
+        self.parts = parts
+
+
+class TemplateIf(TemplateNode):
+    __slots__ = ("raw", "condition", "true_branch", "false_branch")
+    has_if = True
+
+    def __init__(self, raw: str, condition, true_branch: list, false_branch: list):
+        self.raw = raw
+        self.condition = condition
+        self.true_branch = true_branch
+        self.false_branch = false_branch
+
+    @property
+    def source(self) -> str:
+        return "{" + self.raw + "}"
+
+
+class CompiledTemplate:
+    """Parsed template (or one stage of it); ``str()`` gives the template text."""
+
+    __slots__ = ("nodes", "source", "has_if", "has_delay")
+
+    def __init__(self, nodes: list, source: Optional[str] = None):
+        self.nodes = nodes
+        self.source = nodes_source(nodes) if source is None else source
+        self.has_if = nodes_have_if(nodes)
+        self.has_delay = any(type(node) is TemplateDelay for node in nodes)
+
+    def __str__(self) -> str:
+        return self.source
+
+    def __repr__(self) -> str:
+        return f"CompiledTemplate({self.source!r})"
+
+
+class TemplateCache:
+    """Bounded LRU of compiled templates keyed by response text; syntax errors are cached too."""
+
+    def __init__(self, max_size: int = 2048):
+        self.max_size = max_size
+        self._entries: OrderedDict[str, object] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, response: str):
+        with self._lock:
+            entry = self._entries.get(response)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(response)
+            self.hits += 1
+            return entry
+
+    def put(self, response: str, entry):
+        with self._lock:
+            self._entries[response] = entry
+            self._entries.move_to_end(response)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def join_template_pieces(pieces: list) -> str:
+    """Join rendered pieces and strip outer whitespace, treating markers as text."""
+    start, end = 0, len(pieces)
+    while start < end and pieces[start] is not EFFECT_MARKER and not pieces[start].strip():
+        start += 1
+    while end > start and pieces[end - 1] is not EFFECT_MARKER and not pieces[end - 1].strip():
+        end -= 1
+    if start >= end:
+        return ""
+    parts = [piece for piece in pieces[start:end] if piece is not EFFECT_MARKER]
+    if not parts:
+        return ""
+    if pieces[start] is not EFFECT_MARKER:
+        parts[0] = parts[0].lstrip()
+    if pieces[end - 1] is not EFFECT_MARKER:
+        parts[-1] = parts[-1].rstrip()
+    return "".join(parts)
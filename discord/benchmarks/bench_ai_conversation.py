@@ -0,0 +1,64 @@
+"""Compare rewriting the whole AI history per turn with the append-only conversation log.
+
+Usage: python benchmarks/bench_ai_conversation.py [turns]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+from database import Database
+
+MAX_HISTORY_LENGTH = 200
+CONTENT = "一般聊天訊息 " * 40
+USERS = 20
+
+
+def legacy_turn(database, user_id):
+    # what ConversationManager.add_message used to do: read, append, trim, write the whole list back
+    history = database.get_user_data(user_id, 1, "legacy_conversation", [])
+    history.append({"role": "user", "content": CONTENT, "timestamp": time.time()})
+    database.set_user_data(user_id, 1, "legacy_conversation", history[-MAX_HISTORY_LENGTH:])
+    return database.get_user_data(user_id, 1, "legacy_conversation", [])
+
+
+def log_turn(database, user_id):
+    key = f"ai_conversation_1_{user_id}"
+    database.conversations.append(user_id, 1, key, "user", CONTENT, tokens=len(CONTENT) // 4)
+    return database.conversations.tail(user_id, 1, key)
+
+
+def run(database, turn, turns):
+    # start every conversation at the history limit, the steady state of an active user
+    for user_id in range(USERS):
+        history = [{"role": "user", "content": CONTENT, "timestamp": 0} for _ in range(MAX_HISTORY_LENGTH)]
+        database.set_user_data(user_id, 1, "legacy_conversation", history)
+        database.set_user_data(user_id, 1, f"ai_conversation_1_{user_id}", history)
+    database.flush()
+
+    start = time.perf_counter()
+    for index in range(turns):
+        turn(database, index % USERS)
+    database.flush()
+    return (time.perf_counter() - start) / turns * 1e6
+
+
+def main():
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with tempfile.TemporaryDirectory() as tmp:
+        database = Database(str(Path(tmp) / "bench.db"))
+        before = run(database, legacy_turn, turns)
+        after = run(database, log_turn, turns)
+        database.close()
+
+    print(f"turns:   {turns} (history at {MAX_HISTORY_LENGTH} messages)")
+    print(f"before:  {before:,.0f} µs per turn")
+    print(f"after:   {after:,.0f} µs per turn")
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
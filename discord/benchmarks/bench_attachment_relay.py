@@ -0,0 +1,113 @@
+"""Compare peak Python memory of FixLink's old attachment re-upload with AttachmentRelay.
+
+The old path read every attachment into bytes (``attachment.to_file``) on
+each webhook attempt. The relay streams each attachment into a spooled
+buffer once and reads it back in upload-sized chunks, the way aiohttp writes
+a multipart body. Both sides simulate one failed attempt and one retry.
+Usage: python benchmarks/bench_attachment_relay.py [attachment_mib] [attachments]
+"""
+import asyncio
+import io
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from types import SimpleNamespace
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+from attachment_relay import CHUNK_BYTES, AttachmentRelay
+
+UPLOAD_CHUNK = 2 ** 16
+
+
+class FakeSession:
+    def __init__(self, size):
+        self.size = size
+        self.downloads = 0
+
+    async def _chunks(self, chunk_size):
+        sent = 0
+        while sent < self.size:
+            chunk = b"\0" * min(chunk_size, self.size - sent)
+            sent += len(chunk)
+            yield chunk
+
+    def get(self, url, timeout=None):
+        session = self
+
+        class Response:
+            content = SimpleNamespace(iter_chunked=session._chunks)
+
+            async def __aenter__(self):
+                session.downloads += 1
+                return self
+
+            async def __aexit__(self, *exc_info):
+                return False
+
+            def raise_for_status(self):
+                pass
+
+        return Response()
+
+
+def make_attachments(count, size):
+    return [
+        SimpleNamespace(filename=f"clip{index}.mp4", size=size, url=f"https://cdn.example.com/{index}",
+                        proxy_url=f"https://media.example.com/{index}", description=None, is_spoiler=lambda: False)
+        for index in range(count)
+    ]
+
+
+def upload(fp):
+    while fp.read(UPLOAD_CHUNK):
+        pass
+
+
+async def legacy(session, attachments):
+    for _ in range(2):
+        files = []
+        for attachment in attachments:
+            body = bytearray()
+            async with session.get(attachment.proxy_url) as response:
+                async for chunk in response.content.iter_chunked(CHUNK_BYTES):
+                    body += chunk
+            files.append(io.BytesIO(bytes(body)))
+        for fp in files:
+            upload(fp)
+
+
+async def relayed(session, attachments):
+    with AttachmentRelay(max_total_bytes=sum(a.size for a in attachments)) as relay:
+        await relay.fetch(session, attachments)
+        for _ in range(2):
+            files = relay.files()
+            for file in files:
+                upload(file.fp)
+                file.close()
+
+
+def measure(run, size, count):
+    session = FakeSession(size)
+    tracemalloc.start()
+    start = time.perf_counter()
+    asyncio.run(run(session, make_attachments(count, size)))
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, session.downloads
+
+
+def main():
+    size = int(float(sys.argv[1]) * 1024 * 1024) if len(sys.argv) > 1 else 32 * 1024 * 1024
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    print(f"attachments: {count} x {size / 1024 / 1024:.1f} MiB, one retry")
+    for name, run in (("to_file per attempt", legacy), ("AttachmentRelay", relayed)):
+        elapsed, peak, downloads = measure(run, size, count)
+        print(f"{name:20} peak {peak / 1024 / 1024:8.1f} MiB  downloads {downloads}  {elapsed * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
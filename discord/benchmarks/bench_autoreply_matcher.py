@@ -0,0 +1,89 @@
+"""Micro-benchmark: AutoReply trigger matching on a guild with 1k rules.
+
+Compares the per-message linear loop over every rule and trigger with the
+compiled per-guild matcher. Usage: python benchmarks/bench_autoreply_matcher.py [rules] [messages]
+"""
+import random
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+import discord
+import AutoReply
+from autoreply_matcher import CompiledTriggerMatcher
+
+WORDS = ["早安", "午安", "晚安", "hello", "bug", "deploy", "貓咪", "coffee", "ping", "gg", "lol", "test"]
+
+
+def build_rules(rng, count):
+    modes = ["contains"] * 5 + ["equals", "starts_with", "ends_with", "regex"]
+    rules = []
+    for index in range(count):
+        mode = rng.choice(modes)
+        triggers = [f"{rng.choice(WORDS)}{index}" for _ in range(rng.randint(1, 4))]
+        if mode == "regex":
+            triggers = [rf"{rng.choice(WORDS)}\s*{index}\b" for _ in triggers]
+        rule = {"mode": mode, "trigger": triggers, "response": ["ok"], "channel_mode": "all", "channels": []}
+        if rng.random() < 0.1:
+            rule["channel_mode"] = "blacklist"
+            rule["channels"] = [rng.randint(1, 5)]
+        rules.append(rule)
+    return rules
+
+
+def build_messages(rng, count, rule_count):
+    messages = []
+    for _ in range(count):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(3, 20))]
+        if rng.random() < 0.05:
+            words.append(f"{rng.choice(WORDS)}{rng.randrange(rule_count)}")
+        messages.append(SimpleNamespace(content=" ".join(words), type=discord.MessageType.default))
+    return messages
+
+
+def linear(cog, rules, message, channel_id):
+    for ar in rules:
+        channel_mode = ar.get("channel_mode", "all")
+        channels = ar.get("channels", [])
+        if channel_mode == "whitelist" and channel_id not in channels:
+            continue
+        elif channel_mode == "blacklist" and channel_id in channels:
+            continue
+        if cog._message_matches_autoreply_triggers(message, ar.get("mode"), ar.get("trigger", [])):
+            return ar
+    return None
+
+
+def main():
+    rule_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    message_count = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    rng = random.Random(42)
+    rules = build_rules(rng, rule_count)
+    messages = build_messages(rng, message_count, rule_count)
+    cog = AutoReply.AutoReply(None)
+
+    start = time.perf_counter()
+    expected = [linear(cog, rules, message, 1) for message in messages]
+    before = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matcher = CompiledTriggerMatcher(rules, cog._parse_message_type_trigger)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = [matcher.first_match(message, 1) for message in messages]
+    after = time.perf_counter() - start
+
+    assert [m[1] if m else None for m in actual] == expected, "compiled matcher disagrees with the linear loop"
+    print(f"rules: {rule_count}, messages: {message_count}, matches: {sum(1 for m in expected if m)}")
+    print(f"linear loop:      {before / message_count * 1e6:9.1f} us/message")
+    print(f"compiled matcher: {after / message_count * 1e6:9.1f} us/message (build {build * 1e3:.1f} ms)")
+    print(f"speedup:          {before / after:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Micro-benchmark: rendering AutoReply response templates.
+
+Renders every template from the built-in template packs, once with the
+compiled-template cache cleared before each render (every message re-parses
+and re-validates its template, as the old string pipeline did) and once with
+the cache warm. Usage: python benchmarks/bench_autoreply_template.py [rounds]
+"""
+import asyncio
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+import AutoReply
+
+EXTRA_TEMPLATES = [
+    "{if:{contentsplit:0}==hello&&{math:(2*3)}>=6:hi {user} {embedtitle:{author}}:else:bye}",
+    "{math:(({randint:1-6}+{randint:1-6})*2)} {timemd:R} {react:👍}",
+    "step 1{edit:1}step 2{newmsg:2}{embeddescription:{contentsplit:1-}}",
+]
+
+
+def make_message():
+    guild = SimpleNamespace(
+        name="Guild", id=10, icon=None, owner=None, member_count=3, roles=[1, 2],
+        banner=None, premium_subscription_count=None, emojis=[], stickers=[],
+    )
+    author = SimpleNamespace(
+        mention="<@1>", name="alice", id=1, display_avatar=None, banner=None,
+        created_at=datetime(2024, 1, 2, 3, 4, 5), top_role=SimpleNamespace(name="member"),
+    )
+    return SimpleNamespace(content="hello brave new world", guild=guild, author=author, channel=SimpleNamespace(name="general"))
+
+
+def collect_templates():
+    templates = list(EXTRA_TEMPLATES)
+    for pack in AutoReply.AUTOREPLY_TEMPLATE_PACKS.values():
+        for rule in pack["rules"]:
+            templates.extend(rule["response"])
+    return templates
+
+
+async def render_all(cog, templates, message, rounds, cold):
+    for _ in range(rounds):
+        for template in templates:
+            if cold:
+                AutoReply._TEMPLATE_CACHE.clear()
+            await cog._process_response_v2(template, message)
+
+
+async def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    cog = AutoReply.AutoReply(None)
+    cog._queue_template_reaction = lambda message, emoji: None
+    templates = collect_templates()
+    message = make_message()
+    renders = rounds * len(templates)
+
+    start = time.perf_counter()
+    await render_all(cog, templates, message, rounds, cold=True)
+    cold = time.perf_counter() - start
+
+    await render_all(cog, templates, message, 1, cold=False)
+    start = time.perf_counter()
+    await render_all(cog, templates, message, rounds, cold=False)
+    warm = time.perf_counter() - start
+
+    print(f"templates: {len(templates)}, renders: {renders}, cache: {AutoReply._TEMPLATE_CACHE.stats()}")
+    print(f"parse every render: {cold / renders * 1e6:9.1f} us/render")
+    print(f"compiled (cached):  {warm / renders * 1e6:9.1f} us/render")
+    print(f"speedup:            {cold / warm:9.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
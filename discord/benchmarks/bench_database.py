@@ -0,0 +1,72 @@
+"""Compare the legacy connect-per-call storage with the pooled write-behind engine.
+
+Usage: python benchmarks/bench_database.py [operations]
+"""
+import json
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+from database import Database
+
+
+class LegacyDatabase(Database):
+    """The pre-pool behaviour: one sqlite3.connect and one commit per call."""
+
+    def get_user_data(self, user_id, guild_id, key, default=None):
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute(
+                'SELECT data_value FROM user_data WHERE user_id = ? AND guild_id = ? AND data_key = ?',
+                (user_id, guild_id or 0, key),
+            ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_user_data(self, user_id, guild_id, key, value):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO user_data (user_id, guild_id, data_key, data_value) VALUES (?, ?, ?, ?)',
+                (user_id, guild_id or 0, key, json.dumps(value)),
+            )
+            conn.commit()
+        return True
+
+
+def run(database, operations):
+    start = time.perf_counter()
+    for i in range(operations):
+        user_id = i % 500
+        database.set_user_data(user_id, 1, "economy_balance", i)
+        database.get_user_data(user_id, 1, "economy_balance")
+        database.get_user_data(user_id, 1, "items", {})
+    database.flush()
+    elapsed = time.perf_counter() - start
+    return operations * 3 / elapsed
+
+
+def main():
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = LegacyDatabase(str(Path(tmp) / "legacy.db"), write_behind=False)
+        legacy.close()
+        # The legacy engine ran in rollback-journal mode.
+        with sqlite3.connect(legacy.db_path) as conn:
+            conn.execute("PRAGMA journal_mode=DELETE")
+        before = run(legacy, operations)
+
+        pooled = Database(str(Path(tmp) / "pooled.db"))
+        after = run(pooled, operations)
+        pooled.close()
+
+    print(f"operations:  {operations * 3} (1 set + 2 get per message)")
+    print(f"before:      {before:,.0f} ops/sec")
+    print(f"after:       {after:,.0f} ops/sec")
+    print(f"speedup:     {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Compare per-purchase config read-modify-write with EconomyAggregates.
+
+The old record path read and rewrote the supply, the transaction count and
+the exchange rate through get_server_config/set_server_config on every
+purchase, and recomputed the rate each time. The aggregates queue the deltas
+in memory, add them in SQL on flush and recompute the rate once per guild
+per flush. Both run against a temporary database with write-behind on, like
+the bot.
+Usage: python benchmarks/bench_economy_aggregates.py [purchases] [guilds]
+"""
+import math
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+from database import Database
+from economy_aggregates import EXCHANGE_RATE_KEY, SUPPLY_KEY, TRANSACTION_COUNT_KEY, EconomyAggregates
+
+WEIGHT = 0.005
+
+
+def market_rate(rate, supply, amount):
+    if supply <= 0:
+        return rate
+    return rate * (1 + min(math.log2(1 + amount / supply) * WEIGHT, 0.05))
+
+
+def legacy_purchase(db, guild_id, price):
+    supply = db.get_server_config(guild_id, SUPPLY_KEY, 0.0)
+    db.set_server_config(guild_id, SUPPLY_KEY, max(0, round(supply - price, 2)))
+    count = db.get_server_config(guild_id, TRANSACTION_COUNT_KEY, 0)
+    db.set_server_config(guild_id, TRANSACTION_COUNT_KEY, count + 1)
+    rate = db.get_server_config(guild_id, EXCHANGE_RATE_KEY, 1.0)
+    supply = db.get_server_config(guild_id, SUPPLY_KEY, 0.0)
+    db.set_server_config(guild_id, EXCHANGE_RATE_KEY, round(market_rate(rate, supply, price), 6))
+
+
+def recompute(guild_id, values, pressure):
+    rate = values.get(EXCHANGE_RATE_KEY, 1.0)
+    for _, _, amount in pressure:
+        rate = market_rate(rate, values.get(SUPPLY_KEY, 0.0), amount)
+    return round(rate, 6)
+
+
+def run(count, guilds, aggregated):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(str(Path(tmp) / "data.db"))
+        aggregates = EconomyAggregates(db, recompute, flush_interval=0.05)
+        try:
+            for guild_id in range(guilds):
+                db.set_server_config(guild_id, SUPPLY_KEY, 1_000_000.0)
+            db.flush()
+            start = time.perf_counter()
+            for index in range(count):
+                guild_id = index % guilds
+                if aggregated:
+                    aggregates.add(guild_id, SUPPLY_KEY, -25)
+                    aggregates.add(guild_id, TRANSACTION_COUNT_KEY, 1)
+                    aggregates.press(guild_id, "market_deflation", WEIGHT, 25)
+                else:
+                    legacy_purchase(db, guild_id, 25)
+            call = time.perf_counter() - start
+            aggregates.flush()
+            db.flush()
+            total = time.perf_counter() - start
+            final = db.get_server_config(0, TRANSACTION_COUNT_KEY)
+        finally:
+            aggregates.close()
+            db.close()
+    return call / count, total / count, final
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    guilds = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    print(f"purchases: {count}, guilds: {guilds}")
+    for name, aggregated in (("config read-modify-write", False), ("EconomyAggregates", True)):
+        call, total, final = run(count, guilds, aggregated)
+        print(f"{name:25} call {call * 1e6:7.2f} us   incl. flush {total * 1e6:7.2f} us   guild 0 tx count {final}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Compare the old economy_history blob rewrite with EconomyLedger appends and pages.
+
+The old log_transaction read the user's whole JSON history, appended one
+entry, trimmed it to 50 and wrote it back; /economy history then decoded
+the whole list again to show one page. The ledger inserts one row and reads
+a page with an indexed range query. Both run against a temporary database
+with write-behind on, like the bot.
+Usage: python benchmarks/bench_economy_ledger.py [transactions] [users]
+"""
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+from database import Database
+
+
+def legacy_log(db, guild_id, user_id, index):
+    history = db.get_user_data(user_id, guild_id, "economy_history", [])
+    history.append({
+        "type": "每日簽到",
+        "amount": 100,
+        "currency": "伺服幣",
+        "detail": f"#{index}",
+        "time": datetime.now(timezone.utc).isoformat(),
+        "balance_after": db.get_user_data(user_id, guild_id, "economy_balance", 0.0),
+    })
+    if len(history) > 50:
+        history = history[-50:]
+    db.set_user_data(user_id, guild_id, "economy_history", history)
+
+
+def legacy_page(db, guild_id, user_id):
+    history = list(reversed(db.get_user_data(user_id, guild_id, "economy_history", [])))
+    return history[:10]
+
+
+def ledger_log(db, guild_id, user_id, index):
+    balance = db.get_user_data(user_id, guild_id, "economy_balance", 0.0)
+    db.ledger.append(guild_id, user_id, "每日簽到", 100, "伺服幣", f"#{index}", balance)
+
+
+def ledger_page(db, guild_id, user_id):
+    return db.ledger.page(guild_id, user_id, 10)
+
+
+def run(log_fn, page_fn, count, users):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(str(Path(tmp) / "data.db"))
+        try:
+            start = time.perf_counter()
+            for index in range(count):
+                log_fn(db, 5, index % users, index)
+            db.flush()
+            write = time.perf_counter() - start
+            start = time.perf_counter()
+            for index in range(count):
+                page_fn(db, 5, index % users)
+            read = time.perf_counter() - start
+        finally:
+            db.close()
+    return write / count, read / count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    print(f"transactions: {count}, users: {users}")
+    for name, log_fn, page_fn in (
+        ("economy_history blob", legacy_log, legacy_page),
+        ("EconomyLedger", ledger_log, ledger_page),
+    ):
+        write, read = run(log_fn, page_fn, count, users)
+        print(f"{name:22} write {write * 1e6:8.1f} us/tx   page {read * 1e6:8.1f} us")
+
+
+if __name__ == "__main__":
+    main()
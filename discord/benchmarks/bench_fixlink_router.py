@@ -0,0 +1,174 @@
+"""Compare FixLink's old per-message URL matching with the compiled FixLinkRouter.
+
+The corpus is every URL in tests/test_fixlink.py, repeated into link-heavy
+messages, for a guild with the maximum number of custom platforms. The old
+path re-normalized the guild config on each message and matched every URL
+against uncompiled rule strings and a linear custom platform scan.
+Usage: python benchmarks/bench_fixlink_router.py [messages] [links_per_message]
+"""
+import json
+import random
+import re
+import sys
+import time
+from pathlib import Path
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+import FixLink
+from database import ServerConfigSnapshot
+
+
+def legacy_builtin_platform_for_hostname(hostname):
+    normalized = str(hostname or "").casefold().rstrip(".")
+    if normalized.startswith("www."):
+        normalized = normalized[4:]
+    for name, platform in FixLink.supported_platforms.items():
+        if normalized in platform.get("origins", []):
+            return name
+        if any(normalized == suffix or normalized.endswith(f".{suffix}") for suffix in platform.get("origin_suffixes", [])):
+            return name
+    return None
+
+
+def legacy_match_builtin(url):
+    try:
+        parsed = urlsplit(url)
+        port = parsed.port
+    except ValueError:
+        return None
+    if parsed.scheme.casefold() not in {"http", "https"} or parsed.username or parsed.password:
+        return None
+    if port not in (None, 80, 443):
+        return None
+    hostname = FixLink._normalized_host(url, strip_www=True)
+    platform_name = legacy_builtin_platform_for_hostname(hostname)
+    if platform_name is None:
+        return None
+    platform = FixLink.supported_platforms[platform_name]
+    if platform.get("special_handler"):
+        return None
+    decoded_path = unquote(parsed.path or "/")
+    query_keys = {key for key, _ in parse_qsl(parsed.query, keep_blank_values=True)}
+    for rule in platform.get("rules", []):
+        rule_hosts = rule.get("hosts")
+        if rule_hosts and hostname not in rule_hosts:
+            continue
+        if re.fullmatch(rule["path"], decoded_path, flags=re.IGNORECASE) is None:
+            continue
+        if not set(rule.get("query_keys", [])).issubset(query_keys):
+            continue
+        query_any = set(rule.get("query_any", []))
+        if query_any and query_any.isdisjoint(query_keys):
+            continue
+        return platform_name, platform, parsed, hostname
+    return None
+
+
+def legacy_find_custom(url, platforms):
+    try:
+        parsed = urlsplit(url)
+    except ValueError:
+        return None
+    if parsed.scheme.casefold() not in {"http", "https"}:
+        return None
+    hostname = (parsed.hostname or "").casefold().rstrip(".")
+    decoded_path = unquote(parsed.path or "/")
+    candidates = []
+    for platform in platforms:
+        if hostname not in platform.get("origins", []):
+            continue
+        for prefix in platform.get("path_prefixes", []):
+            if decoded_path.startswith(prefix):
+                candidates.append((len(prefix), platform))
+    if not candidates:
+        return None
+    candidates.sort(key=lambda item: item[0], reverse=True)
+    return candidates[0][1]
+
+
+def legacy_message(snapshot, content):
+    config = FixLink.normalize_fixlink_config(snapshot.get(FixLink.FIXLINK_CONFIG_KEY))
+    kinds = []
+    for extracted in FixLink.extract_urls(content):
+        if FixLink.parse_threads_url(extracted.url):
+            kinds.append("threads")
+        elif legacy_match_builtin(extracted.url):
+            kinds.append("builtin")
+        elif legacy_find_custom(extracted.url, config["custom_platforms"]):
+            kinds.append("custom")
+        else:
+            kinds.append(None)
+    return kinds
+
+
+def router_message(cog, content):
+    router = cog.get_router(1)
+    kinds = []
+    for extracted in FixLink.extract_urls(content):
+        route = router.route(extracted.url)
+        if route and route[0] == "threads" and not FixLink.parse_threads_url(extracted.url):
+            route = None
+        kinds.append(route[0] if route else None)
+    return kinds
+
+
+def custom_platforms():
+    platforms = []
+    for index in range(FixLink.MAX_CUSTOM_PLATFORMS):
+        platforms.append({
+            "id": f"benchcustom{index:05d}",
+            "name": f"Custom {index}",
+            "origins": [f"site{index}.example.org", "shared.example.org"],
+            "path_prefixes": [f"/p{index}/", f"/p{index}/a/", f"/p{index}/b/", f"/q{index}/", f"/r{index}/"],
+            "keep_query_keys": ["id"],
+            "fixer": {"name": "Fix", "endpoint": "https://fix.example.org/embed", "source_param": "url"},
+        })
+    return platforms
+
+
+def build_messages(rng, urls, count, per_message):
+    messages = []
+    for _ in range(count):
+        words = []
+        for url in rng.sample(urls, min(per_message, len(urls))):
+            words.append(rng.choice(["看這個", "lol", "笑死", "wow"]))
+            words.append(url)
+        messages.append(" ".join(words))
+    return messages
+
+
+def run(check, target, messages):
+    start = time.perf_counter()
+    results = [check(target, content) for content in messages]
+    return time.perf_counter() - start, results
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    per_message = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    corpus = (DISCORD_DIR / "tests" / "test_fixlink.py").read_text(encoding="utf-8")
+    urls = sorted({item.url for item in FixLink.extract_urls(corpus)})
+    urls += [f"https://shared.example.org/p{index}/a/{index}?id=1" for index in range(FixLink.MAX_CUSTOM_PLATFORMS)]
+    messages = build_messages(random.Random(42), urls, count, per_message)
+
+    raw = json.dumps({"enabled": True, "disabled_platforms": [], "custom_platforms": custom_platforms()})
+    snapshot = ServerConfigSnapshot(1, {FixLink.FIXLINK_CONFIG_KEY: raw})
+    FixLink.get_server_config_snapshot = lambda guild_id: snapshot
+    cog = FixLink.FixLink(FixLink.bot)
+
+    old_total, old_results = run(legacy_message, snapshot, messages)
+    new_total, new_results = run(router_message, cog, messages)
+    links = sum(len(kinds) for kinds in old_results)
+    mismatches = sum(old != new for old, new in zip(old_results, new_results))
+
+    print(f"corpus urls: {len(urls)}, messages: {count}, links: {links}, mismatches: {mismatches}")
+    print(f"normalize + linear match: {old_total / count * 1e6:9.1f} us/message")
+    print(f"FixLinkRouter:            {new_total / count * 1e6:9.1f} us/message")
+    print(f"speedup:                  {old_total / new_total:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Replay benchmark: HackedDetector's raw gateway listener.
+
+Replays gateway frames through the old path (decode + json.loads on every
+frame) and the new one (byte-level prefilter, then the fastest available JSON
+decoder for the few survivors), reporting events/sec and CPU time.
+
+Usage: python benchmarks/bench_gateway_prefilter.py [capture.jsonl] [frames]
+
+A capture is one raw gateway frame per line (as received by
+on_socket_raw_receive). Without one, a synthetic mix shaped like a busy
+bot's traffic is generated.
+"""
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+import gateway_prefilter
+from gateway_prefilter import decode_payload, may_match
+
+THUMBHASHES = {"3PcNNYSFeXh/d3eld0iHZoZgVwh2", "1QcSHQRnh493V4dIh4eXh1h4kJUI"}
+
+# (event, weight) roughly matching a large bot with presence and member intents
+EVENT_MIX = [
+    ("PRESENCE_UPDATE", 45),
+    ("TYPING_START", 15),
+    ("GUILD_MEMBER_UPDATE", 8),
+    ("MESSAGE_CREATE", 20),
+    ("MESSAGE_UPDATE", 5),
+    ("MESSAGE_REACTION_ADD", 5),
+    ("VOICE_STATE_UPDATE", 2),
+]
+
+
+def synthetic_frame(rng, sequence):
+    event = rng.choices([name for name, _ in EVENT_MIX], [weight for _, weight in EVENT_MIX])[0]
+    user = {"id": str(rng.randrange(10**17, 10**18)), "username": f"user{rng.randrange(10000)}", "avatar": "a" * 32, "bot": False}
+    data = {"guild_id": str(rng.randrange(10**17, 10**18)), "user": user}
+    if event == "PRESENCE_UPDATE":
+        data["status"] = rng.choice(["online", "idle", "dnd"])
+        data["activities"] = [{"name": "Visual Studio Code", "type": 0, "state": "Editing main.py" * rng.randint(1, 4)}]
+    elif event.startswith("MESSAGE_"):
+        data.update({"channel_id": str(rng.randrange(10**17, 10**18)), "author": user, "content": "lorem ipsum " * rng.randint(1, 30), "embeds": [], "mentions": []})
+        attachments = []
+        roll = rng.random()
+        if roll < 0.1:
+            attachments = [{"id": str(i), "filename": "image.png", "size": 12345, "placeholder": "m" * 28, "placeholder_version": 1} for i in range(rng.randint(1, 4))]
+        elif roll < 0.102:
+            attachments = [{"id": str(i), "filename": "image.png", "placeholder": rng.choice(sorted(THUMBHASHES))} for i in range(4)]
+        data["attachments"] = attachments
+    return json.dumps({"t": event, "s": sequence, "op": 0, "d": data}, separators=(",", ":"))
+
+
+def old_listener(payload):
+    if isinstance(payload, bytes):
+        try:
+            payload = payload.decode("utf-8")
+        except Exception:
+            return None
+    try:
+        data = json.loads(payload)
+    except json.JSONDecodeError:
+        return None
+    if data.get("t") != "MESSAGE_CREATE":
+        return None
+    return data
+
+
+def new_listener(payload):
+    if not may_match(payload, "MESSAGE_CREATE", '"placeholder"'):
+        return None
+    data = decode_payload(payload)
+    if data is None or data.get("t") != "MESSAGE_CREATE":
+        return None
+    return data
+
+
+def suspicious(data):
+    if data is None:
+        return False
+    attachments = data["d"].get("attachments", [])
+    return len(attachments) in (2, 4) and all(attachment.get("placeholder") in THUMBHASHES for attachment in attachments)
+
+
+def run(listener, frames):
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    hits = sum(1 for payload in frames if suspicious(listener(payload)))
+    return time.perf_counter() - wall, time.process_time() - cpu, hits
+
+
+def main():
+    args = sys.argv[1:]
+    capture = Path(args.pop(0)) if args and not args[0].isdigit() else None
+    frame_count = int(args[0]) if args else 100_000
+    if capture is not None:
+        frames = [line for line in capture.read_text(encoding="utf-8").splitlines() if line.strip()]
+    else:
+        rng = random.Random(42)
+        frames = [synthetic_frame(rng, sequence) for sequence in range(frame_count)]
+
+    old_wall, old_cpu, old_hits = run(old_listener, frames)
+    new_wall, new_cpu, new_hits = run(new_listener, frames)
+    assert old_hits == new_hits, "prefilter changed which frames are flagged"
+
+    print(f"frames: {len(frames)} ({'capture' if capture else 'synthetic'}), suspicious: {new_hits}, decoder: {gateway_prefilter.JSON_BACKEND}")
+    print(f"json.loads every frame: {len(frames) / old_wall:12,.0f} events/s  cpu {old_cpu * 1e3:8.1f} ms")
+    print(f"prefilter + decoder:    {len(frames) / new_wall:12,.0f} events/s  cpu {new_cpu * 1e3:8.1f} ms")
+    print(f"cpu saved:              {(1 - new_cpu / old_cpu) * 100:11.1f} %")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Compare the old leaderboard (decode every balance row, sort in Python) with the indexed top-N query.
+
+Usage: python benchmarks/bench_leaderboard.py [users]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+from database import Database
+
+GUILD_ID = 1
+ROUNDS = 20
+
+
+def legacy_leaderboard(database):
+    all_users = database.get_all_user_data(GUILD_ID, "economy_balance")
+    sorted_users = sorted(all_users.items(), key=lambda x: x[1].get("economy_balance", 0), reverse=True)
+    return [(user_id, data["economy_balance"]) for user_id, data in sorted_users[:10]]
+
+
+def timed(func, database):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        result = func(database)
+    return (time.perf_counter() - start) / ROUNDS * 1000, result
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    with tempfile.TemporaryDirectory() as tmp:
+        database = Database(str(Path(tmp) / "bench.db"))
+        for user_id in range(users):
+            database.set_user_data(user_id, GUILD_ID, "economy_balance", round((user_id * 7919) % 100003 / 3, 2))
+        database.flush()
+
+        before, legacy_top = timed(legacy_leaderboard, database)
+        after, top = timed(lambda db: db.get_top_balances(GUILD_ID, 10), database)
+        database.close()
+
+    assert [balance for _, balance in legacy_top] == [balance for _, balance in top]
+    print(f"users:   {users}")
+    print(f"before:  {before:.2f} ms per leaderboard")
+    print(f"after:   {after:.3f} ms per leaderboard")
+    print(f"speedup: {before / after:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
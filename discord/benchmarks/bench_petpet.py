@@ -0,0 +1,84 @@
+"""PetPet GIF throughput: overlays re-opened per call vs preloaded, and cache hits.
+
+Usage: python benchmarks/bench_petpet.py [gifs]
+"""
+import io
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+import petpet
+
+
+def legacy_make(avatar):
+    images = []
+    base = Image.open(io.BytesIO(avatar)).convert("RGBA").resize(petpet.resolution)
+    for i in range(petpet.frames):
+        squeeze = i if i < petpet.frames / 2 else petpet.frames - i
+        width = 0.8 + squeeze * 0.02
+        height = 0.8 - squeeze * 0.05
+        canvas = Image.new("RGBA", size=petpet.resolution, color=(0, 0, 0, 0))
+        canvas.paste(
+            base.resize((round(width * 128), round(height * 128))),
+            (round(((1 - width) * 0.5 + 0.1) * 128), round(((1 - height) - 0.08) * 128)),
+        )
+        pet = Image.open(os.path.join(petpet.PETPET_ASSET_DIR, f"pet{i}.gif")).convert("RGBA").resize(petpet.resolution)
+        canvas.paste(pet, mask=pet)
+        images.append(canvas)
+    buffer = io.BytesIO()
+    petpet.save_transparent_gif(images, durations=20, save_file=buffer)
+    return buffer.getvalue()
+
+
+def cached_make(cache, url, avatar):
+    data = cache.get(url)
+    if data is None:
+        data = petpet.make_bytes(avatar)
+        cache.put(url, data)
+    return data
+
+
+def measure(func, calls):
+    latencies = []
+    start = time.perf_counter()
+    for args in calls:
+        call_start = time.perf_counter()
+        func(*args)
+        latencies.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return len(calls) / elapsed, latencies[int(len(latencies) * 0.95) - 1] * 1000
+
+
+def main():
+    gifs = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    rng = random.Random(1)
+    avatars = []
+    for seed in range(10):
+        image = Image.new("RGBA", (128, 128), (rng.randrange(256), rng.randrange(256), rng.randrange(256), 255))
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        avatars.append((f"https://cdn.example/avatars/{seed}.png", buffer.getvalue()))
+    # popular users get petted over and over
+    requests = [avatars[min(int(rng.expovariate(0.5)), len(avatars) - 1)] for _ in range(gifs)]
+
+    petpet.load_overlays()
+    cache = petpet.PetPetCache()
+    results = {
+        "legacy": measure(legacy_make, [(avatar,) for _, avatar in requests]),
+        "preloaded": measure(petpet.make_bytes, [(avatar,) for _, avatar in requests]),
+        "preloaded+cache": measure(lambda url, avatar: cached_make(cache, url, avatar), requests),
+    }
+    for name, (rate, p95) in results.items():
+        print(f"{name:16} {rate:8.1f} GIFs/s   p95 {p95:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Compare the TWBus timestamp-in-user_data cooldown with the in-memory RateLimiter.
+
+Both check and record one cooldown per interaction for a pool of users.
+Usage: python benchmarks/bench_rate_limiter.py [interactions] [users]
+"""
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+from database import Database
+from rate_limiter import RateLimiter
+
+COOLDOWN = 10
+
+
+def legacy_check(database, user_id):
+    # what TWBus rate_limit used to do on every command
+    last = database.get_user_data(0, str(user_id), "rate_limit_last", None)
+    if last and (datetime.utcnow() - datetime.fromisoformat(last)).total_seconds() < COOLDOWN:
+        return False
+    database.set_user_data(0, str(user_id), "rate_limit_last", datetime.utcnow().isoformat())
+    return True
+
+
+def limiter_check(limiter, user_id):
+    return not limiter.hit(user_id)
+
+
+def run(check, store, interactions, users):
+    allowed = 0
+    start = time.perf_counter()
+    for i in range(interactions):
+        allowed += check(store, i % users)
+    return time.perf_counter() - start, allowed
+
+
+def main():
+    interactions = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    with tempfile.TemporaryDirectory() as tmp:
+        database = Database(str(Path(tmp) / "bench.db"))
+        old_total, old_allowed = run(legacy_check, database, interactions, users)
+        database.close()
+    new_total, new_allowed = run(limiter_check, RateLimiter(1, COOLDOWN), interactions, users)
+
+    print(f"interactions: {interactions}, users: {users}, allowed old/new: {old_allowed}/{new_allowed}")
+    print(f"user_data timestamps: {old_total / interactions * 1e6:9.2f} us/interaction")
+    print(f"RateLimiter:          {new_total / interactions * 1e6:9.2f} us/interaction")
+    print(f"speedup:              {old_total / new_total:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Micro-benchmark: AutoModerate anti_spam during a 500-user raid.
+
+Every raider posts long near-duplicate messages (a shared template with a few
+random edits) a couple of times per second. Compares the old per-user list +
+pairwise SequenceMatcher check with SpamTracker.
+Usage: python benchmarks/bench_spam_tracker.py [users] [messages_per_user]
+"""
+import random
+import sys
+import time
+from difflib import SequenceMatcher
+from pathlib import Path
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+from spam_tracker import SpamTracker
+
+MAX_MESSAGES = 5
+TIME_WINDOW = 30
+THRESHOLD = 0.75
+TEMPLATE = "@everyone FREE DISCORD NITRO giveaway!!! claim now at https://dlscord-gift.example/claim before it expires, only 100 left. "
+
+
+def mutate(rng, text):
+    chars = list(text)
+    for _ in range(rng.randint(1, 12)):
+        chars[rng.randrange(len(chars))] = rng.choice("abcdefghijklmnopqrstuvwxyz!? ")
+    return "".join(chars)
+
+
+def build_raid(rng, users, per_user):
+    events = []
+    for user_id in range(users):
+        base = TEMPLATE * rng.randint(3, 12)
+        start = rng.uniform(0, 5)
+        for index in range(per_user):
+            events.append((start + index * rng.uniform(0.3, 1.0), user_id, mutate(rng, base)))
+    events.sort()
+    return events
+
+
+def legacy_check(tracker, user_id, content, now):
+    history = tracker.setdefault(user_id, [])
+    history[:] = [(c, t) for c, t in history if now - t < TIME_WINDOW]
+    history.append((content, now))
+    if len(history) < MAX_MESSAGES:
+        return False
+    similar = 0
+    for old_content, _ in history[:-1]:
+        if content == old_content or (content and old_content and SequenceMatcher(None, content, old_content).ratio() >= THRESHOLD):
+            similar += 1
+    if similar >= MAX_MESSAGES - 1:
+        history.clear()
+        return True
+    return False
+
+
+def tracker_check(tracker, user_id, content, now):
+    similar = tracker.record(user_id, content, now, TIME_WINDOW, MAX_MESSAGES, THRESHOLD)
+    if similar is not None and similar >= MAX_MESSAGES - 1:
+        tracker.reset(user_id)
+        return True
+    return False
+
+
+def run(check, tracker, events):
+    worst = 0.0
+    flagged = 0
+    start = time.perf_counter()
+    for now, user_id, content in events:
+        tick = time.perf_counter()
+        flagged += check(tracker, user_id, content, now)
+        worst = max(worst, time.perf_counter() - tick)
+    return time.perf_counter() - start, worst, flagged
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    per_user = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    events = build_raid(random.Random(42), users, per_user)
+
+    old_total, old_worst, old_flagged = run(legacy_check, {}, events)
+    new_total, new_worst, new_flagged = run(tracker_check, SpamTracker(), events)
+
+    print(f"raiders: {users}, messages: {len(events)}, flagged old/new: {old_flagged}/{new_flagged}")
+    print(f"list + SequenceMatcher: {old_total / len(events) * 1e6:9.1f} us/message  worst {old_worst * 1e3:7.2f} ms  total {old_total:6.2f} s")
+    print(f"SpamTracker:            {new_total / len(events) * 1e6:9.1f} us/message  worst {new_worst * 1e3:7.2f} ms  total {new_total:6.2f} s")
+    print(f"speedup:                {old_total / new_total:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Short-lived snapshots of complete TWBus route info.
+
+``RouteSnapshotCache.get(route_key)`` returns a ``RouteSnapshot``: the
+per-path stop lists with ETAs, the route row, and a ``stop_id -> (path_id,
+index)`` index built once per fetch, so finding a stop is a dict lookup.
+
+A snapshot is fresh for ``ttl`` seconds. Until ``stale_ttl`` it is still
+served immediately while one background fetch replaces it
+(stale-while-revalidate), so refresh buttons on a popular route never wait
+on the API. Older or missing snapshots are fetched in the foreground.
+Concurrent misses for one route share a single fetch.
+
+Snapshots are shared between views and must not be modified.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+SNAPSHOT_TTL = 10.0
+SNAPSHOT_STALE_TTL = 30.0
+MAX_ROUTES = 256
+
+
+class RouteSnapshot:
+    __slots__ = ("route_key", "info", "route", "stop_index", "fetched_at", "fetched_at_utc")
+
+    def __init__(self, route_key: int, info: dict, route: Optional[dict], fetched_at: float):
+        self.route_key = route_key
+        # taiwanbus 會原地更新自己快取的站牌 dict，複製一份避免被下一次查詢改掉
+        self.info = {
+            path_id: {**path_data, "stops": [dict(stop) for stop in path_data["stops"]]}
+            for path_id, path_data in info.items()
+        }
+        self.route = route
+        self.stop_index: dict = {}
+        for path_id, path_data in self.info.items():
+            for index, stop in enumerate(path_data["stops"]):
+                self.stop_index.setdefault(stop["stop_id"], (path_id, index))
+        self.fetched_at = fetched_at
+        self.fetched_at_utc = datetime.now(timezone.utc)
+
+    def locate(self, stop_id: int) -> Optional[tuple]:
+        """(path_id, index) of the first path that stops at ``stop_id``"""
+        return self.stop_index.get(stop_id)
+
+    def age(self, now: Optional[float] = None) -> float:
+        return (time.monotonic() if now is None else now) - self.fetched_at
+
+
+class RouteSnapshotCache:
+    def __init__(self, loader: Callable[[int], tuple], ttl: float = SNAPSHOT_TTL,
+                 stale_ttl: float = SNAPSHOT_STALE_TTL, max_routes: int = MAX_ROUTES,
+                 on_error: Optional[Callable[[int, BaseException], None]] = None):
+        """``loader(route_key) -> (info, route)`` is blocking and runs in a worker thread.
+        ``on_error`` is told about failed background refreshes; the stale snapshot stays in place."""
+        self.loader = loader
+        self.on_error = on_error
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_routes = max_routes
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._snapshots: OrderedDict[int, RouteSnapshot] = OrderedDict()
+        self._loading: dict[int, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._snapshots)
+
+    async def get(self, route_key: int) -> RouteSnapshot:
+        snapshot = self._snapshots.get(route_key)
+        if snapshot is not None:
+            age = snapshot.age()
+            if age < self.ttl:
+                self.hits += 1
+                self._snapshots.move_to_end(route_key)
+                return snapshot
+            if age < self.stale_ttl:
+                self.stale_hits += 1
+                self._snapshots.move_to_end(route_key)
+                self._revalidate(route_key)
+                return snapshot
+        self.misses += 1
+        return await asyncio.shield(self._fetch(route_key))
+
+    def _fetch(self, route_key: int) -> asyncio.Future:
+        pending = self._loading.get(route_key)
+        if pending is None:
+            pending = asyncio.ensure_future(self._load(route_key))
+            self._loading[route_key] = pending
+            pending.add_done_callback(lambda _: self._loading.pop(route_key, None))
+        return pending
+
+    def _revalidate(self, route_key: int):
+        if route_key in self._loading:
+            return
+        self._fetch(route_key).add_done_callback(lambda future: self._report(route_key, future))
+
+    def _report(self, route_key: int, future: asyncio.Future):
+        if future.cancelled() or future.exception() is None:
+            return
+        if self.on_error is not None:
+            self.on_error(route_key, future.exception())
+
+    async def _load(self, route_key: int) -> RouteSnapshot:
+        info, route = await asyncio.to_thread(self.loader, route_key)
+        snapshot = RouteSnapshot(route_key, info, route, time.monotonic())
+        self._snapshots[route_key] = snapshot
+        self._snapshots.move_to_end(route_key)
+        while len(self._snapshots) > self.max_routes:
+            self._snapshots.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, route_key: Optional[int] = None):
+        if route_key is None:
+            self._snapshots.clear()
+        else:
+            self._snapshots.pop(route_key, None)
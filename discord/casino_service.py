@@ -98,6 +98,7 @@ class CasinoService:
         self.db_path = db_path or db.db_path
 
     def _connect(self):
+        db.flush()
         conn = sqlite3.connect(self.db_path, timeout=30)
         conn.row_factory = sqlite3.Row
         return conn
@@ -144,30 +145,30 @@ class CasinoService:
     def _balance(conn, user_id: int) -> float:
         row = conn.execute(
             """
-            SELECT data_value FROM user_data
-            WHERE user_id = ? AND guild_id = ? AND data_key = 'economy_balance'
+            SELECT balance FROM user_balances
+            WHERE guild_id = ? AND user_id = ?
             """,
-            (int(user_id), Economy.GLOBAL_GUILD_ID),
+            (Economy.GLOBAL_GUILD_ID, int(user_id)),
         ).fetchone()
         try:
             return float(row[0]) if row else 0.0
         except (TypeError, ValueError):
             return 0.0
 
-    @staticmethod
-    def _log_events(events: Iterable[tuple[int, str, float, str]]) -> None:
+    @classmethod
+    def _log_events(cls, conn, events: Iterable[tuple[int, str, float, str]]) -> None:
+        """Append the ledger rows inside the caller's transaction, before it commits."""
         for user_id, tx_type, amount, detail in events:
-            try:
-                Economy.log_transaction(
-                    Economy.GLOBAL_GUILD_ID,
-                    user_id,
-                    tx_type,
-                    amount,
-                    Economy.GLOBAL_CURRENCY_NAME,
-                    detail,
-                )
-            except Exception:
-                pass
+            Economy.log_transaction(
+                Economy.GLOBAL_GUILD_ID,
+                user_id,
+                tx_type,
+                amount,
+                Economy.GLOBAL_CURRENCY_NAME,
+                detail,
+                balance_after=cls._balance(conn, user_id),
+                connection=conn,
+            )
 
     @staticmethod
     def _lottery_state_from_conn(conn, guild_id: int = Economy.GLOBAL_GUILD_ID) -> dict:
@@ -215,6 +216,7 @@ class CasinoService:
             conn.execute("BEGIN IMMEDIATE")
             self._save_lottery_state(conn, rules.normalize_lottery_state(state), guild_id)
             conn.commit()
+        db.invalidate_server_config(guild_id)
         return True
 
     def play(self, user_id: int, payload: dict) -> dict:
@@ -264,11 +266,11 @@ class CasinoService:
                 "result": outcome,
             }
             self._store_request(conn, request_id, user_id, "play", response)
-            conn.commit()
             logs.append((user_id, f"Explore {game} 下注", -bet, f"Explore 賭場 {game} 下注"))
             if payout > 0:
                 logs.append((user_id, f"Explore {game} 派彩", payout, f"Explore 賭場 {game} 派彩"))
-        self._log_events(logs)
+            self._log_events(conn, logs)
+            conn.commit()
         return response
 
     def _instant_outcome(self, game: str, payload: dict) -> dict:
@@ -345,9 +347,10 @@ class CasinoService:
                 "lottery": self.lottery_public(state, user_id),
             }
             self._store_request(conn, request_id, user_id, "lottery", response, state.get("round_id"))
-            conn.commit()
             logs.append((user_id, f"{source} 彩票下注", -bet, f"購買 {number_key} 號彩票"))
-        self._log_events(logs)
+            self._log_events(conn, logs)
+            conn.commit()
+            db.invalidate_server_config(Economy.GLOBAL_GUILD_ID)
         return response
 
     def prepare_lottery_settlement(
@@ -433,6 +436,7 @@ class CasinoService:
 
             self._save_lottery_state(conn, state, guild_id)
             conn.commit()
+            db.invalidate_server_config(guild_id)
             return state, True
 
     def start_round(self, user_id: int, payload: dict) -> dict:
@@ -498,11 +502,11 @@ class CasinoService:
                 round_id, game, bet, status, state, payout, balance, expires_at, result
             )
             self._store_request(conn, request_id, user_id, "round_start", response, round_id)
-            conn.commit()
             logs.append((user_id, f"Explore {game} 下注", -bet, f"Explore 賭場 {game} 開始"))
             if payout > 0:
                 logs.append((user_id, f"Explore {game} 派彩", payout, f"Explore 賭場 {game} 結算"))
-        self._log_events(logs)
+            self._log_events(conn, logs)
+            conn.commit()
         return response
 
     def _new_round_state(self, game: str, bet: float) -> dict:
@@ -547,8 +551,8 @@ class CasinoService:
             if row["status"] != "active":
                 response = self._response_from_row(row, self._balance(conn, user_id))
                 self._store_request(conn, request_id, user_id, "round_action", response, round_id)
+                self._log_events(conn, logs)
                 conn.commit()
-                self._log_events(logs)
                 return response
             state = _loads(row["state_json"], {})
             game = row["game"]
@@ -584,12 +588,12 @@ class CasinoService:
                 None if settled else expires_at, result
             )
             self._store_request(conn, request_id, user_id, "round_action", response, round_id)
-            conn.commit()
             if extra_bet > 0:
                 logs.append((user_id, "Explore blackjack 加倍", -extra_bet, "Explore 21 點加倍"))
             if settled and payout > 0:
                 logs.append((user_id, f"Explore {game} 派彩", payout, f"Explore 賭場 {game} 結算"))
-        self._log_events(logs)
+            self._log_events(conn, logs)
+            conn.commit()
         return response
 
     def _apply_action(self, conn, user_id, game, bet, state, action, payload):
@@ -767,8 +771,8 @@ class CasinoService:
                 "bet_min": rules.BET_MIN,
                 "bet_max": rules.BET_MAX,
             }
+            self._log_events(conn, logs)
             conn.commit()
-        self._log_events(logs)
         return response
 
     def _response_from_row(self, row, balance: float) -> dict:
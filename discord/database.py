@@ -1,9 +1,34 @@
 import sqlite3
 import json
 import os
-from typing import Any, Dict, Optional
+import atexit
+import logging
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional
 
 DB_PATH = 'data.db'
+DB_POOL_SIZE = 4
+DB_FLUSH_INTERVAL = 0.005  # seconds to gather a group commit
+DB_MAX_BATCH = 512
+DB_FLUSH_RETRIES = 5  # failed group commits in a row before the batch is committed write by write
+CONFIG_CACHE_SIZE = 1024  # guilds kept in the server config cache
+SCHEMA_VERSION = 3  # PRAGMA user_version; 1 = hot user_data keys in typed tables, 2 = AI conversation log, 3 = economy ledger
+AI_CONVERSATION_MAX_MESSAGES = 200  # same as ai.ConversationManager.MAX_HISTORY_LENGTH
+AI_CONVERSATION_CACHE_SIZE = 256  # conversation tails kept in memory
+AI_CONVERSATION_FLUSH_INTERVAL = 1.0
+AI_CONVERSATION_PRUNE_INTERVAL = 60.0
+COUNTER_FLUSH_INTERVAL = 10.0  # seconds between counter delta flushes
+COUNTER_HOURLY_RETENTION = timedelta(days=14)
+COUNTER_DAILY_RETENTION = timedelta(days=366)
+LEDGER_COMPACT_AFTER = timedelta(days=180)  # older economy transactions are folded into summary rows
+LEDGER_COMPACT_BATCH = 500  # (guild, user, currency) groups folded per compact() call
+LEDGER_SUMMARY_TYPE = "歷史彙總"
 
 # Default server configuration
 DEFAULT_SERVER_CONFIG = {
@@ -22,14 +47,848 @@ DEFAULT_SERVER_CONFIG = {
     "dsize_drop_item_chance": 5,
 }
 
+# user_data keys that live in their own typed tables; the EAV API routes them transparently
+BALANCE_KEY = 'economy_balance'
+ECONOMY_HISTORY_KEY = 'economy_history'  # legacy blob, moved into economy_transactions (schema v3)
+ITEMS_KEY = 'items'
+AI_CONVERSATION_PREFIX = 'ai_conversation_'
+
+
+def _log_error(message: str):
+    """Report through logger.log once the bot's logger module is loaded (it imports this module), print before that"""
+    logger = sys.modules.get('logger')
+    if logger is not None and hasattr(logger, 'log'):
+        try:
+            logger.log(message, level=logging.ERROR, module_name="Database")
+            return
+        except Exception:
+            pass
+    print(message)
+
+
+def _user_data_table(key: str) -> str:
+    if key == BALANCE_KEY:
+        return 'user_balances'
+    if key == ITEMS_KEY:
+        return 'user_items'
+    if key.startswith(AI_CONVERSATION_PREFIX):
+        return 'ai_conversation_messages'
+    return 'user_data'
+
+
+def _normalize_items(value: Any) -> Dict[str, Any]:
+    """items is {item_id: count}; the old list-of-ids format is counted up"""
+    if isinstance(value, dict):
+        return {str(item_id): count for item_id, count in value.items()}
+    if isinstance(value, list):
+        counts: Dict[str, Any] = {}
+        for item_id in value:
+            counts[str(item_id)] = counts.get(str(item_id), 0) + 1
+        return counts
+    return {}
+
+
+_CONVERSATION_INSERT_SQL = (
+    'INSERT INTO ai_conversation_messages (user_id, guild_id, conversation_key, role, content, timestamp, tokens) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?)'
+)
+
+
+def _conversation_rows(user_id: int, guild_id: int, key: str, history: Any, limit: int) -> list:
+    """Message rows of a legacy JSON history list (the newest ``limit`` dict entries)"""
+    if not isinstance(history, list):
+        return []
+    rows = []
+    for message in history[-limit:]:
+        if not isinstance(message, dict):
+            continue
+        rows.append((
+            user_id, guild_id, key,
+            str(message.get("role") or ""), str(message.get("content") or ""),
+            message.get("timestamp") or 0, None,
+        ))
+    return rows
+
+
+_LEDGER_INSERT_SQL = (
+    'INSERT INTO economy_transactions (guild_id, user_id, created_at, tx_type, amount, currency, detail, balance_after, entries) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'
+)
+
+
+def _parse_timestamp(value: Any) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _ledger_rows(guild_id: int, user_id: int, history: Any) -> list:
+    """Transaction rows of a legacy economy_history JSON list, oldest first"""
+    if not isinstance(history, list):
+        return []
+    rows = []
+    for entry in history:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            amount = float(entry.get("amount") or 0)
+        except (TypeError, ValueError):
+            amount = 0.0
+        try:
+            balance_after = float(entry["balance_after"])
+        except (KeyError, TypeError, ValueError):
+            balance_after = None
+        rows.append((
+            guild_id, user_id, _parse_timestamp(entry.get("time")),
+            str(entry.get("type") or ""), amount, str(entry.get("currency") or ""),
+            str(entry.get("detail") or ""), balance_after, 1,
+        ))
+    return rows
+
+
+def _matches_stored_value(stored: Any, value: Any) -> bool:
+    """get_all_user_data's ``value`` filter for typed tables (user_data compares the stored text)"""
+    if isinstance(stored, float):
+        try:
+            return stored == float(value)
+        except (TypeError, ValueError):
+            return False
+    encoded = json.dumps(stored) if isinstance(stored, (dict, list)) else str(stored)
+    return encoded == str(value)
+
+
+def _decode_value(raw: str) -> Any:
+    """Decode a stored config/user value the same way regardless of where it came from"""
+    try:
+        return json.loads(raw)
+    except (json.JSONDecodeError, TypeError):
+        # Try to convert to bool
+        if raw.lower() in ('true', 'false'):
+            return raw.lower() == 'true'
+        if raw.lower() == 'none':
+            return None
+        # Try to convert to int if it looks like a number
+        try:
+            return int(raw)
+        except (ValueError, TypeError):
+            return raw
+
+
+class FrozenDict(dict):
+    """A dict that refuses mutation; handed out by server config snapshots"""
+    __slots__ = ()
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("server config snapshots are read-only; use get_server_config() for a mutable copy")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def copy(self):
+        return dict(self)
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return _thaw(self)
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+
+class FrozenList(list):
+    """A list that refuses mutation; handed out by server config snapshots"""
+    __slots__ = ()
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("server config snapshots are read-only; use get_server_config() for a mutable copy")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = extend = insert = pop = remove = clear = sort = reverse = _readonly
+
+    def copy(self):
+        return list(self)
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return _thaw(self)
+
+    def __reduce__(self):
+        return (FrozenList, (list(self),))
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, dict):
+        return FrozenDict((k, _freeze(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return FrozenList(_freeze(v) for v in value)
+    return value
+
+
+def _thaw(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_thaw(v) for v in value]
+    return value
+
+
+_FROZEN_DEFAULT_SERVER_CONFIG = {key: _freeze(value) for key, value in DEFAULT_SERVER_CONFIG.items()}
+
+
+class ServerConfigSnapshot:
+    """Immutable, pre-parsed view of every server_configs row of one guild"""
+    __slots__ = ("guild_id", "_raw", "_values")
+
+    def __init__(self, guild_id: int, raw: Dict[str, str], values: Optional[Dict[str, Any]] = None):
+        self.guild_id = guild_id
+        self._raw = raw
+        if values is None:
+            values = {key: _freeze(_decode_value(value)) for key, value in raw.items()}
+        self._values = values
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Same lookup rules as Database.get_server_config, but returns a shared read-only value"""
+        if key in self._values:
+            return self._values[key]
+        return default if default is not None else _FROZEN_DEFAULT_SERVER_CONFIG.get(key)
+
+    def raw(self, key: str) -> Optional[str]:
+        return self._raw.get(key)
+
+    def raw_items(self):
+        return self._raw.items()
+
+    def replace(self, key: str, raw_value: str) -> "ServerConfigSnapshot":
+        """Return a new snapshot with one key changed, reusing every other parsed value"""
+        raw = dict(self._raw)
+        raw[key] = raw_value
+        values = dict(self._values)
+        values[key] = _freeze(_decode_value(raw_value))
+        return ServerConfigSnapshot(self.guild_id, raw, values)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._raw
+
+    def __len__(self) -> int:
+        return len(self._raw)
+
+
+class ServerConfigCache:
+    """Bounded LRU of per-guild config snapshots with write-through updates"""
+
+    def __init__(self, loader: Callable[[int], Dict[str, str]], max_guilds: int = CONFIG_CACHE_SIZE):
+        self._loader = loader
+        self.max_guilds = max(1, max_guilds)
+        self._snapshots: "OrderedDict[int, ServerConfigSnapshot]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, guild_id: int) -> ServerConfigSnapshot:
+        with self._lock:
+            snapshot = self._snapshots.get(guild_id)
+            if snapshot is not None:
+                self._snapshots.move_to_end(guild_id)
+                self.hits += 1
+                return snapshot
+            self.misses += 1
+            generation = self._generation
+
+        snapshot = ServerConfigSnapshot(guild_id, self._loader(guild_id))
+        with self._lock:
+            # Only keep the load if nothing was written while it ran.
+            if generation == self._generation:
+                self._snapshots[guild_id] = snapshot
+                self._snapshots.move_to_end(guild_id)
+                while len(self._snapshots) > self.max_guilds:
+                    self._snapshots.popitem(last=False)
+        return snapshot
+
+    def apply(self, guild_id: int, key: str, raw_value: str):
+        """Write-through: update a cached guild in place of invalidating it"""
+        with self._lock:
+            self._generation += 1
+            snapshot = self._snapshots.get(guild_id)
+            if snapshot is not None:
+                self._snapshots[guild_id] = snapshot.replace(key, raw_value)
+
+    def invalidate(self, guild_id: Optional[int] = None):
+        with self._lock:
+            self._generation += 1
+            if guild_id is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(guild_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"guilds": len(self._snapshots), "max_guilds": self.max_guilds, "hits": self.hits, "misses": self.misses}
+
+
+class ConnectionPool:
+    """A small pool of long-lived WAL-mode connections shared between threads"""
+
+    def __init__(self, db_path: str, size: int = DB_POOL_SIZE):
+        self.db_path = db_path
+        self.size = max(1, size)
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=30000')
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; the transaction is committed or rolled back on release"""
+        conn = None
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                conn = self._idle.get()
+        try:
+            with conn:
+                yield conn
+        finally:
+            if self._closed:
+                conn.close()
+            else:
+                self._idle.put(conn)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+class CounterStore:
+    """In-memory counters flushed to the ``counters`` table as deltas on an interval
+
+    ``increment`` only touches memory, so it is safe to call from the event loop.
+    Every increment lands in the all-time total and in the hour and day bucket
+    it happened in; a background thread adds the accumulated deltas with
+    ``count = count + ?`` and drops buckets past their retention.
+    """
+
+    def __init__(self, pool: ConnectionPool, legacy_loader: Optional[Callable[[str], Dict[str, int]]] = None,
+                 flush_interval: float = COUNTER_FLUSH_INTERVAL):
+        self.pool = pool
+        self.legacy_loader = legacy_loader
+        self.flush_interval = flush_interval
+        self._totals: Dict[str, Dict[str, int]] = {}
+        self._pending: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self._last_prune = 0.0
+        self._closed = False
+
+    @staticmethod
+    def bucket_keys(when: datetime) -> tuple:
+        return when.strftime('%Y-%m-%dT%H'), when.strftime('%Y-%m-%d')
+
+    def _load_totals(self, namespace: str) -> Dict[str, int]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT name, count FROM counters WHERE namespace = ? AND granularity = 'total'",
+                (namespace,)
+            ).fetchall()
+        if rows or self.legacy_loader is None:
+            return dict(rows)
+
+        # One-time import of the old JSON dict kept in global_config
+        totals = {}
+        for name, count in (self.legacy_loader(namespace) or {}).items():
+            try:
+                totals[str(name)] = int(count)
+            except (TypeError, ValueError):
+                continue
+        if totals:
+            with self.pool.connection() as conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO counters (namespace, name, granularity, bucket, count) VALUES (?, ?, 'total', '', ?)",
+                    [(namespace, name, count) for name, count in totals.items()]
+                )
+        return totals
+
+    def _namespace_totals(self, namespace: str) -> Dict[str, int]:
+        totals = self._totals.get(namespace)
+        if totals is not None:
+            return totals
+        # Holding the flush lock keeps every delta either in the loaded rows or in _pending, never both or neither
+        with self._flush_lock:
+            totals = self._totals.get(namespace)
+            if totals is not None:
+                return totals
+            totals = self._load_totals(namespace)
+            with self._lock:
+                for (pending_namespace, name, granularity, _), delta in self._pending.items():
+                    if pending_namespace == namespace and granularity == 'total':
+                        totals[name] = totals.get(name, 0) + delta
+                self._totals[namespace] = totals
+        return totals
+
+    def preload(self, *namespaces: str):
+        """Load totals up front (e.g. at startup) so later reads never touch the disk"""
+        for namespace in namespaces:
+            self._namespace_totals(namespace)
+
+    def increment(self, namespace: str, name: str, amount: int = 1, when: Optional[datetime] = None):
+        hour_key, day_key = self.bucket_keys(when or datetime.now())
+        with self._lock:
+            totals = self._totals.get(namespace)
+            if totals is not None:
+                totals[name] = totals.get(name, 0) + amount
+            for granularity, bucket in (('total', ''), ('hour', hour_key), ('day', day_key)):
+                pending_key = (namespace, name, granularity, bucket)
+                self._pending[pending_key] = self._pending.get(pending_key, 0) + amount
+            if self._flusher is None and not self._closed:
+                self._flusher = threading.Thread(target=self._flusher_loop, name="counter-flusher", daemon=True)
+                self._flusher.start()
+        if self._closed:
+            self.flush()
+
+    def totals(self, namespace: str) -> Dict[str, int]:
+        """All-time counts per name (a copy)"""
+        totals = self._namespace_totals(namespace)
+        with self._lock:
+            return dict(totals)
+
+    def series(self, namespace: str, granularity: str, since: datetime, name: Optional[str] = None) -> Dict[str, int]:
+        """Counts per hour/day bucket from ``since`` on, summed over names unless ``name`` is given.
+
+        Reads the database; call it off the event loop.
+        """
+        if granularity not in ('hour', 'day'):
+            raise ValueError(f"Unknown counter granularity: {granularity}")
+        start = self.bucket_keys(since)[0 if granularity == 'hour' else 1]
+        sql = 'SELECT bucket, SUM(count) FROM counters WHERE namespace = ? AND granularity = ? AND bucket >= ?'
+        params = [namespace, granularity, start]
+        if name is not None:
+            sql += ' AND name = ?'
+            params.append(name)
+        sql += ' GROUP BY bucket'
+        with self.pool.connection() as conn:
+            result = dict(conn.execute(sql, params).fetchall())
+        with self._lock:
+            for (pending_namespace, pending_name, pending_granularity, bucket), delta in self._pending.items():
+                if (pending_namespace == namespace and pending_granularity == granularity and bucket >= start
+                        and (name is None or pending_name == name)):
+                    result[bucket] = result.get(bucket, 0) + delta
+        return dict(sorted(result.items()))
+
+    def _flusher_loop(self):
+        while not self._stopping.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing counters: {e}")
+
+    def flush(self):
+        """Add every pending delta to the counters table in one transaction"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                batch = self._pending
+                self._pending = {}
+            try:
+                with self.pool.connection() as conn:
+                    conn.executemany(
+                        'INSERT INTO counters (namespace, name, granularity, bucket, count) VALUES (?, ?, ?, ?, ?) '
+                        'ON CONFLICT (namespace, name, granularity, bucket) DO UPDATE SET count = count + excluded.count',
+                        [(*pending_key, delta) for pending_key, delta in batch.items()]
+                    )
+                    now = time.time()
+                    if now - self._last_prune >= 3600:
+                        self._last_prune = now
+                        current = datetime.now()
+                        conn.execute(
+                            "DELETE FROM counters WHERE granularity = 'hour' AND bucket < ?",
+                            (self.bucket_keys(current - COUNTER_HOURLY_RETENTION)[0],)
+                        )
+                        conn.execute(
+                            "DELETE FROM counters WHERE granularity = 'day' AND bucket < ?",
+                            (self.bucket_keys(current - COUNTER_DAILY_RETENTION)[1],)
+                        )
+            except Exception:
+                with self._lock:
+                    for pending_key, delta in batch.items():
+                        self._pending[pending_key] = self._pending.get(pending_key, 0) + delta
+                raise
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._stopping.set()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join(timeout=5)
+        self.flush()
+
+
+class ConversationLog:
+    """Append-only AI conversation messages with a cached tail per conversation
+
+    Every turn is a single queued INSERT instead of a rewrite of the whole
+    history. A background thread commits the queue; rows older than the newest
+    ``max_messages`` of a conversation are pruned there as well. The tails of
+    recently used conversations stay in memory, each message carrying its token
+    estimate, so reading a history never decodes JSON again.
+    """
+
+    def __init__(self, pool: ConnectionPool, max_messages: int = AI_CONVERSATION_MAX_MESSAGES,
+                 cache_size: int = AI_CONVERSATION_CACHE_SIZE, flush_interval: float = AI_CONVERSATION_FLUSH_INTERVAL):
+        self.pool = pool
+        self.max_messages = max_messages
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        # (user_id, guild_id, conversation_key) -> deque of message dicts
+        self._tails: OrderedDict[tuple, deque] = OrderedDict()
+        # ('append', row params) / ('clear', (user_id, guild_id, conversation_key)), in call order
+        self._ops: list = []
+        self._dirty: set = set()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self._last_prune = time.monotonic()
+        self._closed = False
+
+    def _cache(self, conversation: tuple, tail: deque):
+        self._tails[conversation] = tail
+        self._tails.move_to_end(conversation)
+        while len(self._tails) > self.cache_size:
+            self._tails.popitem(last=False)
+
+    def _start_flusher(self):
+        if self._flusher is None and not self._closed:
+            self._flusher = threading.Thread(target=self._flusher_loop, name="conversation-flusher", daemon=True)
+            self._flusher.start()
+
+    def tail(self, user_id: int, guild_id: int, key: str) -> list:
+        """The newest ``max_messages`` messages, oldest first (copies, with a ``tokens`` estimate when known)"""
+        conversation = (user_id, guild_id, key)
+        with self._lock:
+            cached = self._tails.get(conversation)
+            if cached is not None:
+                self._tails.move_to_end(conversation)
+                return [dict(message) for message in cached]
+
+        # Holding the flush lock means every queued op is either on disk or still in _ops, never in between
+        with self._flush_lock:
+            with self.pool.connection() as conn:
+                rows = conn.execute(
+                    'SELECT role, content, timestamp, tokens FROM ('
+                    ' SELECT id, role, content, timestamp, tokens FROM ai_conversation_messages'
+                    ' WHERE user_id = ? AND guild_id = ? AND conversation_key = ?'
+                    ' ORDER BY id DESC LIMIT ?'
+                    ') ORDER BY id',
+                    (user_id, guild_id, key, self.max_messages)
+                ).fetchall()
+            tail = deque(
+                ({"role": role, "content": content, "timestamp": timestamp, "tokens": tokens}
+                 for role, content, timestamp, tokens in rows),
+                maxlen=self.max_messages
+            )
+            with self._lock:
+                for op, params in self._ops:
+                    if tuple(params[:3]) != conversation:
+                        continue
+                    if op == 'clear':
+                        tail.clear()
+                    else:
+                        tail.append(self._message(params))
+                self._cache(conversation, tail)
+                return [dict(message) for message in tail]
+
+    @staticmethod
+    def _message(params: tuple) -> Dict[str, Any]:
+        _, _, _, role, content, timestamp, tokens = params
+        return {"role": role, "content": content, "timestamp": timestamp, "tokens": tokens}
+
+    def append(self, user_id: int, guild_id: int, key: str, role: str, content: str,
+               timestamp: Optional[float] = None, tokens: Optional[int] = None):
+        params = (user_id, guild_id, key, role, content, time.time() if timestamp is None else timestamp, tokens)
+        conversation = (user_id, guild_id, key)
+        with self._lock:
+            self._ops.append(('append', params))
+            cached = self._tails.get(conversation)
+            if cached is not None:
+                cached.append(self._message(params))
+            self._dirty.add(conversation)
+            self._start_flusher()
+        if self._closed:
+            self.flush()
+
+    def clear(self, user_id: int, guild_id: int, key: str):
+        conversation = (user_id, guild_id, key)
+        with self._lock:
+            self._ops.append(('clear', conversation))
+            self._cache(conversation, deque(maxlen=self.max_messages))
+            self._dirty.discard(conversation)
+            self._start_flusher()
+        if self._closed:
+            self.flush()
+
+    def replace(self, user_id: int, guild_id: int, key: str, messages: Any):
+        """Overwrite a conversation with a legacy list of {"role", "content", "timestamp"} dicts"""
+        self.clear(user_id, guild_id, key)
+        for params in _conversation_rows(user_id, guild_id, key, messages, self.max_messages):
+            self.append(*params)
+
+    def _flusher_loop(self):
+        while not self._stopping.wait(self.flush_interval):
+            try:
+                self.flush()
+                if time.monotonic() - self._last_prune >= AI_CONVERSATION_PRUNE_INTERVAL:
+                    self._last_prune = time.monotonic()
+                    self.prune()
+            except Exception as e:
+                print(f"Error flushing AI conversations: {e}")
+
+    def flush(self):
+        """Commit queued appends and clears, in order, in one transaction"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._ops:
+                    return
+                ops = self._ops
+                self._ops = []
+            try:
+                with self.pool.connection() as conn:
+                    appends = []
+                    for op, params in ops:
+                        if op == 'append':
+                            appends.append(params)
+                            continue
+                        if appends:
+                            conn.executemany(_CONVERSATION_INSERT_SQL, appends)
+                            appends = []
+                        conn.execute(
+                            'DELETE FROM ai_conversation_messages WHERE user_id = ? AND guild_id = ? AND conversation_key = ?',
+                            params
+                        )
+                    if appends:
+                        conn.executemany(_CONVERSATION_INSERT_SQL, appends)
+            except Exception:
+                with self._lock:
+                    self._ops = ops + self._ops
+                raise
+
+    def prune(self) -> int:
+        """Delete messages beyond the newest ``max_messages`` of every conversation appended to since the last prune"""
+        with self._lock:
+            dirty = self._dirty
+            self._dirty = set()
+        deleted = 0
+        with self.pool.connection() as conn:
+            for user_id, guild_id, key in dirty:
+                deleted += conn.execute(
+                    'DELETE FROM ai_conversation_messages'
+                    ' WHERE user_id = ? AND guild_id = ? AND conversation_key = ? AND id <= ('
+                    '  SELECT id FROM ai_conversation_messages'
+                    '  WHERE user_id = ? AND guild_id = ? AND conversation_key = ?'
+                    '  ORDER BY id DESC LIMIT 1 OFFSET ?'
+                    ' )',
+                    (user_id, guild_id, key, user_id, guild_id, key, self.max_messages)
+                ).rowcount
+        return deleted
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._stopping.set()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join(timeout=5)
+        self.flush()
+        self.prune()
+
+
+class EconomyLedger:
+    """Append-only economy transactions, one row per balance change
+
+    ``append`` is a single INSERT, so it can run inside the caller's
+    transaction and costs the same however long a user's history is.
+    History pages are range reads of the (guild_id, user_id, created_at)
+    index, newest first. Nothing is capped per user; ``compact`` instead
+    folds rows older than ``compact_after`` into one summary row per user
+    and currency, keeping the net amount and how many entries it replaced.
+    """
+
+    def __init__(self, pool: ConnectionPool, compact_after: timedelta = LEDGER_COMPACT_AFTER):
+        self.pool = pool
+        self.compact_after = compact_after
+
+    def append(self, guild_id: int, user_id: int, tx_type: str, amount: float, currency: str, detail: str = "",
+               balance_after: Optional[float] = None, *, timestamp: Optional[float] = None, connection=None):
+        """Insert one transaction; pass ``connection`` to commit it together with the balance change"""
+        params = (
+            int(guild_id or 0), int(user_id), time.time() if timestamp is None else timestamp,
+            str(tx_type), round(float(amount), 2), str(currency), str(detail or ""),
+            None if balance_after is None else round(float(balance_after), 2), 1,
+        )
+        if connection is not None:
+            connection.execute(_LEDGER_INSERT_SQL, params)
+            return
+        with self.pool.connection() as conn:
+            conn.execute(_LEDGER_INSERT_SQL, params)
+
+    @staticmethod
+    def _entry(row) -> Dict[str, Any]:
+        """A row in the old economy_history dict format (plus ``id`` and ``entries``)"""
+        row_id, created_at, tx_type, amount, currency, detail, balance_after, entries = row
+        return {
+            "id": row_id,
+            "type": tx_type,
+            "amount": amount,
+            "currency": currency,
+            "detail": detail,
+            "time": datetime.fromtimestamp(created_at, timezone.utc).isoformat(),
+            "balance_after": balance_after,
+            "entries": entries,
+        }
+
+    def page(self, guild_id: int, user_id: int, limit: int = 10, offset: int = 0) -> list:
+        """Up to ``limit`` transactions, newest first, skipping the newest ``offset``"""
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                'SELECT id, created_at, tx_type, amount, currency, detail, balance_after, entries'
+                ' FROM economy_transactions WHERE guild_id = ? AND user_id = ?'
+                ' ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?',
+                (int(guild_id or 0), int(user_id), max(0, limit), max(0, offset))
+            ).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def count(self, guild_id: int, user_id: int) -> int:
+        with self.pool.connection() as conn:
+            return conn.execute(
+                'SELECT COUNT(*) FROM economy_transactions WHERE guild_id = ? AND user_id = ?',
+                (int(guild_id or 0), int(user_id))
+            ).fetchone()[0]
+
+    def has(self, guild_id: int, user_id: int, tx_type: str, detail_contains: str = "") -> bool:
+        with self.pool.connection() as conn:
+            return conn.execute(
+                'SELECT 1 FROM economy_transactions'
+                ' WHERE guild_id = ? AND user_id = ? AND tx_type = ? AND instr(detail, ?) > 0 LIMIT 1',
+                (int(guild_id or 0), int(user_id), tx_type, detail_contains)
+            ).fetchone() is not None
+
+    def guild_ids(self, user_id: int) -> list:
+        """Every scope the user has transactions in"""
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                'SELECT DISTINCT guild_id FROM economy_transactions WHERE user_id = ?', (int(user_id),)
+            ).fetchall()
+        return sorted(int(row[0]) for row in rows)
+
+    def compact(self, now: Optional[float] = None, batch: int = LEDGER_COMPACT_BATCH) -> int:
+        """Fold old rows into summary rows, at most ``batch`` groups per call; returns how many rows were removed"""
+        cutoff = (time.time() if now is None else now) - self.compact_after.total_seconds()
+        removed = 0
+        with self.pool.connection() as conn:
+            groups = conn.execute(
+                'SELECT guild_id, user_id, currency, COUNT(*), TOTAL(amount), TOTAL(entries), MAX(created_at), MAX(id)'
+                ' FROM economy_transactions WHERE created_at < ?'
+                ' GROUP BY guild_id, user_id, currency HAVING COUNT(*) > 1 LIMIT ?',
+                (cutoff, batch)
+            ).fetchall()
+            for guild_id, user_id, currency, rows, amount, entries, last_at, last_id in groups:
+                balance_after = conn.execute(
+                    'SELECT balance_after FROM economy_transactions WHERE id = ?', (last_id,)
+                ).fetchone()[0]
+                removed += conn.execute(
+                    'DELETE FROM economy_transactions'
+                    ' WHERE guild_id = ? AND user_id = ? AND currency = ? AND created_at < ?',
+                    (guild_id, user_id, currency, cutoff)
+                ).rowcount
+                conn.execute(_LEDGER_INSERT_SQL, (
+                    guild_id, user_id, last_at, LEDGER_SUMMARY_TYPE, round(amount, 2), currency,
+                    f"{int(entries)} 筆較舊的交易", balance_after, int(entries),
+                ))
+        return removed - len(groups)
+
+
 class Database:
-    def __init__(self, db_path: str = DB_PATH):
+    """Synchronous storage API over a pooled SQLite connection with write-behind.
+
+    ``set_*`` calls queue the write and return at once. A background thread
+    group-commits the queue every ``flush_interval`` seconds, so a crash can
+    lose writes queued in that window (5 ms by default; longer while a failing
+    batch is being retried). Pass ``durable=True`` for writes that must be on
+    disk before the call returns: the queue is committed right away and the
+    call returns False if that fails.
+
+    A batch that fails ``DB_FLUSH_RETRIES`` times in a row is committed write
+    by write. Writes that fail on their own with anything but an
+    ``OperationalError`` (locked, disk full, I/O) are dropped and logged;
+    the rest stay queued.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, *, pool_size: int = DB_POOL_SIZE,
+                 write_behind: bool = True, flush_interval: float = DB_FLUSH_INTERVAL):
         self.db_path = db_path
+        self.pool = ConnectionPool(db_path, pool_size)
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        # Pending writes keyed by (table, *primary key) -> SQL params.
+        # Readers consult _pending and _inflight first so they always see their own writes.
+        self._pending: Dict[tuple, tuple] = {}
+        self._inflight: Dict[tuple, tuple] = {}
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        self._failed_flushes = 0
+        self._failed_conversation_flushes = 0
+        self._closed = False
+        self.config_cache = ServerConfigCache(self._load_server_config_rows)
         self.init_database()
+        self.counters = CounterStore(self.pool, lambda namespace: self.get_global_config(namespace, {}))
+        self.conversations = ConversationLog(self.pool)
+        self.ledger = EconomyLedger(self.pool)
+        atexit.register(self.close)
     
     def init_database(self):
         """Initialize the database with required tables"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
             
             # Create server_configs table
@@ -61,242 +920,639 @@ class Database:
                 )
             ''')
 
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_user_data_key
+                ON user_data (guild_id, data_key)
+            ''')
+
+            # Typed tables for the hottest user_data keys
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS user_balances (
+                    user_id INTEGER NOT NULL,
+                    guild_id INTEGER NOT NULL,
+                    balance REAL NOT NULL,
+                    PRIMARY KEY (guild_id, user_id)
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_user_balances_rank
+                ON user_balances (guild_id, balance DESC)
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS user_items (
+                    user_id INTEGER NOT NULL,
+                    guild_id INTEGER NOT NULL,
+                    item_id TEXT NOT NULL,
+                    count NUMERIC NOT NULL,
+                    PRIMARY KEY (guild_id, user_id, item_id)
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_user_items_item
+                ON user_items (guild_id, item_id, count DESC)
+            ''')
+            # Append-only AI conversation log (one row per message)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS ai_conversation_messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    guild_id INTEGER NOT NULL,
+                    conversation_key TEXT NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    timestamp REAL NOT NULL,
+                    tokens INTEGER
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_ai_conversation_messages_tail
+                ON ai_conversation_messages (user_id, guild_id, conversation_key, id)
+            ''')
+
+            # Append-only economy transaction ledger (one row per balance change)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS economy_transactions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    guild_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    tx_type TEXT NOT NULL,
+                    amount REAL NOT NULL,
+                    currency TEXT NOT NULL,
+                    detail TEXT NOT NULL DEFAULT '',
+                    balance_after REAL,
+                    entries INTEGER NOT NULL DEFAULT 1
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_economy_transactions_user_time
+                ON economy_transactions (guild_id, user_id, created_at)
+            ''')
+
+            # Create counters table (statistics; granularity is total / hour / day)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS counters (
+                    namespace TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    granularity TEXT NOT NULL,
+                    bucket TEXT NOT NULL,
+                    count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (namespace, name, granularity, bucket)
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_counters_bucket
+                ON counters (namespace, granularity, bucket)
+            ''')
+
+            schema_version = cursor.execute('PRAGMA user_version').fetchone()[0]
+            if schema_version < 1:
+                self._migrate_typed_user_data(cursor)
+            if schema_version < 2:
+                self._migrate_ai_conversation_blobs(cursor)
+            if schema_version < 3:
+                self._migrate_economy_history_blobs(cursor)
+            cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
             conn.commit()
+
+    @staticmethod
+    def _migrate_typed_user_data(cursor):
+        """Move economy_balance / items / ai_conversation_* rows out of user_data (schema v0 -> v1)"""
+        where = "guild_id IS NOT NULL AND (data_key IN (?, ?) OR data_key LIKE ? ESCAPE '\\')"
+        params = (BALANCE_KEY, ITEMS_KEY, AI_CONVERSATION_PREFIX.replace('_', '\\_') + '%')
+        rows = cursor.execute(
+            f'SELECT user_id, guild_id, data_key, data_value FROM user_data WHERE {where}', params
+        ).fetchall()
+        for user_id, guild_id, key, raw in rows:
+            table = _user_data_table(key)
+            if table == 'ai_conversation_messages':
+                cursor.executemany(
+                    _CONVERSATION_INSERT_SQL,
+                    _conversation_rows(user_id, guild_id, key, _decode_value(raw), AI_CONVERSATION_MAX_MESSAGES)
+                )
+            else:
+                Database._apply_writes(cursor, table, [Database._typed_params(user_id, guild_id, key, raw)])
+        cursor.execute(f'DELETE FROM user_data WHERE {where}', params)
+        if rows:
+            print(f"Moved {len(rows)} user_data rows into typed tables")
+
+    @staticmethod
+    def _migrate_ai_conversation_blobs(cursor):
+        """Split the v1 ai_conversations JSON blobs into message rows (schema v1 -> v2)"""
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ai_conversations'"
+        ).fetchone()
+        if not exists:
+            return
+        for user_id, guild_id, key, raw in cursor.execute(
+            'SELECT user_id, guild_id, conversation_key, history FROM ai_conversations'
+        ).fetchall():
+            cursor.executemany(
+                _CONVERSATION_INSERT_SQL,
+                _conversation_rows(user_id, guild_id, key, _decode_value(raw), AI_CONVERSATION_MAX_MESSAGES)
+            )
+        cursor.execute('DROP TABLE ai_conversations')
+
+    @staticmethod
+    def _migrate_economy_history_blobs(cursor):
+        """Move the economy_history JSON lists out of user_data into economy_transactions (schema v2 -> v3)"""
+        rows = cursor.execute(
+            'SELECT user_id, guild_id, data_value FROM user_data WHERE data_key = ?', (ECONOMY_HISTORY_KEY,)
+        ).fetchall()
+        for user_id, guild_id, raw in rows:
+            cursor.executemany(_LEDGER_INSERT_SQL, _ledger_rows(guild_id or 0, user_id, _decode_value(raw)))
+        cursor.execute('DELETE FROM user_data WHERE data_key = ?', (ECONOMY_HISTORY_KEY,))
+        if rows:
+            print(f"Moved {len(rows)} economy_history lists into economy_transactions")
     
+    # ---------- write-behind engine ----------
+
+    _UPSERT_SQL = {
+        'server_configs': 'INSERT OR REPLACE INTO server_configs (guild_id, config_key, config_value) VALUES (?, ?, ?)',
+        'global_config': 'INSERT OR REPLACE INTO global_config (config_key, config_value) VALUES (?, ?)',
+        'user_data': 'INSERT OR REPLACE INTO user_data (user_id, guild_id, data_key, data_value) VALUES (?, ?, ?, ?)',
+        'user_balances': 'INSERT OR REPLACE INTO user_balances (user_id, guild_id, balance) VALUES (?, ?, ?)',
+    }
+
+    @staticmethod
+    def _replace_user_items(conn, rows):
+        for user_id, guild_id, raw in rows:
+            conn.execute('DELETE FROM user_items WHERE guild_id = ? AND user_id = ?', (guild_id, user_id))
+            items = _normalize_items(_decode_value(raw))
+            # rowid order keeps the dict's insertion order on the way back out
+            conn.executemany(
+                'INSERT INTO user_items (user_id, guild_id, item_id, count) VALUES (?, ?, ?, ?)',
+                [(user_id, guild_id, item_id, count) for item_id, count in items.items()]
+            )
+
+    @staticmethod
+    def _apply_writes(conn, table: str, rows: list):
+        if table == 'user_items':
+            Database._replace_user_items(conn, rows)
+        else:
+            conn.executemany(Database._UPSERT_SQL[table], rows)
+
+    @staticmethod
+    def _typed_params(user_id: int, guild_id: int, key: str, raw: str) -> tuple:
+        """SQL params of a user_data write in the table its key is routed to; the raw value is always last"""
+        if _user_data_table(key) == 'user_data':
+            return (user_id, guild_id, key, raw)
+        return (user_id, guild_id, raw)
+
+    def _lookup_pending(self, pending_key: tuple) -> Optional[str]:
+        """Return the not-yet-committed raw value for a key, if any"""
+        with self._pending_lock:
+            params = self._pending.get(pending_key)
+            if params is None:
+                params = self._inflight.get(pending_key)
+        return params[-1] if params is not None else None
+
+    def _write(self, pending_key: tuple, params: tuple, durable: bool = False):
+        """Queue a write for the next group commit (or write through when write-behind is off).
+
+        ``durable`` commits the queue before returning and raises if that fails.
+        """
+        if not self.write_behind or self._closed:
+            with self.pool.connection() as conn:
+                self._apply_writes(conn, pending_key[0], [params])
+            if pending_key[0] == 'server_configs':
+                self.config_cache.apply(params[0], params[1], params[2])
+            return
+        with self._pending_lock:
+            self._pending[pending_key] = params
+            if pending_key[0] == 'server_configs':
+                self.config_cache.apply(params[0], params[1], params[2])
+            batch_full = len(self._pending) >= DB_MAX_BATCH
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._writer_loop, name="db-writer", daemon=True)
+                self._writer.start()
+        if batch_full or durable:
+            self.flush()
+        else:
+            self._wake.set()
+
+    def _writer_loop(self):
+        while not self._closed:
+            self._wake.wait()
+            if self._closed:
+                break
+            self._stopping.wait(self.flush_interval)  # let concurrent writers join this commit
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                _log_error(f"Error flushing database writes: {e}")
+                self._stopping.wait(min(1.0, self.flush_interval * 100))
+                self._wake.set()
+
+    def flush(self):
+        """Commit every queued write in one transaction. Safe to call from any thread."""
+        # The conversation log keeps its ops when it fails, so report it and carry on with the main queue
+        try:
+            self.conversations.flush()
+        except Exception as e:
+            self._failed_conversation_flushes += 1
+            _log_error(f"Failed to flush the AI conversation log "
+                       f"({self._failed_conversation_flushes} in a row, kept for the next flush): {e}")
+        else:
+            self._failed_conversation_flushes = 0
+        with self._flush_lock:
+            with self._pending_lock:
+                if not self._pending:
+                    return
+                self._inflight = self._pending
+                self._pending = {}
+            batch = self._inflight
+            grouped: Dict[str, list] = {}
+            for pending_key, params in batch.items():
+                grouped.setdefault(pending_key[0], []).append(params)
+            try:
+                with self.pool.connection() as conn:
+                    for table, rows in grouped.items():
+                        self._apply_writes(conn, table, rows)
+            except Exception as e:
+                self._failed_flushes += 1
+                if self._failed_flushes < DB_FLUSH_RETRIES:
+                    self._requeue(batch)
+                    raise
+                self._failed_flushes = 0
+                self._commit_each(batch, e)
+                raise
+            self._failed_flushes = 0
+            with self._pending_lock:
+                self._inflight = {}
+
+    def _requeue(self, batch: Dict[tuple, tuple]):
+        # Put the batch back without clobbering anything written since.
+        with self._pending_lock:
+            for pending_key, params in batch.items():
+                self._pending.setdefault(pending_key, params)
+            self._inflight = {}
+
+    def _commit_each(self, batch: Dict[tuple, tuple], error: Exception):
+        """Commit a batch that keeps failing one write at a time so one bad write can't block the rest"""
+        retry: Dict[tuple, tuple] = {}
+        dropped = []
+        for pending_key, params in batch.items():
+            try:
+                with self.pool.connection() as conn:
+                    self._apply_writes(conn, pending_key[0], [params])
+            except sqlite3.OperationalError:
+                retry[pending_key] = params
+            except Exception as e:
+                dropped.append(f"{pending_key} ({e})")
+                if pending_key[0] == 'server_configs':
+                    self.config_cache.invalidate(pending_key[1])
+        self._requeue(retry)
+        if dropped:
+            _log_error(f"Dropped {len(dropped)} database write(s) after {DB_FLUSH_RETRIES} failed commits ({error}): "
+                       + ", ".join(dropped[:10]))
+
+    def close(self):
+        """Flush queued writes and release every pooled connection"""
+        if self._closed:
+            return
+        self._closed = True
+        self._stopping.set()
+        self._wake.set()
+        if self._writer is not None and self._writer is not threading.current_thread():
+            self._writer.join(timeout=5)
+        try:
+            self.counters.close()
+            self.conversations.close()
+            self.flush()
+        finally:
+            self.pool.close()
+
+    def _load_server_config_rows(self, guild_id: int) -> Dict[str, str]:
+        self.flush()
+        with self.pool.connection() as conn:
+            return dict(conn.execute(
+                'SELECT config_key, config_value FROM server_configs WHERE guild_id = ?',
+                (guild_id,)
+            ).fetchall())
+
+    def invalidate_server_config(self, guild_id: Optional[int] = None):
+        """Drop cached config after server_configs was changed with raw SQL"""
+        self.config_cache.invalidate(guild_id)
+
+    # ---------- public API ----------
+
+    def get_server_config_snapshot(self, guild_id: int) -> ServerConfigSnapshot:
+        """Get a read-only, pre-parsed view of a server's configuration (no DB round-trip once cached)"""
+        return self.config_cache.get(guild_id)
+
     def get_server_config(self, guild_id: int, key: str, default: Any = None) -> Any:
         """Get a configuration value for a specific server"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                'SELECT config_value FROM server_configs WHERE guild_id = ? AND config_key = ?',
-                (guild_id, key)
-            )
-            result = cursor.fetchone()
-            
-            if result:
-                try:
-                    return json.loads(result[0])
-                except (json.JSONDecodeError, TypeError):
-                    # Try to convert to bool
-                    if result[0].lower() in ('true', 'false'):
-                        return result[0].lower() == 'true'
-                    if result[0].lower() == 'none':
-                        return None
-                    # Try to convert to int if it looks like a number
-                    try:
-                        return int(result[0])
-                    except (ValueError, TypeError):
-                        return result[0]
-            
-            return default if default is not None else DEFAULT_SERVER_CONFIG.get(key)
+        snapshot = self.config_cache.get(guild_id)
+        raw = snapshot.raw(key)
+        if raw is not None:
+            value = snapshot.get(key)
+            if isinstance(value, (dict, list)):
+                # Decode again so callers get their own mutable copy.
+                return _decode_value(raw)
+            return value
+
+        return default if default is not None else DEFAULT_SERVER_CONFIG.get(key)
     
-    def set_server_config(self, guild_id: int, key: str, value: Any) -> bool:
-        """Set a configuration value for a specific server"""
+    def set_server_config(self, guild_id: int, key: str, value: Any, *, durable: bool = False) -> bool:
+        """Set a configuration value for a specific server (``durable`` commits before returning)"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Convert value to JSON if it's a complex type, otherwise keep as string
-                if isinstance(value, (dict, list)):
-                    json_value = json.dumps(value)
-                elif isinstance(value, bool):
-                    json_value = str(value)  # Store booleans as "True" or "False"
-                elif isinstance(value, int):
-                    json_value = str(value)  # Store integers as strings for consistency
-                else:
-                    json_value = str(value)
-                
-                cursor.execute('''
-                    INSERT OR REPLACE INTO server_configs (guild_id, config_key, config_value)
-                    VALUES (?, ?, ?)
-                ''', (guild_id, key, json_value))
-                
-                conn.commit()
-                return True
+            # Convert value to JSON if it's a complex type, otherwise keep as string
+            if isinstance(value, (dict, list)):
+                json_value = json.dumps(value)
+            elif isinstance(value, bool):
+                json_value = str(value)  # Store booleans as "True" or "False"
+            elif isinstance(value, int):
+                json_value = str(value)  # Store integers as strings for consistency
+            else:
+                json_value = str(value)
+
+            self._write(('server_configs', guild_id, key), (guild_id, key, json_value), durable)
+            return True
         except Exception as e:
-            print(f"Error setting server config: {e}")
+            _log_error(f"Error setting server config: {e}")
             return False
     
     def get_all_server_config(self, guild_id: int) -> Dict[str, Any]:
         """Get all configuration values for a specific server"""
         config = DEFAULT_SERVER_CONFIG.copy()
-        
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                'SELECT config_key, config_value FROM server_configs WHERE guild_id = ?',
-                (guild_id,)
-            )
-            results = cursor.fetchall()
-            
-            for key, value in results:
+
+        for key, value in self.config_cache.get(guild_id).raw_items():
+            try:
+                config[key] = json.loads(value)
+            except (json.JSONDecodeError, TypeError):
+                # Try to convert to int if it looks like a number
                 try:
-                    config[key] = json.loads(value)
-                except (json.JSONDecodeError, TypeError):
-                    # Try to convert to int if it looks like a number
-                    try:
-                        config[key] = int(value)
-                    except (ValueError, TypeError):
-                        config[key] = value
+                    config[key] = int(value)
+                except (ValueError, TypeError):
+                    config[key] = value
         
         return config
     
     def get_all_server_config_key(self, key: str) -> Dict[int, Any]:
         """Get a specific configuration value for all servers"""
         configs = {}
+        self.flush()
         
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
+        with self.pool.connection() as conn:
+            results = conn.execute(
                 'SELECT guild_id, config_value FROM server_configs WHERE config_key = ?',
                 (key,)
-            )
-            results = cursor.fetchall()
+            ).fetchall()
             
-            for guild_id, value in results:
+        for guild_id, value in results:
+            try:
+                configs[guild_id] = json.loads(value)
+            except (json.JSONDecodeError, TypeError):
+                # Try to convert to int if it looks like a number
                 try:
-                    configs[guild_id] = json.loads(value)
-                except (json.JSONDecodeError, TypeError):
-                    # Try to convert to int if it looks like a number
-                    try:
-                        configs[guild_id] = int(value)
-                    except (ValueError, TypeError):
-                        configs[guild_id] = value
+                    configs[guild_id] = int(value)
+                except (ValueError, TypeError):
+                    configs[guild_id] = value
         
         return configs
     
     def get_global_config(self, key: str, default: Any = None) -> Any:
         """Get a global configuration value (for backward compatibility)"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                'SELECT config_value FROM global_config WHERE config_key = ?',
-                (key,)
-            )
-            result = cursor.fetchone()
-            
+        raw = self._lookup_pending(('global_config', key))
+        if raw is None:
+            with self.pool.connection() as conn:
+                result = conn.execute(
+                    'SELECT config_value FROM global_config WHERE config_key = ?',
+                    (key,)
+                ).fetchone()
             if result:
-                try:
-                    return json.loads(result[0])
-                except (json.JSONDecodeError, TypeError):
-                    return result[0]
-            
-            return default
+                raw = result[0]
+
+        if raw is not None:
+            try:
+                return json.loads(raw)
+            except (json.JSONDecodeError, TypeError):
+                return raw
+
+        return default
     
-    def set_global_config(self, key: str, value: Any) -> bool:
+    def set_global_config(self, key: str, value: Any, *, durable: bool = False) -> bool:
         """Set a global configuration value (for backward compatibility)"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Convert value to JSON if it's a complex type
-                if isinstance(value, (dict, list)):
-                    json_value = json.dumps(value)
-                else:
-                    json_value = str(value)
-                
-                cursor.execute('''
-                    INSERT OR REPLACE INTO global_config (config_key, config_value)
-                    VALUES (?, ?)
-                ''', (key, json_value))
-                
-                conn.commit()
-                return True
+            # Convert value to JSON if it's a complex type
+            if isinstance(value, (dict, list)):
+                json_value = json.dumps(value)
+            else:
+                json_value = str(value)
+
+            self._write(('global_config', key), (key, json_value), durable)
+            return True
         except Exception as e:
-            print(f"Error setting global config: {e}")
+            _log_error(f"Error setting global config: {e}")
             return False
     
     def get_user_data(self, user_id: int, guild_id: Optional[int], key: str, default: Any = None) -> Any:
         """Get user-specific data, optionally scoped to a guild"""
         if not guild_id:
             guild_id = 0  # Use 0 to represent global data
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                'SELECT data_value FROM user_data WHERE user_id = ? AND guild_id = ? AND data_key = ?',
-                (user_id, guild_id, key)
-            )
-            result = cursor.fetchone()
-            
+        table = _user_data_table(key)
+        if table == 'ai_conversation_messages':
+            history = [
+                {"role": message["role"], "content": message["content"], "timestamp": message["timestamp"]}
+                for message in self.conversations.tail(user_id, guild_id, key)
+            ]
+            return history if history else default
+        if table == 'user_balances':
+            pending_key = (table, user_id, guild_id)
+            sql = 'SELECT balance FROM user_balances WHERE guild_id = ? AND user_id = ?'
+            params = (guild_id, user_id)
+        elif table == 'user_items':
+            pending_key = (table, user_id, guild_id)
+            sql = 'SELECT item_id, count FROM user_items WHERE guild_id = ? AND user_id = ? ORDER BY rowid'
+            params = (guild_id, user_id)
+        else:
+            pending_key = (table, user_id, guild_id, key)
+            sql = 'SELECT data_value FROM user_data WHERE user_id = ? AND guild_id = ? AND data_key = ?'
+            params = (user_id, guild_id, key)
+
+        raw = self._lookup_pending(pending_key)
+        if raw is None:
+            with self.pool.connection() as conn:
+                if table == 'user_items':
+                    items = dict(conn.execute(sql, params).fetchall())
+                    return items if items else default
+                result = conn.execute(sql, params).fetchone()
             if result:
-                try:
-                    return json.loads(result[0])
-                except (json.JSONDecodeError, TypeError):
-                    # Try to convert to bool
-                    if result[0].lower() in ('true', 'false'):
-                        return result[0].lower() == 'true'
-                    if result[0].lower() == 'none':
-                        return None
-                    # Try to convert to int if it looks like a number
-                    try:
-                        return int(result[0])
-                    except (ValueError, TypeError):
-                        return result[0]
-            
+                raw = result[0]
+
+        if raw is None:
             return default
+        if table == 'user_items':
+            return _normalize_items(_decode_value(raw))
+        if isinstance(raw, str):
+            return _decode_value(raw)
+        return raw  # user_balances.balance is already a number
     
-    def set_user_data(self, user_id: int, guild_id: Optional[int], key: str, value: Any) -> bool:
-        """Set user-specific data, optionally scoped to a guild"""
+    def set_user_data(self, user_id: int, guild_id: Optional[int], key: str, value: Any, *,
+                      durable: bool = False) -> bool:
+        """Set user-specific data, optionally scoped to a guild (``durable`` commits before returning)"""
         try:
             if not guild_id:
                 guild_id = 0  # Use 0 to represent global data
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Convert value to JSON if it's a complex type
-                if isinstance(value, (dict, list)):
-                    json_value = json.dumps(value)
-                else:
-                    json_value = str(value)
-                
-                cursor.execute('''
-                    INSERT OR REPLACE INTO user_data (user_id, guild_id, data_key, data_value)
-                    VALUES (?, ?, ?, ?)
-                ''', (user_id, guild_id, key, json_value))
-                
-                conn.commit()
+
+            table = _user_data_table(key)
+            if table == 'ai_conversation_messages':
+                self.conversations.replace(user_id, guild_id, key, value)
                 return True
+            if table == 'user_items':
+                value = _normalize_items(value)
+
+            # Convert value to JSON if it's a complex type
+            if isinstance(value, (dict, list)):
+                json_value = json.dumps(value)
+            else:
+                json_value = str(value)
+
+            params = self._typed_params(user_id, guild_id, key, json_value)
+            self._write((table, *params[:-1]), params, durable)
+            return True
         except Exception as e:
-            print(f"Error setting user data: {e}")
+            _log_error(f"Error setting user data: {e}")
             return False
+
+    def _typed_user_rows(self, conn, table: str, guild_id: int, key: Optional[str]) -> list:
+        """(user_id, key, value) rows of one typed table for get_all_user_data"""
+        if table == 'user_balances':
+            return [
+                (user_id, BALANCE_KEY, _decode_value(balance) if isinstance(balance, str) else balance)
+                for user_id, balance in conn.execute(
+                    'SELECT user_id, balance FROM user_balances WHERE guild_id = ?', (guild_id,)
+                )
+            ]
+        if table == 'user_items':
+            items: Dict[int, Dict[str, Any]] = {}
+            for user_id, item_id, count in conn.execute(
+                'SELECT user_id, item_id, count FROM user_items WHERE guild_id = ? ORDER BY rowid', (guild_id,)
+            ):
+                items.setdefault(user_id, {})[item_id] = count
+            return [(user_id, ITEMS_KEY, user_items) for user_id, user_items in items.items()]
+        query = 'SELECT user_id, conversation_key, role, content, timestamp FROM ai_conversation_messages WHERE guild_id = ?'
+        params: list = [guild_id]
+        if key is not None:
+            query += ' AND conversation_key = ?'
+            params.append(key)
+        histories: Dict[tuple, list] = {}
+        for user_id, conversation_key, role, content, timestamp in conn.execute(query + ' ORDER BY id', params):
+            histories.setdefault((user_id, conversation_key), []).append(
+                {"role": role, "content": content, "timestamp": timestamp}
+            )
+        return [(user_id, conversation_key, history)
+                for (user_id, conversation_key), history in histories.items()]
     
     def get_all_user_data(self, guild_id: Optional[int] = None, key: Optional[str] = None, value: Optional[Any] = None) -> Dict[int, Dict[str, Any]]:
         """Get all user data, optionally filtered by guild and/or key"""
         data = {}
         if not guild_id:
             guild_id = 0  # Use 0 to represent global data
+        self.flush()
+
+        table = _user_data_table(key) if key is not None else None
+        with self.pool.connection() as conn:
+            if table is None or table == 'user_data':
+                query = 'SELECT user_id, data_key, data_value FROM user_data WHERE 1=1'
+                params = []
+
+                if guild_id is not None:
+                    query += ' AND guild_id IS ?'
+                    params.append(guild_id)
+                if key is not None:
+                    query += ' AND data_key = ?'
+                    params.append(key)
+                if value is not None:
+                    query += ' AND data_value = ?'
+                    params.append(str(value))
+                results = conn.execute(query, params).fetchall()
+
+                for user_id, data_key, data_value in results:
+                    if user_id not in data:
+                        data[user_id] = {}
+                    try:
+                        data[user_id][data_key] = json.loads(data_value)
+                    except (json.JSONDecodeError, TypeError):
+                        data[user_id][data_key] = data_value
+
+            typed_tables = ('user_balances', 'user_items', 'ai_conversation_messages') if table is None else (table,)
+            for typed_table in typed_tables:
+                if typed_table == 'user_data':
+                    continue
+                for user_id, data_key, data_value in self._typed_user_rows(conn, typed_table, guild_id, key):
+                    if value is not None and not _matches_stored_value(data_value, value):
+                        continue
+                    data.setdefault(user_id, {})[data_key] = data_value
         
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            query = 'SELECT user_id, data_key, data_value FROM user_data WHERE 1=1'
-            params = []
-            
-            if guild_id is not None:
-                query += ' AND guild_id IS ?'
-                params.append(guild_id)
-            if key is not None:
-                query += ' AND data_key = ?'
-                params.append(key)
-            if value is not None:
-                query += ' AND data_value = ?'
-                params.append(str(value))
-            cursor.execute(query, params)
-            results = cursor.fetchall()
-            
-            for user_id, data_key, data_value in results:
-                if user_id not in data:
-                    data[user_id] = {}
-                try:
-                    data[user_id][data_key] = json.loads(data_value)
-                except (json.JSONDecodeError, TypeError):
-                    data[user_id][data_key] = data_value
-        
         return data
+
+    def get_user_data_by_marker(self, guild_id: Optional[int], marker_key: str, marker_values, keys) -> Dict[int, Dict[str, Any]]:
+        """{user_id: {key: value}} of several user_data keys, for every user whose marker_key is one of marker_values
+
+        One query instead of a get_all_user_data for the marker plus a
+        get_user_data per user and key. The marker itself is included.
+        """
+        keys = list(dict.fromkeys([marker_key, *keys]))
+        marker_values = [str(value) for value in marker_values]
+        if not marker_values:
+            return {}
+        if any(_user_data_table(key) != 'user_data' for key in keys):
+            raise ValueError("get_user_data_by_marker only reads plain user_data keys")
+        if not guild_id:
+            guild_id = 0
+        self.flush()
+        data: Dict[int, Dict[str, Any]] = {}
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f'SELECT user_id, data_key, data_value FROM user_data '
+                f'WHERE guild_id = ? AND data_key IN ({", ".join("?" * len(keys))}) AND user_id IN ('
+                f'  SELECT user_id FROM user_data WHERE guild_id = ? AND data_key = ? '
+                f'  AND data_value IN ({", ".join("?" * len(marker_values))}))',
+                (guild_id, *keys, guild_id, marker_key, *marker_values)
+            ).fetchall()
+        for user_id, data_key, data_value in rows:
+            data.setdefault(user_id, {})[data_key] = _decode_value(data_value)
+        return data
+
+    def get_top_balances(self, guild_id: Optional[int], limit: int = 10, offset: int = 0) -> list:
+        """[(user_id, balance)] with a positive balance, richest first"""
+        self.flush()
+        with self.pool.connection() as conn:
+            return conn.execute(
+                'SELECT user_id, balance FROM user_balances WHERE guild_id = ? AND balance > 0 '
+                'ORDER BY balance DESC, user_id LIMIT ? OFFSET ?',
+                (guild_id or 0, limit, offset)
+            ).fetchall()
+
+    def get_top_combined_balances(self, guild_id: int, rate: float, limit: int = 10) -> list:
+        """[(user_id, total)] of guild balance * rate + global balance, highest first"""
+        self.flush()
+        with self.pool.connection() as conn:
+            return conn.execute(
+                'SELECT user_id, SUM(CASE WHEN guild_id = ? THEN balance * ? ELSE balance END) AS total '
+                'FROM user_balances WHERE guild_id IN (?, 0) '
+                'GROUP BY user_id HAVING total > 0 ORDER BY total DESC, user_id LIMIT ?',
+                (guild_id, rate, guild_id, limit)
+            ).fetchall()
+
+    def get_balance_summary(self, guild_id: Optional[int]) -> tuple:
+        """(holders, total) over every balance row of a guild (0 for global)"""
+        self.flush()
+        with self.pool.connection() as conn:
+            count, total = conn.execute(
+                'SELECT COUNT(*), TOTAL(balance) FROM user_balances WHERE guild_id = ?', (guild_id or 0,)
+            ).fetchone()
+        return count, total
     
     def get_database_count(self) -> dict:
         """Get the total number of entries in the database"""
         total = 0
-        with sqlite3.connect(self.db_path) as conn:
+        self.flush()
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT COUNT(*) FROM server_configs')
             server_config_count = cursor.fetchone()[0]
@@ -306,7 +1562,13 @@ class Database:
             global_config_count = cursor.fetchone()[0]
             total += global_config_count
 
-            cursor.execute('SELECT COUNT(*) FROM user_data')
+            # Keys routed to typed tables still count as user data (items count one row per user)
+            cursor.execute('''
+                SELECT (SELECT COUNT(*) FROM user_data)
+                     + (SELECT COUNT(*) FROM user_balances)
+                     + (SELECT COUNT(*) FROM (SELECT DISTINCT guild_id, user_id FROM user_items))
+                     + (SELECT COUNT(*) FROM (SELECT DISTINCT user_id, guild_id, conversation_key FROM ai_conversation_messages))
+            ''')
             user_data_count = cursor.fetchone()[0]
             total += user_data_count
         return {
@@ -317,8 +1579,9 @@ class Database:
         }
     
     def get_connection(self):
-        """Get a new database connection"""
-        return sqlite3.connect(self.db_path)
+        """Get a new database connection (queued writes are committed first so raw SQL sees them)"""
+        self.flush()
+        return sqlite3.connect(self.db_path, timeout=30)
 
 # Global database instance
-db = Database()
\ No newline at end of file
+db = Database()
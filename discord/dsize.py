@@ -6,8 +6,9 @@ from discord.ext import commands
 from discord import app_commands
 from datetime import datetime, timedelta, timezone
 from globalenv import (
-    bot, start_bot, get_user_data, set_user_data, get_all_user_data, get_server_config,
+    bot, start_bot, get_user_data, set_user_data, get_server_config,
     set_server_config, modules, get_command_mention, config, interaction_uses_guild_scope,
+    get_user_data_by_marker,
 )
 from PIL import Image, ImageDraw
 from io import BytesIO
@@ -16,10 +17,12 @@ import logging
 import os
 import json
 import time
+import heapq
 from collections import deque
 from typing import Union
 from urllib.parse import urlencode
 from expiring_dict import ExpiringDict
+from user_cache import UserCache
 if "OwnerTools" in modules:
     import OwnerTools
 else:
@@ -33,6 +36,8 @@ BREAK_TRIGGER_CACHE_EXPIRE_SECONDS = 30
 
 # Per-channel keyword trigger timestamps. Entries expire automatically by TTL.
 channel_break_trigger_times = ExpiringDict(ttl=BREAK_TRIGGER_CACHE_EXPIRE_SECONDS)
+# 排行榜 / 亂槍打鳥用的使用者快取
+dsize_user_cache = UserCache(bot)
 
 
 def percent_random(percent: int) -> bool:
@@ -56,6 +61,36 @@ def normalize_stored_date(value, default=None):
         return default
 
 
+def get_today_dsize_entries(guild_id, today) -> dict:
+    """今天量過長度的使用者 {user_id: (size, fake_size)}，一次查詢取得
+
+    fake_size 只有在今天用了自欺欺人尺時才不是 None。
+    viagra 會把 last_dsize 設成明天，所以明天的也算。
+    """
+    rows = get_user_data_by_marker(
+        guild_id, "last_dsize", (today, today + timedelta(days=1)),
+        ("last_dsize_size", "dsize_fake_ruler_used_date", "last_dsize_fake_size"),
+    )
+    entries = {}
+    for user_id, data in rows.items():
+        size = data.get("last_dsize_size")
+        if size is None:
+            continue
+        fake_size = None
+        if normalize_stored_date(data.get("dsize_fake_ruler_used_date")) == today:
+            fake_size = data.get("last_dsize_fake_size")
+        entries[user_id] = (size, fake_size)
+    return entries
+
+
+def rank_dsize_entries(entries: dict, limit: int, reverse: bool = False) -> list:
+    """前 limit 名 [(user_id, size, fake_size)]，預設由長到短"""
+    rows = ((user_id, size, fake_size) for user_id, (size, fake_size) in entries.items())
+    if reverse:
+        return heapq.nsmallest(limit, rows, key=lambda row: row[1])
+    return heapq.nlargest(limit, rows, key=lambda row: row[1])
+
+
 def update_channel_break_trigger_state(channel_id: int) -> None:
     channel_break_trigger_times[channel_id] = channel_break_trigger_times.get(channel_id, 0) + 1
 
@@ -703,68 +738,34 @@ async def dsize_leaderboard(interaction: discord.Interaction, limit: int = 10, g
         else:
             global_leaderboard = False if interaction.guild else True
             guild_id = interaction.guild.id if interaction.guild else None  # None for global
-    leaderboard = []
     if limit < 1 or limit > 50:
         await interaction.response.send_message("限制必須在 1 到 50 之間。", ephemeral=True)
         return
     await interaction.response.defer()
 
     today = (datetime.now(timezone(timedelta(hours=8)))).date()  # 台灣時間
-    next_day = today + timedelta(days=1)  # for viagra check
-    valid_user_ids = set(get_all_user_data(guild_id, "last_dsize", value=str(today)).keys()) | \
-                     set(get_all_user_data(guild_id, "last_dsize", value=str(next_day)).keys())
-    all_data_fake = {}
-    for user_id in valid_user_ids:
-        size = get_user_data(guild_id, user_id, "last_dsize_size")
-        if size is not None:
-            leaderboard.append((user_id, size))
-        fake_ruler_used_date = get_user_data(guild_id, user_id, "dsize_fake_ruler_used_date")
-        if fake_ruler_used_date is not None:
-            try:
-                if not isinstance(fake_ruler_used_date, datetime):
-                    fake_ruler_used_date = datetime.fromisoformat(str(fake_ruler_used_date)).date()
-                else:
-                    fake_ruler_used_date = fake_ruler_used_date.date()
-            except Exception:
-                fake_ruler_used_date = None
-            if fake_ruler_used_date == today:
-                fake_size = get_user_data(guild_id, user_id, "last_dsize_fake_size")
-                if fake_size is not None:
-                    all_data_fake[user_id] = {"last_dsize_fake_size": fake_size}
-    
-    if not leaderboard:
+    entries = await asyncio.to_thread(get_today_dsize_entries, guild_id, today)
+    if not entries:
         await interaction.followup.send("今天還沒有任何人量過屌長。")
         return
 
-    # 按照大小排序並取前limit名
-    leaderboard.sort(key=lambda x: x[1], reverse=not reverse)
-    top_users = leaderboard[:limit]
+    # 取前limit名
+    top_users = rank_dsize_entries(entries, limit, reverse)
+    if global_leaderboard or not interaction.guild:
+        users = await dsize_user_cache.resolve_many(user_id for user_id, _, _ in top_users)
+    else:
+        users = {user_id: interaction.guild.get_member(user_id) for user_id, _, _ in top_users}
 
     # 建立排行榜訊息
     description = ""
-    for rank, (user_id, size) in enumerate(top_users, start=1):
+    for rank, (user_id, size, fake_size) in enumerate(top_users, start=1):
         if size == -1:
-            last_japanese_cola_used = get_user_data(guild_id, user_id, "last_dsize_japanese_cola_used")
-            if last_japanese_cola_used is not None and not isinstance(last_japanese_cola_used, datetime):
-                try:
-                    last_japanese_cola_used = datetime.fromisoformat(str(last_japanese_cola_used)).date()
-                except Exception:
-                    last_japanese_cola_used = None
-            elif isinstance(last_japanese_cola_used, datetime):
-                last_japanese_cola_used = last_japanese_cola_used.date()
-            if last_japanese_cola_used == today:
-                japanese_cola_size = get_user_data(guild_id, user_id, "dsize_japanese_cola_used")
-                size = f"有 {japanese_cola_size} cm 的**男娘！**"
             size = "**男娘！**"
+        elif fake_size is not None:
+            size = f"{fake_size} cm..?"
         else:
-            if all_data_fake.get(user_id) and all_data_fake[user_id].get("last_dsize_fake_size") is not None:
-                size = f"{all_data_fake[user_id].get('last_dsize_fake_size')} cm..?"
-            else:
-                size = f"{size} cm"
-        if global_leaderboard:
-            user = bot.get_user(user_id) or await bot.fetch_user(user_id)
-        else:
-            user = interaction.guild.get_member(user_id) if interaction.guild else await bot.fetch_user(user_id)
+            size = f"{size} cm"
+        user = users.get(user_id)
         if user:
             description += f"**{rank}. {user.display_name}**({user.name}) - {size}\n"
         else:
@@ -2004,15 +2005,9 @@ async def use_random_attack(interaction: discord.Interaction):
     if not removed:
         await interaction.followup.send("你沒有亂槍打鳥，無法使用。")
         return
-    leaderboard = []
     today = (datetime.now(timezone(timedelta(hours=8)))).date()  # 台灣時間
-    next_day = today + timedelta(days=1)  # for viagra check
-    valid_user_ids = (set(get_all_user_data(guild_key, "last_dsize", value=str(today)).keys()) | \
-                     set(get_all_user_data(guild_key, "last_dsize", value=str(next_day)).keys()))
-    for user_id in valid_user_ids:
-        size = get_user_data(guild_key, user_id, "last_dsize_size")
-        if size is not None and size != -1:
-            leaderboard.append((user_id, size))
+    entries = await asyncio.to_thread(get_today_dsize_entries, guild_key, today)
+    leaderboard = [(user_id, size) for user_id, (size, _) in entries.items() if size != -1]
 
     target = random.choice(leaderboard) if leaderboard else None
     if target is None:
@@ -2033,7 +2028,7 @@ async def use_random_attack(interaction: discord.Interaction):
     attacker_statistics = get_user_data(0, interaction.user.id, "dsize_statistics", {})
     attacker_statistics["total_performed_random_attacks"] = attacker_statistics.get("total_performed_random_attacks", 0) + 1
     set_user_data(0, interaction.user.id, "dsize_statistics", attacker_statistics)
-    target_user = bot.get_user(target[0]) or await bot.fetch_user(target[0])
+    target_user = await dsize_user_cache.resolve(target[0]) or await bot.fetch_user(target[0])
     if target_user.id == interaction.user.id:
         await interaction.followup.send(f"# {interaction.user.mention} 亂槍打鳥打到自己啦！\n自殘造成了 {reduced_size} cm 的傷害！\n你的屌長從 {target[1]} cm 變成了 {target[1] - reduced_size} cm！", allowed_mentions=discord.AllowedMentions.none())
         log(f"{interaction.user} used random attack on themselves, reduced size: {reduced_size} cm", module_name="dsize", user=interaction.user, guild=interaction.guild)
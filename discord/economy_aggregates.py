@@ -0,0 +1,207 @@
+"""Per-guild economy counters and exchange-rate pressure, written to server_configs in batches.
+
+Every purchase, sale, pay and daily claim used to read and rewrite the
+supply, admin-injected and transaction-count configs and the exchange rate
+one by one. Two commands running at once could lose each other's update.
+``EconomyAggregates`` keeps those changes in memory instead:
+
+- ``add(guild_id, key, delta)`` queues a counter delta.
+- ``press(guild_id, kind, weight, amount)`` queues exchange-rate pressure.
+  Each call is kept as its own ``(kind, weight, amount)`` entry, in order,
+  because the rate formulas are not linear in the amount: two injections of
+  100 move the rate more than one of 200.
+
+A background thread flushes every ``flush_interval`` seconds. It adds the
+counter deltas in SQL (``config_value = config_value + ?``) and then calls
+``recompute(guild_id, values, pressure)`` once per guild, with the counters
+as they stand after the update and the pressure entries in the order they
+were queued. That call returns the new exchange rate. The
+counters and the rate are written in the same transaction.
+
+``get`` returns the stored value plus whatever is still queued, so counters
+read back straight away. The exchange rate changes when the next flush runs.
+"""
+
+import json
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+SUPPLY_KEY = "economy_total_supply"
+ADMIN_INJECTED_KEY = "economy_admin_injected"
+TRANSACTION_COUNT_KEY = "economy_transaction_count"
+EXCHANGE_RATE_KEY = "economy_exchange_rate"
+COUNTER_KEYS = (SUPPLY_KEY, ADMIN_INJECTED_KEY, TRANSACTION_COUNT_KEY)
+INTEGER_KEYS = frozenset({TRANSACTION_COUNT_KEY})
+FLUSH_INTERVAL = 2.0
+
+# 金額類的值跟以前一樣四捨五入到小數第二位，且不會小於 0
+_AMOUNT_UPSERT_SQL = (
+    "INSERT INTO server_configs (guild_id, config_key, config_value) VALUES (?, ?, ?) "
+    "ON CONFLICT (guild_id, config_key) DO UPDATE SET "
+    "config_value = MAX(0, ROUND(CAST(config_value AS REAL) + ?, 2))"
+)
+_INTEGER_UPSERT_SQL = (
+    "INSERT INTO server_configs (guild_id, config_key, config_value) VALUES (?, ?, ?) "
+    "ON CONFLICT (guild_id, config_key) DO UPDATE SET "
+    "config_value = CAST(config_value AS INTEGER) + ?"
+)
+
+
+def _settle(key: str, value, delta):
+    if key in INTEGER_KEYS:
+        return int(value or 0) + int(delta)
+    return max(0, round(float(value or 0) + delta, 2))
+
+
+def _merge(target: Dict[int, Dict], source: Dict[int, Dict]):
+    for guild_id, deltas in source.items():
+        merged = target.setdefault(guild_id, {})
+        for name, delta in deltas.items():
+            merged[name] = merged.get(name, 0) + delta
+
+
+def _prepend(target: Dict[int, List], source: Dict[int, List]):
+    # 寫入失敗的那批比之後才排進來的壓力早，要放回前面
+    for guild_id, entries in source.items():
+        target[guild_id] = entries + target.get(guild_id, [])
+
+
+class EconomyAggregates:
+    def __init__(self, db, recompute: Optional[Callable[[int, dict, list], float]] = None,
+                 flush_interval: float = FLUSH_INTERVAL):
+        self.db = db
+        self.recompute = recompute
+        self.flush_interval = flush_interval
+        self._counters: Dict[int, Dict[str, float]] = {}
+        self._pressure: Dict[int, List[Tuple[str, float, float]]] = {}
+        # 正在寫入的那批；寫完並清掉快取前，讀取仍要算進去
+        self._inflight: Dict[int, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self._closed = False
+
+    def _queued(self, guild_id: int, key: str) -> float:
+        return self._counters.get(guild_id, {}).get(key, 0) + self._inflight.get(guild_id, {}).get(key, 0)
+
+    def _ensure_flusher(self):
+        if self._flusher is None and not self._closed:
+            self._flusher = threading.Thread(target=self._flusher_loop, name="economy-aggregates", daemon=True)
+            self._flusher.start()
+
+    def add(self, guild_id: int, key: str, delta: float):
+        if key not in COUNTER_KEYS:
+            raise ValueError(f"Unknown economy counter: {key}")
+        with self._lock:
+            deltas = self._counters.setdefault(guild_id, {})
+            deltas[key] = deltas.get(key, 0) + delta
+            self._ensure_flusher()
+        if self._closed:
+            self.flush()
+
+    def press(self, guild_id: int, kind: str, weight: float, amount: float = 1.0):
+        with self._lock:
+            self._pressure.setdefault(guild_id, []).append((kind, weight, amount))
+            self._ensure_flusher()
+        if self._closed:
+            self.flush()
+
+    def get(self, guild_id: int, key: str, default=0):
+        with self._lock:
+            value = self.db.get_server_config(guild_id, key, default)
+            delta = self._queued(guild_id, key)
+        return _settle(key, value, delta) if delta else value
+
+    def projected_rate(self, guild_id: int, default: float = 1.0) -> float:
+        """The exchange rate the next flush would write for this guild, without writing it"""
+        with self._lock:
+            pressure = list(self._pressure.get(guild_id, []))
+        rate = self.db.get_server_config(guild_id, EXCHANGE_RATE_KEY, default)
+        if not pressure or self.recompute is None:
+            return rate
+        values = {key: self.get(guild_id, key) for key in COUNTER_KEYS}
+        values[EXCHANGE_RATE_KEY] = rate
+        return self.recompute(guild_id, values, pressure)
+
+    def discard(self, guild_id: int, reset: Optional[Callable[[], None]] = None):
+        """Drop everything queued for a guild, then call ``reset`` (e.g. to zero its counters).
+
+        Both run under the flush lock, so a batch that is being written when
+        this is called lands before the reset instead of on top of it.
+        """
+        with self._flush_lock:
+            with self._lock:
+                self._counters.pop(guild_id, None)
+                self._pressure.pop(guild_id, None)
+            if reset is not None:
+                reset()
+
+    def _flusher_loop(self):
+        while not self._stopping.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing economy aggregates: {e}")
+
+    def _read_values(self, conn, guild_id: int) -> dict:
+        keys = (*COUNTER_KEYS, EXCHANGE_RATE_KEY)
+        rows = conn.execute(
+            f"SELECT config_key, config_value FROM server_configs WHERE guild_id = ? "
+            f"AND config_key IN ({', '.join('?' * len(keys))})",
+            (guild_id, *keys),
+        ).fetchall()
+        values = {}
+        for key, raw in rows:
+            try:
+                values[key] = json.loads(raw)
+            except (json.JSONDecodeError, TypeError):
+                continue
+        return values
+
+    def flush(self) -> int:
+        """Apply every queued delta and recompute touched rates in one transaction; returns guilds written"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._counters and not self._pressure:
+                    return 0
+                counters, self._counters = self._counters, {}
+                pressure, self._pressure = self._pressure, {}
+                self._inflight = counters
+            guild_ids = set(counters) | set(pressure)
+            try:
+                # 先把 set_server_config 排隊中的寫入送出，增量才會疊在最新的值上
+                self.db.flush()
+                with self.db.pool.connection() as conn:
+                    for guild_id, deltas in counters.items():
+                        for key, delta in deltas.items():
+                            sql = _INTEGER_UPSERT_SQL if key in INTEGER_KEYS else _AMOUNT_UPSERT_SQL
+                            conn.execute(sql, (guild_id, key, str(_settle(key, 0, delta)), delta))
+                    if self.recompute is not None:
+                        for guild_id, guild_pressure in pressure.items():
+                            rate = self.recompute(guild_id, self._read_values(conn, guild_id), guild_pressure)
+                            conn.execute(
+                                "INSERT OR REPLACE INTO server_configs (guild_id, config_key, config_value) "
+                                "VALUES (?, ?, ?)",
+                                (guild_id, EXCHANGE_RATE_KEY, str(rate)),
+                            )
+            except Exception:
+                with self._lock:
+                    _merge(self._counters, counters)
+                    _prepend(self._pressure, pressure)
+                    self._inflight = {}
+                raise
+            with self._lock:
+                for guild_id in guild_ids:
+                    self.db.invalidate_server_config(guild_id)
+                self._inflight = {}
+            return len(guild_ids)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._stopping.set()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join(timeout=5)
+        self.flush()
@@ -0,0 +1,71 @@
+"""Cheap checks on raw gateway frames for ``on_socket_raw_receive`` listeners.
+
+With ``enable_debug_events=True`` every gateway event (presence, typing,
+guild member updates, ...) reaches ``on_socket_raw_receive`` as raw text.
+Listeners that only care about one event type can reject almost all of them
+with a few substring checks instead of a full JSON parse, then decode the
+survivors with the fastest JSON library available (orjson, ujson, or the
+standard library).
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+if orjson is not None:
+    JSON_BACKEND = "orjson"
+    _loads = orjson.loads
+elif ujson is not None:
+    JSON_BACKEND = "ujson"
+    _loads = ujson.loads
+else:
+    JSON_BACKEND = "json"
+    _loads = json.loads
+
+
+
+def may_match(payload, event: str, *markers: str) -> bool:
+    """False only when ``payload`` is certainly not ``event`` or lacks one of ``markers``.
+
+    A True result still needs a real decode; the check never rejects a frame
+    the full parse would have accepted.
+    """
+    # Discord serialises the dispatch name first ({"t":"MESSAGE_CREATE","s":...}),
+    # so most frames are rejected by looking at their first few characters.
+    if isinstance(payload, (bytes, bytearray)):
+        encoded_event = f'"{event}"'.encode()
+        if encoded_event not in payload:
+            return False
+        if payload.startswith(b'{"t":"') and not payload.startswith(encoded_event, 5):
+            return False
+        return all(marker.encode() in payload for marker in markers)
+
+    if not isinstance(payload, str):
+        return False
+    if payload.startswith('{"t":"'):
+        if not payload.startswith(f'{event}"', 6):
+            return False
+    elif f'"{event}"' not in payload:
+        return False
+    return all(marker in payload for marker in markers)
+
+
+def decode_payload(payload):
+    """Decode a raw frame; returns None for anything that is not a JSON object."""
+    if isinstance(payload, bytearray):
+        payload = bytes(payload)
+    if not isinstance(payload, (str, bytes)):
+        return None
+    try:
+        data = _loads(payload)
+    except (ValueError, TypeError):
+        return None
+    return data if isinstance(data, dict) else None
@@ -14,7 +14,7 @@ from pathlib import Path
 
 
 # Global configuration for backward compatibility
-config_version = 33
+config_version = 34
 config_path = 'config.json'
 
 default_config = {
@@ -55,6 +55,7 @@ default_config = {
     "contribute_channel_id": 0,
     "update_channel_id": 0,
     "disable_modules": [],
+    "lazy_modules": [],  # 延遲到第一次使用才載入的模組
     "join_leave_log_channel_id": 0,
     # "lavalink_host": "localhost",  # decprecated, use lavalink_nodes instead
     # "lavalink_port": 2333,
@@ -210,6 +211,7 @@ def configure_runtime_logging():
 
 modules = []
 failed_modules = []
+module_loader = None  # all.py 設定的 ModuleLoader
 
 # ============= Panel Settings Registry =============
 # Allows any module to register its server settings for the web panel.
@@ -282,9 +284,13 @@ def get_server_config(guild_id: int, key: str, default=None):
     """Get server-specific configuration"""
     return db.get_server_config(guild_id, key, default)
 
-def set_server_config(guild_id: int, key: str, value):
-    """Set server-specific configuration"""
-    return db.set_server_config(guild_id, key, value)
+def set_server_config(guild_id: int, key: str, value, *, durable: bool = False):
+    """Set server-specific configuration; durable=True returns once it is committed"""
+    return db.set_server_config(guild_id, key, value, durable=durable)
+
+def get_server_config_snapshot(guild_id: int):
+    """Get a cached, read-only view of a server's configuration for hot paths"""
+    return db.get_server_config_snapshot(guild_id)
 
 def get_all_server_config_key(key: str):
     """Get all server-specific configuration for a specific key"""
@@ -321,19 +327,48 @@ def get_user_data(guild_id: int, user_id: int, key: str, default=None):
     """Get user-specific data in a server"""
     return db.get_user_data(user_id, guild_id, key, default)
 
-def set_user_data(guild_id: int, user_id: int, key: str, value):
-    """Set user-specific data in a server"""
-    return db.set_user_data(user_id, guild_id, key, value)
+def set_user_data(guild_id: int, user_id: int, key: str, value, *, durable: bool = False):
+    """Set user-specific data in a server; durable=True returns once it is committed"""
+    return db.set_user_data(user_id, guild_id, key, value, durable=durable)
 
 def get_all_user_data(guild_id: int, key: str, value=None):
     """Get all user-specific data for a specific key in a server"""
     return db.get_all_user_data(guild_id, key, value)
 
+def get_user_data_by_marker(guild_id: int, marker_key: str, marker_values, keys) -> dict:
+    """{user_id: {key: value}} of `keys` for users whose `marker_key` is one of `marker_values` (one query)"""
+    return db.get_user_data_by_marker(guild_id, marker_key, marker_values, keys)
+
+# AI conversation log (append-only, see database.ConversationLog)
+def get_ai_conversation(guild_id: int, user_id: int, key: str) -> list:
+    """Newest messages of a conversation, oldest first, each with a cached "tokens" estimate"""
+    return db.conversations.tail(user_id, guild_id or 0, key)
+
+def append_ai_conversation_message(guild_id: int, user_id: int, key: str, role: str, content: str, tokens: int = None):
+    return db.conversations.append(user_id, guild_id or 0, key, role, content, tokens=tokens)
+
+def clear_ai_conversation(guild_id: int, user_id: int, key: str):
+    return db.conversations.clear(user_id, guild_id or 0, key)
+
 def get_global_config(key: str, default=None):
     return db.get_global_config(key, default)
 
-def set_global_config(key: str, value):
-    return db.set_global_config(key, value)
+def set_global_config(key: str, value, *, durable: bool = False):
+    return db.set_global_config(key, value, durable=durable)
+
+
+# Statistics counters (in memory, flushed to the counters table in the background)
+def increment_counter(namespace: str, name: str, amount: int = 1):
+    """Add to a counter without touching the database"""
+    db.counters.increment(namespace, name, amount)
+
+def get_counter_totals(namespace: str) -> dict:
+    """All-time counts of a namespace, e.g. "command_usage_stats" -> {command: count}"""
+    return db.counters.totals(namespace)
+
+def get_counter_series(namespace: str, granularity: str, since, name: str = None) -> dict:
+    """Hourly / daily buckets since a datetime; reads the database, so run it with asyncio.to_thread"""
+    return db.counters.series(namespace, granularity, since, name)
 
 def get_db_connection():
     """Get a new database connection"""
@@ -822,17 +857,23 @@ on_ready_tasks = []
 on_close_tasks = set()  # only works on !shutdown
 
 
+async def sync_commands():
+    if "Explore" in modules:
+        from Explore import activity_entry
+        bot.tree._global_commands["launch"] = activity_entry
+    try:
+        return await bot.tree.sync()
+    finally:
+        if "Explore" in modules:
+            bot.tree._global_commands.pop("launch", None)
+
+
 @bot.event
 async def on_ready():
     log(f'已登入為 {bot.user}', module_name="Main")
     try:
-        if "Explore" in modules:
-            from Explore import activity_entry
-            bot.tree._global_commands["launch"] = activity_entry
-        synced = await bot.tree.sync()  # 同步指令
+        synced = await sync_commands()  # 同步指令
         log(f"已同步 {len(synced)} 個指令", module_name="Main")
-        if "Explore" in modules:
-            del bot.tree._global_commands["launch"]
 
         # 快取所有伺服器的成員資料
         for guild in bot.guilds:
@@ -0,0 +1,315 @@
+"""Scheduling and caching for MessageImage's GIF and video "what is this guy talking" renders.
+
+Rendering a GIF composites every template frame, and rendering a video
+runs ffmpeg. ``MediaJobScheduler`` runs at most ``workers`` of these jobs at
+a time. Waiting jobs are grouped by guild and taken round-robin, so one busy
+guild cannot hold up the others. A guild may have ``per_guild_limit`` jobs
+waiting, and there may be ``queue_limit`` waiting in total; any more are
+refused with ``MediaQueueFull``, so a burst gets a "try again later" reply
+instead of a pile of ffmpeg processes.
+
+``TemplateCache`` keeps what is derived from each template file: probed
+video dimensions, preview frames, and GIF frames already resized to the
+template width. An entry is dropped when the file's mtime or size changes.
+``OutputCache`` optionally keeps finished renders, keyed by the screenshot
+hash and the template they were rendered with.
+"""
+
+import asyncio
+import hashlib
+import io
+import os
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Hashable, Optional
+
+from PIL import Image, ImageSequence
+
+MEDIA_JOB_WORKERS = 2
+MEDIA_QUEUE_LIMIT = 12
+MEDIA_PER_GUILD_LIMIT = 3
+TEMPLATE_CACHE_BYTES = 256 * 1024 * 1024
+OUTPUT_CACHE_BYTES = 64 * 1024 * 1024
+
+
+class MediaQueueFull(Exception):
+    pass
+
+
+class _Job:
+    __slots__ = ("func", "args", "future")
+
+    def __init__(self, func, args, future):
+        self.func = func
+        self.args = args
+        self.future = future
+
+
+class MediaJobScheduler:
+    def __init__(self, workers: int = MEDIA_JOB_WORKERS, queue_limit: int = MEDIA_QUEUE_LIMIT,
+                 per_guild_limit: int = MEDIA_PER_GUILD_LIMIT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.per_guild_limit = per_guild_limit
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self._queues: dict[Hashable, deque] = {}
+        self._turns: deque = deque()  # 輪到的 guild 順序
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def submit(self, key: Hashable, func: Callable[..., Awaitable], *args):
+        """Run ``await func(*args)`` when a worker is free; raises MediaQueueFull when the queue is full"""
+        queue = self._queues.get(key)
+        if self.queued >= self.queue_limit or (queue is not None and len(queue) >= self.per_guild_limit):
+            self.rejected += 1
+            raise MediaQueueFull("目前排隊的媒體生成太多了，請稍後再試。")
+        future = asyncio.get_running_loop().create_future()
+        if queue is None:
+            queue = self._queues[key] = deque()
+            self._turns.append(key)
+        queue.append(_Job(func, args, future))
+        self._pump()
+        return await future
+
+    def _next_job(self) -> Optional[_Job]:
+        while self._turns:
+            key = self._turns.popleft()
+            queue = self._queues[key]
+            job = queue.popleft()
+            if queue:
+                self._turns.append(key)
+            else:
+                del self._queues[key]
+            if not job.future.done():  # 等待中被取消的就跳過
+                return job
+        return None
+
+    def _pump(self):
+        while self.running < self.workers:
+            job = self._next_job()
+            if job is None:
+                return
+            self.running += 1
+            task = asyncio.ensure_future(self._run(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job: _Job):
+        try:
+            result = await job.func(*job.args)
+        except asyncio.CancelledError:
+            job.future.cancel()
+            raise
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self._pump()
+
+    async def close(self):
+        for queue in self._queues.values():
+            for job in queue:
+                job.future.cancel()
+        self._queues.clear()
+        self._turns.clear()
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+def file_signature(path: str) -> tuple:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _estimate_size(value) -> int:
+    if isinstance(value, Image.Image):
+        return value.width * value.height * len(value.getbands())
+    if isinstance(value, GifTemplate):
+        return sum(_estimate_size(frame) for frame in value.frames)
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return 0
+
+
+class TemplateCache:
+    """Values derived from template files, keyed by (path, kind) and bounded by estimated bytes"""
+
+    def __init__(self, max_bytes: int = TEMPLATE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple, tuple] = OrderedDict()  # (path, kind) -> (signature, value, size)
+        self._loading: dict[tuple, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _drop(self, key: tuple):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[2]
+
+    def get(self, path: str, kind: str):
+        key = (path, kind)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        try:
+            signature = file_signature(path)
+        except OSError:
+            signature = None
+        if entry[0] != signature:
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, path: str, kind: str, value, signature: Optional[tuple] = None):
+        key = (path, kind)
+        size = _estimate_size(value)
+        self._drop(key)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (signature or file_signature(path), value, size)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+
+    async def get_or_load(self, path: str, kind: str, loader: Callable[[str], Awaitable]):
+        """Cached value, or ``await loader(path)``; concurrent misses for one key share a single load"""
+        value = self.get(path, kind)
+        if value is not None:
+            self.hits += 1
+            return value
+        key = (path, kind)
+        pending = self._loading.get(key)
+        if pending is None:
+            self.misses += 1
+            pending = asyncio.ensure_future(self._load(path, kind, loader))
+            self._loading[key] = pending
+            pending.add_done_callback(lambda _: self._loading.pop(key, None))
+        return await asyncio.shield(pending)
+
+    async def _load(self, path: str, kind: str, loader):
+        signature = file_signature(path)
+        value = await loader(path)
+        self.put(path, kind, value, signature)
+        return value
+
+    def retain(self, paths):
+        """Forget every template not in ``paths`` (after the folder is reloaded)"""
+        keep = set(paths)
+        for key in [key for key in self._entries if key[0] not in keep]:
+            self._drop(key)
+
+
+class OutputCache:
+    """LRU of finished renders bounded by total bytes; ``max_bytes=0`` disables it"""
+
+    def __init__(self, max_bytes: int = OUTPUT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries: OrderedDict[tuple, bytes] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(screenshot_bytes: bytes, media_type: str, template_path: str) -> tuple:
+        digest = hashlib.sha1(screenshot_bytes).hexdigest()
+        try:
+            signature = file_signature(template_path)
+        except OSError:
+            signature = None
+        return digest, media_type, template_path, signature
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        data = self._entries.get(key)
+        if data is not None:
+            self._entries.move_to_end(key)
+        return data
+
+    def put(self, key: tuple, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.total_bytes -= len(old)
+        self._entries[key] = data
+        self.total_bytes += len(data)
+        while self.total_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.total_bytes -= len(evicted)
+
+
+def resize_screenshot(screenshot_bytes: bytes, target_width: int) -> Image.Image:
+    with Image.open(io.BytesIO(screenshot_bytes)) as screenshot_pil_image:
+        screenshot_rgb = screenshot_pil_image.convert("RGB")
+
+    screenshot_aspect_ratio = screenshot_rgb.width / screenshot_rgb.height
+    new_screenshot_height = max(int(target_width / screenshot_aspect_ratio), 1)
+    return screenshot_rgb.resize((target_width, new_screenshot_height), Image.Resampling.LANCZOS)
+
+
+@dataclass
+class GifTemplate:
+    width: int
+    frames: list = field(default_factory=list)  # RGBA，已縮放到 width
+    durations: list = field(default_factory=list)
+    loop: int = 0
+
+
+def load_gif_template(path: str) -> GifTemplate:
+    with Image.open(path) as template_image:
+        template = GifTemplate(width=template_image.width, loop=template_image.info.get("loop", 0))
+        for frame in ImageSequence.Iterator(template_image):
+            frame_rgba = frame.convert("RGBA")
+            if frame_rgba.width != template.width:
+                new_height = max(int(frame_rgba.height * (template.width / frame_rgba.width)), 1)
+                frame_rgba = frame_rgba.resize((template.width, new_height), Image.Resampling.LANCZOS)
+            template.frames.append(frame_rgba)
+            template.durations.append(
+                frame.info.get("duration", template_image.info.get("duration", 80)) or 80
+            )
+    if not template.frames:
+        raise RuntimeError("GIF 素材沒有可用的影格")
+    return template
+
+
+def compose_gif(screenshot_bytes: bytes, template: GifTemplate) -> bytes:
+    resized_screenshot = resize_screenshot(screenshot_bytes, template.width)
+    frames = []
+    for frame_rgba in template.frames:
+        combined = Image.new(
+            "RGBA",
+            (template.width, resized_screenshot.height + frame_rgba.height),
+            (0, 0, 0, 255),
+        )
+        combined.paste(resized_screenshot, (0, 0))
+        combined.paste(frame_rgba, (0, resized_screenshot.height), frame_rgba)
+        frames.append(combined.convert("RGB"))
+
+    output_buffer = io.BytesIO()
+    frames[0].save(
+        output_buffer,
+        format="GIF",
+        save_all=True,
+        append_images=frames[1:],
+        duration=template.durations,
+        loop=template.loop,
+        optimize=True,
+    )
+    return output_buffer.getvalue()
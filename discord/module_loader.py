@@ -0,0 +1,429 @@
+"""Module loading for all.py: per-module startup profiling and deferred modules.
+
+Every module in modules.json is imported through ``ModuleLoader`` so its
+import time and resident-memory growth are recorded (shown by the owner
+command ``!startupprofile``).
+
+Modules listed in the ``lazy_modules`` config are not imported at startup
+once a manifest of what they register exists. The manifest
+(``module_manifest.json``) is written on every command sync. It holds each
+module's slash-command payloads, prefix command names, and the events it
+listens to. A deferred module is imported the first time one of these is
+used:
+
+- Its slash commands stay registered with Discord, because ``bot.tree.sync``
+  adds the manifest payloads to the tree for the duration of the sync. An
+  interaction for one of them imports the module and then dispatches
+  normally.
+- Its prefix commands are placeholder commands that import the module and
+  re-invoke the message.
+- Events it listens to import it and are replayed to its listeners. The
+  hook sits on the bot's ``ConnectionState``, which is where gateway events
+  are dispatched from.
+
+Modules register their cogs with ``asyncio.run(bot.add_cog(...))`` at import
+time. That call fails inside the running bot, so while a deferred module is
+being imported (and only then) ``asyncio.run`` schedules the coroutine on the
+running loop instead.
+"""
+
+import asyncio
+import importlib
+import json
+import sys
+import time
+import traceback
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+from discord import app_commands
+from discord.ext import commands
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+MANIFEST_PATH = Path(__file__).resolve().parent / "module_manifest.json"
+# an interaction has to be answered within 3 seconds of arriving
+SLOW_DEFERRED_LOAD_SECONDS = 2.0
+
+
+def _rss() -> Optional[int]:
+    if psutil is None:
+        return None
+    try:
+        return psutil.Process().memory_info().rss
+    except Exception:
+        return None
+
+
+class ModuleLoadStat:
+    __slots__ = ("name", "status", "seconds", "memory_bytes", "trigger", "error")
+
+    def __init__(self, name: str, status: str, seconds: float = 0.0, memory_bytes: Optional[int] = None,
+                 trigger: str = "startup", error: Optional[str] = None):
+        self.name = name
+        self.status = status  # loaded / deferred / failed
+        self.seconds = seconds
+        self.memory_bytes = memory_bytes
+        self.trigger = trigger
+        self.error = error
+
+
+class ModuleOwnership:
+    """What one module registered while it was imported"""
+    __slots__ = ("app_commands", "commands", "events")
+
+    def __init__(self):
+        self.app_commands: list = []
+        self.commands: list = []
+        self.events: dict = {}
+
+
+def _app_command_key(command_type: int, name: str) -> str:
+    return f"{command_type}:{name}"
+
+
+def _command_type(command) -> int:
+    if isinstance(command, app_commands.ContextMenu):
+        return command.type.value
+    return 1  # chat input
+
+
+class ManifestCommand:
+    """Stands in for a deferred module's app command while the tree is synced"""
+    __slots__ = ("payload",)
+
+    def __init__(self, payload: dict):
+        self.payload = payload
+
+    def to_dict(self, tree) -> dict:
+        return self.payload
+
+    async def get_translated_payload(self, tree, translator) -> dict:
+        return self.payload
+
+
+class ModuleLoader:
+    def __init__(self, bot: commands.Bot, on_ready_tasks: Optional[list] = None, manifest_path: Path = MANIFEST_PATH,
+                 resync=None):
+        self.bot = bot
+        # coroutine function used to re-sync commands after a deferred load (defaults to bot.tree.sync)
+        self.resync = resync
+        self.on_ready_tasks = on_ready_tasks if on_ready_tasks is not None else []
+        self.manifest_path = Path(manifest_path)
+        self.manifest: dict = self._read_manifest()
+        self.stats: dict[str, ModuleLoadStat] = {}
+        self.owned: dict[str, ModuleOwnership] = {}
+        self.deferred: set = set()
+        self.startup_seconds = 0.0
+        # lookups for deferred modules only
+        self._app_command_owners: dict[str, str] = {}
+        self._stubs: dict[str, str] = {}
+        self._event_waiters: dict[str, set] = {}
+        self._loading: dict[str, asyncio.Future] = {}
+        self._scheduled: list = []
+        self._installed = False
+        self._original_sync = None
+
+    # ---------- manifest ----------
+
+    def _read_manifest(self) -> dict:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            return manifest if isinstance(manifest, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _write_manifest(self):
+        try:
+            with open(self.manifest_path, "w", encoding="utf-8") as f:
+                json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            print(f"[!] Failed to write module manifest: {e}")
+
+    # ---------- startup ----------
+
+    def load_all(self, modules: list, lazy_modules=()) -> list:
+        """Import (or defer) every module; returns the ones that failed"""
+        self.install()
+        failed = []
+        start = time.perf_counter()
+        for module in modules:
+            if module in self.stats:
+                continue  # already pulled in by an earlier module
+            if module in lazy_modules and self.manifest.get(module) and module not in sys.modules:
+                self._defer(module)
+                continue
+            before = self._import(module, "startup")
+            if before is None:
+                failed.append(module)
+            else:
+                self._record_ownership(module, before, self._snapshot())
+            for other in modules:
+                if other not in self.stats and other in sys.modules:
+                    self.stats[other] = ModuleLoadStat(other, "loaded", trigger=f"imported by {module}")
+        self.startup_seconds = time.perf_counter() - start
+        return failed
+
+    def _snapshot(self):
+        return (
+            {id(command): command for command in self.bot.tree.get_commands()},
+            {id(command): command for command in self.bot.commands},
+            {event: list(listeners) for event, listeners in self.bot.extra_events.items()},
+        )
+
+    def _import(self, module: str, trigger: str):
+        """Import and time one module; returns the registration snapshot taken before it (None on failure)"""
+        before = self._snapshot()
+        memory_before = _rss()
+        start = time.perf_counter()
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            self.stats[module] = ModuleLoadStat(module, "failed", time.perf_counter() - start, trigger=trigger, error=str(e))
+            traceback.print_exc()
+            return None
+        seconds = time.perf_counter() - start
+        memory_after = _rss()
+
+        memory = memory_after - memory_before if memory_before is not None and memory_after is not None else None
+        self.stats[module] = ModuleLoadStat(module, "loaded", seconds, memory, trigger)
+        return before
+
+    def _record_ownership(self, module: str, before, after):
+        ownership = self.owned.setdefault(module, ModuleOwnership())
+        app_before, prefix_before, events_before = before
+        app_after, prefix_after, events_after = after
+        ownership.app_commands.extend(command for key, command in app_after.items() if key not in app_before)
+        ownership.commands.extend(command for key, command in prefix_after.items() if key not in prefix_before)
+        for event, listeners in events_after.items():
+            previous = events_before.get(event, [])
+            added = [listener for listener in listeners if not any(listener is old for old in previous)]
+            if added:
+                ownership.events.setdefault(event, []).extend(added)
+
+        entry = self.manifest.setdefault(module, {})
+        entry["commands"] = sorted({name for command in ownership.commands for name in (command.name, *command.aliases)})
+        entry["events"] = sorted(ownership.events)
+        entry.setdefault("app_commands", [])
+
+    def _defer(self, module: str):
+        entry = self.manifest[module]
+        self.deferred.add(module)
+        self.stats[module] = ModuleLoadStat(module, "deferred", trigger="-")
+        for payload in entry.get("app_commands", []):
+            self._app_command_owners[_app_command_key(payload.get("type", 1), payload.get("name"))] = module
+        for event in entry.get("events", []):
+            self._event_waiters.setdefault(event, set()).add(module)
+        for name in entry.get("commands", []):
+            if self.bot.all_commands.get(name) is None:
+                self._add_stub(module, name)
+
+    def _add_stub(self, module: str, name: str):
+        loader = self
+
+        async def deferred_command(ctx, *, _: str = None):
+            await loader.ensure_loaded(module, f"!{ctx.invoked_with}")
+            new_ctx = await loader.bot.get_context(ctx.message)
+            if new_ctx.command is not None and loader._stubs.get(new_ctx.invoked_with) is None:
+                await loader.bot.invoke(new_ctx)
+
+        self.bot.add_command(commands.Command(deferred_command, name=name, hidden=True))
+        self._stubs[name] = module
+
+    # ---------- hooks ----------
+
+    def install(self):
+        if self._installed:
+            return
+        self._installed = True
+        bot = self.bot
+        tree = bot.tree
+        original_add_command = bot.add_command
+        original_dispatch = bot.dispatch
+        original_from_interaction = tree._from_interaction
+        loader = self
+
+        def add_command(command):
+            # a deferred module imported some other way replaces its placeholders
+            for name in (command.name, *getattr(command, "aliases", ())):
+                if loader._stubs.pop(name, None) is not None:
+                    bot.remove_command(name)
+            return original_add_command(command)
+
+        def dispatch(event_name, /, *args, **kwargs):
+            original_dispatch(event_name, *args, **kwargs)
+            waiting = loader._event_waiters.get("on_" + event_name)
+            if waiting:
+                for module in list(waiting):
+                    bot.loop.create_task(loader._load_for_event(module, "on_" + event_name, args, kwargs))
+
+        def from_interaction(interaction):
+            module = loader._module_for_interaction(interaction)
+            if module is None:
+                return original_from_interaction(interaction)
+            bot.loop.create_task(loader._load_for_interaction(module, interaction, original_from_interaction))
+
+        async def sync(*, guild=None):
+            if guild is not None:
+                return await loader._original_sync(guild=guild)
+            return await loader.sync_app_commands()
+
+        bot.add_command = add_command
+        # ConnectionState keeps the bound dispatch it was built with, so gateway events only see it there
+        bot.dispatch = dispatch
+        bot._connection.dispatch = dispatch
+        tree._from_interaction = from_interaction
+        self._original_sync = tree.sync
+        tree.sync = sync
+
+    @contextmanager
+    def _scheduling_asyncio_run(self, loop: asyncio.AbstractEventLoop):
+        """Make ``asyncio.run`` schedule on ``loop`` while a deferred module is imported"""
+        original_run = asyncio.run
+        loader = self
+
+        def run(main, *, debug=None):
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                return original_run(main, debug=debug)
+            if running is not loop:
+                return original_run(main, debug=debug)
+            task = loop.create_task(main)
+            loader._scheduled.append(task)
+            return None
+
+        asyncio.run = run
+        try:
+            yield
+        finally:
+            asyncio.run = original_run
+
+    def _module_for_interaction(self, interaction) -> Optional[str]:
+        if not self._app_command_owners:
+            return None
+        data = interaction.data or {}
+        name = data.get("name")
+        if name is None:
+            return None
+        return self._app_command_owners.get(_app_command_key(data.get("type", 1), name))
+
+    # ---------- deferred loading ----------
+
+    def _forget_deferred(self, module: str):
+        self.deferred.discard(module)
+        for key in [key for key, owner in self._app_command_owners.items() if owner == module]:
+            del self._app_command_owners[key]
+        for waiting in self._event_waiters.values():
+            waiting.discard(module)
+        for name in [name for name, owner in self._stubs.items() if owner == module]:
+            del self._stubs[name]
+            self.bot.remove_command(name)
+
+    async def ensure_loaded(self, module: str, trigger: str):
+        """Import a deferred module once; concurrent callers wait for the same import"""
+        pending = self._loading.get(module)
+        if pending is not None:
+            await pending
+            return
+        if module not in self.deferred:
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._loading[module] = future
+        try:
+            self._forget_deferred(module)
+            on_ready_count = len(self.on_ready_tasks)
+            self._scheduled = []
+            start = time.perf_counter()
+            with self._scheduling_asyncio_run(asyncio.get_running_loop()):
+                before = self._import(module, trigger)
+            scheduled, self._scheduled = self._scheduled, []
+            if scheduled:
+                # the module's asyncio.run(bot.add_cog(...)) calls
+                for result in await asyncio.gather(*scheduled, return_exceptions=True):
+                    if isinstance(result, Exception):
+                        traceback.print_exception(result)
+            if before is not None:
+                self._record_ownership(module, before, self._snapshot())
+                self.stats[module].seconds = time.perf_counter() - start
+                if getattr(self.bot, "_on_ready_tasks_started", False):
+                    for task_coro_func in self.on_ready_tasks[on_ready_count:]:
+                        self.bot.loop.create_task(task_coro_func())
+                if self.stats[module].seconds > SLOW_DEFERRED_LOAD_SECONDS:
+                    print(f"[!] Deferred module {module} took {self.stats[module].seconds:.1f}s to load ({trigger})")
+                await self._resync_if_changed(module)
+        finally:
+            future.set_result(None)
+            del self._loading[module]
+
+    async def _load_for_interaction(self, module: str, interaction, dispatch):
+        await self.ensure_loaded(module, f"/{(interaction.data or {}).get('name')}")
+        dispatch(interaction)
+
+    async def _load_for_event(self, module: str, event: str, args: tuple, kwargs: dict):
+        await self.ensure_loaded(module, event)
+        ownership = self.owned.get(module)
+        if ownership is None:
+            return
+        for listener in ownership.events.get(event, []):
+            self.bot._schedule_event(listener, event, *args, **kwargs)
+
+    # ---------- command sync ----------
+
+    async def _payload(self, command) -> dict:
+        tree = self.bot.tree
+        if tree.translator:
+            return await command.get_translated_payload(tree, tree.translator)
+        return command.to_dict(tree)
+
+    async def _module_payloads(self, module: str) -> list:
+        ownership = self.owned.get(module)
+        if ownership is None:
+            return []
+        registered = {id(command) for command in self.bot.tree.get_commands()}
+        return [await self._payload(command) for command in ownership.app_commands if id(command) in registered]
+
+    async def sync_app_commands(self) -> list:
+        """bot.tree.sync() plus the slash commands of modules that are still deferred"""
+        tree = self.bot.tree
+        sync = self._original_sync or tree.sync
+        placeholders = {}
+        for module in sorted(self.deferred):
+            for payload in self.manifest.get(module, {}).get("app_commands", []):
+                key = "deferred:" + _app_command_key(payload.get("type", 1), payload.get("name"))
+                placeholders[key] = ManifestCommand(payload)
+        # 跟 globalenv.sync_commands 加入 launch 的做法一樣，只在同步期間放進 tree
+        tree._global_commands.update(placeholders)
+        try:
+            synced = await sync()
+        finally:
+            for key in placeholders:
+                tree._global_commands.pop(key, None)
+
+        for module in self.owned:
+            self.manifest.setdefault(module, {})["app_commands"] = await self._module_payloads(module)
+        self._write_manifest()
+        return synced
+
+    async def _resync_if_changed(self, module: str):
+        payloads = await self._module_payloads(module)
+        if payloads == self.manifest.get(module, {}).get("app_commands"):
+            return
+        # the module's commands changed since the manifest was written
+        self.manifest.setdefault(module, {})["app_commands"] = payloads
+        if self.bot.is_ready():
+            try:
+                await (self.resync or self.bot.tree.sync)()
+            except Exception as e:
+                print(f"[!] Failed to resync commands after loading {module}: {e}")
+
+    # ---------- report ----------
+
+    def report(self) -> list:
+        """Load stats, slowest first (deferred modules last)"""
+        return sorted(self.stats.values(), key=lambda stat: (stat.status == "deferred", -stat.seconds))
@@ -0,0 +1,198 @@
+"""A small pool of warm browser pages for MessageImage's screenshot generator.
+
+Opening a page per screenshot costs a renderer process round-trip each
+time. ``PagePool`` keeps ``size`` pages open and hands them out one request
+at a time. A page is closed and replaced after ``max_uses`` renders, so
+long-lived pages do not accumulate memory. At most ``queue_limit`` requests
+may wait for a page; beyond that ``PagePoolFull`` is raised so a burst is
+refused early instead of piling up.
+
+The pool only calls a handful of methods on the browser and its pages, so
+it does not import Playwright itself.
+
+``StageMetrics`` keeps recent per-stage durations for the owner stats
+command.
+"""
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Awaitable, Callable, Optional
+
+DEFAULT_VIEWPORT = {"width": 1920, "height": 1080}
+
+
+class PagePoolError(Exception):
+    pass
+
+
+class PagePoolFull(PagePoolError):
+    pass
+
+
+class StageMetrics:
+    """Recent durations of named stages (seconds)"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: dict[str, deque] = {}
+        self.counts: dict[str, int] = {}
+
+    def record(self, stage: str, seconds: float):
+        self._samples.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+        self.counts[stage] = self.counts.get(stage, 0) + 1
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def increment(self, stage: str):
+        self.counts[stage] = self.counts.get(stage, 0) + 1
+
+    def summary(self) -> dict:
+        """{stage: {"count", "p50", "p95", "max"}} over the recent window (ms)"""
+        result = {}
+        for stage, samples in self._samples.items():
+            ordered = sorted(samples)
+            result[stage] = {
+                "count": self.counts.get(stage, 0),
+                "p50": ordered[len(ordered) // 2] * 1000,
+                "p95": ordered[max(int(len(ordered) * 0.95) - 1, 0)] * 1000,
+                "max": ordered[-1] * 1000,
+            }
+        for stage, count in self.counts.items():
+            result.setdefault(stage, {"count": count})
+        return result
+
+
+class _PoolPage:
+    __slots__ = ("page", "uses")
+
+    def __init__(self, page=None):
+        self.page = page
+        self.uses = 0
+
+
+class PagePool:
+    def __init__(self, launch: Callable[[], Awaitable], size: int = 3, max_uses: int = 50, queue_limit: int = 20,
+                 viewport: Optional[dict] = None, metrics: Optional[StageMetrics] = None):
+        self.launch = launch
+        self.size = size
+        self.max_uses = max_uses
+        self.queue_limit = queue_limit
+        self.viewport = viewport or DEFAULT_VIEWPORT
+        self.metrics = metrics or StageMetrics()
+        self.browser = None
+        self.waiting = 0
+        self._idle: Optional[asyncio.Queue] = None
+        self._browser_lock = asyncio.Lock()
+        self._closed = False
+
+    @property
+    def started(self) -> bool:
+        return self._idle is not None
+
+    async def start(self):
+        """Launch the browser and open every page up front
+
+        Pages that fail to open are retried when borrowed; the error is
+        re-raised only when no page could be opened at all.
+        """
+        self._idle = asyncio.Queue()
+        error = None
+        opened = 0
+        for _ in range(self.size):
+            entry = _PoolPage()
+            try:
+                entry.page = await self._new_page()
+                opened += 1
+            except Exception as e:
+                error = e
+            self._idle.put_nowait(entry)
+        if error is not None and not opened:
+            raise error
+
+    async def _ensure_browser(self):
+        async with self._browser_lock:
+            if self.browser is None or not self.browser.is_connected():
+                if self.browser is not None:
+                    self.metrics.increment("browser_restarts")
+                self.browser = await self.launch()
+            return self.browser
+
+    async def _new_page(self):
+        browser = await self._ensure_browser()
+        return await browser.new_page(viewport=self.viewport)
+
+    @staticmethod
+    async def _close_page(page):
+        try:
+            await page.close()
+        except Exception:
+            pass
+
+    @asynccontextmanager
+    async def page(self):
+        """Borrow a warm page; raises PagePoolFull when too many requests are already waiting"""
+        if self._idle is None or self._closed:
+            raise PagePoolError("瀏覽器尚未啟動，請稍後再試。")
+        if self.waiting >= self.queue_limit:
+            self.metrics.increment("rejected")
+            raise PagePoolFull("截圖請求太多了，請稍後再試。")
+        self.waiting += 1
+        start = time.perf_counter()
+        try:
+            entry = await self._idle.get()
+        finally:
+            self.waiting -= 1
+        self.metrics.record("queue_wait", time.perf_counter() - start)
+        try:
+            if entry.page is None or entry.page.is_closed():
+                entry.page = await self._new_page()
+                entry.uses = 0
+            entry.uses += 1
+            yield entry.page
+        finally:
+            await self._release(entry)
+
+    async def _release(self, entry: _PoolPage):
+        page = entry.page
+        try:
+            if page is not None and not page.is_closed():
+                if entry.uses >= self.max_uses or self._closed:
+                    self.metrics.increment("recycled")
+                    await self._close_page(page)
+                    entry.page = None
+                else:
+                    await page.set_viewport_size(self.viewport)
+            else:
+                entry.page = None
+        except Exception:
+            await self._close_page(page)
+            entry.page = None
+        if entry.page is None:
+            entry.uses = 0
+            if not self._closed:
+                try:
+                    entry.page = await self._new_page()
+                except Exception:
+                    pass  # retried when the entry is borrowed again
+        self._idle.put_nowait(entry)
+
+    async def close(self):
+        self._closed = True
+        if self._idle is not None:
+            while not self._idle.empty():
+                entry = self._idle.get_nowait()
+                if entry.page is not None:
+                    await self._close_page(entry.page)
+        if self.browser is not None:
+            try:
+                await self.browser.close()
+            except Exception:
+                pass
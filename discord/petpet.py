@@ -8,10 +8,11 @@ from logger import log
 import asyncio
 import logging
 import traceback
-import aiohttp
+import hashlib
 import os
-from typing import Tuple, List, Union
-from collections import defaultdict
+from functools import lru_cache
+from typing import Tuple, List, Union, Optional
+from collections import defaultdict, OrderedDict
 from random import randrange
 from itertools import chain
 
@@ -21,6 +22,9 @@ from PIL.Image import Image as PILImage
 frames = 10
 resolution = (128, 128)
 delay = 20
+PETPET_ASSET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "petpet")
+PETPET_CACHE_SIZE = 256
+PETPET_CACHE_MAX_BYTES = 32 * 1024 * 1024
 
 class TransparentAnimatedGifConverter(object):
     _PALETTE_SLOTSET = set(range(256))
@@ -31,17 +35,17 @@ class TransparentAnimatedGifConverter(object):
 
     def _process_pixels(self):
         """Set the transparent pixels to the color 0."""
-        self._transparent_pixels = set(
-            idx for idx, alpha in enumerate(
-                self._img_rgba.getchannel(channel='A').getdata())
-            if alpha <= self._alpha_threshold)
+        threshold = self._alpha_threshold
+        # 255 where the pixel is transparent; PIL does the per-pixel work
+        self._transparent_mask = self._img_rgba.getchannel(channel='A').point(
+            lambda alpha: 255 if alpha <= threshold else 0)
 
     def _set_parsed_palette(self):
         """Parse the RGB palette color `tuple`s from the palette."""
         palette = self._img_p.getpalette()
-        self._img_p_used_palette_idxs = set(
-            idx for pal_idx, idx in enumerate(self._img_p_data)
-            if pal_idx not in self._transparent_pixels)
+        opaque_mask = self._transparent_mask.point(lambda value: 255 - value)
+        histogram = Image.frombytes('L', self._img_p.size, bytes(self._img_p_data)).histogram(mask=opaque_mask)
+        self._img_p_used_palette_idxs = set(idx for idx, count in enumerate(histogram) if count)
         self._img_p_parsedpalette = dict(
             (idx, tuple(palette[idx * 3:idx * 3 + 3]))
             for idx in self._img_p_used_palette_idxs)
@@ -95,9 +99,8 @@ class TransparentAnimatedGifConverter(object):
                 bytes(self._palette_replaces['idx_from']),
                 bytes(self._palette_replaces['idx_to']))
             self._img_p_data = self._img_p_data.translate(trans_table)
-        for idx_pixel in self._transparent_pixels:
-            self._img_p_data[idx_pixel] = 0
         self._img_p.frombytes(data=bytes(self._img_p_data))
+        self._img_p.paste(0, mask=self._transparent_mask)
 
     def _adjust_palette(self):
         """Modify the palette in the new `Image`."""
@@ -161,6 +164,15 @@ def save_transparent_gif(images: List[PILImage], durations: Union[int, List[int]
     root_frame, save_args = _create_animated_gif(images, durations)
     root_frame.save(save_file, **save_args)
 
+@lru_cache(maxsize=1)
+def load_overlays() -> Tuple[PILImage, ...]:
+    """The hand overlay of every frame, decoded and resized once"""
+    return tuple(
+        Image.open(os.path.join(PETPET_ASSET_DIR, f"pet{i}.gif")).convert('RGBA').resize(resolution)
+        for i in range(frames)
+    )
+
+
 def make(source, dest):
     """
 
@@ -173,7 +185,7 @@ def make(source, dest):
     images = []
     base = Image.open(source).convert('RGBA').resize(resolution)
 
-    for i in range(frames):
+    for i, pet in enumerate(load_overlays()):
         squeeze = i if i < frames/2 else frames - i
         width = 0.8 + squeeze * 0.02
         height = 0.8 - squeeze * 0.05
@@ -182,12 +194,66 @@ def make(source, dest):
 
         canvas = Image.new('RGBA', size=resolution, color=(0, 0, 0, 0))
         canvas.paste(base.resize((round(width * resolution[0]), round(height * resolution[1]))), (round(offsetX * resolution[0]), round(offsetY * resolution[1])))
-        pet = Image.open(os.path.join("assets", "petpet", f"pet{i}.gif")).convert('RGBA').resize(resolution)
         canvas.paste(pet, mask=pet)
         images.append(canvas)
 
     save_transparent_gif(images, durations=20, save_file=dest)
 
+
+def make_bytes(avatar: bytes) -> bytes:
+    gif_bytes = io.BytesIO()
+    make(io.BytesIO(avatar), gif_bytes)
+    return gif_bytes.getvalue()
+
+
+class PetPetCache:
+    """LRU of finished GIFs keyed by a hash of the avatar URL (the URL changes with the avatar)"""
+
+    def __init__(self, max_entries: int = PETPET_CACHE_SIZE, max_bytes: int = PETPET_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+
+    @staticmethod
+    def key(avatar_url: str) -> str:
+        return hashlib.sha1(avatar_url.encode()).hexdigest()
+
+    def get(self, avatar_url: str) -> Optional[bytes]:
+        key = self.key(avatar_url)
+        data = self._entries.get(key)
+        if data is not None:
+            self._entries.move_to_end(key)
+        return data
+
+    def put(self, avatar_url: str, data: bytes):
+        key = self.key(avatar_url)
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.total_bytes -= len(previous)
+        self._entries[key] = data
+        self.total_bytes += len(data)
+        while self._entries and (len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self.total_bytes -= len(evicted)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+petpet_cache = PetPetCache()
+
+
+async def generate(user: Union[discord.User, discord.Member]) -> discord.File:
+    """PetPet GIF of a user's avatar; generated in a thread, repeats come from petpet_cache"""
+    avatar = user.display_avatar.with_size(128).with_static_format("png")
+    data = petpet_cache.get(avatar.url)
+    if data is None:
+        data = await asyncio.to_thread(make_bytes, await avatar.read())
+        petpet_cache.put(avatar.url, data)
+    return discord.File(fp=io.BytesIO(data), filename="petpet.gif")
+
+
 @app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
 @app_commands.allowed_installs(guilds=True, users=True)
 class PetPetCommand(commands.Cog):
@@ -208,15 +274,7 @@ class PetPetCommand(commands.Cog):
                 user = interaction.user
 
             log(f"生成 petpet GIF 給 {user}", module_name="petpet", user=interaction.user, guild=interaction.guild)
-            avatar_url = user.display_avatar.with_size(128).with_static_format("png").url
-            async with aiohttp.ClientSession() as session:
-                async with session.get(avatar_url) as resp:
-                    avatar = io.BytesIO(await resp.read())
-            gif_bytes = io.BytesIO()
-            make(avatar, gif_bytes)
-            gif_bytes.seek(0)
-
-            file = discord.File(fp=gif_bytes, filename="petpet.gif")
+            file = await generate(user)
             await interaction.followup.send(file=file)
             t = get_user_data(0, interaction.user.id, "petpet_count", 0)
             set_user_data(0, interaction.user.id, "petpet_count", t + 1)
@@ -238,16 +296,7 @@ class PetPetCommand(commands.Cog):
                         user = ctx.author
 
                 log(f"生成 petpet GIF 給 {user}", module_name="petpet", user=ctx.author, guild=ctx.guild)
-                avatar_url = user.display_avatar.with_size(128).with_static_format("png").url
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(avatar_url) as resp:
-                        avatar = io.BytesIO(await resp.read())
-
-                gif_bytes = io.BytesIO()
-                make(avatar, gif_bytes)
-                gif_bytes.seek(0)
-
-                file = discord.File(fp=gif_bytes, filename="petpet.gif")
+                file = await generate(user)
                 await ctx.reply(file=file)
                 t = get_user_data(0, ctx.author.id, "petpet_count", 0)
                 set_user_data(0, ctx.author.id, "petpet_count", t + 1)
@@ -276,15 +325,7 @@ class PetPetCommand(commands.Cog):
                 user = interaction.user
 
             log(f"生成 petpet GIF 給 {user}", module_name="petpet", user=interaction.user, guild=interaction.guild)
-            avatar_url = user.display_avatar.with_size(128).with_static_format("png").url
-            async with aiohttp.ClientSession() as session:
-                async with session.get(avatar_url) as resp:
-                    avatar = io.BytesIO(await resp.read())
-            gif_bytes = io.BytesIO()
-            make(avatar, gif_bytes)
-            gif_bytes.seek(0)
-
-            file = discord.File(fp=gif_bytes, filename="petpet.gif")
+            file = await generate(user)
             await interaction.followup.send(file=file)
             t = get_user_data(0, interaction.user.id, "petpet_count", 0)
             set_user_data(0, interaction.user.id, "petpet_count", t + 1)
@@ -0,0 +1,495 @@
+"""Quote card ("Make it a Quote") rendering for MessageImage.
+
+Everything here is plain Pillow work with no Discord objects, so
+``render_quote`` can run in a worker process. The pieces that do not depend
+on the message are computed once per process:
+
+- fonts, cached by (path, size)
+- the gradient arc / black block foreground mask
+
+The message font size is binary-searched instead of shrinking 2px at a time.
+
+Emoji images are fetched by the caller (see ``EmojiCache``) before rendering.
+Each segment carries its raw image bytes into the worker.
+"""
+
+import asyncio
+import functools
+import hashlib
+import io
+import os
+import re
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import emoji
+from PIL import Image, ImageDraw, ImageFont, ImageSequence
+
+if getattr(sys, 'frozen', False):
+    FONT_DIR = os.path.join(sys._MEIPASS, 'assets')
+else:
+    FONT_DIR = os.path.join(os.path.dirname(__file__), 'assets')
+
+MESSAGE_FONT = os.path.join(FONT_DIR, "notobold.ttf")
+NAME_FONT = os.path.join(FONT_DIR, "notoregular.ttf")
+SIGNATURE_FONT = os.path.join(FONT_DIR, "notolight.ttf")
+
+WIDTH, HEIGHT = 1200, 630
+AVATAR_SIZE = 630
+# Area constraints
+X_MIN, X_MAX = 560, 1150
+Y_MIN, Y_MAX = 50, 580
+MAX_FONT_SIZE = 55
+MIN_FONT_SIZE = 20
+FONT_SIZE_STEP = 2
+LINE_SPACING = 10
+
+EMOJI_CACHE_SIZE = 512
+EMOJI_CACHE_DIR = os.path.join(tempfile.gettempdir(), "useless-script-emoji-cache")
+EMOJI_DISK_CACHE_FILES = 4096
+EMOJI_DISK_CACHE_MAX_AGE = 30 * 24 * 3600
+# The directory is scanned on the first write and then once every this many writes
+EMOJI_DISK_PRUNE_EVERY = 64
+
+
+@functools.lru_cache(maxsize=64)
+def get_font(path: str, size: int) -> ImageFont.FreeTypeFont:
+    return ImageFont.truetype(path, size)
+
+
+@functools.lru_cache(maxsize=1)
+def foreground_mask() -> Image.Image:
+    """Gradient arc and black block on a transparent layer; copy before drawing on it"""
+    mask = Image.new("RGBA", (WIDTH, HEIGHT), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(mask)
+    # 畫漸層弧形遮罩
+    for i in range(51):
+        alpha = min((i+1) * 5, 255)
+        draw.arc([-300 + i, -200, 630 + i, 1030], 270, 90, fill=(0, 0, 0, alpha), width=150)
+    # 畫右側黑底區塊
+    draw.rectangle([540, 0, 700, 300], fill="black")
+    return mask
+
+
+class Segment:
+    def __init__(self, type, content, url=None):
+        self.type = type  # 'text', 'emoji' or 'unicode_emoji'
+        self.content = content
+        self.url = url
+        self.width = 0
+        self.height = 0
+        self.image = None
+        self.data = None  # raw emoji image bytes, decoded in the renderer
+
+
+def prepare_segments(text):
+    segments = []
+    # Split by custom emojis <a:name:id> or <:name:id>
+    pattern = r'<(a?):(\w+):(\d+)>'
+    last_pos = 0
+    temp_segments = []
+
+    for match in re.finditer(pattern, text):
+        if match.start() > last_pos:
+            temp_segments.append(Segment('text', text[last_pos:match.start()]))
+
+        is_animated = match.group(1) == 'a'
+        name = match.group(2)
+        emoji_id = match.group(3)
+        ext = 'gif' if is_animated else 'png'
+        url = f"https://cdn.discordapp.com/emojis/{emoji_id}.{ext}"
+
+        temp_segments.append(Segment('emoji', name, url))
+        last_pos = match.end()
+
+    if last_pos < len(text):
+        temp_segments.append(Segment('text', text[last_pos:]))
+
+    # Now process text segments for Unicode Emojis
+    for seg in temp_segments:
+        if seg.type == 'text':
+            last_idx = 0
+            # emoji.analyze yields Token objects
+            for match in emoji.analyze(seg.content, non_emoji=False):
+                start = match.value.start
+                end = match.value.end
+                if start > last_idx:
+                    segments.append(Segment('text', seg.content[last_idx:start]))
+                unicode_seg = Segment('unicode_emoji', match.chars)
+                unicode_seg.url = get_twemoji_url(match.chars)
+                segments.append(unicode_seg)
+                last_idx = end
+
+            if last_idx < len(seg.content):
+                segments.append(Segment('text', seg.content[last_idx:]))
+        else:
+            segments.append(seg)
+
+    return segments
+
+
+def get_text_size(text, font):
+    # 使用 getlength 來獲取正確的寬度（包含空格）
+    try:
+        width = font.getlength(text)
+    except AttributeError:
+        # 舊版 Pillow 備用方案
+        bbox = font.getmask(text).getbbox()
+        width = bbox[2] - bbox[0] if bbox else 0
+
+    # 高度使用 getbbox 或 getmetrics
+    bbox = font.getmask(text).getbbox()
+    if bbox:
+        height = bbox[3] - bbox[1]
+    else:
+        # 對於純空格，使用字體的 metrics
+        ascent, descent = font.getmetrics()
+        height = ascent + descent
+
+    return int(width), height
+
+
+def get_twemoji_url(emoji_char):
+    """將 Unicode emoji 轉換為 Twemoji CDN URL"""
+    # 將 emoji 轉換為 codepoints
+    codepoints = []
+    for char in emoji_char:
+        cp = ord(char)
+        # 跳過變體選擇器 (FE0E, FE0F)
+        if cp not in (0xFE0E, 0xFE0F):
+            codepoints.append(f"{cp:x}")
+
+    filename = "-".join(codepoints)
+    return f"https://cdn.jsdelivr.net/gh/twitter/twemoji@latest/assets/72x72/{filename}.png"
+
+
+def render_sheared_text(text, font_path, font_size, fill="white", shear=0.2, scale=4):
+    """Render italic-like text at a higher resolution, then downsample for sharper output."""
+    hi_font = get_font(font_path, font_size * scale)
+    bbox = hi_font.getbbox(text)
+    text_w = max(bbox[2] - bbox[0], 1)
+    text_h = max(bbox[3] - bbox[1], 1)
+
+    padding = 12 * scale
+    canvas_w = text_w + padding * 2
+    canvas_h = text_h + padding * 2
+
+    text_img = Image.new("RGBA", (canvas_w, canvas_h), (0, 0, 0, 0))
+    text_draw = ImageDraw.Draw(text_img)
+    text_draw.text((padding - bbox[0], padding - bbox[1]), text, font=hi_font, fill=fill)
+
+    sheared = text_img.transform(
+        text_img.size,
+        Image.AFFINE,
+        (1, shear, 0, 0, 1, 0),
+        resample=Image.Resampling.BICUBIC,
+    )
+
+    downsampled = sheared.resize(
+        (max(sheared.width // scale, 1), max(sheared.height // scale, 1)),
+        Image.Resampling.LANCZOS,
+    )
+    cropped_bbox = downsampled.getbbox()
+    return downsampled.crop(cropped_bbox) if cropped_bbox else downsampled
+
+
+def _is_cjk(char):
+    """判斷字元是否為 CJK（中日韓）字元，用於逐字換行"""
+    cp = ord(char)
+    return (
+        (0x4E00 <= cp <= 0x9FFF) or    # CJK Unified Ideographs
+        (0x3400 <= cp <= 0x4DBF) or    # CJK Unified Ideographs Extension A
+        (0x20000 <= cp <= 0x2A6DF) or  # CJK Unified Ideographs Extension B
+        (0x2A700 <= cp <= 0x2B73F) or  # CJK Unified Ideographs Extension C
+        (0x2B740 <= cp <= 0x2B81F) or  # CJK Unified Ideographs Extension D
+        (0xF900 <= cp <= 0xFAFF) or    # CJK Compatibility Ideographs
+        (0x3000 <= cp <= 0x303F) or    # CJK Symbols and Punctuation
+        (0xFF00 <= cp <= 0xFFEF) or    # Halfwidth and Fullwidth Forms
+        (0x3040 <= cp <= 0x309F) or    # Hiragana
+        (0x30A0 <= cp <= 0x30FF) or    # Katakana
+        (0xAC00 <= cp <= 0xD7AF)       # Hangul Syllables
+    )
+
+
+def _split_text_for_wrapping(text):
+    """將文字拆分為可換行的單位：CJK 字元逐字拆分，其他按空白分割"""
+    tokens = []
+    buffer = ""
+    for char in text:
+        if _is_cjk(char):
+            if buffer:
+                # 先把累積的非 CJK 文字按空白分割加入
+                tokens.extend(re.split(r'(\s+)', buffer))
+                buffer = ""
+            tokens.append(char)
+        else:
+            buffer += char
+    if buffer:
+        tokens.extend(re.split(r'(\s+)', buffer))
+    return [t for t in tokens if t]  # 過濾空字串
+
+
+def layout_segments(segments, font, max_width, emoji_size):
+    lines = []
+    current_line = []
+    current_width = 0
+
+    for seg in segments:
+        if seg.type == 'text':
+            # Split text logic - 使用支援 CJK 逐字換行的拆分
+            for word in _split_text_for_wrapping(seg.content):
+                word_w, word_h = get_text_size(word, font)
+                if current_width + word_w > max_width and current_line:
+                    lines.append(current_line)
+                    current_line = []
+                    current_width = 0
+
+                word_seg = Segment('text', word)
+                word_seg.width = word_w
+                word_seg.height = word_h
+                current_line.append(word_seg)
+                current_width += word_w
+        else:
+            # Emoji or Unicode Emoji (both drawn as images of the same size)
+            seg.width = emoji_size
+            seg.height = emoji_size
+            if current_width + seg.width > max_width and current_line:
+                lines.append(current_line)
+                current_line = []
+                current_width = 0
+            current_line.append(seg)
+            current_width += seg.width
+
+    if current_line:
+        lines.append(current_line)
+    return lines
+
+
+def fit_layout(segments, font_path=None, max_width=X_MAX - X_MIN, max_height=Y_MAX - Y_MIN):
+    """Largest font size (55, 53, ... 21) whose layout fits the text box; returns (lines, font)
+
+    Falls back to the smallest size when nothing fits.
+    """
+    font_path = font_path or MESSAGE_FONT
+    sizes = list(range(MAX_FONT_SIZE, MIN_FONT_SIZE - 1, -FONT_SIZE_STEP))
+
+    def try_size(size):
+        font = get_font(font_path, size)
+        ascent, descent = font.getmetrics()
+        lines = layout_segments(segments, font, max_width, ascent + descent)
+        return lines, font, len(lines) * (ascent + descent + LINE_SPACING) <= max_height
+
+    low, high = 0, len(sizes) - 1
+    best = None
+    while low <= high:
+        middle = (low + high) // 2
+        lines, font, fits = try_size(sizes[middle])
+        if fits:
+            best = (lines, font)
+            high = middle - 1
+        else:
+            low = middle + 1
+    if best is None:
+        lines, font, _ = try_size(sizes[-1])
+        best = (lines, font)
+    # the last attempt may have been a different size; lay out the winner again
+    lines, font, _ = try_size(best[1].size)
+    return lines, font
+
+
+def _decode_emoji(data: bytes, size: int) -> Optional[Image.Image]:
+    try:
+        return Image.open(io.BytesIO(data)).convert("RGBA").resize((size, size), Image.Resampling.LANCZOS)
+    except Exception:
+        return None
+
+
+def render_quote(segments: list, name: str, avatar_data: bytes, animate_gif: bool = False) -> tuple:
+    """Render a quote card; returns (image bytes, "png" or "gif")"""
+    avatar_img = Image.open(io.BytesIO(avatar_data))
+    # 判斷是否為動態圖片
+    is_animated = getattr(avatar_img, "is_animated", False)
+
+    # --- 建立「前景層」(文字與遮罩) ---
+    foreground = foreground_mask().copy()
+    draw_fg = ImageDraw.Draw(foreground)
+
+    lines, font = fit_layout(segments)
+    ascent, descent = font.getmetrics()
+    emoji_size = ascent + descent
+    for seg in segments:
+        if seg.data is not None:
+            seg.image = _decode_emoji(seg.data, emoji_size)
+
+    # Calculate vertical position
+    total_text_height = len(lines) * (emoji_size + LINE_SPACING)
+    _, name_h = get_text_size(f" - {name}", get_font(NAME_FONT, 25))
+    max_h = Y_MAX - Y_MIN
+    total_content_height = total_text_height + 20 + name_h
+    current_y = Y_MIN + (max_h - total_content_height) // 2
+    center_x = (X_MIN + X_MAX) // 2
+
+    # Draw Text and Emojis (畫在 foreground 上)
+    for line in lines:
+        line_width = sum(seg.width for seg in line)
+        cursor_x = center_x - line_width // 2
+        for seg in line:
+            if seg.type != 'text' and seg.image:
+                foreground.paste(seg.image, (int(cursor_x), int(current_y)), seg.image)
+            elif seg.type != 'emoji':
+                draw_fg.text((cursor_x, current_y), seg.content, font=font, fill="white")
+            cursor_x += seg.width
+        current_y += emoji_size + LINE_SPACING
+
+    # the author name is drawn on the final opaque image to avoid fuzzy edges from compositing
+    signature = render_sheared_text(f" - {name}", SIGNATURE_FONT, 25, fill="white", shear=0.2, scale=4)
+    signature_pos = (center_x - signature.width // 2, int(current_y + 20))
+
+    def compose(frame):
+        frame_rgba = frame.convert("RGBA").resize((AVATAR_SIZE, AVATAR_SIZE), Image.Resampling.LANCZOS)
+        base = Image.new("RGBA", (WIDTH, HEIGHT), (0, 0, 0, 255))
+        base.paste(frame_rgba, (0, 0), frame_rgba)
+        combined = Image.alpha_composite(base, foreground)
+        combined.paste(signature, signature_pos, signature)
+        return combined
+
+    output_buffer = io.BytesIO()
+    if is_animated and animate_gif:
+        frames = []
+        durations = []
+        for frame in ImageSequence.Iterator(avatar_img):
+            # 取得每一幀的持續時間 (預設 50 毫秒)
+            durations.append(frame.info.get('duration', 50))
+            # 轉換為 RGB 以利 GIF 儲存 (去透明底)
+            frames.append(compose(frame).convert("RGB"))
+        frames[0].save(
+            output_buffer,
+            format="GIF",
+            save_all=True,
+            append_images=frames[1:],
+            duration=durations,
+            loop=0,
+            optimize=True
+        )
+        return output_buffer.getvalue(), "gif"
+
+    compose(avatar_img).save(output_buffer, format="PNG")
+    return output_buffer.getvalue(), "png"
+
+
+class EmojiCache:
+    """Emoji image bytes by URL: an in-memory LRU in front of an on-disk cache
+
+    The disk cache keeps at most ``max_files`` files, none older than
+    ``max_age`` seconds. A disk hit refreshes the file's mtime, so the files
+    dropped when it is over the limit are the least recently used ones.
+    """
+
+    def __init__(self, directory: str = EMOJI_CACHE_DIR, max_size: int = EMOJI_CACHE_SIZE,
+                 max_files: int = EMOJI_DISK_CACHE_FILES, max_age: float = EMOJI_DISK_CACHE_MAX_AGE):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_files = max_files
+        self.max_age = max_age
+        self._writes_until_prune = 0
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._fetching: dict[str, asyncio.Future] = {}
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(url.encode()).hexdigest())
+
+    def _remember(self, url: str, data: bytes):
+        self._memory[url] = data
+        self._memory.move_to_end(url)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, url: str) -> Optional[bytes]:
+        path = self._path(url)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def _write_disk(self, url: str, data: bytes):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = self._path(url) + ".tmp"
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, self._path(url))
+        except OSError:
+            return
+        self._writes_until_prune -= 1
+        if self._writes_until_prune <= 0:
+            self._writes_until_prune = EMOJI_DISK_PRUNE_EVERY
+            self._prune_disk()
+
+    def _prune_disk(self, now: Optional[float] = None):
+        """Delete files older than ``max_age``, then the least recently used ones over ``max_files``"""
+        now = time.time() if now is None else now
+        files = []
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    try:
+                        mtime = entry.stat().st_mtime
+                    except OSError:
+                        continue
+                    files.append((mtime, entry.path))
+        except OSError:
+            return
+        files.sort()
+        expired = sum(1 for mtime, _ in files if now - mtime > self.max_age)
+        for _, path in files[:max(expired, len(files) - self.max_files)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    async def _download(self, session, url: str) -> Optional[bytes]:
+        data = await asyncio.to_thread(self._read_disk, url)
+        if data is None:
+            try:
+                async with session.get(url) as resp:
+                    if resp.status != 200:
+                        print(f"Failed to load emoji {url}, status: {resp.status}")
+                        return None
+                    data = await resp.read()
+            except Exception as e:
+                print(f"Failed to load emoji {url}: {e}")
+                return None
+            await asyncio.to_thread(self._write_disk, url, data)
+        self._remember(url, data)
+        return data
+
+    async def get(self, session, url: str) -> Optional[bytes]:
+        data = self._memory.get(url)
+        if data is not None:
+            self._memory.move_to_end(url)
+            return data
+        pending = self._fetching.get(url)
+        if pending is None:
+            pending = asyncio.ensure_future(self._download(session, url))
+            self._fetching[url] = pending
+            pending.add_done_callback(lambda _: self._fetching.pop(url, None))
+        return await asyncio.shield(pending)
+
+    async def load(self, session, segments: list):
+        """Fetch every emoji segment's image concurrently into ``seg.data``
+
+        Custom emojis that cannot be loaded fall back to their ``:name:`` text.
+        """
+        emoji_segments = [seg for seg in segments if seg.type != 'text' and seg.url]
+        results = await asyncio.gather(*(self.get(session, seg.url) for seg in emoji_segments))
+        for seg, data in zip(emoji_segments, results):
+            seg.data = data
+            if data is None and seg.type == 'emoji':
+                seg.type = 'text'
+                seg.content = f":{seg.content}:"
@@ -0,0 +1,197 @@
+"""Token-bucket rate limiting shared by the cogs.
+
+A ``RateLimiter`` allows ``rate`` uses per ``per`` seconds for each key. Up to
+``burst`` of them may be used back to back; ``burst`` defaults to ``rate``.
+With ``rate=1`` it is a plain cooldown. Buckets live in memory, spread over
+a few shards. A shard that grows too large drops its full buckets, which
+behave the same as absent ones. A check is a dict lookup and a little
+arithmetic, with no database round-trip. Each shard has its own lock, since
+some limiters are hit from the web server's threads as well as the bot loop.
+
+``get_limiter(name, ...)`` returns one shared limiter per name, so a command
+and a button can throttle against the same bucket. Limiters created with
+``persist=True`` can be written to and read back from a JSON file with
+``save_limiters`` / ``load_limiters``, for cooldowns long enough to matter
+across a restart.
+
+``rate_limited(limiter)`` decorates an interaction handler (a cog method or
+a plain function) and replies with an ephemeral message instead of running
+it when the user is throttled.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from functools import wraps
+from typing import Callable, Hashable, Optional
+
+import discord
+
+STATE_PATH = "rate_limits.json"
+DEFAULT_SHARDS = 16
+MAX_KEYS_PER_SHARD = 4096
+RATE_LIMITED_MESSAGE = "你操作的太快了，請稍後再試。"
+
+
+class RateLimiter:
+    def __init__(self, rate: float, per: float, *, burst: Optional[float] = None, name: Optional[str] = None,
+                 persist: bool = False, shards: int = DEFAULT_SHARDS, max_keys_per_shard: int = MAX_KEYS_PER_SHARD):
+        self.rate = rate
+        self.per = per
+        self.capacity = float(burst if burst is not None else rate)
+        self.fill_rate = rate / per  # tokens per second
+        self.name = name
+        self.persist = persist
+        self.max_keys_per_shard = max_keys_per_shard
+        self._shards: list[dict] = [{} for _ in range(shards)]  # key -> [tokens, updated_at]
+        self._locks = [threading.Lock() for _ in range(shards)]
+
+    def _shard(self, key: Hashable) -> tuple[dict, threading.Lock]:
+        index = hash(key) % len(self._shards)
+        return self._shards[index], self._locks[index]
+
+    def _tokens(self, bucket: list, now: float) -> float:
+        return min(self.capacity, bucket[0] + (now - bucket[1]) * self.fill_rate)
+
+    def _retry_after(self, tokens: float, cost: float) -> float:
+        return (cost - tokens) / self.fill_rate
+
+    def retry_after(self, key: Hashable, cost: float = 1.0, now: Optional[float] = None) -> float:
+        """Seconds until ``cost`` tokens are available, without using them; 0.0 when allowed now"""
+        shard, lock = self._shard(key)
+        with lock:
+            bucket = shard.get(key)
+            if bucket is None:
+                return 0.0
+            tokens = self._tokens(bucket, time.monotonic() if now is None else now)
+        return 0.0 if tokens >= cost else self._retry_after(tokens, cost)
+
+    def hit(self, key: Hashable, cost: float = 1.0, now: Optional[float] = None) -> float:
+        """Use ``cost`` tokens if available and return 0.0; otherwise return the seconds to wait"""
+        now = time.monotonic() if now is None else now
+        shard, lock = self._shard(key)
+        with lock:
+            bucket = shard.get(key)
+            if bucket is None:
+                if cost > self.capacity:
+                    return self._retry_after(self.capacity, cost)
+                if len(shard) >= self.max_keys_per_shard:
+                    self._evict(shard, now)
+                shard[key] = [self.capacity - cost, now]
+                return 0.0
+            tokens = self._tokens(bucket, now)
+            if tokens < cost:
+                return self._retry_after(tokens, cost)
+            bucket[0] = tokens - cost
+            bucket[1] = now
+            return 0.0
+
+    def reset(self, key: Hashable):
+        """Forget a key, e.g. to refund a use that did not happen"""
+        shard, lock = self._shard(key)
+        with lock:
+            shard.pop(key, None)
+
+    def _evict(self, shard: dict, now: float):
+        # 呼叫端已持有這個 shard 的鎖
+        full = [key for key, bucket in shard.items() if self._tokens(bucket, now) >= self.capacity]
+        for key in full:
+            del shard[key]
+        if len(shard) >= self.max_keys_per_shard:
+            # 都還在冷卻中：丟掉最久沒動的一半
+            oldest = sorted(shard, key=lambda key: shard[key][1])[:len(shard) // 2]
+            for key in oldest:
+                del shard[key]
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    def snapshot(self, now: Optional[float] = None, wall_now: Optional[float] = None) -> list:
+        """[[key, tokens, updated_at as a UNIX timestamp]] for buckets that are not full"""
+        now = time.monotonic() if now is None else now
+        wall_now = time.time() if wall_now is None else wall_now
+        entries = []
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                entries.extend(
+                    [key, bucket[0], wall_now - (now - bucket[1])]
+                    for key, bucket in shard.items()
+                    if self._tokens(bucket, now) < self.capacity
+                )
+        return entries
+
+    def restore(self, entries: list, now: Optional[float] = None, wall_now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        wall_now = time.time() if wall_now is None else wall_now
+        for key, tokens, updated_at in entries:
+            if isinstance(key, list):
+                key = tuple(key)  # JSON 沒有 tuple
+            bucket = [float(tokens), now - max(0.0, wall_now - updated_at)]
+            if self._tokens(bucket, now) < self.capacity:
+                shard, lock = self._shard(key)
+                with lock:
+                    shard[key] = bucket
+
+
+_limiters: dict[str, RateLimiter] = {}
+_saved_entries: dict[str, list] = {}  # 檔案裡有、但還沒建立的 limiter
+
+
+def get_limiter(name: str, rate: float, per: float, **kwargs) -> RateLimiter:
+    """The shared limiter called ``name``, created on first use"""
+    limiter = _limiters.get(name)
+    if limiter is None:
+        limiter = _limiters[name] = RateLimiter(rate, per, name=name, **kwargs)
+        entries = _saved_entries.pop(name, None)
+        if entries and limiter.persist:
+            limiter.restore(entries)
+    return limiter
+
+
+def save_limiters(path: str = STATE_PATH):
+    data = {name: limiter.snapshot() for name, limiter in _limiters.items() if limiter.persist}
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def load_limiters(path: str = STATE_PATH):
+    """Restore persisted buckets; limiters that are created later pick theirs up from get_limiter"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return
+    for name, entries in data.items():
+        limiter = _limiters.get(name)
+        if limiter is None:
+            _saved_entries[name] = entries
+        elif limiter.persist:
+            limiter.restore(entries)
+
+
+def format_retry_after(seconds: float) -> int:
+    return max(1, math.ceil(seconds))
+
+
+def rate_limited(limiter: RateLimiter, *, key: Optional[Callable[[discord.Interaction], Hashable]] = None,
+                 message: str = RATE_LIMITED_MESSAGE, on_limited: Optional[Callable] = None):
+    """Throttle an interaction handler; ``on_limited(interaction, func, retry_after)`` runs when refused"""
+    key = key or (lambda interaction: interaction.user.id)
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            interaction = args[1] if len(args) > 1 and isinstance(args[1], discord.Interaction) else args[0]
+            retry_after = limiter.hit(key(interaction))
+            if retry_after:
+                if on_limited is not None:
+                    on_limited(interaction, func, retry_after)
+                await interaction.response.send_message(message, ephemeral=True)
+                return
+            return await func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,197 @@
+"""Bounded TTL cache for resolved values, optionally persisted to SQLite.
+
+``ResolutionCache.resolve(key, loader)`` returns the cached value for
+``key`` if it has not expired. Otherwise it awaits ``loader()`` and stores
+the result. Concurrent misses for one key share a single load. A ``None``
+result (nothing resolved) is cached too, for ``negative_ttl`` seconds.
+
+At most ``max_size`` keys are kept, with the least recently used evicted
+first. When a ``ConnectionPool`` is attached, new results are queued and a
+background thread writes them to ``table`` every ``flush_interval`` seconds,
+off the request path. Persistence is best effort: a failed write is printed
+and the rows are retried on the next flush, while ``resolve`` keeps
+returning what the loader produced. ``load`` brings the unexpired rows back
+after a restart. Expiry uses wall-clock time so it means the same across
+restarts.
+
+``stats()`` reports hits, misses, coalesced waits, loads in flight and
+evictions, for sizing the cache.
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+CACHE_SIZE = 2048
+CACHE_TTL = 600.0
+NEGATIVE_TTL = 60.0
+FLUSH_INTERVAL = 30.0
+
+
+class ResolutionCache:
+    def __init__(self, table: str, max_size: int = CACHE_SIZE, ttl: float = CACHE_TTL,
+                 negative_ttl: float = NEGATIVE_TTL, flush_interval: float = FLUSH_INTERVAL):
+        self.table = table
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.flush_interval = flush_interval
+        self.pool = None
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, tuple] = OrderedDict()  # key -> (expires_at, value or None)
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._dirty: dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self._closed = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str, now: Optional[float] = None) -> tuple[bool, Any]:
+        """(found, value); an expired entry counts as not found"""
+        now = time.time() if now is None else now
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        if entry[0] <= now:
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, entry[1]
+
+    def put(self, key: str, value, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        entry = (now + (self.ttl if value is not None else self.negative_ttl), value)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        if self.pool is not None:
+            with self._lock:
+                self._dirty[key] = entry
+
+    async def resolve(self, key: str, loader: Callable[[], Awaitable]):
+        found, value = self.get(key)
+        if found:
+            self.hits += 1
+            return value
+        pending = self._inflight.get(key)
+        if pending is None:
+            self.misses += 1
+            pending = asyncio.ensure_future(self._load(key, loader))
+            self._inflight[key] = pending
+            pending.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(pending)
+
+    async def _load(self, key: str, loader):
+        value = await loader()
+        self.put(key, value)
+        return value
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight),
+            "evictions": self.evictions,
+        }
+
+    def _ensure_table(self, conn):
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "cache_key TEXT PRIMARY KEY, cache_value TEXT, expires_at REAL NOT NULL)"
+        )
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_expires ON {self.table}(expires_at)")
+
+    def attach(self, pool):
+        """Persist to ``pool`` (a database.ConnectionPool) from now on"""
+        with pool.connection() as conn:
+            self._ensure_table(conn)
+        self.pool = pool
+        if self._flusher is None and not self._closed:
+            self._flusher = threading.Thread(target=self._flusher_loop, name=f"{self.table}-flusher", daemon=True)
+            self._flusher.start()
+
+    def _flusher_loop(self):
+        while not self._stopping.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing {self.table}: {e}")
+
+    def load(self, now: Optional[float] = None) -> int:
+        """Read unexpired rows into memory, newest last; returns how many were loaded"""
+        if self.pool is None:
+            return 0
+        now = time.time() if now is None else now
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f"SELECT cache_key, cache_value, expires_at FROM {self.table} "
+                "WHERE expires_at > ? ORDER BY expires_at DESC LIMIT ?",
+                (now, self.max_size),
+            ).fetchall()
+        for key, value, expires_at in reversed(rows):
+            if key not in self._entries:
+                self._entries[key] = (expires_at, value)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return len(rows)
+
+    def flush(self, now: Optional[float] = None) -> int:
+        """Write new results and drop expired or surplus rows in one transaction.
+
+        On failure the rows are queued again, behind anything newer for the same key, and the error is raised.
+        """
+        if self.pool is None:
+            return 0
+        now = time.time() if now is None else now
+        with self._flush_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, {}
+            if not dirty:
+                return 0
+            try:
+                with self.pool.connection() as conn:
+                    conn.executemany(
+                        f"INSERT OR REPLACE INTO {self.table} (cache_key, cache_value, expires_at) VALUES (?, ?, ?)",
+                        [(key, value, expires_at) for key, (expires_at, value) in dirty.items()],
+                    )
+                    conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (now,))
+                    conn.execute(
+                        f"DELETE FROM {self.table} WHERE cache_key NOT IN "
+                        f"(SELECT cache_key FROM {self.table} ORDER BY expires_at DESC LIMIT ?)",
+                        (self.max_size,),
+                    )
+            except Exception:
+                with self._lock:
+                    for key, entry in dirty.items():
+                        self._dirty.setdefault(key, entry)
+                raise
+        return len(dirty)
+
+    def close(self):
+        """Stop the background flusher and write what is still queued (best effort)"""
+        if self._closed:
+            return
+        self._closed = True
+        self._stopping.set()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join(timeout=5)
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Error flushing {self.table}: {e}")
@@ -0,0 +1,190 @@
+"""Per-guild message history for AutoModerate's anti_spam check.
+
+Each user keeps the messages of their time window in a ring buffer (capped
+at ``HISTORY_LIMIT``, or ``max_messages`` if that is larger, purely as a
+memory guard). Short messages are compared with ``difflib.SequenceMatcher``
+(cheap at that size). Long ones carry a bottom-k MinHash signature over
+character shingles, and each is filed in a band index under the
+``LSH_KEYS`` smallest values of its signature. Two messages whose shingle
+sets overlap by a Jaccard index of J share the smallest value of their
+union with probability J. Near-duplicates therefore almost always meet in
+one of the bands. A long message is only compared with the entries it
+meets there (plus any short ones), not with the whole window.
+
+Users whose newest message has fallen out of their time window are dropped
+by ``expire_idle``, which AutoModerate runs on a timer.
+"""
+
+from __future__ import annotations
+
+import heapq
+from collections import deque
+from difflib import SequenceMatcher
+from itertools import islice
+from typing import Optional
+
+SHINGLE_SIZE = 3
+SIGNATURE_SIZE = 64
+# Messages up to this length are compared exactly with SequenceMatcher.
+EXACT_COMPARE_LIMIT = 64
+# Signature values a long message is indexed under; a pair at Dice 0.75 (Jaccard 0.6) misses all of them ~0.07% of the time
+LSH_KEYS = 8
+HISTORY_LIMIT = 512
+
+
+def history_size(max_messages: int) -> int:
+    return max(max_messages, HISTORY_LIMIT)
+
+
+def shingle_signature(text: str) -> frozenset:
+    """Bottom-k MinHash of ``text``'s character shingles."""
+    if len(text) <= SHINGLE_SIZE:
+        return frozenset((hash(text),))
+    # zip() builds the shingles as tuples in C, far cheaper than slicing the string per position
+    shingles = set(zip(*(text[offset:] for offset in range(SHINGLE_SIZE))))
+    if len(shingles) <= SIGNATURE_SIZE:
+        return frozenset(map(hash, shingles))
+    return frozenset(heapq.nsmallest(SIGNATURE_SIZE, map(hash, shingles)))
+
+
+def signature_similarity(a: frozenset, b: frozenset) -> float:
+    """Dice coefficient estimated from two bottom-k signatures.
+
+    Dice (2J / (1 + J)) is used rather than the Jaccard index itself because it
+    tracks ``SequenceMatcher.ratio()`` closely, which keeps the configured
+    similarity percentage meaning the same thing for short and long messages.
+    """
+    if not a or not b:
+        return 0.0
+    union_bottom = sorted(a | b)[:SIGNATURE_SIZE]
+    shared = sum(1 for value in union_bottom if value in a and value in b)
+    jaccard = shared / len(union_bottom)
+    return 2 * jaccard / (1 + jaccard)
+
+
+class SpamEntry:
+    __slots__ = ("content", "timestamp", "signature", "keys")
+
+    def __init__(self, content: str, timestamp: float):
+        self.content = content
+        self.timestamp = timestamp
+        if len(content) > EXACT_COMPARE_LIMIT:
+            self.signature = shingle_signature(content)
+            self.keys = heapq.nsmallest(LSH_KEYS, self.signature)
+        else:
+            self.signature = None
+            self.keys = ()
+
+    def is_similar(self, other: "SpamEntry", threshold: float) -> bool:
+        if not self.content or not other.content:
+            return False
+        # ratio() can never exceed 2 * shorter / total, so very different lengths are rejected outright
+        shorter, longer = sorted((len(self.content), len(other.content)))
+        if 2 * shorter / (shorter + longer) < threshold:
+            return False
+        if self.signature is not None and other.signature is not None:
+            return signature_similarity(self.signature, other.signature) >= threshold
+        matcher = SequenceMatcher(None, self.content, other.content)
+        return matcher.quick_ratio() >= threshold and matcher.ratio() >= threshold
+
+
+class UserSpamHistory:
+    __slots__ = ("size", "entries", "short", "bands", "last_seen", "time_window")
+
+    def __init__(self, size: int):
+        self.size = size
+        self.entries: deque[SpamEntry] = deque()
+        # 短訊息另外排一條，長訊息才不用掃過整個視窗去找它們
+        self.short: deque[SpamEntry] = deque()
+        self.bands: dict[int, deque[SpamEntry]] = {}
+        self.last_seen = 0.0
+        self.time_window = 0.0
+
+    def append(self, entry: SpamEntry):
+        if len(self.entries) >= self.size:
+            self.popleft()
+        self.entries.append(entry)
+        if entry.signature is None:
+            self.short.append(entry)
+        for key in entry.keys:
+            self.bands.setdefault(key, deque()).append(entry)
+
+    def popleft(self) -> SpamEntry:
+        entry = self.entries.popleft()
+        if entry.signature is None:
+            self.short.popleft()
+        for key in entry.keys:
+            band = self.bands[key]
+            # the oldest entry is always first in each of its bands
+            if band[0] is entry:
+                band.popleft()
+            else:
+                band.remove(entry)
+            if not band:
+                del self.bands[key]
+        return entry
+
+    def candidates(self, entry: SpamEntry):
+        """Earlier entries that could be similar to ``entry`` (the newest one)"""
+        if entry.signature is None:
+            return islice(self.entries, len(self.entries) - 1)
+        found = {id(entry): entry}
+        for key in entry.keys:
+            for other in self.bands[key]:
+                found.setdefault(id(other), other)
+        del found[id(entry)]
+        return [*found.values(), *self.short]
+
+
+class SpamTracker:
+    """anti_spam history of one guild."""
+
+    __slots__ = ("_users",)
+
+    def __init__(self):
+        self._users: dict[int, UserSpamHistory] = {}
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def record(self, user_id: int, content: str, now: float, time_window: float, max_messages: int, similarity_threshold: float) -> Optional[int]:
+        """Add a message and return how many earlier messages in the window resemble it.
+
+        Returns None while the user has fewer than ``max_messages`` messages in
+        the window, mirroring the old list-based check.
+        """
+        size = history_size(max_messages)
+        history = self._users.get(user_id)
+        if history is None or history.size != size:
+            previous = history.entries if history is not None else ()
+            history = UserSpamHistory(size)
+            for old_entry in previous:
+                history.append(old_entry)
+            self._users[user_id] = history
+
+        entries = history.entries
+        while entries and now - entries[0].timestamp >= time_window:
+            history.popleft()
+
+        entry = SpamEntry(content, now)
+        history.append(entry)
+        history.last_seen = now
+        history.time_window = time_window
+
+        if len(entries) < max_messages:
+            return None
+
+        similar_count = 0
+        for old_entry in history.candidates(entry):
+            if content == old_entry.content or entry.is_similar(old_entry, similarity_threshold):
+                similar_count += 1
+        return similar_count
+
+    def reset(self, user_id: int):
+        self._users.pop(user_id, None)
+
+    def expire_idle(self, now: float) -> int:
+        expired = [user_id for user_id, history in self._users.items() if now - history.last_seen >= history.time_window]
+        for user_id in expired:
+            del self._users[user_id]
+        return len(expired)
@@ -0,0 +1,102 @@
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+from attachment_relay import AttachmentRelay, AttachmentTooLarge
+
+
+class FakeContent:
+    def __init__(self, body):
+        self.body = body
+
+    async def iter_chunked(self, size):
+        for start in range(0, len(self.body), size):
+            yield self.body[start:start + size]
+
+
+class FakeResponse:
+    def __init__(self, body, status=200):
+        self.content = FakeContent(body)
+        self.status = status
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise RuntimeError(f"HTTP {self.status}")
+
+
+class FakeSession:
+    def __init__(self, bodies):
+        self.bodies = bodies
+        self.requests = []
+
+    def get(self, url, timeout=None):
+        self.requests.append(url)
+        return FakeResponse(self.bodies[url])
+
+
+def make_attachment(name, body, size=None, spoiler=False):
+    return SimpleNamespace(
+        filename=name,
+        size=len(body) if size is None else size,
+        url=f"https://cdn.example.com/{name}",
+        proxy_url=f"https://media.example.com/{name}",
+        description=None,
+        is_spoiler=lambda: spoiler,
+    )
+
+
+class AttachmentRelayTests(unittest.TestCase):
+    def test_files_can_be_sent_twice_from_one_download(self):
+        small, large = b"a" * 100, b"b" * 5000
+        attachments = [make_attachment("a.png", small), make_attachment("b.mp4", large, spoiler=True)]
+        session = FakeSession({a.proxy_url: body for a, body in zip(attachments, (small, large))})
+        with AttachmentRelay(spool_bytes=1024, chunk_bytes=256) as relay:
+            asyncio.run(relay.fetch(session, attachments))
+            self.assertEqual(relay.total_bytes, 5100)
+            self.assertEqual(relay.on_disk(), 1)  # 超過門檻的才寫到暫存檔
+            for _ in range(2):
+                files = relay.files()
+                self.assertEqual([file.fp.read() for file in files], [small, large])
+                self.assertEqual(files[1].filename, "SPOILER_b.mp4")
+                for file in files:
+                    file.close()
+        self.assertEqual(len(session.requests), 2)
+        self.assertEqual(len(relay), 0)
+
+    def test_declared_size_over_cap_downloads_nothing(self):
+        session = FakeSession({})
+        relay = AttachmentRelay(max_total_bytes=100)
+        with self.assertRaises(AttachmentTooLarge):
+            asyncio.run(relay.fetch(session, [make_attachment("a.mp4", b"", size=101)]))
+        self.assertEqual(session.requests, [])
+
+    def test_received_size_over_cap_is_refused(self):
+        attachment = make_attachment("a.mp4", b"x" * 500, size=10)
+        relay = AttachmentRelay(max_total_bytes=100, chunk_bytes=64)
+        with self.assertRaises(AttachmentTooLarge):
+            asyncio.run(relay.fetch(FakeSession({attachment.proxy_url: b"x" * 500}), [attachment]))
+        self.assertEqual(len(relay), 0)
+
+    def test_close_after_unclosed_file(self):
+        attachment = make_attachment("a.png", b"abc")
+        relay = AttachmentRelay()
+        asyncio.run(relay.fetch(FakeSession({attachment.proxy_url: b"abc"}), [attachment]))
+        buffer = relay.files()[0].fp
+        relay.close()
+        self.assertTrue(buffer.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
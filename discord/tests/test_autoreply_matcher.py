@@ -0,0 +1,125 @@
+import random
+import sys
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+import discord
+import AutoReply
+from autoreply_matcher import AhoCorasick, CompiledTriggerMatcher
+
+
+def make_message(content, message_type=discord.MessageType.default):
+    return SimpleNamespace(content=content, type=message_type)
+
+
+def linear_first_match(cog, rules, message, channel_id):
+    """The loop AutoReply.on_message used before rules were compiled."""
+    for index, rule in enumerate(rules):
+        channel_mode = rule.get("channel_mode", "all")
+        channels = rule.get("channels", [])
+        if channel_mode == "whitelist" and channel_id not in channels:
+            continue
+        if channel_mode == "blacklist" and channel_id in channels:
+            continue
+        if cog._message_matches_autoreply_triggers(message, rule.get("mode"), rule.get("trigger", [])):
+            return index
+    return None
+
+
+class AhoCorasickTests(unittest.TestCase):
+    def test_reports_overlapping_matches(self):
+        automaton = AhoCorasick()
+        for word in ("he", "she", "his", "hers"):
+            automaton.add(word, word)
+        found = sorted(automaton.iter_matches("ushers"))
+        self.assertEqual(found, [(3, "he"), (3, "she"), (5, "hers")])
+
+
+class CompiledTriggerMatcherTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.cog = AutoReply.AutoReply(None)
+
+    def compile(self, rules):
+        return CompiledTriggerMatcher(rules, self.cog._parse_message_type_trigger)
+
+    def test_modes_and_rule_order(self):
+        rules = [
+            {"mode": "equals", "trigger": ["hi"]},
+            {"mode": "starts_with", "trigger": ["早安"]},
+            {"mode": "ends_with", "trigger": ["!"]},
+            {"mode": "contains", "trigger": ["cat"]},
+            {"mode": "regex", "trigger": [r"\d{3}"]},
+            {"mode": "contains", "trigger": ["type:join"]},
+        ]
+        matcher = self.compile(rules)
+        self.assertEqual(matcher.first_match(make_message("hi"), 1)[0], 0)
+        self.assertEqual(matcher.first_match(make_message("早安 cat"), 1)[0], 1)
+        self.assertEqual(matcher.first_match(make_message("a cat!"), 1)[0], 2)
+        self.assertEqual(matcher.first_match(make_message("concatenate"), 1)[0], 3)
+        self.assertEqual(matcher.first_match(make_message("code 123"), 1)[0], 4)
+        self.assertIsNone(matcher.first_match(make_message("nothing"), 1))
+        self.assertEqual(matcher.first_match(make_message("", discord.MessageType.new_member), 1)[0], 5)
+
+    def test_channel_filters_skip_to_next_rule(self):
+        rules = [
+            {"mode": "contains", "trigger": ["x"], "channel_mode": "whitelist", "channels": [5]},
+            {"mode": "contains", "trigger": ["x"], "channel_mode": "blacklist", "channels": [6]},
+        ]
+        matcher = self.compile(rules)
+        self.assertEqual(matcher.first_match(make_message("x"), 5)[0], 0)
+        self.assertEqual(matcher.first_match(make_message("x"), 7)[0], 1)
+        self.assertIsNone(matcher.first_match(make_message("x"), 6))
+
+    def test_regex_with_groups_and_invalid_patterns(self):
+        rules = [
+            {"mode": "regex", "trigger": ["(unclosed"]},
+            {"mode": "regex", "trigger": [r"(ab)\1"]},
+            {"mode": "regex", "trigger": ["(?i)HELLO"]},
+        ]
+        matcher = self.compile(rules)
+        self.assertEqual(matcher.first_match(make_message("xxabab"), 1)[0], 1)
+        self.assertEqual(matcher.first_match(make_message("hello"), 1)[0], 2)
+        self.assertIsNone(matcher.first_match(make_message("(unclosed"), 1))
+
+    def test_matches_linear_loop_on_random_rules(self):
+        rng = random.Random(1234)
+        alphabet = "abcd早安!"
+        modes = ["contains", "equals", "starts_with", "ends_with", "regex", "unknown"]
+
+        def word():
+            return "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 3)))
+
+        for _ in range(30):
+            rules = []
+            for _ in range(rng.randint(1, 40)):
+                mode = rng.choice(modes)
+                triggers = [word() for _ in range(rng.randint(0, 3))]
+                if mode == "regex":
+                    triggers = [rng.choice(["a+b", "^c", "d$", "(a|b)c", "[", "早.安"]) for _ in triggers]
+                if rng.random() < 0.1:
+                    triggers.append(rng.choice(["type:join", "type:boost", "type:nope"]))
+                rule = {"mode": mode, "trigger": triggers}
+                if rng.random() < 0.3:
+                    rule["channel_mode"] = rng.choice(["whitelist", "blacklist"])
+                    rule["channels"] = [rng.randint(1, 3)]
+                rules.append(rule)
+            matcher = self.compile(rules)
+            for _ in range(50):
+                message = make_message(
+                    "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 8))),
+                    rng.choice([discord.MessageType.default, discord.MessageType.new_member]),
+                )
+                channel_id = rng.randint(1, 3)
+                expected = linear_first_match(self.cog, rules, message, channel_id)
+                actual = matcher.first_match(message, channel_id)
+                self.assertEqual(actual[0] if actual else None, expected, (rules, message))
+
+
+if __name__ == "__main__":
+    unittest.main()
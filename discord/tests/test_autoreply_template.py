@@ -0,0 +1,147 @@
+import asyncio
+import sys
+import unittest
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+import AutoReply
+from autoreply_template import CompiledTemplate, TemplateCache, TemplateMath
+
+
+def make_message(content="hello brave new world"):
+    guild = SimpleNamespace(
+        name="Guild", id=10, icon=None, owner=None, member_count=3, roles=[1, 2],
+        banner=None, premium_subscription_count=None, emojis=[], stickers=[],
+    )
+    author = SimpleNamespace(
+        mention="<@1>", name="alice", id=1, display_avatar=None, banner=None,
+        created_at=datetime(2024, 1, 2, 3, 4, 5), top_role=SimpleNamespace(name="member"),
+    )
+    return SimpleNamespace(content=content, guild=guild, author=author, channel=SimpleNamespace(name="general"))
+
+
+class TemplateCompileTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.cog = AutoReply.AutoReply(None)
+
+    def assertSyntaxError(self, template, message):
+        with self.assertRaises(AutoReply.TemplateSyntaxError) as ctx:
+            self.cog._validate_template_syntax(template)
+        self.assertEqual(str(ctx.exception), message)
+
+    def test_validation_errors(self):
+        self.assertSyntaxError("a } b", "Unexpected closing brace")
+        self.assertSyntaxError("{user", "Unclosed brace")
+        self.assertSyntaxError("{if:{user}:yes}", "Invalid if condition")
+        self.assertSyntaxError("{if:1==1}", "Invalid if syntax")
+        self.assertSyntaxError("{if:1==1||:a:b}", "Invalid if condition")
+        self.assertSyntaxError("{math:(1+)}", "Invalid math syntax")
+        self.assertSyntaxError("{math:(5/0)}", "Division by zero")
+        self.assertSyntaxError("{contentsplit:x}", "Invalid contentsplit syntax")
+        self.assertSyntaxError("{newmsg:9}", "newmsg delay must be between 1 and 3")
+        self.assertSyntaxError("{EmbedTitle:}", "Empty EmbedTitle payload")
+        self.assertSyntaxError("{embedfield:name}", "Invalid embed field syntax")
+        self.assertSyntaxError("{randint:a-b}", "Invalid randint syntax")
+        self.assertSyntaxError("{mention:maybe}", "Invalid mention syntax")
+        self.assertSyntaxError("{react: }", "Empty react payload")
+
+    def test_unknown_tokens_are_not_validated(self):
+        self.cog._validate_template_syntax("{foo:{randint:x}} {}")
+
+    def test_compiled_templates_and_errors_are_cached(self):
+        template = "hi {user} {math:(1+2*3)}"
+        compiled = self.cog._compile_template(template)
+        self.assertIs(self.cog._compile_template(template), compiled)
+        self.assertEqual(str(compiled), template)
+        math_node = compiled.nodes[-1]
+        self.assertIsInstance(math_node, TemplateMath)
+        self.assertEqual(math_node.result, "7")
+
+        for _ in range(2):
+            with self.assertRaises(AutoReply.TemplateSyntaxError):
+                self.cog._compile_template("{math:(1+)}")
+
+    def test_cache_is_bounded(self):
+        cache = TemplateCache(max_size=2)
+        for key in ("a", "b", "c"):
+            cache.put(key, CompiledTemplate([], key))
+        self.assertIsNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("c"))
+        self.assertEqual(len(cache), 2)
+
+
+class TemplateRenderTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.cog = AutoReply.AutoReply(None)
+
+    def render(self, template, content="hello brave new world"):
+        return asyncio.run(self.cog._process_response_v2(template, make_message(content)))
+
+    def test_placeholders_and_escapes(self):
+        text, sticker, embed, _, _ = self.render("  {user} in {guild}/{channel}\\n{author}{null}  ")
+        self.assertEqual(text, "<@1> in Guild/general\nalice")
+        self.assertIsNone(sticker)
+        self.assertIsNone(embed)
+
+    def test_contentsplit(self):
+        text = self.render("{contentsplit:1}|{contentsplit:1-2}|{contentsplit(-1)}|{contentsplit:9}")[0]
+        self.assertEqual(text, "brave|brave new|world|")
+
+    def test_if_conditions(self):
+        template = "{if:{contentsplit:0}==hello&&{math:(2*3)}>=6:yes {user}:else:no}"
+        self.assertEqual(self.render(template)[0], "yes <@1>")
+        self.assertEqual(self.render(template, content="bye")[0], "no")
+        self.assertEqual(self.render("{if:a==b||1==1:{if:2==2:nested:x}:z}")[0], "nested")
+
+    def test_math_with_nested_tokens(self):
+        self.assertEqual(self.render("{math:({contentsplit:0}+1)}", content="41 x")[0], "42")
+        self.assertEqual(self.render("{math:({contentsplit:1}+1)}", content="41 x")[0], "")
+
+    def test_substituted_content_is_not_reparsed(self):
+        self.assertEqual(self.render("{content}", content="{user}")[0], "{user}")
+
+    def test_unknown_and_case_variant_tokens_render_literally(self):
+        self.assertEqual(self.render("{foo {user}} {RANDINT:1-1}")[0], "{foo <@1>} {RANDINT:1-1}")
+
+    def test_effects_and_embed(self):
+        text, _, embed, allowed_mentions, _ = self.render(
+            "{mention:true}{embedtitle: Title {author} }{embedfield:Name:{contentsplit:0}}{embedcolor:#ff0000}  body  "
+        )
+        self.assertEqual(text, "  body")
+        self.assertTrue(allowed_mentions.everyone)
+        self.assertEqual(embed.title, "Title alice")
+        self.assertEqual(embed.fields[0].name, "Name")
+        self.assertEqual(embed.fields[0].value, "hello")
+        self.assertEqual(embed.color.value, 0xFF0000)
+
+    def test_delays_split_into_stages(self):
+        text, _, _, _, delayed = self.render("first{edit:1}second{newmsg:2}third{edit:3}fourth")
+        self.assertEqual(text, "first")
+        self.assertEqual([str(action["template"]) for action in delayed["initial_edits"]], ["second"])
+        followup = delayed["followups"][0]
+        self.assertEqual(followup["send_delay"], 2)
+        self.assertEqual(str(followup["template"]), "third")
+        self.assertEqual(followup["edits"][0]["delay"], 3)
+
+        rendered = asyncio.run(self.cog._render_response_segment(followup["edits"][0]["template"], make_message()))
+        self.assertEqual(rendered[0], "fourth")
+
+    def test_delays_inside_if_branches(self):
+        _, _, _, _, delayed = self.render("{if:1==1:a{newmsg:1}b:c}")
+        self.assertEqual(str(delayed["followups"][0]["template"]), "b")
+
+    def test_delay_limits(self):
+        result = self.render("a{newmsg:1}b{newmsg:1}c{newmsg:1}d")
+        self.assertEqual(result[0], "")
+        self.assertEqual(result[4], {"initial_edits": [], "followups": []})
+
+
+if __name__ == "__main__":
+    unittest.main()
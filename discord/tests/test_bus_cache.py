@@ -0,0 +1,108 @@
+import asyncio
+import sys
+import threading
+import unittest
+from pathlib import Path
+
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+from bus_cache import RouteSnapshotCache
+
+
+def make_info(sec):
+    return {
+        1: {"name": "去程", "stops": [{"stop_id": 10, "sequence": 1, "sec": sec}, {"stop_id": 11, "sequence": 2, "sec": sec}]},
+        2: {"name": "返程", "stops": [{"stop_id": 11, "sequence": 1, "sec": sec}, {"stop_id": 12, "sequence": 2, "sec": sec}]},
+    }
+
+
+class FakeLoader:
+    def __init__(self, delay=0.0):
+        self.calls = 0
+        self.delay = delay
+        self.fail = False
+        self._lock = threading.Lock()
+
+    def __call__(self, route_key):
+        with self._lock:
+            self.calls += 1
+            calls = self.calls
+        if self.delay:
+            threading.Event().wait(self.delay)
+        if self.fail:
+            raise RuntimeError("api down")
+        return make_info(calls), {"route_key": route_key, "route_name": "307"}
+
+
+class RouteSnapshotCacheTests(unittest.IsolatedAsyncioTestCase):
+    async def test_stop_index(self):
+        cache = RouteSnapshotCache(FakeLoader())
+        snapshot = await cache.get(307)
+        self.assertEqual(snapshot.locate(11), (1, 1))  # 兩條路徑都有時取第一條
+        self.assertEqual(snapshot.locate(12), (2, 1))
+        self.assertIsNone(snapshot.locate(99))
+        self.assertEqual(snapshot.route["route_name"], "307")
+
+    async def test_concurrent_misses_share_one_fetch(self):
+        loader = FakeLoader(delay=0.02)
+        cache = RouteSnapshotCache(loader)
+        snapshots = await asyncio.gather(*(cache.get(307) for _ in range(5)))
+        self.assertEqual(loader.calls, 1)
+        self.assertTrue(all(snapshot is snapshots[0] for snapshot in snapshots))
+        await cache.get(307)
+        self.assertEqual((cache.hits, cache.misses), (1, 5))
+
+    async def test_stale_snapshot_is_served_while_refreshing(self):
+        loader = FakeLoader()
+        cache = RouteSnapshotCache(loader, ttl=10, stale_ttl=30)
+        first = await cache.get(307)
+        first.fetched_at -= 15
+
+        stale = await cache.get(307)
+        self.assertIs(stale, first)
+        self.assertEqual(cache.stale_hits, 1)
+        await cache._loading[307]
+        fresh = await cache.get(307)
+        self.assertIsNot(fresh, first)
+        self.assertEqual(fresh.info[1]["stops"][0]["sec"], 2)
+        self.assertEqual(loader.calls, 2)
+
+    async def test_expired_snapshot_is_fetched_in_foreground(self):
+        loader = FakeLoader()
+        cache = RouteSnapshotCache(loader, ttl=10, stale_ttl=30)
+        first = await cache.get(307)
+        first.fetched_at -= 60
+        self.assertIsNot(await cache.get(307), first)
+        self.assertEqual(cache.misses, 2)
+
+    async def test_failed_refresh_keeps_stale_snapshot(self):
+        loader = FakeLoader()
+        errors = []
+        cache = RouteSnapshotCache(loader, ttl=10, stale_ttl=30, on_error=lambda key, error: errors.append(key))
+        first = await cache.get(307)
+        first.fetched_at -= 15
+        loader.fail = True
+        self.assertIs(await cache.get(307), first)
+        await asyncio.sleep(0.05)
+        self.assertEqual(errors, [307])
+        self.assertIs(await cache.get(307), first)
+        await asyncio.sleep(0.05)
+
+    async def test_snapshot_is_a_copy(self):
+        info = make_info(5)
+        cache = RouteSnapshotCache(lambda route_key: (info, None))
+        snapshot = await cache.get(307)
+        info[1]["stops"][0]["sec"] = 0
+        self.assertEqual(snapshot.info[1]["stops"][0]["sec"], 5)
+
+    async def test_least_recent_route_is_dropped(self):
+        cache = RouteSnapshotCache(FakeLoader(), max_routes=2)
+        for route_key in (1, 2, 1, 3):
+            await cache.get(route_key)
+        self.assertEqual(list(cache._snapshots), [1, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
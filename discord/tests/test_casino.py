@@ -35,7 +35,7 @@ class FixedRng:
 
 class QuietCasinoService(CasinoService):
     @staticmethod
-    def _log_events(events):
+    def _log_events(conn, events):
         return None
 
 
@@ -110,6 +110,12 @@ class CasinoServiceTests(unittest.TestCase):
                     data_value TEXT NOT NULL,
                     UNIQUE(user_id, guild_id, data_key)
                 );
+                CREATE TABLE user_balances (
+                    user_id INTEGER NOT NULL,
+                    guild_id INTEGER NOT NULL,
+                    balance REAL NOT NULL,
+                    PRIMARY KEY (guild_id, user_id)
+                );
                 CREATE TABLE server_configs (
                     guild_id INTEGER NOT NULL,
                     config_key TEXT NOT NULL,
@@ -128,15 +134,15 @@ class CasinoServiceTests(unittest.TestCase):
     def set_balance(self, user_id, amount):
         with closing(sqlite3.connect(self.db_path)) as conn:
             conn.execute(
-                "INSERT OR REPLACE INTO user_data VALUES (?, 0, 'economy_balance', ?)",
-                (user_id, str(amount)),
+                "INSERT OR REPLACE INTO user_balances (user_id, guild_id, balance) VALUES (?, 0, ?)",
+                (user_id, amount),
             )
             conn.commit()
 
     def balance(self, user_id=1):
         with closing(sqlite3.connect(self.db_path)) as conn:
             row = conn.execute(
-                "SELECT data_value FROM user_data WHERE user_id = ? AND guild_id = 0 AND data_key = 'economy_balance'",
+                "SELECT balance FROM user_balances WHERE user_id = ? AND guild_id = 0",
                 (user_id,),
             ).fetchone()
             return float(row[0])
@@ -148,6 +154,30 @@ class CasinoServiceTests(unittest.TestCase):
         self.assertEqual(first, second)
         self.assertEqual(self.balance(), 950)
 
+    def test_ledger_rows_commit_with_the_bet(self):
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            conn.execute(
+                """
+                CREATE TABLE economy_transactions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, guild_id INTEGER NOT NULL, user_id INTEGER NOT NULL,
+                    created_at REAL NOT NULL, tx_type TEXT NOT NULL, amount REAL NOT NULL, currency TEXT NOT NULL,
+                    detail TEXT NOT NULL DEFAULT '', balance_after REAL, entries INTEGER NOT NULL DEFAULT 1
+                )
+                """
+            )
+            conn.commit()
+        service = CasinoService(rng=FixedRng(), db_path=self.db_path)
+        service.play(1, {"request_id": "ledger", "game": "dice", "bet": 50, "guess": 2})
+        with self.assertRaises(CasinoError):
+            service.play(1, {"request_id": "too-much", "game": "dice", "bet": 5000, "guess": 2})
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            rows = conn.execute(
+                "SELECT user_id, tx_type, amount, balance_after FROM economy_transactions ORDER BY id"
+            ).fetchall()
+        self.assertEqual(rows[0][:3], (1, "Explore dice 下注", -50.0))
+        self.assertEqual(rows[-1][3], self.balance())
+        self.assertTrue(all(row[1].startswith("Explore dice") for row in rows))
+
     def test_parallel_bets_do_not_lose_updates(self):
         self.set_balance(1, 500)
 
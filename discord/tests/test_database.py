@@ -0,0 +1,607 @@
+import copy
+import json
+import sqlite3
+import sys
+import tempfile
+import threading
+import unittest
+from contextlib import closing
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest.mock import patch
+
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+from database import DB_FLUSH_RETRIES, Database, FrozenDict, FrozenList
+
+
+class DatabaseEngineTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = str(Path(self.tmp.name) / "data.db")
+        # A long flush interval keeps writes queued so the overlay is exercised.
+        self.db = Database(self.db_path, flush_interval=60)
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def _raw_count(self, table):
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def _committed_user_data(self, user_id, guild_id, key):
+        reopened = Database(self.db_path, write_behind=False)
+        try:
+            return reopened.get_user_data(user_id, guild_id, key)
+        finally:
+            reopened.close()
+
+    def test_uses_wal_journal(self):
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+
+    def test_reads_see_queued_writes_before_commit(self):
+        self.db.set_user_data(1, 2, "items", {"apple": 3})
+        self.db.set_server_config(2, "enabled", True)
+        self.db.set_global_config("counter", 5)
+
+        self.assertEqual(self._raw_count("user_data"), 0)
+        self.assertEqual(self.db.get_user_data(1, 2, "items"), {"apple": 3})
+        self.assertIs(self.db.get_server_config(2, "enabled"), True)
+        self.assertEqual(self.db.get_global_config("counter"), 5)
+
+    def test_flush_group_commits_and_keeps_last_write(self):
+        for value in range(10):
+            self.db.set_user_data(1, None, "score", value)
+        self.db.flush()
+
+        self.assertEqual(self._raw_count("user_data"), 1)
+        self.assertEqual(self.db.get_user_data(1, 0, "score"), 9)
+
+    def test_bulk_reads_and_raw_connections_see_queued_writes(self):
+        self.db.set_user_data(1, 5, "economy_balance", 10)
+        self.db.set_user_data(2, 5, "economy_balance", 20)
+        self.assertEqual(
+            self.db.get_all_user_data(5, "economy_balance"),
+            {1: {"economy_balance": 10}, 2: {"economy_balance": 20}},
+        )
+
+        self.db.set_server_config(5, "dsize_max", 40)
+        with closing(self.db.get_connection()) as conn:
+            row = conn.execute(
+                "SELECT config_value FROM server_configs WHERE guild_id = 5 AND config_key = 'dsize_max'"
+            ).fetchone()
+        self.assertEqual(row[0], "40")
+
+    def test_value_decoding_matches_legacy_storage(self):
+        self.db.set_server_config(1, "flag", False)
+        self.db.set_server_config(1, "nothing", None)
+        self.db.set_server_config(1, "name", "hello")
+        self.assertIs(self.db.get_server_config(1, "flag"), False)
+        self.assertIsNone(self.db.get_server_config(1, "nothing"))
+        self.assertEqual(self.db.get_server_config(1, "name"), "hello")
+        self.assertEqual(self.db.get_server_config(1, "dsize_max"), 30)
+
+        self.db.flush()
+        self.assertIs(self.db.get_server_config(1, "flag"), False)
+        self.assertIsNone(self.db.get_server_config(1, "nothing"))
+        self.assertEqual(self.db.get_server_config(1, "name"), "hello")
+
+    def test_close_commits_pending_writes(self):
+        self.db.set_user_data(7, 0, "key", [1, 2])
+        self.db.close()
+
+        reopened = Database(self.db_path, write_behind=False)
+        try:
+            self.assertEqual(reopened.get_user_data(7, 0, "key"), [1, 2])
+        finally:
+            reopened.close()
+
+    def test_durable_write_is_committed_before_returning(self):
+        self.assertTrue(self.db.set_user_data(1, 2, "economy_balance", 50.0, durable=True))
+        self.assertEqual(self._raw_count("user_balances"), 1)
+
+        with patch.object(Database, "_apply_writes", side_effect=sqlite3.OperationalError("disk I/O error")), \
+                patch("database._log_error"):
+            self.assertFalse(self.db.set_user_data(1, 2, "economy_balance", 60.0, durable=True))
+        # still queued, so the next commit stores it
+        self.assertEqual(self.db.get_user_data(1, 2, "economy_balance"), 60.0)
+        self.db.flush()
+        self.assertEqual(self._raw_count("user_balances"), 1)
+        self.assertEqual(self._committed_user_data(1, 2, "economy_balance"), 60.0)
+
+    def test_poisoned_write_is_dropped_after_retries(self):
+        self.db.set_server_config(1, "good", "yes")
+        self.db.set_user_data(3, 1, "note", "kept")
+        self.db._write(("server_configs", 1, "bad"), (1, "bad", object()))
+        with patch("database._log_error") as log_error:
+            for _ in range(DB_FLUSH_RETRIES):
+                with self.assertRaises(sqlite3.Error):
+                    self.db.flush()
+        self.assertEqual(log_error.call_count, 1)
+        self.assertIn("bad", log_error.call_args[0][0])
+        self.db.flush()
+        self.assertEqual(self._raw_count("server_configs"), 1)
+        self.assertEqual(self.db.get_server_config(1, "good"), "yes")
+        self.assertIsNone(self.db.get_server_config(1, "bad"))
+        self.assertEqual(self._committed_user_data(3, 1, "note"), "kept")
+
+    def test_failing_conversation_log_does_not_block_the_main_queue(self):
+        self.db.set_user_data(3, 1, "note", "kept")
+        self.db.conversations.append(3, 1, "chat", "user", "hi")
+        with patch.object(self.db.conversations, "flush", side_effect=sqlite3.OperationalError("locked")), \
+                patch("database._log_error") as log_error:
+            self.db.flush()
+        self.assertEqual(self.db.conversations._ops[0][0], "append")
+        self.assertEqual(log_error.call_count, 1)
+        self.assertEqual(self.db._failed_conversation_flushes, 1)
+        self.assertEqual(self._committed_user_data(3, 1, "note"), "kept")
+        self.db.flush()
+        self.assertEqual(self.db._failed_conversation_flushes, 0)
+        self.assertEqual([message["content"] for message in self.db.conversations.tail(3, 1, "chat")], ["hi"])
+
+    def test_concurrent_writers_from_threads(self):
+        fast = Database(self.db_path, flush_interval=0.001)
+        try:
+            def worker(user_id):
+                for value in range(50):
+                    fast.set_user_data(user_id, 1, "n", value)
+
+            threads = [threading.Thread(target=worker, args=(user_id,)) for user_id in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            fast.flush()
+            self.assertEqual(
+                {user_id: values["n"] for user_id, values in fast.get_all_user_data(1, "n").items()},
+                {user_id: 49 for user_id in range(8)},
+            )
+        finally:
+            fast.close()
+
+
+class ServerConfigCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = str(Path(self.tmp.name) / "data.db")
+        self.db = Database(self.db_path, flush_interval=60)
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def test_warm_cache_serves_reads_without_queries(self):
+        self.db.set_server_config(1, "autoreplies", [{"trigger": ["hi"], "response": ["hello"]}])
+        self.db.get_server_config_snapshot(1)
+        self.db.pool.close()  # any further query would need a new pooled connection
+
+        with patch.object(self.db.pool, "_connect", side_effect=AssertionError("queried")):
+            snapshot = self.db.get_server_config_snapshot(1)
+            self.assertEqual(snapshot.get("autoreplies")[0]["response"], ["hello"])
+            self.assertEqual(self.db.get_server_config(1, "autoreplies"), [{"trigger": ["hi"], "response": ["hello"]}])
+            self.assertEqual(snapshot.get("dsize_max"), 30)
+
+    def test_snapshots_are_read_only_and_typed_like_json(self):
+        self.db.set_server_config(1, "automod", {"anti_spam": {"enabled": True, "channels": [1]}})
+        settings = self.db.get_server_config_snapshot(1).get("automod")
+
+        self.assertIsInstance(settings, dict)
+        self.assertIsInstance(settings["anti_spam"]["channels"], list)
+        with self.assertRaises(TypeError):
+            settings["anti_spam"]["enabled"] = False
+        with self.assertRaises(TypeError):
+            settings["anti_spam"]["channels"].append(2)
+
+        thawed = copy.deepcopy(settings)
+        thawed["anti_spam"]["channels"].append(2)
+        self.assertNotIsInstance(thawed, (FrozenDict, FrozenList))
+
+    def test_get_server_config_still_returns_mutable_copies(self):
+        self.db.set_server_config(1, "autoreplies", [])
+        autoreplies = self.db.get_server_config(1, "autoreplies")
+        autoreplies.append({"trigger": ["x"]})
+        self.assertEqual(self.db.get_server_config(1, "autoreplies"), [])
+
+    def test_writes_update_cached_snapshot(self):
+        before = self.db.get_server_config_snapshot(1)
+        self.db.set_server_config(1, "log_channel_id", 123)
+
+        self.assertIsNone(before.get("log_channel_id"))
+        self.assertEqual(self.db.get_server_config_snapshot(1).get("log_channel_id"), 123)
+        self.assertEqual(self.db.get_all_server_config(1)["log_channel_id"], 123)
+
+    def test_lru_evicts_least_recently_used_guild(self):
+        self.db.config_cache.max_guilds = 2
+        for guild_id in (1, 2, 1, 3):
+            self.db.get_server_config_snapshot(guild_id)
+        self.assertEqual(list(self.db.config_cache._snapshots), [1, 3])
+
+    def test_invalidate_picks_up_raw_sql_writes(self):
+        self.db.get_server_config_snapshot(1)
+        with closing(self.db.get_connection()) as conn:
+            conn.execute("INSERT INTO server_configs VALUES (1, 'raw_key', '5')")
+            conn.commit()
+        self.assertIsNone(self.db.get_server_config(1, "raw_key"))
+
+        self.db.invalidate_server_config(1)
+        self.assertEqual(self.db.get_server_config(1, "raw_key"), 5)
+
+
+class CounterStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = str(Path(self.tmp.name) / "data.db")
+        self.db = Database(self.db_path, flush_interval=60)
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def _rows(self, granularity):
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            return conn.execute(
+                "SELECT namespace, name, bucket, count FROM counters WHERE granularity = ? ORDER BY name, bucket",
+                (granularity,)
+            ).fetchall()
+
+    def test_increments_stay_in_memory_until_flush(self):
+        self.db.counters.totals("command_usage_stats")
+        for _ in range(5):
+            self.db.counters.increment("command_usage_stats", "ping")
+        self.db.counters.increment("command_usage_stats", "help")
+
+        self.assertEqual(self._rows("total"), [])
+        self.assertEqual(self.db.counters.totals("command_usage_stats"), {"ping": 5, "help": 1})
+
+        self.db.counters.flush()
+        self.db.counters.increment("command_usage_stats", "ping", 2)
+        self.db.counters.flush()
+        self.assertEqual(
+            self._rows("total"),
+            [("command_usage_stats", "help", "", 1), ("command_usage_stats", "ping", "", 7)],
+        )
+
+    def test_hour_and_day_buckets(self):
+        # buckets older than the retention window are pruned on flush, so stay close to now
+        first = datetime.now().replace(hour=23, minute=30) - timedelta(days=2)
+        second = first + timedelta(hours=1)
+        first_day, second_day = first.strftime("%Y-%m-%d"), second.strftime("%Y-%m-%d")
+        self.db.counters.increment("command_error_stats", "ping", when=first)
+        self.db.counters.increment("command_error_stats", "ping", when=second)
+        self.db.counters.increment("command_error_stats", "help", when=second)
+
+        # pending deltas are merged into the series before and after the flush alike
+        for _ in range(2):
+            self.assertEqual(
+                self.db.counters.series("command_error_stats", "day", first),
+                {first_day: 1, second_day: 2},
+            )
+            self.assertEqual(
+                self.db.counters.series("command_error_stats", "hour", second, name="ping"),
+                {second_day + "T00": 1},
+            )
+            self.db.counters.flush()
+        with self.assertRaises(ValueError):
+            self.db.counters.series("command_error_stats", "week", first)
+
+    def test_seeds_totals_from_legacy_global_config(self):
+        self.db.set_global_config("app_command_usage_stats", {"stats command": 41, "broken": "x"})
+        self.db.flush()
+        self.db.counters.increment("app_command_usage_stats", "stats command")
+
+        self.assertEqual(self.db.counters.totals("app_command_usage_stats"), {"stats command": 42})
+        self.db.counters.flush()
+        self.assertEqual(self._rows("total"), [("app_command_usage_stats", "stats command", "", 42)])
+
+    def test_close_flushes_pending_counts(self):
+        self.db.counters.increment("command_usage_stats", "ping", 3)
+        self.db.close()
+
+        reopened = Database(self.db_path, flush_interval=60)
+        try:
+            self.assertEqual(reopened.counters.totals("command_usage_stats"), {"ping": 3})
+        finally:
+            reopened.close()
+
+    def test_failed_flush_keeps_deltas(self):
+        self.db.counters.increment("command_usage_stats", "ping")
+        with patch.object(self.db.pool, "connection", side_effect=sqlite3.OperationalError("locked")):
+            with self.assertRaises(sqlite3.OperationalError):
+                self.db.counters.flush()
+        self.db.counters.flush()
+        self.assertEqual(self._rows("total"), [("command_usage_stats", "ping", "", 1)])
+
+
+class TypedUserDataTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = str(Path(self.tmp.name) / "data.db")
+        self.db = Database(self.db_path, flush_interval=60)
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def _raw_count(self, table):
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def test_hot_keys_are_routed_to_typed_tables(self):
+        self.db.set_user_data(1, 5, "economy_balance", 12.5)
+        self.db.set_user_data(1, 5, "items", {"b": 2, "a": 1})
+        self.db.set_user_data(1, 5, "ai_conversation_5_1", [{"role": "user", "content": "hi"}])
+        self.db.set_user_data(1, 5, "economy_history", [])
+
+        for _ in range(2):  # once from the pending overlay, once from disk
+            self.assertEqual(self.db.get_user_data(1, 5, "economy_balance"), 12.5)
+            self.assertEqual(list(self.db.get_user_data(1, 5, "items").items()), [("b", 2), ("a", 1)])
+            self.assertEqual(self.db.get_user_data(1, 5, "ai_conversation_5_1")[0]["content"], "hi")
+            self.db.flush()
+
+        self.assertEqual(self._raw_count("user_data"), 1)
+        self.assertEqual(self._raw_count("user_balances"), 1)
+        self.assertEqual(self._raw_count("user_items"), 2)
+        self.assertEqual(self._raw_count("ai_conversation_messages"), 1)
+        self.assertEqual(self.db.get_user_data(2, 5, "items", {}), {})
+        self.assertEqual(self.db.get_user_data(2, 5, "economy_balance", 0.0), 0.0)
+
+    def test_items_rows_are_replaced_and_lists_counted(self):
+        self.db.set_user_data(1, 5, "items", {"a": 1, "b": 1})
+        self.db.flush()
+        self.db.set_user_data(1, 5, "items", ["c", "c", "a"])
+        self.db.flush()
+        self.assertEqual(self.db.get_user_data(1, 5, "items"), {"c": 2, "a": 1})
+
+    def test_get_all_user_data_includes_typed_tables(self):
+        self.db.set_user_data(1, 5, "economy_balance", 10)
+        self.db.set_user_data(2, 5, "items", {"a": 3})
+        self.db.set_user_data(2, 5, "last_dsize", "2026-01-01")
+
+        everything = self.db.get_all_user_data(5)
+        self.assertEqual(everything[1], {"economy_balance": 10})
+        self.assertEqual(everything[2], {"items": {"a": 3}, "last_dsize": "2026-01-01"})
+        self.assertEqual(self.db.get_all_user_data(5, "economy_balance", 10), {1: {"economy_balance": 10}})
+        self.assertEqual(self.db.get_all_user_data(5, "economy_balance", 11), {})
+        self.assertEqual(self.db.get_database_count()["user_data"], 3)
+
+    def test_leaderboard_queries(self):
+        for user_id, server, global_balance in ((1, 100, 5), (2, 50, 500), (3, 0, 0), (4, -1, 1)):
+            self.db.set_user_data(user_id, 5, "economy_balance", server)
+            self.db.set_user_data(user_id, 0, "economy_balance", global_balance)
+
+        self.assertEqual(self.db.get_top_balances(5), [(1, 100), (2, 50)])
+        self.assertEqual(self.db.get_top_balances(5, limit=1, offset=1), [(2, 50)])
+        self.assertEqual(self.db.get_top_balances(0, 2), [(2, 500), (1, 5)])
+        self.assertEqual(self.db.get_top_combined_balances(5, 0.5, 3), [(2, 525), (1, 55), (4, 0.5)])
+        self.assertEqual(self.db.get_balance_summary(5), (4, 149))
+
+    def test_user_data_by_marker_reads_every_key_in_one_call(self):
+        self.db.set_user_data(1, 5, "last_dsize", "2026-01-01")
+        self.db.set_user_data(1, 5, "last_dsize_size", 12)
+        self.db.set_user_data(1, 5, "dsize_fake_ruler_used_date", "2026-01-01")
+        self.db.set_user_data(2, 5, "last_dsize", "2026-01-02")
+        self.db.set_user_data(2, 5, "last_dsize_size", -1)
+        self.db.set_user_data(3, 5, "last_dsize", "2025-12-31")
+        self.db.set_user_data(3, 5, "last_dsize_size", 30)
+        self.db.set_user_data(4, 6, "last_dsize", "2026-01-01")
+
+        rows = self.db.get_user_data_by_marker(
+            5, "last_dsize", ("2026-01-01", "2026-01-02"), ("last_dsize_size", "dsize_fake_ruler_used_date")
+        )
+        self.assertEqual(rows, {
+            1: {"last_dsize": "2026-01-01", "last_dsize_size": 12, "dsize_fake_ruler_used_date": "2026-01-01"},
+            2: {"last_dsize": "2026-01-02", "last_dsize_size": -1},
+        })
+        self.assertEqual(self.db.get_user_data_by_marker(5, "last_dsize", (), ("last_dsize_size",)), {})
+        with self.assertRaises(ValueError):
+            self.db.get_user_data_by_marker(5, "last_dsize", ("2026-01-01",), ("economy_balance",))
+
+    def test_migrates_legacy_user_data_rows(self):
+        self.db.close()
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            conn.executemany(
+                "INSERT INTO user_data VALUES (?, ?, ?, ?)",
+                [
+                    (1, 5, "economy_balance", "42.5"),
+                    (1, 5, "items", '["x", "x"]'),
+                    (1, 0, "ai_conversation_dm_1", '[{"role": "user", "content": "hi", "timestamp": 1}]'),
+                    (1, 5, "aiXconversation", "1"),
+                ],
+            )
+            conn.execute("PRAGMA user_version = 0")
+            conn.commit()
+
+        self.db = Database(self.db_path, flush_interval=60)
+        self.assertEqual(self.db.get_user_data(1, 5, "economy_balance"), 42.5)
+        self.assertEqual(self.db.get_user_data(1, 5, "items"), {"x": 2})
+        self.assertEqual(
+            self.db.get_user_data(1, 0, "ai_conversation_dm_1"),
+            [{"role": "user", "content": "hi", "timestamp": 1}],
+        )
+        self.assertEqual(self.db.get_user_data(1, 5, "aiXconversation"), 1)
+        self.assertEqual(self._raw_count("user_data"), 1)
+
+    def test_write_through_mode_uses_typed_tables(self):
+        direct = Database(str(Path(self.tmp.name) / "direct.db"), write_behind=False)
+        try:
+            direct.set_user_data(1, 5, "items", {"a": 1})
+            direct.set_user_data(1, 5, "economy_balance", 3)
+            self.assertEqual(direct.get_user_data(1, 5, "items"), {"a": 1})
+            self.assertEqual(direct.get_top_balances(5), [(1, 3)])
+        finally:
+            direct.close()
+
+
+class ConversationLogTests(unittest.TestCase):
+    KEY = "ai_conversation_5_1"
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = str(Path(self.tmp.name) / "data.db")
+        self.db = Database(self.db_path, flush_interval=60)
+        self.log = self.db.conversations
+        self.log.flush_interval = 60
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def _rows(self):
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            return conn.execute("SELECT role, content FROM ai_conversation_messages ORDER BY id").fetchall()
+
+    def test_appends_are_single_rows(self):
+        self.log.append(1, 5, self.KEY, "user", "hi", 1.0, 1)
+        self.log.append(1, 5, self.KEY, "assistant", "hello", 2.0, 2)
+        self.assertEqual(self._rows(), [])
+        self.assertEqual([m["content"] for m in self.log.tail(1, 5, self.KEY)], ["hi", "hello"])
+
+        self.log.flush()
+        self.assertEqual(self._rows(), [("user", "hi"), ("assistant", "hello")])
+        self.assertEqual(self.log.tail(1, 5, self.KEY)[1], {"role": "assistant", "content": "hello", "timestamp": 2.0, "tokens": 2})
+
+    def test_cold_tail_merges_queued_ops(self):
+        self.log.append(1, 5, self.KEY, "user", "old", 1.0)
+        self.log.flush()
+        self.log._tails.clear()
+        self.log.clear(1, 5, self.KEY)
+        self.log._tails.clear()
+        self.log.append(1, 5, self.KEY, "user", "new", 2.0)
+
+        self.assertEqual([m["content"] for m in self.log.tail(1, 5, self.KEY)], ["new"])
+        self.log.flush()
+        self.assertEqual(self._rows(), [("user", "new")])
+
+    def test_tail_and_prune_keep_newest_messages(self):
+        self.log.max_messages = 3
+        for index in range(5):
+            self.log.append(1, 5, self.KEY, "user", str(index), float(index))
+        self.log.append(2, 5, "ai_conversation_5_2", "user", "other", 0.0)
+        self.log.flush()
+        self.log._tails.clear()
+
+        self.assertEqual([m["content"] for m in self.log.tail(1, 5, self.KEY)], ["2", "3", "4"])
+        self.assertEqual(self.log.prune(), 2)
+        self.assertEqual(self._rows(), [("user", "2"), ("user", "3"), ("user", "4"), ("user", "other")])
+
+    def test_user_data_api_still_reads_and_writes_histories(self):
+        history = [{"role": "user", "content": "a", "timestamp": 1}, "junk", {"role": "assistant", "content": "b", "timestamp": 2}]
+        self.db.set_user_data(1, 5, self.KEY, history)
+        expected = [history[0], history[2]]
+        self.assertEqual(self.db.get_user_data(1, 5, self.KEY), expected)
+        self.assertEqual(self.db.get_all_user_data(5, self.KEY), {1: {self.KEY: expected}})
+
+        self.db.set_user_data(1, 5, self.KEY, [])
+        self.assertEqual(self.db.get_user_data(1, 5, self.KEY, []), [])
+        self.db.flush()
+        self.assertEqual(self._rows(), [])
+
+    def test_close_flushes_appends(self):
+        self.log.append(1, 5, self.KEY, "user", "bye", 1.0)
+        self.db.close()
+        reopened = Database(self.db_path, flush_interval=60)
+        try:
+            self.assertEqual(reopened.get_user_data(1, 5, self.KEY)[0]["content"], "bye")
+        finally:
+            reopened.close()
+
+    def test_migrates_v1_conversation_blobs(self):
+        self.db.close()
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            conn.execute(
+                "CREATE TABLE ai_conversations (user_id INTEGER, guild_id INTEGER, conversation_key TEXT, history TEXT)"
+            )
+            conn.execute(
+                "INSERT INTO ai_conversations VALUES (1, 5, ?, ?)",
+                (self.KEY, '[{"role": "user", "content": "hi", "timestamp": 3}]'),
+            )
+            conn.execute("PRAGMA user_version = 1")
+            conn.commit()
+
+        self.db = Database(self.db_path, flush_interval=60)
+        self.assertEqual(self.db.get_user_data(1, 5, self.KEY), [{"role": "user", "content": "hi", "timestamp": 3}])
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            self.assertIsNone(conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'ai_conversations'").fetchone())
+
+
+class EconomyLedgerTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = str(Path(self.tmp.name) / "data.db")
+        self.db = Database(self.db_path, flush_interval=60)
+        self.ledger = self.db.ledger
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def _count(self):
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            return conn.execute("SELECT COUNT(*) FROM economy_transactions").fetchone()[0]
+
+    def test_pages_are_newest_first(self):
+        for index in range(25):
+            self.ledger.append(5, 1, "每日簽到", index, "伺服幣", f"#{index}", index * 2, timestamp=1000.0 + index)
+        self.ledger.append(5, 2, "每日簽到", 1, "伺服幣", timestamp=2000.0)
+
+        self.assertEqual(self.ledger.count(5, 1), 25)
+        first = self.ledger.page(5, 1, 10)
+        self.assertEqual([entry["detail"] for entry in first[:2]], ["#24", "#23"])
+        self.assertEqual(first[0]["balance_after"], 48)
+        self.assertEqual(first[0]["time"], "1970-01-01T00:17:04+00:00")
+        self.assertEqual([entry["amount"] for entry in self.ledger.page(5, 1, 10, 20)], [4, 3, 2, 1, 0])
+        self.assertTrue(self.ledger.has(5, 1, "每日簽到", "#7"))
+        self.assertFalse(self.ledger.has(5, 1, "每小時簽到", "#7"))
+        self.assertEqual(self.ledger.guild_ids(1), [5])
+
+    def test_append_joins_the_callers_transaction(self):
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self.ledger.append(5, 1, "轉帳支出", -10, "伺服幣", connection=conn)
+            conn.rollback()
+        self.assertEqual(self._count(), 0)
+
+    def test_compact_folds_old_rows_per_user_and_currency(self):
+        day = 86400.0
+        now = 1000 * day
+        for index in range(4):
+            self.ledger.append(5, 1, "每日簽到", 100, "伺服幣", balance_after=100 * (index + 1), timestamp=index * day)
+        self.ledger.append(5, 1, "兌換收入", 7, "全域幣", timestamp=0.0)
+        self.ledger.append(5, 1, "每日簽到", 100, "伺服幣", balance_after=500, timestamp=now)
+
+        self.assertEqual(self.ledger.compact(now=now), 3)
+        entries = self.ledger.page(5, 1, 10)
+        self.assertEqual(len(entries), 3)
+        self.assertEqual(entries[0]["balance_after"], 500)
+        summary = entries[1]
+        self.assertEqual((summary["amount"], summary["entries"], summary["balance_after"]), (400, 4, 400))
+        # 已經彙總過的不會再動
+        self.assertEqual(self.ledger.compact(now=now), 0)
+
+    def test_migrates_v2_history_blobs(self):
+        self.db.close()
+        history = [
+            {"type": "每日簽到", "amount": 100, "currency": "伺服幣", "detail": "",
+             "time": "2024-01-01T00:00:00+00:00", "balance_after": 100},
+            "junk",
+            {"type": "轉帳支出", "amount": -30, "currency": "伺服幣", "detail": "→ a",
+             "time": "2024-01-02T00:00:00+00:00", "balance_after": 70},
+        ]
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            conn.execute("INSERT INTO user_data VALUES (1, 5, 'economy_history', ?)", (json.dumps(history),))
+            conn.execute("PRAGMA user_version = 2")
+            conn.commit()
+
+        self.db = Database(self.db_path, flush_interval=60)
+        entries = self.db.ledger.page(5, 1)
+        self.assertEqual([entry["type"] for entry in entries], ["轉帳支出", "每日簽到"])
+        self.assertEqual(entries[0]["time"], "2024-01-02T00:00:00+00:00")
+        self.assertIsNone(self.db.get_user_data(1, 5, "economy_history"))
+
+
+if __name__ == "__main__":
+    unittest.main()
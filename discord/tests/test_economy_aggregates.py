@@ -0,0 +1,221 @@
+import sqlite3
+import sys
+import tempfile
+import threading
+import unittest
+from contextlib import closing
+from pathlib import Path
+
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+from database import Database
+from economy_aggregates import (
+    ADMIN_INJECTED_KEY,
+    EXCHANGE_RATE_KEY,
+    SUPPLY_KEY,
+    TRANSACTION_COUNT_KEY,
+    EconomyAggregates,
+)
+
+
+class EconomyAggregatesTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = str(Path(self.tmp.name) / "data.db")
+        self.db = Database(self.db_path, flush_interval=60)
+        self.calls = []
+        # 每筆壓力讓匯率加 amount * weight，方便驗證加總
+        self.aggregates = EconomyAggregates(self.db, self._recompute, flush_interval=60)
+
+    def tearDown(self):
+        self.aggregates.close()
+        self.db.close()
+        self.tmp.cleanup()
+
+    def _recompute(self, guild_id, values, pressure):
+        self.calls.append((guild_id, dict(values), list(pressure)))
+        rate = values.get(EXCHANGE_RATE_KEY, 1.0)
+        return round(rate + sum(weight * amount for _, weight, amount in pressure), 6)
+
+    def _raw(self, guild_id, key):
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            row = conn.execute(
+                "SELECT config_value FROM server_configs WHERE guild_id = ? AND config_key = ?",
+                (guild_id, key),
+            ).fetchone()
+        return row[0] if row else None
+
+    def test_queued_deltas_read_back_and_flush_as_increments(self):
+        self.aggregates.add(1, SUPPLY_KEY, 100.255)
+        self.aggregates.add(1, SUPPLY_KEY, -0.25)
+        self.aggregates.add(1, TRANSACTION_COUNT_KEY, 1)
+        self.aggregates.add(1, TRANSACTION_COUNT_KEY, 1)
+        self.assertEqual(self.aggregates.get(1, SUPPLY_KEY, 0.0), 100.0)
+        self.assertIsNone(self._raw(1, SUPPLY_KEY))
+
+        self.assertEqual(self.aggregates.flush(), 1)
+        self.assertEqual(self._raw(1, TRANSACTION_COUNT_KEY), "2")
+        self.aggregates.add(1, SUPPLY_KEY, 50)
+        self.aggregates.add(1, TRANSACTION_COUNT_KEY, 3)
+        self.aggregates.flush()
+        self.assertEqual(self.db.get_server_config(1, SUPPLY_KEY), 150.0)
+        self.assertEqual(self.db.get_server_config(1, TRANSACTION_COUNT_KEY), 5)
+        self.assertEqual(self.aggregates.get(1, TRANSACTION_COUNT_KEY), 5)
+
+    def test_supply_never_goes_below_zero(self):
+        self.aggregates.add(1, SUPPLY_KEY, 10)
+        self.aggregates.flush()
+        self.aggregates.add(1, SUPPLY_KEY, -25)
+        self.assertEqual(self.aggregates.get(1, SUPPLY_KEY), 0)
+        self.aggregates.flush()
+        self.assertEqual(self.db.get_server_config(1, SUPPLY_KEY), 0.0)
+
+    def test_deltas_land_on_top_of_queued_config_writes(self):
+        self.db.set_server_config(1, SUPPLY_KEY, 1000.0)
+        self.aggregates.add(1, SUPPLY_KEY, 5)
+        self.assertEqual(self.aggregates.get(1, SUPPLY_KEY), 1005.0)
+        self.aggregates.flush()
+        self.assertEqual(self._raw(1, SUPPLY_KEY), "1005.0")
+
+    def test_concurrent_adds_are_not_lost(self):
+        def worker():
+            for _ in range(500):
+                self.aggregates.add(7, TRANSACTION_COUNT_KEY, 1)
+                self.aggregates.add(7, SUPPLY_KEY, 1)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for _ in range(5):
+            self.aggregates.flush()
+        for thread in threads:
+            thread.join()
+        self.aggregates.flush()
+        self.assertEqual(self.db.get_server_config(7, TRANSACTION_COUNT_KEY), 4000)
+        self.assertEqual(self.db.get_server_config(7, SUPPLY_KEY), 4000.0)
+
+    def test_rate_is_recomputed_once_per_guild_per_flush(self):
+        self.db.set_server_config(1, EXCHANGE_RATE_KEY, 2.0)
+        self.aggregates.add(1, ADMIN_INJECTED_KEY, 30)
+        for _ in range(3):
+            self.aggregates.press(1, "deflation", 0.01)
+        self.aggregates.press(1, "market_deflation", 0.001, 40)
+        self.aggregates.press(1, "market_deflation", 0.001, 60)
+        self.aggregates.press(2, "deflation", 0.5)
+        self.assertAlmostEqual(self.aggregates.projected_rate(1), 2.13)
+        self.assertEqual(self.db.get_server_config(1, EXCHANGE_RATE_KEY), 2.0)
+
+        self.calls.clear()
+        self.aggregates.flush()
+        self.assertEqual(sorted(call[0] for call in self.calls), [1, 2])
+        guild_call = next(call for call in self.calls if call[0] == 1)
+        self.assertEqual(guild_call[1][ADMIN_INJECTED_KEY], 30.0)
+        self.assertEqual(guild_call[2], [
+            ("deflation", 0.01, 1.0),
+            ("deflation", 0.01, 1.0),
+            ("deflation", 0.01, 1.0),
+            ("market_deflation", 0.001, 40),
+            ("market_deflation", 0.001, 60),
+        ])
+        self.assertAlmostEqual(self.db.get_server_config(1, EXCHANGE_RATE_KEY), 2.13)
+        self.assertEqual(self.db.get_server_config(2, EXCHANGE_RATE_KEY), 1.5)
+
+        self.calls.clear()
+        self.aggregates.add(1, SUPPLY_KEY, 1)
+        self.aggregates.flush()
+        self.assertEqual(self.calls, [])
+
+    def test_failed_flush_keeps_the_batch(self):
+        attempts = []
+
+        def recompute(guild_id, values, pressure):
+            attempts.append(values)
+            if len(attempts) == 1:
+                raise RuntimeError("boom")
+            return 3.0
+
+        self.aggregates.recompute = recompute
+        self.aggregates.add(1, TRANSACTION_COUNT_KEY, 2)
+        self.aggregates.press(1, "deflation", 0.01)
+        with self.assertRaises(RuntimeError):
+            self.aggregates.flush()
+        self.assertEqual(self.aggregates.get(1, TRANSACTION_COUNT_KEY), 2)
+        self.aggregates.flush()
+        self.assertEqual(self.db.get_server_config(1, TRANSACTION_COUNT_KEY), 2)
+        self.assertEqual(self.db.get_server_config(1, EXCHANGE_RATE_KEY), 3.0)
+        self.assertEqual(attempts[1][TRANSACTION_COUNT_KEY], 2)  # 第一次的增量已回滾，不會加兩次
+
+    def test_pressure_is_folded_per_entry_in_order(self):
+        applied = []
+
+        def recompute(guild_id, values, pressure):
+            rate = values.get(EXCHANGE_RATE_KEY, 1.0)
+            for kind, weight, amount in pressure:
+                applied.append((kind, amount))
+                # 非線性：兩次 100 要比一次 200 影響更大
+                rate *= 1 - min(amount ** 0.5 * weight, 0.6)
+            return round(rate, 6)
+
+        self.aggregates.recompute = recompute
+        self.aggregates.press(1, "inflation", 0.01, 100)
+        self.aggregates.press(1, "market_deflation", 0.001, 5)
+        self.aggregates.press(1, "inflation", 0.01, 100)
+        self.aggregates.press(2, "inflation", 0.01, 200)
+        self.aggregates.flush()
+        self.assertEqual(applied[:3], [("inflation", 100), ("market_deflation", 5), ("inflation", 100)])
+        self.assertLess(self.db.get_server_config(1, EXCHANGE_RATE_KEY), self.db.get_server_config(2, EXCHANGE_RATE_KEY))
+
+    def test_failed_flush_keeps_pressure_ahead_of_newer_entries(self):
+        def recompute(guild_id, values, pressure):
+            raise RuntimeError("boom")
+
+        self.aggregates.recompute = recompute
+        self.aggregates.press(1, "inflation", 0.01, 1)
+        with self.assertRaises(RuntimeError):
+            self.aggregates.flush()
+        self.aggregates.press(1, "inflation", 0.01, 2)
+        seen = []
+        self.aggregates.recompute = lambda guild_id, values, pressure: seen.extend(pressure) or 1.0
+        self.aggregates.flush()
+        self.assertEqual(seen, [("inflation", 0.01, 1), ("inflation", 0.01, 2)])
+
+    def test_discard_drops_queued_changes(self):
+        self.aggregates.add(1, SUPPLY_KEY, 10)
+        self.aggregates.press(1, "deflation", 0.01)
+        self.aggregates.discard(1)
+        self.assertEqual(self.aggregates.flush(), 0)
+        self.assertIsNone(self._raw(1, SUPPLY_KEY))
+
+    def test_discard_waits_for_the_batch_being_written(self):
+        entered = threading.Event()
+        release = threading.Event()
+
+        def recompute(guild_id, values, pressure):
+            entered.set()
+            release.wait(5)
+            return 1.0
+
+        self.aggregates.recompute = recompute
+        self.aggregates.add(1, SUPPLY_KEY, 10)
+        self.aggregates.press(1, "deflation", 0.01)
+        flusher = threading.Thread(target=self.aggregates.flush)
+        flusher.start()
+        self.assertTrue(entered.wait(5))
+        resetter = threading.Thread(
+            target=self.aggregates.discard, args=(1, lambda: self.db.set_server_config(1, SUPPLY_KEY, 0.0))
+        )
+        resetter.start()
+        resetter.join(0.2)
+        self.assertTrue(resetter.is_alive())  # 等正在寫入的那批完成才歸零
+        release.set()
+        flusher.join()
+        resetter.join()
+        self.db.flush()
+        self.assertEqual(self.aggregates.get(1, SUPPLY_KEY), 0.0)
+        self.assertEqual(self._raw(1, SUPPLY_KEY), "0.0")
+
+
+if __name__ == "__main__":
+    unittest.main()
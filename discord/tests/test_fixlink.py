@@ -1,4 +1,5 @@
 import asyncio
+import json
 import sys
 import unittest
 from pathlib import Path
@@ -239,6 +240,61 @@ class URLHelperTests(unittest.TestCase):
         self.assertTrue(all(len(chunk) <= FixLink.MAX_REPLY_CHUNK_LENGTH for chunk in chunks))
 
 
+class RouterTests(unittest.TestCase):
+    def test_builtin_hostname_lookup_covers_suffixes(self):
+        self.assertEqual(FixLink.builtin_platform_for_hostname("www.x.com"), "Twitter")
+        self.assertEqual(FixLink.builtin_platform_for_hostname("artist.newgrounds.com"), "Newgrounds")
+        self.assertEqual(FixLink.builtin_platform_for_hostname("a.b.tumblr.com"), "Tumblr")
+        self.assertIsNone(FixLink.builtin_platform_for_hostname("notnewgrounds.com"))
+        self.assertIsNone(FixLink.builtin_platform_for_hostname("example.com"))
+
+    def test_route_parses_each_kind(self):
+        platform = custom_platform()
+        router = FixLink.FixLinkRouter(FixLink.normalize_fixlink_config({"custom_platforms": [platform]}))
+        self.assertEqual(router.route(DIRECT_URL), ("threads", None))
+        kind, builtin = router.route("https://x.com/discord/status/1234567890")
+        self.assertEqual((kind, builtin[0]), ("builtin", "Twitter"))
+        self.assertEqual(router.route("https://social.example.com/post/1")[1]["id"], platform["id"])
+        self.assertIsNone(router.route("https://social.example.com/other/1"))
+        self.assertIsNone(router.route("https://x.com:8443/discord/status/1234567890"))
+        self.assertIsNone(router.route("ftp://x.com/discord/status/1234567890"))
+
+    def test_equal_prefixes_keep_the_first_platform(self):
+        first = custom_platform(path_prefixes=["/a/"])
+        second = dict(first, id="custom0987654321", name="Second", origins=["other.example.com", "social.example.com"])
+        matched = FixLink.find_custom_platform("https://social.example.com/a/1", [first, second])
+        self.assertEqual(matched["name"], "Example")
+
+    def test_router_is_rebuilt_when_config_changes(self):
+        from database import ServerConfigSnapshot
+
+        cog = FixLink.FixLink(FixLink.bot)
+        snapshots = {2: ServerConfigSnapshot(2, {FixLink.FIXLINK_CONFIG_KEY: '{"enabled": true}'})}
+
+        def set_config(guild_id, key, value):
+            snapshots[guild_id] = ServerConfigSnapshot(guild_id, {key: json.dumps(value)})
+            return True
+
+        with (
+            patch.object(FixLink, "get_server_config_snapshot", side_effect=lambda guild_id: snapshots[guild_id]),
+            patch.object(FixLink, "set_server_config", side_effect=set_config),
+            patch.object(FixLink, "normalize_fixlink_config", wraps=FixLink.normalize_fixlink_config) as normalize,
+        ):
+            router = cog.get_router(2)
+            self.assertIs(cog.get_router(2), router)
+            self.assertEqual(normalize.call_count, 1)
+
+            config = cog.get_config(2)
+            config["remove_tracker"] = True
+            self.assertFalse(router.config["remove_tracker"])  # 拿到的是副本
+            self.assertTrue(cog.save_config(2, config))
+            self.assertTrue(cog.get_router(2).config["remove_tracker"])
+
+            # 從其他地方（例如 GuildPanel）直接改設定也會重建
+            snapshots[2] = ServerConfigSnapshot(2, {FixLink.FIXLINK_CONFIG_KEY: '{"enabled": false}'})
+            self.assertFalse(cog.get_router(2).config["enabled"])
+
+
 class MatchTests(unittest.IsolatedAsyncioTestCase):
     async def asyncSetUp(self):
         self.cog = FixLink.FixLink(FixLink.bot)
@@ -548,6 +604,26 @@ def http_exception(status=403):
     return discord.HTTPException(response, {"message": "failed", "code": 0})
 
 
+class FakeDownloadSession:
+    def __init__(self, body):
+        self.body = body
+        self.requests = []
+
+    def get(self, url, timeout=None):
+        self.requests.append(url)
+        body = self.body
+
+        async def iter_chunked(size):
+            for start in range(0, len(body), size):
+                yield body[start:start + size]
+
+        response = SimpleNamespace(raise_for_status=lambda: None, content=SimpleNamespace(iter_chunked=iter_chunked))
+        context = MagicMock()
+        context.__aenter__ = AsyncMock(return_value=response)
+        context.__aexit__ = AsyncMock(return_value=False)
+        return context
+
+
 class NormalReplyPreviewTests(unittest.IsolatedAsyncioTestCase):
     async def asyncSetUp(self):
         self.cog = FixLink.FixLink(FixLink.bot)
@@ -759,7 +835,7 @@ class MessageRoutingTests(unittest.IsolatedAsyncioTestCase):
             }
         )
         with (
-            patch.object(self.cog, "get_config", return_value=config),
+            patch.object(self.cog, "get_router", return_value=FixLink.FixLinkRouter(config)),
             patch.object(self.cog, "match_message", new=AsyncMock(return_value=[match])),
             patch.object(self.cog, "replace_with_webhook", new=AsyncMock()) as replace,
             patch.object(self.cog, "send_normal_reply", new=AsyncMock()) as reply,
@@ -799,7 +875,7 @@ class MessageRoutingTests(unittest.IsolatedAsyncioTestCase):
             }
         )
         with (
-            patch.object(self.cog, "get_config", return_value=config),
+            patch.object(self.cog, "get_router", return_value=FixLink.FixLinkRouter(config)),
             patch.object(self.cog, "match_message", new=AsyncMock(return_value=matches)),
             patch.object(
                 self.cog,
@@ -936,6 +1012,42 @@ class WebhookTransactionTests(unittest.IsolatedAsyncioTestCase):
         self.assertFalse(replaced)
         self.assertEqual(events, ["send", "rollback"])
 
+    async def test_retried_send_reuses_downloaded_attachments(self):
+        attachment = SimpleNamespace(
+            filename="clip.mp4",
+            size=3000,
+            url="https://cdn.example.com/clip.mp4",
+            proxy_url="https://media.example.com/clip.mp4",
+            description=None,
+            is_spoiler=lambda: False,
+        )
+        session = FakeDownloadSession(b"v" * 3000)
+        uploads = []
+
+        async def send(**kwargs):
+            uploads.append([file.fp.read() for file in kwargs["files"]])
+            if len(uploads) == 1:
+                raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found", headers={}), "gone")
+            return SimpleNamespace(id=10)
+
+        webhook = SimpleNamespace(send=AsyncMock(side_effect=send))
+        message = SimpleNamespace(
+            attachments=[attachment],
+            guild=SimpleNamespace(id=2, filesize_limit=10 * 1024 * 1024),
+            channel=SimpleNamespace(id=3),
+            author=SimpleNamespace(display_name="user", display_avatar=SimpleNamespace(url="https://cdn.example.com/a.png")),
+        )
+        with (
+            patch.object(self.cog, "_http_session", return_value=session),
+            patch.object(self.cog, "_get_or_create_webhook", new=AsyncMock(return_value=webhook)),
+            patch.object(self.cog, "_invalidate_webhook", new=AsyncMock()) as invalidate,
+        ):
+            _, sent = await self.cog._send_webhook_clone(message, FZ_DIRECT_URL)
+        self.assertEqual(sent.id, 10)
+        invalidate.assert_awaited_once_with(2, 3)
+        self.assertEqual(uploads, [[b"v" * 3000], [b"v" * 3000]])
+        self.assertEqual(session.requests, [attachment.proxy_url])
+
 
 if __name__ == "__main__":
     unittest.main()
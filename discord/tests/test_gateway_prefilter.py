@@ -0,0 +1,69 @@
+import json
+import sys
+import unittest
+from pathlib import Path
+
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+import gateway_prefilter
+from gateway_prefilter import decode_payload, may_match
+
+
+def frame(event, data, op=0):
+    return json.dumps({"t": event, "s": 1, "op": op, "d": data}, separators=(",", ":"))
+
+
+MESSAGE_WITH_ATTACHMENTS = {
+    "guild_id": "1",
+    "channel_id": "2",
+    "author": {"id": "3"},
+    "attachments": [{"id": "4", "placeholder": "abc"}, {"id": "5", "placeholder": "def"}],
+}
+
+
+class GatewayPrefilterTests(unittest.TestCase):
+    def accepted_by_full_parse(self, payload):
+        data = json.loads(payload)
+        if data.get("t") != "MESSAGE_CREATE":
+            return False
+        return any("placeholder" in attachment for attachment in data["d"].get("attachments", []))
+
+    def test_never_rejects_a_matching_frame(self):
+        payloads = [
+            frame("MESSAGE_CREATE", MESSAGE_WITH_ATTACHMENTS),
+            frame("MESSAGE_CREATE", {"content": "hi", "attachments": []}),
+            frame("PRESENCE_UPDATE", {"status": "online"}),
+            frame("TYPING_START", {"channel_id": "2"}),
+            frame("MESSAGE_UPDATE", MESSAGE_WITH_ATTACHMENTS),
+            frame("GUILD_MEMBER_UPDATE", {"nick": "MESSAGE_CREATE placeholder"}),
+            frame(None, None, op=11),
+            json.dumps({"op": 0, "d": MESSAGE_WITH_ATTACHMENTS, "t": "MESSAGE_CREATE", "s": 1}),
+            json.dumps({"t": "MESSAGE_CREATE", "d": MESSAGE_WITH_ATTACHMENTS}, indent=1),
+        ]
+        for payload in payloads:
+            with self.subTest(payload=payload[:40]):
+                accepted = self.accepted_by_full_parse(payload)
+                self.assertTrue(not accepted or may_match(payload, "MESSAGE_CREATE", '"placeholder"'))
+                self.assertTrue(not accepted or may_match(payload.encode(), "MESSAGE_CREATE", '"placeholder"'))
+
+    def test_rejects_other_events_without_parsing(self):
+        self.assertFalse(may_match(frame("PRESENCE_UPDATE", {}), "MESSAGE_CREATE"))
+        self.assertFalse(may_match(frame("MESSAGE_CREATE", {"attachments": []}), "MESSAGE_CREATE", '"placeholder"'))
+        self.assertFalse(may_match(frame("TYPING_START", {}).encode(), "MESSAGE_CREATE"))
+        self.assertFalse(may_match(None, "MESSAGE_CREATE"))
+
+    def test_decode_payload(self):
+        payload = frame("MESSAGE_CREATE", MESSAGE_WITH_ATTACHMENTS)
+        self.assertEqual(decode_payload(payload)["d"], MESSAGE_WITH_ATTACHMENTS)
+        self.assertEqual(decode_payload(bytearray(payload.encode()))["t"], "MESSAGE_CREATE")
+        self.assertIsNone(decode_payload("{not json"))
+        self.assertIsNone(decode_payload(b"\xff\xfe"))
+        self.assertIsNone(decode_payload("[1, 2]"))
+        self.assertIsNone(decode_payload(42))
+        self.assertIn(gateway_prefilter.JSON_BACKEND, {"orjson", "ujson", "json"})
+
+
+if __name__ == "__main__":
+    unittest.main()
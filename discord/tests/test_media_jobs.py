@@ -0,0 +1,212 @@
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from PIL import Image
+
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+from media_jobs import (
+    GifTemplate,
+    MediaJobScheduler,
+    MediaQueueFull,
+    OutputCache,
+    TemplateCache,
+    compose_gif,
+    load_gif_template,
+)
+
+
+def make_png(size=(40, 20), color=(255, 0, 0)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class MediaJobSchedulerTests(unittest.IsolatedAsyncioTestCase):
+    async def test_runs_at_most_workers_jobs(self):
+        scheduler = MediaJobScheduler(workers=2, queue_limit=10, per_guild_limit=10)
+        active = 0
+        peak = 0
+
+        async def job(value):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            return value * 2
+
+        results = await asyncio.gather(*(scheduler.submit(i % 3, job, i) for i in range(6)))
+        self.assertEqual(results, [0, 2, 4, 6, 8, 10])
+        self.assertEqual(peak, 2)
+        self.assertEqual(scheduler.completed, 6)
+        self.assertEqual(scheduler.running, 0)
+
+    async def test_guilds_take_turns(self):
+        scheduler = MediaJobScheduler(workers=1, queue_limit=10, per_guild_limit=10)
+        order = []
+        gate = asyncio.Event()
+
+        async def job(name):
+            await gate.wait()
+            order.append(name)
+
+        tasks = [asyncio.ensure_future(scheduler.submit("busy", job, f"busy{i}")) for i in range(5)]
+        tasks.append(asyncio.ensure_future(scheduler.submit("quiet", job, "quiet")))
+        await asyncio.sleep(0)
+        gate.set()
+        await asyncio.gather(*tasks)
+        # quiet 比 busy 晚排，但不用等 busy 全部做完
+        self.assertEqual(order, ["busy0", "busy1", "quiet", "busy2", "busy3", "busy4"])
+
+    async def test_rejects_when_queue_is_full(self):
+        scheduler = MediaJobScheduler(workers=1, queue_limit=2, per_guild_limit=1)
+        gate = asyncio.Event()
+
+        async def job():
+            await gate.wait()
+
+        running = asyncio.ensure_future(scheduler.submit("a", job))
+        await asyncio.sleep(0)
+        queued = asyncio.ensure_future(scheduler.submit("a", job))
+        await asyncio.sleep(0)
+        with self.assertRaises(MediaQueueFull):
+            await scheduler.submit("a", job)  # per-guild limit
+        other = asyncio.ensure_future(scheduler.submit("b", job))
+        await asyncio.sleep(0)
+        with self.assertRaises(MediaQueueFull):
+            await scheduler.submit("c", job)  # total limit
+        self.assertEqual(scheduler.rejected, 2)
+        gate.set()
+        await asyncio.gather(running, queued, other)
+
+    async def test_cancelled_waiter_is_skipped(self):
+        scheduler = MediaJobScheduler(workers=1, queue_limit=5, per_guild_limit=5)
+        gate = asyncio.Event()
+        ran = []
+
+        async def job(name):
+            await gate.wait()
+            ran.append(name)
+
+        first = asyncio.ensure_future(scheduler.submit("a", job, "first"))
+        second = asyncio.ensure_future(scheduler.submit("a", job, "second"))
+        await asyncio.sleep(0)
+        second.cancel()
+        gate.set()
+        await first
+        await asyncio.sleep(0)
+        self.assertEqual(ran, ["first"])
+        self.assertEqual(scheduler.queued, 0)
+
+    async def test_errors_reach_the_caller(self):
+        scheduler = MediaJobScheduler(workers=1)
+
+        async def job():
+            raise RuntimeError("boom")
+
+        with self.assertRaises(RuntimeError):
+            await scheduler.submit("a", job)
+        self.assertEqual(scheduler.running, 0)
+
+
+class TemplateCacheTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "template.png")
+        Image.new("RGBA", (10, 10)).save(self.path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    async def test_concurrent_misses_share_one_load(self):
+        cache = TemplateCache()
+        calls = []
+
+        async def loader(path):
+            calls.append(path)
+            await asyncio.sleep(0.01)
+            return (1280, 720)
+
+        results = await asyncio.gather(*(cache.get_or_load(self.path, "size", loader) for _ in range(5)))
+        self.assertEqual(results, [(1280, 720)] * 5)
+        self.assertEqual(calls, [self.path])
+        self.assertEqual(await cache.get_or_load(self.path, "size", loader), (1280, 720))
+        self.assertEqual(cache.hits, 1)
+
+    async def test_changed_file_is_reloaded(self):
+        cache = TemplateCache()
+        cache.put(self.path, "size", (1, 1))
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        self.assertIsNone(cache.get(self.path, "size"))
+
+    def test_evicts_by_estimated_bytes(self):
+        cache = TemplateCache(max_bytes=10 * 10 * 4 * 2)
+        other = os.path.join(self.tmp.name, "other.png")
+        third = os.path.join(self.tmp.name, "third.png")
+        for path in (other, third):
+            Image.new("RGBA", (10, 10)).save(path)
+        for path in (self.path, other, third):
+            cache.put(path, "preview", Image.new("RGBA", (10, 10)))
+        self.assertIsNone(cache.get(self.path, "preview"))
+        self.assertIsNotNone(cache.get(third, "preview"))
+        self.assertEqual(cache.total_bytes, 800)
+        cache.retain([third])
+        self.assertEqual(len(cache), 1)
+
+
+class OutputCacheTests(unittest.TestCase):
+    def test_lru_by_bytes_and_disabled(self):
+        cache = OutputCache(max_bytes=10)
+        cache.put(("a",), b"12345")
+        cache.put(("b",), b"12345")
+        cache.get(("a",))
+        cache.put(("c",), b"12345")
+        self.assertIsNone(cache.get(("b",)))
+        self.assertEqual(cache.get(("a",)), b"12345")
+        self.assertEqual(cache.total_bytes, 10)
+
+        disabled = OutputCache(max_bytes=0)
+        disabled.put(("a",), b"x")
+        self.assertEqual(len(disabled), 0)
+
+    def test_key_depends_on_screenshot(self):
+        with tempfile.NamedTemporaryFile(suffix=".gif") as template:
+            first = OutputCache.key(b"one", "gif", template.name)
+            self.assertEqual(first, OutputCache.key(b"one", "gif", template.name))
+            self.assertNotEqual(first, OutputCache.key(b"two", "gif", template.name))
+
+
+class GifTemplateTests(unittest.TestCase):
+    def test_frames_are_resized_and_composited(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "template.gif")
+            frames = [Image.new("RGB", (30, 10), color) for color in ((0, 255, 0), (0, 0, 255))]
+            frames[0].save(path, save_all=True, append_images=frames[1:], duration=[50, 70], loop=0)
+            template = load_gif_template(path)
+
+        self.assertIsInstance(template, GifTemplate)
+        self.assertEqual(template.width, 30)
+        self.assertEqual(template.durations, [50, 70])
+        self.assertTrue(all(frame.mode == "RGBA" for frame in template.frames))
+
+        with Image.open(io.BytesIO(compose_gif(make_png(), template))) as output:
+            # 40x20 的截圖縮到 30 寬 → 15 高，下面接 10 高的模板
+            self.assertEqual(output.size, (30, 25))
+            self.assertEqual(output.n_frames, 2)
+            top = output.convert("RGB").getpixel((15, 5))
+            bottom = output.convert("RGB").getpixel((15, 20))
+        self.assertGreater(top[0], 200)
+        self.assertGreater(bottom[1], 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import sys
+import tempfile
+import types
+import unittest
+from pathlib import Path
+
+import discord
+from discord.ext import commands
+
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+from module_loader import ModuleLoader
+
+
+FAKE_MODULE = '''
+import asyncio
+from discord import app_commands
+from discord.ext import commands
+from loader_test_env import bot, events
+
+
+class {name}Cog(commands.Cog):
+    @commands.command(aliases=["{name}_alias"])
+    async def {name}_cmd(self, ctx):
+        events.append("command")
+
+    @app_commands.command(name="{name}_slash", description="test")
+    async def {name}_slash(self, interaction):
+        events.append("slash")
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        events.append(("join", member))
+
+
+asyncio.run(bot.add_cog({name}Cog()))
+'''
+
+
+class FakeHTTP:
+    def __init__(self):
+        self.payloads = []
+
+    async def bulk_upsert_global_commands(self, application_id, payload):
+        self.payloads.append(payload)
+        return []
+
+
+class ModuleLoaderTests(unittest.IsolatedAsyncioTestCase):
+    counter = 0
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        sys.path.insert(0, self.tmp.name)
+        self.original_run = asyncio.run
+        self.events = []
+        self.bot = commands.Bot(command_prefix="!", intents=discord.Intents.none())
+        self.bot._connection.application_id = 1
+        self.http = FakeHTTP()
+        self.bot.tree._http = self.http
+        sys.modules["loader_test_env"] = types.SimpleNamespace(bot=self.bot, events=self.events)
+
+    def tearDown(self):
+        asyncio.run = self.original_run
+        sys.path.remove(self.tmp.name)
+        sys.modules.pop("loader_test_env", None)
+        self.tmp.cleanup()
+
+    def make_module(self) -> str:
+        ModuleLoaderTests.counter += 1
+        name = f"fakemod{ModuleLoaderTests.counter}"
+        (self.dir / f"{name}.py").write_text(FAKE_MODULE.format(name=name), encoding="utf-8")
+        self.addCleanup(sys.modules.pop, name, None)
+        return name
+
+    def make_loader(self) -> ModuleLoader:
+        return ModuleLoader(self.bot, [], manifest_path=self.dir / "manifest.json")
+
+    async def eager_manifest(self, name: str):
+        # a first run imports everything and writes the manifest on sync
+        self.bot.loop = asyncio.get_running_loop()
+        loader = self.make_loader()
+        await asyncio.to_thread(loader.load_all, [name])
+        await loader.sync_app_commands()
+        await self.bot.remove_cog(f"{name}Cog")
+        sys.modules.pop(name)
+        return json.loads((self.dir / "manifest.json").read_text(encoding="utf-8"))
+
+    def test_eager_load_records_stats_and_ownership(self):
+        name = self.make_module()
+        loader = self.make_loader()
+        failed = loader.load_all([name, "missing_module_for_loader_test"])
+        self.assertEqual(failed, ["missing_module_for_loader_test"])
+        self.assertEqual(loader.stats[name].status, "loaded")
+        self.assertGreater(loader.stats[name].seconds, 0)
+        self.assertEqual(loader.stats["missing_module_for_loader_test"].status, "failed")
+        self.assertEqual(loader.manifest[name]["commands"], [f"{name}_alias", f"{name}_cmd"])
+        self.assertEqual(loader.manifest[name]["events"], ["on_member_join"])
+        self.assertEqual([command.name for command in loader.owned[name].app_commands], [f"{name}_slash"])
+        self.assertEqual(loader.report()[0].name, name)
+
+    async def test_sync_writes_manifest_payloads(self):
+        name = self.make_module()
+        manifest = await self.eager_manifest(name)
+        self.assertEqual([payload["name"] for payload in manifest[name]["app_commands"]], [f"{name}_slash"])
+        self.assertEqual([payload["name"] for payload in self.http.payloads[-1]], [f"{name}_slash"])
+
+    async def test_deferred_module_keeps_slash_commands_registered(self):
+        name = self.make_module()
+        await self.eager_manifest(name)
+        loader = self.make_loader()
+        loader.load_all([name], lazy_modules=[name])
+        self.assertIn(name, loader.deferred)
+        self.assertNotIn(name, sys.modules)
+        await self.bot.tree.sync()
+        self.assertEqual([payload["name"] for payload in self.http.payloads[-1]], [f"{name}_slash"])
+        self.assertEqual(self.bot.tree.get_commands(), [])
+
+    async def test_event_loads_deferred_module_and_replays(self):
+        name = self.make_module()
+        await self.eager_manifest(name)
+        loader = self.make_loader()
+        loader.load_all([name], lazy_modules=[name])
+        self.assertIs(asyncio.run, self.original_run)
+        # gateway events go through ConnectionState.dispatch, not bot.dispatch
+        self.bot._connection.dispatch("member_join", "someone")
+        for _ in range(20):
+            await asyncio.sleep(0)
+            if self.events:
+                break
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.events, [("join", "someone")])
+        self.assertNotIn(name, loader.deferred)
+        self.assertEqual(loader.stats[name].trigger, "on_member_join")
+        self.assertIsNotNone(self.bot.get_cog(f"{name}Cog"))
+        self.assertIs(asyncio.run, self.original_run)
+
+    async def test_prefix_stub_is_replaced_by_real_command(self):
+        name = self.make_module()
+        await self.eager_manifest(name)
+        loader = self.make_loader()
+        loader.load_all([name], lazy_modules=[name])
+        stub = self.bot.get_command(f"{name}_alias")
+        self.assertTrue(stub.hidden)
+        await loader.ensure_loaded(name, "test")
+        command = self.bot.get_command(f"{name}_alias")
+        self.assertEqual(command.name, f"{name}_cmd")
+        self.assertFalse(loader._stubs)
+
+    async def test_interaction_waits_for_deferred_module(self):
+        name = self.make_module()
+        await self.eager_manifest(name)
+        dispatched = []
+        self.bot.tree._from_interaction = lambda interaction: dispatched.append(interaction)
+        loader = self.make_loader()
+        loader.load_all([name], lazy_modules=[name])
+        interaction = types.SimpleNamespace(data={"name": f"{name}_slash", "type": 1})
+        self.bot.tree._from_interaction(interaction)
+        self.assertEqual(dispatched, [])
+        for _ in range(20):
+            await asyncio.sleep(0)
+            if dispatched:
+                break
+        self.assertEqual(dispatched, [interaction])
+        self.assertIn(name, sys.modules)
+        self.assertIsNotNone(self.bot.tree.get_command(f"{name}_slash"))
+
+    def test_module_without_manifest_is_loaded_eagerly(self):
+        name = self.make_module()
+        loader = self.make_loader()
+        loader.load_all([name], lazy_modules=[name])
+        self.assertEqual(loader.stats[name].status, "loaded")
+        self.assertFalse(loader.deferred)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+from page_pool import PagePool, PagePoolError, PagePoolFull, StageMetrics
+
+
+class FakePage:
+    def __init__(self, browser):
+        self.browser = browser
+        self.closed = False
+        self.viewports = []
+
+    def is_closed(self):
+        return self.closed or not self.browser.connected
+
+    async def close(self):
+        self.closed = True
+
+    async def set_viewport_size(self, viewport):
+        self.viewports.append(viewport)
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.connected = True
+        self.pages = []
+
+    def is_connected(self):
+        return self.connected
+
+    async def new_page(self, viewport=None):
+        page = FakePage(self)
+        self.pages.append(page)
+        return page
+
+    async def close(self):
+        self.connected = False
+
+
+class PagePoolTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.browsers = []
+
+        async def launch():
+            browser = FakeBrowser()
+            self.browsers.append(browser)
+            return browser
+
+        self.launch = launch
+
+    async def test_pages_are_warm_reused_and_recycled(self):
+        pool = PagePool(self.launch, size=2, max_uses=3)
+        await pool.start()
+        self.assertEqual(len(self.browsers[0].pages), 2)
+
+        used = []
+        for _ in range(6):
+            async with pool.page() as page:
+                used.append(page)
+        # each page serves max_uses renders before it is replaced
+        self.assertEqual(len(set(map(id, used))), 2)
+        self.assertEqual(len(self.browsers[0].pages), 4)
+        self.assertEqual(pool.metrics.counts["recycled"], 2)
+        self.assertTrue(all(page.closed for page in used))
+
+    async def test_requests_run_in_parallel_up_to_pool_size(self):
+        pool = PagePool(self.launch, size=3)
+        await pool.start()
+        active = 0
+        peak = 0
+
+        async def render():
+            nonlocal active, peak
+            async with pool.page():
+                active += 1
+                peak = max(peak, active)
+                await asyncio.sleep(0.01)
+                active -= 1
+
+        await asyncio.gather(*(render() for _ in range(9)))
+        self.assertEqual(peak, 3)
+
+    async def test_backpressure_rejects_when_queue_is_full(self):
+        pool = PagePool(self.launch, size=1, queue_limit=2)
+        await pool.start()
+        release = asyncio.Event()
+
+        async def hold():
+            async with pool.page():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        waiters = [asyncio.create_task(hold()) for _ in range(2)]
+        await asyncio.sleep(0)
+        with self.assertRaises(PagePoolFull):
+            async with pool.page():
+                pass
+        release.set()
+        await asyncio.gather(holder, *waiters)
+        self.assertEqual(pool.metrics.counts["rejected"], 1)
+
+    async def test_relaunches_disconnected_browser(self):
+        pool = PagePool(self.launch, size=1)
+        await pool.start()
+        self.browsers[0].connected = False
+        async with pool.page() as page:
+            self.assertIs(page.browser, self.browsers[1])
+        self.assertEqual(pool.metrics.counts["browser_restarts"], 1)
+
+    async def test_not_started(self):
+        pool = PagePool(self.launch)
+        with self.assertRaises(PagePoolError):
+            async with pool.page():
+                pass
+
+
+class StageMetricsTests(unittest.TestCase):
+    def test_summary_percentiles(self):
+        metrics = StageMetrics(window=100)
+        for value in range(1, 101):
+            metrics.record("render", value / 1000)
+        metrics.increment("failed")
+        summary = metrics.summary()
+        self.assertEqual(summary["render"]["count"], 100)
+        self.assertAlmostEqual(summary["render"]["p50"], 51)
+        self.assertAlmostEqual(summary["render"]["p95"], 95)
+        self.assertEqual(summary["failed"], {"count": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
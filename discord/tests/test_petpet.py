@@ -0,0 +1,77 @@
+import io
+import os
+import random
+import sys
+import unittest
+from pathlib import Path
+
+from PIL import Image
+
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+import petpet
+from petpet import PetPetCache, make_bytes
+
+
+def avatar_bytes(seed):
+    rng = random.Random(seed)
+    image = Image.new("RGBA", (128, 128))
+    image.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256), 255) for _ in range(128 * 128)])
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def legacy_make(avatar):
+    """make() before the overlays were cached: every frame re-opens its overlay"""
+    images = []
+    base = Image.open(io.BytesIO(avatar)).convert("RGBA").resize(petpet.resolution)
+    for i in range(petpet.frames):
+        squeeze = i if i < petpet.frames / 2 else petpet.frames - i
+        width = 0.8 + squeeze * 0.02
+        height = 0.8 - squeeze * 0.05
+        offset_x = (1 - width) * 0.5 + 0.1
+        offset_y = (1 - height) - 0.08
+        canvas = Image.new("RGBA", size=petpet.resolution, color=(0, 0, 0, 0))
+        canvas.paste(
+            base.resize((round(width * petpet.resolution[0]), round(height * petpet.resolution[1]))),
+            (round(offset_x * petpet.resolution[0]), round(offset_y * petpet.resolution[1])),
+        )
+        pet = Image.open(os.path.join(petpet.PETPET_ASSET_DIR, f"pet{i}.gif")).convert("RGBA").resize(petpet.resolution)
+        canvas.paste(pet, mask=pet)
+        images.append(canvas)
+    buffer = io.BytesIO()
+    petpet.save_transparent_gif(images, durations=20, save_file=buffer)
+    return buffer.getvalue()
+
+
+class PetPetTests(unittest.TestCase):
+    def test_output_matches_overlays_loaded_per_call(self):
+        for seed in range(3):
+            avatar = avatar_bytes(seed)
+            random.seed(seed)
+            data = make_bytes(avatar)
+            random.seed(seed)
+            self.assertEqual(data, legacy_make(avatar))
+        self.assertEqual(Image.open(io.BytesIO(data)).n_frames, petpet.frames)
+
+    def test_cache_is_bounded_by_entries_and_bytes(self):
+        cache = PetPetCache(max_entries=2, max_bytes=10)
+        cache.put("a", b"1234")
+        cache.put("b", b"1234")
+        self.assertEqual(cache.get("a"), b"1234")
+        cache.put("c", b"1234")  # "b" is the least recently used
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(len(cache), 2)
+
+        cache.put("d", b"123456789")
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.total_bytes, 9)
+        cache.put("d", b"12")
+        self.assertEqual(cache.total_bytes, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
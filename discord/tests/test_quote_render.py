@@ -0,0 +1,134 @@
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from PIL import Image
+
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+import quote_render
+from quote_render import EmojiCache, fit_layout, get_font, layout_segments, prepare_segments, render_quote
+
+# notobold / notolight are not checked in; the regular face lays out the same way
+TEST_FONT = str(DISCORD_DIR / "assets" / "notoregular.ttf")
+
+
+def png_bytes(color=(255, 0, 0, 255), size=(8, 8)):
+    buffer = io.BytesIO()
+    Image.new("RGBA", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def linear_fit(segments):
+    """The old shrink-by-2 loop"""
+    for size in range(55, 19, -2):
+        font = get_font(TEST_FONT, size)
+        ascent, descent = font.getmetrics()
+        lines = layout_segments(segments, font, 590, ascent + descent)
+        if len(lines) * (ascent + descent + 10) <= 530:
+            return size, len(lines)
+    return 21, len(lines)
+
+
+class FakeResponse:
+    def __init__(self, status, data):
+        self.status = status
+        self._data = data
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def read(self):
+        return self._data
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+
+    def get(self, url):
+        self.requests.append(url)
+        status, data = self.responses.get(url, (404, b""))
+        return FakeResponse(status, data)
+
+
+class QuoteRenderTests(unittest.TestCase):
+    def setUp(self):
+        self._fonts = (quote_render.MESSAGE_FONT, quote_render.NAME_FONT, quote_render.SIGNATURE_FONT)
+        quote_render.MESSAGE_FONT = quote_render.NAME_FONT = quote_render.SIGNATURE_FONT = TEST_FONT
+
+    def tearDown(self):
+        quote_render.MESSAGE_FONT, quote_render.NAME_FONT, quote_render.SIGNATURE_FONT = self._fonts
+
+    def test_binary_search_matches_linear_shrink(self):
+        texts = ["hi", "短句", "word " * 40, "很長的中文句子" * 30, "x" * 3000, "mixed 中文 and english " * 25]
+        for text in texts:
+            with self.subTest(text=text[:20]):
+                segments = prepare_segments(text)
+                lines, font = fit_layout(segments)
+                self.assertEqual((font.size, len(lines)), linear_fit(segments))
+
+    def test_segments_split_custom_and_unicode_emoji(self):
+        segments = prepare_segments("hi <:cat:123> 😀")
+        self.assertEqual([seg.type for seg in segments], ["text", "emoji", "text", "unicode_emoji"])
+        self.assertEqual(segments[1].url, "https://cdn.discordapp.com/emojis/123.png")
+        self.assertTrue(segments[3].url.endswith("/1f600.png"))
+
+    def test_renders_static_and_animated_cards(self):
+        avatar = png_bytes(size=(64, 64))
+        segments = prepare_segments("hello 😀")
+        segments[-1].data = png_bytes()
+        data, ext = render_quote(segments, "someone", avatar)
+        self.assertEqual(ext, "png")
+        self.assertEqual(Image.open(io.BytesIO(data)).size, (1200, 630))
+
+        frames = [Image.new("RGB", (32, 32), color) for color in ((255, 0, 0), (0, 0, 255))]
+        buffer = io.BytesIO()
+        frames[0].save(buffer, format="GIF", save_all=True, append_images=frames[1:], duration=80)
+        data, ext = render_quote(prepare_segments("gif"), "someone", buffer.getvalue(), animate_gif=True)
+        self.assertEqual(ext, "gif")
+        self.assertEqual(Image.open(io.BytesIO(data)).n_frames, 2)
+
+
+class EmojiCacheTests(unittest.IsolatedAsyncioTestCase):
+    async def test_fetches_once_and_falls_back_to_text(self):
+        with tempfile.TemporaryDirectory() as directory:
+            ok = "https://cdn.discordapp.com/emojis/1.png"
+            session = FakeSession({ok: (200, png_bytes())})
+            cache = EmojiCache(directory)
+            segments = prepare_segments("<:a:1><:a:1><:gone:2>")
+            await cache.load(session, segments)
+            self.assertEqual(session.requests.count(ok), 1)
+            self.assertIsNotNone(segments[0].data)
+            self.assertEqual((segments[2].type, segments[2].content), ("text", ":gone:"))
+
+            # a new process only has the disk cache
+            cold = EmojiCache(directory)
+            await cold.load(FakeSession({}), prepare_segments("<:a:1>"))
+            self.assertIn(ok, cold._memory)
+
+    def test_disk_cache_drops_expired_and_least_recently_used_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = EmojiCache(directory, max_files=2, max_age=100)
+            urls = [f"https://cdn.discordapp.com/emojis/{index}.png" for index in range(4)]
+            for url in urls:
+                cache._write_disk(url, b"x")
+            for age, url in zip((500, 30, 20, 10), urls):
+                os.utime(cache._path(url), (1000 - age, 1000 - age))
+            cache._read_disk(urls[1])  # 讀到就更新 mtime，變成最近用過
+            cache._prune_disk(now=1000)
+            self.assertEqual(sorted(os.listdir(directory)), sorted(os.path.basename(cache._path(url)) for url in (urls[1], urls[3])))
+
+
+if __name__ == "__main__":
+    unittest.main()
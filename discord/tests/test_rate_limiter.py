@@ -0,0 +1,166 @@
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+import rate_limiter
+from rate_limiter import RateLimiter, format_retry_after, get_limiter, load_limiters, rate_limited, save_limiters
+
+
+class RateLimiterTests(unittest.TestCase):
+    def test_cooldown(self):
+        limiter = RateLimiter(1, 10)
+        self.assertEqual(limiter.hit(1, now=100.0), 0.0)
+        self.assertAlmostEqual(limiter.hit(1, now=104.0), 6.0)
+        self.assertAlmostEqual(limiter.retry_after(1, now=104.0), 6.0)
+        self.assertEqual(limiter.hit(2, now=104.0), 0.0)  # 每個 key 分開算
+        self.assertEqual(limiter.hit(1, now=110.0), 0.0)
+
+    def test_burst_and_refill(self):
+        limiter = RateLimiter(1, 2, burst=3)
+        for _ in range(3):
+            self.assertEqual(limiter.hit("a", now=0.0), 0.0)
+        self.assertAlmostEqual(limiter.hit("a", now=0.0), 2.0)
+        self.assertEqual(limiter.hit("a", now=2.0), 0.0)
+        self.assertGreater(limiter.hit("a", now=2.0), 0.0)
+        # 再久也只會補滿到 burst
+        for _ in range(3):
+            self.assertEqual(limiter.hit("a", now=100.0), 0.0)
+        self.assertGreater(limiter.hit("a", now=100.0), 0.0)
+
+    def test_retry_after_does_not_consume(self):
+        limiter = RateLimiter(1, 5)
+        self.assertEqual(limiter.retry_after(1, now=0.0), 0.0)
+        self.assertEqual(limiter.hit(1, now=0.0), 0.0)
+
+    def test_reset_refunds(self):
+        limiter = RateLimiter(1, 60)
+        limiter.hit(1, now=0.0)
+        limiter.reset(1)
+        self.assertEqual(limiter.hit(1, now=1.0), 0.0)
+
+    def test_full_buckets_are_evicted_first(self):
+        limiter = RateLimiter(1, 10, shards=1, max_keys_per_shard=4)
+        for key in range(4):
+            limiter.hit(key, now=float(key * 5))
+        limiter.hit("new", now=15.0)
+        # 0 和 1 已經補滿，被丟掉也不影響結果
+        self.assertEqual(len(limiter), 3)
+        self.assertGreater(limiter.retry_after(3, now=15.0), 0.0)
+
+    def test_concurrent_hits_share_buckets_safely(self):
+        churn = RateLimiter(1, 60, shards=2, max_keys_per_shard=64)
+        shared = RateLimiter(5, 60)
+        allowed = []
+        errors = []
+
+        def worker(offset):
+            try:
+                for index in range(2000):
+                    # 每個 thread 用自己的 key 讓 shard 一直滿到要清，同時有別的 thread 在 snapshot
+                    churn.hit((offset, index), now=float(index))
+                    churn.snapshot(now=float(index), wall_now=0.0)
+                    if not shared.hit("shared", now=0.0):
+                        allowed.append(offset)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(allowed), 5)
+
+    def test_format_retry_after(self):
+        self.assertEqual(format_retry_after(0.2), 1)
+        self.assertEqual(format_retry_after(4.1), 5)
+
+
+class PersistenceTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "rate_limits.json")
+        self._limiters = dict(rate_limiter._limiters)
+        rate_limiter._limiters.clear()
+        rate_limiter._saved_entries.clear()
+
+    def tearDown(self):
+        rate_limiter._limiters.clear()
+        rate_limiter._limiters.update(self._limiters)
+        rate_limiter._saved_entries.clear()
+        self.tmp.cleanup()
+
+    def test_snapshot_and_restore(self):
+        limiter = RateLimiter(1, 300)
+        limiter.hit((1, 2), now=0.0)
+        limiter.hit(3, now=-400.0)  # 已經補滿，不用存
+        entries = limiter.snapshot(now=10.0, wall_now=1000.0)
+        self.assertEqual(entries, [[(1, 2), 0.0, 990.0]])
+
+        restored = RateLimiter(1, 300)
+        restored.restore([[[1, 2], 0.0, 990.0]], now=50.0, wall_now=1100.0)
+        self.assertAlmostEqual(restored.retry_after((1, 2), now=50.0), 190.0)
+
+    def test_save_and_load(self):
+        limiter = get_limiter("contribute_test", 1, 300, persist=True)
+        get_limiter("memory_only", 1, 300).hit(1)
+        limiter.hit(42)
+        save_limiters(self.path)
+
+        rate_limiter._limiters.clear()
+        load_limiters(self.path)
+        self.assertNotIn("memory_only", rate_limiter._saved_entries)
+        restored = get_limiter("contribute_test", 1, 300, persist=True)
+        self.assertGreater(restored.retry_after(42), 290.0)
+        self.assertEqual(restored.retry_after(43), 0.0)
+
+    def test_missing_file(self):
+        load_limiters(self.path)
+        self.assertEqual(rate_limiter._saved_entries, {})
+
+
+class FakeResponse:
+    def __init__(self):
+        self.messages = []
+
+    async def send_message(self, content, ephemeral=False):
+        self.messages.append((content, ephemeral))
+
+
+def make_interaction(user_id):
+    return SimpleNamespace(user=SimpleNamespace(id=user_id), response=FakeResponse())
+
+
+class DecoratorTests(unittest.TestCase):
+    def test_second_call_is_refused(self):
+        limiter = RateLimiter(1, 10)
+        calls = []
+        limited = []
+
+        @rate_limited(limiter, message="slow down", on_limited=lambda i, f, r: limited.append(r))
+        async def handler(interaction):
+            calls.append(interaction.user.id)
+            return "ok"
+
+        first = make_interaction(1)
+        second = make_interaction(1)
+        self.assertEqual(asyncio.run(handler(first)), "ok")
+        self.assertIsNone(asyncio.run(handler(second)))
+        self.assertEqual(calls, [1])
+        self.assertEqual(second.response.messages, [("slow down", True)])
+        self.assertEqual(len(limited), 1)
+        self.assertEqual(asyncio.run(handler(make_interaction(2))), "ok")
+
+
+if __name__ == "__main__":
+    unittest.main()
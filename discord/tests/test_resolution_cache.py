@@ -0,0 +1,131 @@
+import asyncio
+import sqlite3
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+from database import ConnectionPool
+from resolution_cache import ResolutionCache
+
+
+class ResolutionCacheTests(unittest.IsolatedAsyncioTestCase):
+    def test_ttl_and_negative_ttl(self):
+        cache = ResolutionCache("test_cache", ttl=600, negative_ttl=60)
+        cache.put("ok", "https://example.com", now=0)
+        cache.put("missing", None, now=0)
+        self.assertEqual(cache.get("ok", now=100), (True, "https://example.com"))
+        self.assertEqual(cache.get("missing", now=30), (True, None))
+        self.assertEqual(cache.get("missing", now=61), (False, None))
+        self.assertEqual(cache.get("ok", now=601), (False, None))
+        self.assertEqual(len(cache), 0)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = ResolutionCache("test_cache", max_size=2)
+        cache.put("a", "1", now=0)
+        cache.put("b", "2", now=0)
+        cache.get("a", now=1)
+        cache.put("c", "3", now=1)
+        self.assertEqual(cache.get("b", now=1), (False, None))
+        self.assertEqual(cache.get("a", now=1), (True, "1"))
+        self.assertEqual(cache.evictions, 1)
+
+    async def test_concurrent_misses_share_one_load(self):
+        cache = ResolutionCache("test_cache")
+        calls = []
+        gate = asyncio.Event()
+
+        async def loader():
+            calls.append(1)
+            await gate.wait()
+            return "resolved"
+
+        tasks = [asyncio.ensure_future(cache.resolve("key", loader)) for _ in range(3)]
+        await asyncio.sleep(0)
+        self.assertEqual(cache.stats()["inflight"], 1)
+        gate.set()
+        self.assertEqual(await asyncio.gather(*tasks), ["resolved"] * 3)
+        self.assertEqual(await cache.resolve("key", loader), "resolved")
+        stats = cache.stats()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual((stats["misses"], stats["coalesced"], stats["hits"], stats["inflight"]), (1, 2, 1, 0))
+
+
+class PersistenceTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.pool = ConnectionPool(str(Path(self.tmp.name) / "cache.db"), size=2)
+
+    def tearDown(self):
+        self.pool.close()
+        self.tmp.cleanup()
+
+    async def test_results_survive_a_restart(self):
+        cache = ResolutionCache("share_cache", max_size=2)
+        cache.attach(self.pool)
+
+        async def loader():
+            return "https://www.threads.com/@user/post/ABC"
+
+        await cache.resolve("/share/abc/", loader)
+        self.assertEqual(cache.flush(), 1)
+        cache.close()
+
+        restarted = ResolutionCache("share_cache", max_size=2)
+        restarted.attach(self.pool)
+        self.assertEqual(restarted.load(), 1)
+        self.assertEqual(restarted.get("/share/abc/"), (True, "https://www.threads.com/@user/post/ABC"))
+        restarted.close()
+
+    async def test_database_errors_do_not_reach_the_caller(self):
+        cache = ResolutionCache("share_cache")
+        cache.attach(self.pool)
+
+        async def loader():
+            return "https://www.threads.com/@user/post/ABC"
+
+        with patch.object(self.pool, "connection", side_effect=sqlite3.OperationalError("database is locked")):
+            self.assertEqual(await cache.resolve("/share/abc/", loader), "https://www.threads.com/@user/post/ABC")
+            with self.assertRaises(sqlite3.OperationalError):
+                cache.flush()
+        # 寫入失敗的那筆留到下次再寫
+        self.assertEqual(cache.flush(), 1)
+        cache.close()
+
+    async def test_background_flusher_writes_new_results(self):
+        cache = ResolutionCache("share_cache", flush_interval=0.01)
+        cache.attach(self.pool)
+
+        async def loader():
+            return "resolved"
+
+        await cache.resolve("key", loader)
+        for _ in range(200):
+            with self.pool.connection() as conn:
+                if conn.execute("SELECT COUNT(*) FROM share_cache").fetchone()[0]:
+                    break
+            await asyncio.sleep(0.01)
+        cache.close()
+        with self.pool.connection() as conn:
+            self.assertEqual(conn.execute("SELECT cache_value FROM share_cache").fetchall(), [("resolved",)])
+
+    def test_flush_drops_expired_and_surplus_rows(self):
+        cache = ResolutionCache("share_cache", max_size=2, ttl=100)
+        cache.attach(self.pool)
+        for index, key in enumerate(("a", "b", "c")):
+            cache.put(key, key, now=index)
+        cache.put("old", "old", now=-500)
+        self.assertEqual(cache.flush(now=10), 4)
+        with self.pool.connection() as conn:
+            keys = [row[0] for row in conn.execute("SELECT cache_key FROM share_cache ORDER BY cache_key")]
+        self.assertEqual(keys, ["b", "c"])
+        cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import random
+import sys
+import unittest
+from difflib import SequenceMatcher
+from pathlib import Path
+
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+from spam_tracker import SpamEntry, SpamTracker, history_size
+
+
+def legacy_similar_count(history, content, threshold):
+    count = 0
+    for old_content in history[:-1]:
+        if content == old_content or (content and old_content and SequenceMatcher(None, content, old_content).ratio() >= threshold):
+            count += 1
+    return count
+
+
+class SpamTrackerTests(unittest.TestCase):
+    def test_short_messages_match_sequence_matcher(self):
+        rng = random.Random(7)
+        words = ["buy", "free", "nitro", "gg", "lol", "http://x.y", "hi", ""]
+        for threshold in (0.5, 0.75, 0.9):
+            tracker = SpamTracker()
+            history = []
+            for step in range(200):
+                content = " ".join(rng.choice(words) for _ in range(rng.randint(0, 6)))
+                history.append(content)
+                result = tracker.record(1, content, float(step), 1000, 3, threshold)
+                expected = legacy_similar_count(history[-history_size(3):], content, threshold)
+                self.assertEqual(result, expected if len(history) >= 3 else None)
+
+    def test_long_near_duplicates_are_detected(self):
+        base = "Free nitro for everyone who clicks this totally legit link right now! " * 10
+        tracker = SpamTracker()
+        results = [tracker.record(1, f"{base} #{index}", float(index), 30, 5, 0.75) for index in range(5)]
+        self.assertEqual(results[:4], [None] * 4)
+        self.assertEqual(results[4], 4)
+
+        unrelated = SpamEntry("".join(random.Random(1).choice("abcdefghij ") for _ in range(500)), 0.0)
+        self.assertFalse(SpamEntry(base, 0.0).is_similar(unrelated, 0.5))
+
+    def test_window_and_ring_buffer_bound_history(self):
+        tracker = SpamTracker()
+        self.assertIsNone(tracker.record(1, "spam", 0.0, 10, 2, 0.75))
+        self.assertIsNone(tracker.record(1, "spam", 10.0, 10, 2, 0.75))
+        self.assertEqual(tracker.record(1, "spam", 11.0, 10, 2, 0.75), 1)
+
+        for step in range(history_size(2) + 100):
+            tracker.record(2, "x", 20.0 + step * 0.01, 1000, 2, 0.75)
+        self.assertEqual(len(tracker._users[2].entries), history_size(2))
+
+    def test_max_messages_above_history_limit_still_fires(self):
+        tracker = SpamTracker()
+        results = [tracker.record(1, "spam", step * 0.01, 1000, 200, 0.75) for step in range(200)]
+        self.assertEqual(results[:199], [None] * 199)
+        self.assertEqual(results[199], 199)
+
+    def test_filler_does_not_push_duplicates_out_of_the_window(self):
+        base = "Join my server for free nitro and robux, limited spots, click the link below! " * 4
+        rng = random.Random(3)
+        tracker = SpamTracker()
+        result = None
+        for step in range(5):
+            for filler in range(40):
+                tracker.record(1, "".join(rng.choice("abcdefgh ") for _ in range(30)), step + filler * 0.001, 30, 5, 0.75)
+            result = tracker.record(1, f"{base}{step}", step + 0.5, 30, 5, 0.75)
+        self.assertEqual(result, 4)
+
+    def test_long_messages_only_compare_with_band_candidates(self):
+        rng = random.Random(5)
+        tracker = SpamTracker()
+        for step in range(300):
+            # 和下面的訊息沒有共同的 shingle，候選數量才不會隨 hash seed 變動
+            text = " ".join("".join(rng.choice("甲乙丙丁戊己庚辛壬癸") for _ in range(6)) for _ in range(30))
+            tracker.record(1, text, step * 0.01, 1000, 5, 0.75)
+        base = "Free nitro for everyone who clicks this totally legit link right now! " * 5
+        for index in range(3):
+            tracker.record(1, f"{base}{index}", 3.0 + index * 0.01, 1000, 5, 0.75)
+        history = tracker._users[1]
+        entry = history.entries[-1]
+        candidates = list(history.candidates(entry))
+        self.assertLess(len(candidates), 20)
+        self.assertEqual(sum(1 for other in candidates if entry.is_similar(other, 0.75)), 2)
+
+    def test_expire_idle_and_reset(self):
+        tracker = SpamTracker()
+        tracker.record(1, "a", 0.0, 30, 5, 0.75)
+        tracker.record(2, "b", 20.0, 30, 5, 0.75)
+        self.assertEqual(tracker.expire_idle(35.0), 1)
+        self.assertEqual(len(tracker), 1)
+        tracker.reset(2)
+        self.assertFalse(tracker)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+import discord
+
+
+DISCORD_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(DISCORD_DIR))
+
+from user_cache import UserCache
+
+
+class FakeClient:
+    def __init__(self, cached=(), missing=()):
+        self.cached = {user_id: SimpleNamespace(id=user_id, name=f"cached{user_id}") for user_id in cached}
+        self.missing = set(missing)
+        self.fetches = []
+        self.active = 0
+        self.max_active = 0
+
+    def get_user(self, user_id):
+        return self.cached.get(user_id)
+
+    async def fetch_user(self, user_id):
+        self.fetches.append(user_id)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(0.01)
+            if user_id in self.missing:
+                raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown User")
+            return SimpleNamespace(id=user_id, name=f"user{user_id}")
+        finally:
+            self.active -= 1
+
+
+class UserCacheTests(unittest.IsolatedAsyncioTestCase):
+    async def test_fetches_missing_users_concurrently_and_remembers_them(self):
+        client = FakeClient(cached=(1,), missing=(3,))
+        cache = UserCache(client, concurrency=4)
+
+        users = await cache.resolve_many([1, 2, 3] + list(range(10, 20)))
+        self.assertEqual(users[1].name, "cached1")
+        self.assertEqual(users[2].name, "user2")
+        self.assertIsNone(users[3])
+        self.assertEqual(client.max_active, 4)
+
+        fetched = len(client.fetches)
+        users = await cache.resolve_many([2, 3, 10])
+        self.assertEqual(len(client.fetches), fetched)
+        self.assertIsNone(users[3])
+
+    async def test_concurrent_lookups_share_one_request(self):
+        client = FakeClient()
+        cache = UserCache(client)
+        first, second = await asyncio.gather(cache.resolve(7), cache.resolve(7))
+        self.assertIs(first, second)
+        self.assertEqual(client.fetches, [7])
+
+    async def test_entries_expire_and_size_is_bounded(self):
+        client = FakeClient()
+        cache = UserCache(client, max_size=2, ttl=0.05)
+        await cache.resolve_many([1, 2, 3])
+        self.assertEqual(len(cache), 2)
+        await cache.resolve(1)  # evicted first
+        self.assertEqual(client.fetches.count(1), 2)
+
+        await asyncio.sleep(0.06)
+        await cache.resolve(3)
+        self.assertEqual(client.fetches.count(3), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -12,73 +12,74 @@ from datetime import timezone, timedelta
 from zoneinfo import ZoneInfo  # Python 3.9+
 from logger import log
 import logging
-from functools import wraps
+from rate_limiter import get_limiter, rate_limited
+from bus_cache import RouteSnapshotCache
+
+
+# 速率限制：所有公車指令和 🔄 共用一個 bucket，View 按鈕另外一個
+bus_command_limiter = get_limiter("twbus", 1, 10)
+bus_view_limiter = get_limiter("twbus_view", 1, 3)
+
+
+def _log_rate_limited(interaction: discord.Interaction, func: Callable, retry_after: float):
+    log(f"Rate limited: {func.__name__}", level=logging.WARNING, module_name="TWBus", user=interaction.user, guild=interaction.guild)
 
 
-# Rate limiting decorator
 def rate_limit(seconds: int = 10):
-    def decorator(func: Callable) -> Callable:
-        @wraps(func)
-        async def wrapper(self, interaction: discord.Interaction, *args, **kwargs):
-            user_last_used = get_user_data(0, str(interaction.user.id), "rate_limit_last", None)
-            if user_last_used:
-                last_time = datetime.fromisoformat(user_last_used)
-                now = datetime.utcnow()
-                delta = (now - last_time).total_seconds()
-                if delta < seconds:
-                    log(f"Rate limited: {func.__name__}", level=logging.WARNING, module_name="TWBus", user=interaction.user, guild=interaction.guild)
-                    await interaction.response.send_message("你操作的太快了，請稍後再試。", ephemeral=True)
-                    return
-            set_user_data(0, str(interaction.user.id), "rate_limit_last", datetime.utcnow().isoformat())
-            return await func(self, interaction, *args, **kwargs)
-        return wrapper
-    return decorator
-
-
-def check_view_rate_limit(user_id: str, seconds: int = 3) -> bool:
+    limiter = bus_command_limiter if seconds == 10 else get_limiter(f"twbus_{seconds}", 1, seconds)
+    return rate_limited(limiter, on_limited=_log_rate_limited)
+
+
+def check_view_rate_limit(user_id: int) -> bool:
     """View 元件共用的速率限制，回傳 True 表示允許操作。"""
-    last = get_user_data(0, user_id, "view_rate_limit_last", None)
-    if last:
-        try:
-            delta = (datetime.utcnow() - datetime.fromisoformat(last)).total_seconds()
-            if delta < seconds:
-                return False
-        except ValueError:
-            pass
-    set_user_data(0, user_id, "view_rate_limit_last", datetime.utcnow().isoformat())
-    return True
+    return not bus_view_limiter.hit(user_id)
 
 
 def _truncate(text: str, limit: int) -> str:
     return text if len(text) <= limit else text[:limit - 1] + "…"
 
 
+def _load_route_snapshot(route_key: int) -> tuple[dict, Optional[dict]]:
+    info = busapi.get_complete_bus_info(route_key)
+    routes = busapi.fetch_route(route_key)
+    return info, routes[0] if routes else None
+
+
+def _log_snapshot_error(route_key: int, error: BaseException):
+    log(f"背景更新路線 {route_key} 的到站資訊失敗：{error}", level=logging.WARNING, module_name="TWBus")
+
+
+# 路線到站資訊快取：同一路線短時間內只查一次 API，稍舊的資料先回傳再背景更新
+route_snapshots = RouteSnapshotCache(_load_route_snapshot, on_error=_log_snapshot_error)
+
+
 # Helper function to fetch stop info
-def fetch_stop_context(route_key: int, stop_id: int) -> Optional[dict]:
+async def fetch_stop_context(route_key: int, stop_id: int) -> Optional[dict]:
     """取得站牌資訊與其所屬路徑的完整站牌列表（供上一站/下一站/路線總覽使用）。"""
-    info = busapi.get_complete_bus_info(route_key)
-    route = busapi.fetch_route(route_key)[0]
-
-    for path_id, path_data in info.items():
-        stops = path_data["stops"]
-        for index, stop in enumerate(stops):
-            if stop["stop_id"] == stop_id:
-                stop_info = dict(stop)
-                stop_info["route_name"] = route["route_name"]
-                stop_info["path_name"] = path_data.get("name", "")
-                return {
-                    "stop": stop_info,
-                    "route": route,
-                    "path_id": path_id,
-                    "stops": stops,
-                    "index": index,
-                }
-    return None
-
-
-def fetch_stop_info(route_key: int, stop_id: int) -> dict:
+    snapshot = await route_snapshots.get(route_key)
+    location = snapshot.locate(stop_id)
+    if location is None or snapshot.route is None:
+        return None
+
+    path_id, index = location
+    path_data = snapshot.info[path_id]
+    stops = path_data["stops"]
+    stop_info = dict(stops[index])
+    stop_info["route_name"] = snapshot.route["route_name"]
+    stop_info["path_name"] = path_data.get("name", "")
+    return {
+        "stop": stop_info,
+        "route": snapshot.route,
+        "path_id": path_id,
+        "stops": stops,
+        "index": index,
+        "fetched_at": snapshot.fetched_at_utc,
+    }
+
+
+async def fetch_stop_info(route_key: int, stop_id: int) -> dict:
     """Fetch complete stop information including route and path details."""
-    ctx = fetch_stop_context(route_key, stop_id)
+    ctx = await fetch_stop_context(route_key, stop_id)
     return ctx["stop"] if ctx else {}
 
 
@@ -162,16 +163,9 @@ class GenericActionsView(discord.ui.View):
             await interaction.response.send_message("你無權限使用此按鈕。", ephemeral=True)
             return
 
-        user_last_used = get_user_data(0, str(interaction.user.id), "rate_limit_last", None)
-        if user_last_used:
-            last_time = datetime.fromisoformat(user_last_used)
-            now = datetime.utcnow()
-            delta = (now - last_time).total_seconds()
-            if delta < 10:
-                await interaction.response.send_message("你操作的太快了，請稍後再試。", ephemeral=True)
-                return
-
-        set_user_data(0, str(interaction.user.id), "rate_limit_last", datetime.utcnow().isoformat())
+        if bus_command_limiter.hit(interaction.user.id):
+            await interaction.response.send_message("你操作的太快了，請稍後再試。", ephemeral=True)
+            return
 
         try:
             embed, map_url = await self.refresh_callback()
@@ -206,7 +200,7 @@ class BaseBusView(discord.ui.View):
         if interaction.user.id != self.owner_id:
             await interaction.response.send_message("你無權限使用此按鈕。", ephemeral=True)
             return False
-        if not check_view_rate_limit(str(interaction.user.id)):
+        if not check_view_rate_limit(interaction.user.id):
             await interaction.response.send_message("你操作的太快了，請稍後再試。", ephemeral=True)
             return False
         self.message = interaction.message
@@ -235,6 +229,7 @@ class BusRouteView(BaseBusView):
         self.route_key = route_key
         self.route = route
         self.info: dict = {}
+        self.fetched_at: Optional[datetime] = None
         self.path_ids: list = []
         self.path_index = 0
         self.page = page
@@ -242,11 +237,13 @@ class BusRouteView(BaseBusView):
         self.stop_select: Optional[discord.ui.Select] = None
 
     async def fetch(self) -> bool:
-        info = await asyncio.to_thread(busapi.get_complete_bus_info, self.route_key)
+        snapshot = await route_snapshots.get(self.route_key)
+        info = snapshot.info
         path_ids = [pid for pid, pdata in info.items() if pdata["stops"]]
         if not path_ids:
             return False
         self.info = info
+        self.fetched_at = snapshot.fetched_at_utc
         self.path_ids = path_ids
         if self._want_path_id in self.path_ids:
             self.path_index = self.path_ids.index(self._want_path_id)
@@ -310,7 +307,7 @@ class BusRouteView(BaseBusView):
 
         embed = discord.Embed(title=title, description=description, color=0x3498DB)
         embed.set_footer(text=f"第 {self.page + 1}/{pages} 頁 ・ 共 {len(stops)} 站 ・ 上次更新")
-        embed.timestamp = datetime.now(timezone.utc)
+        embed.timestamp = self.fetched_at or datetime.now(timezone.utc)
         return embed
 
     def rebuild_items(self):
@@ -438,7 +435,7 @@ class BusStopView(BaseBusView):
         self.map_url: Optional[str] = None
 
     async def fetch(self) -> bool:
-        ctx = await asyncio.to_thread(fetch_stop_context, self.route_key, self.stop_id)
+        ctx = await fetch_stop_context(self.route_key, self.stop_id)
         if not ctx:
             return False
         self.ctx = ctx
@@ -446,6 +443,7 @@ class BusStopView(BaseBusView):
         prev_stop = (stops[index - 1].get("stop_name") or "").strip() if index > 0 else None
         next_stop = (stops[index + 1].get("stop_name") or "").strip() if index < len(stops) - 1 else None
         self.embed, self.map_url = make_bus_embed(ctx["stop"], prev_stop, next_stop)
+        self.embed.timestamp = ctx["fetched_at"]
         return True
 
     def build_embed(self) -> discord.Embed:
@@ -970,7 +968,7 @@ class TWBus(commands.GroupCog, name=app_commands.locale_str("bus")):
                     route_key_int = int(route_key)
                     stop_id_int = int(stop_id)
 
-                    stop_info = await asyncio.to_thread(fetch_stop_info, route_key_int, stop_id_int)
+                    stop_info = await fetch_stop_info(route_key_int, stop_id_int)
                     if stop_info:
                         title, text = make_bus_text(stop_info)
                         return ("bus", stop_identifier, title, text, None)
@@ -0,0 +1,93 @@
+"""Bounded TTL cache of resolved Discord users.
+
+Leaderboards list users that are often no longer in the client cache, and
+``bot.fetch_user`` costs one HTTP round-trip each. ``UserCache.resolve_many``
+looks users up in the client cache first and fetches the rest concurrently,
+a few at a time. It remembers the results, including users that no longer
+exist, so the next leaderboard reuses them.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+import discord
+
+USER_CACHE_SIZE = 2048
+USER_CACHE_TTL = 600.0
+MAX_CONCURRENT_FETCHES = 8
+
+
+class UserCache:
+    def __init__(self, client: discord.Client, max_size: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL,
+                 concurrency: int = MAX_CONCURRENT_FETCHES):
+        self.client = client
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[int, tuple] = OrderedDict()  # user_id -> (expires_at, user or None)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._fetching: dict[int, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _get(self, user_id: int, now: float):
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return False, None
+        if entry[0] <= now:
+            del self._entries[user_id]
+            return False, None
+        self._entries.move_to_end(user_id)
+        return True, entry[1]
+
+    def _put(self, user_id: int, user, now: float):
+        self._entries[user_id] = (now + self.ttl, user)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def _fetch(self, user_id: int):
+        async with self._semaphore:
+            try:
+                user = await self.client.fetch_user(user_id)
+            except discord.NotFound:
+                user = None
+        self._put(user_id, user, time.monotonic())
+        return user
+
+    async def _fetch_shared(self, user_id: int):
+        """Concurrent lookups of the same user share one request"""
+        pending = self._fetching.get(user_id)
+        if pending is None:
+            pending = asyncio.ensure_future(self._fetch(user_id))
+            self._fetching[user_id] = pending
+            pending.add_done_callback(lambda _: self._fetching.pop(user_id, None))
+        try:
+            return await asyncio.shield(pending)
+        except discord.HTTPException:
+            return None
+
+    async def resolve(self, user_id: int) -> Optional[discord.User]:
+        return (await self.resolve_many((user_id,)))[user_id]
+
+    async def resolve_many(self, user_ids: Iterable[int]) -> dict:
+        """{user_id: User or None}; None for users that do not exist or could not be fetched"""
+        now = time.monotonic()
+        resolved = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            user = self.client.get_user(user_id)
+            if user is not None:
+                resolved[user_id] = user
+                continue
+            hit, user = self._get(user_id, now)
+            if hit:
+                resolved[user_id] = user
+            else:
+                missing.append(user_id)
+        if missing:
+            users = await asyncio.gather(*(self._fetch_shared(user_id) for user_id in missing))
+            resolved.update(zip(missing, users))
+        return resolved
@@ -1,6 +1,6 @@
 import os
 import json
-import math
+import atexit
 import threading
 import time
 import sqlite3
@@ -25,6 +25,9 @@ load_dotenv()
 
 from auth_utils import generate_api_key, validate_api_key_structure
 from db_init import init_db
+from warning_grid import TownGrid, build_arrival_times_scalar, np
+from point_ledger import ApiKeyCache, PointLedger
+from upstream_client import UpstreamClient
 
 try:
     from flask_socketio import SocketIO
@@ -47,6 +50,10 @@ COST_PER_API = float(os.getenv("COST_PER_API", "1.0"))
 COST_PER_SCREENSHOT = float(os.getenv("COST_PER_SCREENSHOT", "5.0"))
 COST_PER_SEC_WS = float(os.getenv("COST_PER_SEC_WS", "0.01"))
 WARNING_S_WAVE_SPEED_KMPS = float(os.getenv("WARNING_S_WAVE_SPEED_KMPS", "4.0"))
+API_KEY_CACHE_TTL = float(os.getenv("API_KEY_CACHE_TTL", "30"))
+LEDGER_FLUSH_INTERVAL = float(os.getenv("LEDGER_FLUSH_INTERVAL", "1.0"))
+LEDGER_JOURNAL_PATH = os.getenv("LEDGER_JOURNAL_PATH") or None
+SCREENSHOT_MAX_AGE = float(os.getenv("SCREENSHOT_MAX_AGE", "60"))
 TOWN_ID_PATH = Path(__file__).resolve().parent.parent / "town_id.json"
 TAIWAN_TZ = timezone(timedelta(hours=8))
 
@@ -101,6 +108,8 @@ else:
 
 CACHE = {"report": None, "warning": None}
 CACHE_SCREENSHOT = {"report": None, "warning": None}
+# 上游只有一個渲染器：所有請求共用一個 client，同時間的相同請求合併成一次
+upstream_client = UpstreamClient(UPSTREAM_URL, UPSTREAM_INFO_ENDPOINTS, screenshot_max_age=SCREENSHOT_MAX_AGE)
 
 
 def load_town_locations():
@@ -126,6 +135,7 @@ def load_town_locations():
 
 
 TOWN_LOCATIONS = load_town_locations()
+TOWN_GRID = TownGrid(TOWN_LOCATIONS, WARNING_S_WAVE_SPEED_KMPS) if np is not None else None
 
 connected_clients = {}
 connected_clients_lock = threading.Lock()
@@ -173,19 +183,6 @@ def fetch_user_by_discord_id(discord_id: str):
     return dict(row) if row else None
 
 
-def fetch_user_by_key(api_key: str):
-    discord_id = validate_api_key_structure(api_key)
-    if not discord_id:
-        return None
-
-    row = get_db().execute(
-        "SELECT discord_id, api_key, points, updated_at FROM users WHERE api_key = ?",
-        (api_key,),
-    ).fetchone()
-    if not row or row["discord_id"] != discord_id:
-        return None
-    return dict(row)
-
 def is_user_whitelisted(discord_id: str) -> bool:
     if not WHITELIST_ON:
         return True
@@ -220,6 +217,9 @@ def create_or_get_user(discord_id: str):
 def reset_user_api_key(discord_id: str):
     if not is_user_whitelisted(discord_id):
         return None
+    old_user = fetch_user_by_discord_id(discord_id)
+    if old_user:
+        api_key_cache.invalidate(old_user["api_key"])
     new_api_key = generate_api_key(discord_id)
     db = get_db()
     db.execute(
@@ -230,18 +230,33 @@ def reset_user_api_key(discord_id: str):
     return fetch_user_by_discord_id(discord_id)
 
 
-def deduct_points_by_key(api_key: str, amount: float) -> bool:
-    db = get_db()
-    cursor = db.execute(
-        """
-        UPDATE users
-        SET points = points - ?, updated_at = CURRENT_TIMESTAMP
-        WHERE api_key = ? AND points >= ?
-        """,
-        (amount, api_key, amount),
-    )
-    db.commit()
-    return cursor.rowcount > 0
+def load_api_user(api_key: str):
+    """API Key 對應的使用者與白名單狀態；不依賴 request context，WebSocket 連線也能用"""
+    discord_id = validate_api_key_structure(api_key)
+    if not discord_id:
+        return None
+
+    db = sqlite3.connect(DB_PATH)
+    db.row_factory = sqlite3.Row
+    try:
+        row = db.execute(
+            "SELECT discord_id, api_key FROM users WHERE api_key = ?",
+            (api_key,),
+        ).fetchone()
+        if not row or row["discord_id"] != discord_id:
+            return None
+        whitelisted = not WHITELIST_ON or db.execute(
+            "SELECT 1 FROM whitelist WHERE discord_id = ?",
+            (discord_id,),
+        ).fetchone() is not None
+    finally:
+        db.close()
+    return {"discord_id": row["discord_id"], "api_key": row["api_key"], "whitelisted": whitelisted}
+
+
+# 每個請求都查資料庫、寫一次點數太慢了：API Key 快取一段時間，扣點先記在記憶體再批次寫入
+api_key_cache = ApiKeyCache(load_api_user, ttl=API_KEY_CACHE_TTL)
+point_ledger = PointLedger(DB_PATH, LEDGER_JOURNAL_PATH)
 
 
 def require_api_key(cost: float = COST_PER_API):
@@ -252,15 +267,13 @@ def require_api_key(cost: float = COST_PER_API):
             if not api_key:
                 return jsonify({"error": "Missing API Key"}), 401
 
-            user = fetch_user_by_key(api_key)
+            user = api_key_cache.get(api_key)
             if not user:
                 return jsonify({"error": "Invalid API Key"}), 401
-            if WHITELIST_ON and not is_user_whitelisted(user["discord_id"]):
+            if not user["whitelisted"]:
                 return jsonify({"error": "Unauthorized"}), 403
-            if user["points"] < cost:
+            if not point_ledger.charge(user["discord_id"], cost):
                 return jsonify({"error": "Insufficient Points"}), 402
-            if not deduct_points_by_key(api_key, cost):
-                return jsonify({"error": "Transaction Failed"}), 500
 
             g.api_user = user
             g.api_key = api_key
@@ -285,6 +298,10 @@ def require_login(func):
             if request.path.startswith("/api/"):
                 return jsonify({"error": "Unauthorized"}), 401
             return "You are not whitelisted to use this service.", 403
+        user = dict(user)
+        balance = point_ledger.balance(discord_id)
+        if balance is not None:
+            user["points"] = balance  # 含尚未寫入的扣點
         g.session_user = user
         return func(*args, **kwargs)
 
@@ -327,174 +344,22 @@ def parse_warning_origin(time_text: str):
         return None
 
 
-def haversine_km(lat1, lon1, lat2, lon2):
-    lat1_rad = math.radians(lat1)
-    lon1_rad = math.radians(lon1)
-    lat2_rad = math.radians(lat2)
-    lon2_rad = math.radians(lon2)
-
-    dlat = lat2_rad - lat1_rad
-    dlon = lon2_rad - lon1_rad
-    a = math.sin(dlat / 2) ** 2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2) ** 2
-    return 6371.0 * 2 * math.asin(math.sqrt(a))
-
-
-INTENSITY_LABELS = [
-    "0\u7d1a",
-    "1\u7d1a",
-    "2\u7d1a",
-    "3\u7d1a",
-    "4\u7d1a",
-    "5\u5f31",
-    "5\u5f37",
-    "6\u5f31",
-    "6\u5f37",
-    "7\u7d1a",
-]
-INTENSITY_TO_RANK = {label: rank for rank, label in enumerate(INTENSITY_LABELS)}
-INTENSITY_ALIASES = {
-    "0": "0\u7d1a",
-    "1": "1\u7d1a",
-    "2": "2\u7d1a",
-    "3": "3\u7d1a",
-    "4": "4\u7d1a",
-    "5-": "5\u5f31",
-    "5+": "5\u5f37",
-    "6-": "6\u5f31",
-    "6+": "6\u5f37",
-    "7": "7\u7d1a",
-}
-
-
-def normalize_intensity_label(label):
-    if label is None:
-        return None
-
-    text = str(label).strip()
-    if not text:
-        return None
-    if text in INTENSITY_TO_RANK:
-        return text
-    if text in INTENSITY_ALIASES:
-        return INTENSITY_ALIASES[text]
-
-    compact = text.replace(" ", "")
-    if compact in INTENSITY_TO_RANK:
-        return compact
-    if compact in INTENSITY_ALIASES:
-        return INTENSITY_ALIASES[compact]
-    if compact.endswith("\u7d1a") and compact[:-1].isdigit():
-        return f"{int(compact[:-1])}\u7d1a"
-    if compact.isdigit():
-        return f"{int(compact)}\u7d1a"
-    return None
-
-
-def intensity_rank_to_label(rank: int) -> str:
-    rank = max(0, min(rank, len(INTENSITY_LABELS) - 1))
-    return INTENSITY_LABELS[rank]
-
-
-def estimate_intensity_label(magnitude: float, depth_km: float, hypocenter_distance_km: float) -> str:
-    # Preview estimate only. The old version was too conservative for towns near
-    # the epicenter, so this uses a stronger source term before we anchor to the
-    # upstream max intensity.
-    source_term = 0.58 * magnitude + 0.0038 * depth_km - 0.05
-    attenuation = math.log10(
-        hypocenter_distance_km + 0.0028 * (10 ** (0.5 * magnitude))
-    ) + 0.002 * hypocenter_distance_km
-    pga = 10 ** (source_term - attenuation)
-
-    if pga < 0.8:
-        return "0\u7d1a"
-    if pga < 2.5:
-        return "1\u7d1a"
-    if pga < 8.0:
-        return "2\u7d1a"
-    if pga < 25.0:
-        return "3\u7d1a"
-    if pga < 80.0:
-        return "4\u7d1a"
-    if pga < 140.0:
-        return "5\u5f31"
-    if pga < 250.0:
-        return "5\u5f37"
-    if pga < 440.0:
-        return "6\u5f31"
-    if pga < 800.0:
-        return "6\u5f37"
-    return "7\u7d1a"
-
-
-def calibrate_estimated_intensities(estimated_intensities: dict, warning_data: dict) -> dict:
-    official_max_label = normalize_intensity_label(warning_data.get("maxIntensity"))
-    if not official_max_label or not estimated_intensities:
-        return estimated_intensities
-
-    official_max_rank = INTENSITY_TO_RANK[official_max_label]
-    current_max_rank = max(
-        INTENSITY_TO_RANK.get(normalize_intensity_label(label) or "0\u7d1a", 0)
-        for label in estimated_intensities.values()
-    )
-    delta = official_max_rank - current_max_rank
-    if delta <= 0:
-        return estimated_intensities
-
-    adjusted = {}
-    for town_id, label in estimated_intensities.items():
-        normalized = normalize_intensity_label(label) or "0\u7d1a"
-        adjusted_rank = INTENSITY_TO_RANK[normalized] + delta
-        adjusted[town_id] = intensity_rank_to_label(adjusted_rank)
-    return adjusted
-
-
 def build_warning_arrival_times(warning_data: dict):
     if not warning_data:
         return {}, {}
 
-    try:
-        epicenter_lat = float(warning_data["location"]["latitude"])
-        epicenter_lon = float(warning_data["location"]["longitude"])
-        depth_km = float(warning_data["depth"])
-        magnitude = float(warning_data["magnitude"])
-    except (KeyError, TypeError, ValueError):
-        return {}, {}
-
     origin = parse_warning_origin(warning_data.get("time"))
     now = datetime.now(TAIWAN_TZ)
     elapsed_seconds = max(0.0, (now - origin).total_seconds()) if origin else 0.0
 
-    arrival_times = {}
-    raw_estimated_intensities = {}
-    for town_id, info in TOWN_LOCATIONS.items():
-        latitude = info.get("latitude")
-        longitude = info.get("longitude")
-        if latitude is None or longitude is None:
-            continue
-
-        horizontal_distance_km = haversine_km(epicenter_lat, epicenter_lon, latitude, longitude)
-        hypocenter_distance_km = math.sqrt(horizontal_distance_km ** 2 + depth_km ** 2)
-        travel_seconds = hypocenter_distance_km / WARNING_S_WAVE_SPEED_KMPS
-        remaining_seconds = max(0, math.ceil(travel_seconds - elapsed_seconds))
-        raw_estimated_intensities[town_id] = estimate_intensity_label(
-            magnitude,
-            depth_km,
-            hypocenter_distance_km,
+    if TOWN_GRID is None:
+        return build_arrival_times_scalar(
+            warning_data,
+            TOWN_LOCATIONS,
+            WARNING_S_WAVE_SPEED_KMPS,
+            elapsed_seconds,
         )
-
-        if remaining_seconds > 0:
-            arrival_times[town_id] = remaining_seconds
-
-    calibrated_estimated_intensities = calibrate_estimated_intensities(
-        raw_estimated_intensities,
-        warning_data,
-    )
-    estimated_intensities = {
-        town_id: level
-        for town_id, level in calibrated_estimated_intensities.items()
-        if level != "0\u7d1a"
-    }
-    return arrival_times, estimated_intensities
+    return TOWN_GRID.arrival_times(warning_data, elapsed_seconds)
 
 
 def enrich_warning_payload(payload: dict):
@@ -512,41 +377,27 @@ def enrich_warning_payload(payload: dict):
 
 def update_cache(type_: str):
     try:
-        endpoint = UPSTREAM_INFO_ENDPOINTS.get(type_)
-        if not endpoint:
-            print(f"未知快取類型 ({type_})")
+        payload, _changed = upstream_client.run(upstream_client.fetch_info(type_))
+        if not payload.get("ok", False):
+            print(f"更新快取失敗 ({type_}): 上游回傳 ok=false")
             return
 
-        response = requests.get(f"{UPSTREAM_URL}{endpoint}", timeout=5)
-        if response.ok:
-            payload = response.json()
-            if not payload.get("ok", False):
-                print(f"更新快取失敗 ({type_}): 上游回傳 ok=false")
-                return
-
-            if type_ == "warning":
-                payload = enrich_warning_payload(payload)
-
-            CACHE[type_] = payload
-            mark_event_status(type_, "last_cache_update_at", utc_now())
-            print(f"[{type_}] 資料快取已更新")
-        else:
-            print(f"更新快取失敗 ({type_}): HTTP {response.status_code}")
+        if type_ == "warning":
+            payload = enrich_warning_payload(payload)
+
+        CACHE[type_] = payload
+        mark_event_status(type_, "last_cache_update_at", utc_now())
+        print(f"[{type_}] 資料快取已更新")
     except Exception as exc:
         print(f"更新快取失敗 ({type_}): {exc}")
 
 
 def update_screenshot_cache(type_: str):
+    # 資料版本沒變、截圖也還沒過期時不會重新截圖
     try:
-        if type_ == "report":
-            requests.get(f"{UPSTREAM_URL}/gotoReport", timeout=2)
-        elif type_ == "warning":
-            requests.get(f"{UPSTREAM_URL}/gotoWarning", timeout=2)
-
-        time.sleep(0.2)
-        response = requests.get(f"{UPSTREAM_URL}/screenshot", timeout=5)
-        if response.ok:
-            CACHE_SCREENSHOT[type_] = response.content
+        image_data = upstream_client.run(upstream_client.screenshot(type_))
+        if image_data is not CACHE_SCREENSHOT[type_]:
+            CACHE_SCREENSHOT[type_] = image_data
             mark_event_status(type_, "last_screenshot_update_at", utc_now())
             print(f"[{type_}] 截圖快取已更新")
     except Exception as exc:
@@ -805,6 +656,7 @@ def get_screenshot(type_):
     if type_ not in {"report", "warning"}:
         return jsonify({"error": "Invalid type"}), 400
 
+    update_screenshot_cache(type_)
     image_data = CACHE_SCREENSHOT.get(type_)
     if image_data is None:
         return jsonify({"error": "Cache not ready"}), 503
@@ -958,27 +810,17 @@ def openapi_spec():
 def handle_connect():
     api_key = request.headers.get("X-API-Key") or request.args.get("api_key")
 
-    with app.app_context():
-        db = sqlite3.connect(DB_PATH)
-        db.row_factory = sqlite3.Row
-        try:
-            discord_id = validate_api_key_structure(api_key)
-            if not discord_id:
-                return False
-
-            row = db.execute(
-                "SELECT discord_id, api_key, points FROM users WHERE api_key = ?",
-                (api_key,),
-            ).fetchone()
-            if not row or row["discord_id"] != discord_id or row["points"] <= 0:
-                return False
-        finally:
-            db.close()
+    user = api_key_cache.get(api_key) if api_key else None
+    if not user:
+        return False
+    balance = point_ledger.balance(user["discord_id"])
+    if balance is None or balance <= 0:
+        return False
 
     with connected_clients_lock:
         connected_clients[request.sid] = {
             "api_key": api_key,
-            "discord_id": row["discord_id"],
+            "discord_id": user["discord_id"],
         }
     print(f"Client connected: {request.sid}")
 
@@ -998,25 +840,13 @@ def ws_billing_task():
         if not items:
             continue
 
-        db = sqlite3.connect(DB_PATH)
-        try:
-            cost = COST_PER_SEC_WS * 5
-            to_disconnect = []
-            for sid, info in items:
-                api_key = info["api_key"]
-                cursor = db.execute(
-                    """
-                    UPDATE users
-                    SET points = points - ?, updated_at = CURRENT_TIMESTAMP
-                    WHERE api_key = ? AND points >= ?
-                    """,
-                    (cost, api_key, cost),
-                )
-                if cursor.rowcount == 0:
-                    to_disconnect.append(sid)
-            db.commit()
-        finally:
-            db.close()
+        cost = COST_PER_SEC_WS * 5
+        to_disconnect = []
+        for sid, info in items:
+            # API Key 重設後舊連線也一併斷開
+            user = api_key_cache.get(info["api_key"])
+            if not user or not point_ledger.charge(user["discord_id"], cost):
+                to_disconnect.append(sid)
 
         for sid in to_disconnect:
             socketio.server.disconnect(sid)
@@ -1032,6 +862,7 @@ def get_api_info() -> dict:
             for name, values in system_status["events"].items()
         }
         app_started_at = system_status["app_started_at"]
+    upstream_client_stats = upstream_client.stats
 
     return {
         "connected_clients": count,
@@ -1044,6 +875,7 @@ def get_api_info() -> dict:
             "last_connected_at": format_dt(upstream["last_connected_at"]),
             "last_disconnected_at": format_dt(upstream["last_disconnected_at"]),
             "last_error": upstream["last_error"],
+            "requests": dict(upstream_client_stats),
         },
         "events": {
             name: {
@@ -1060,6 +892,11 @@ def get_api_info() -> dict:
 
 if __name__ == "__main__":
     init_db(DB_PATH)
+    recovered = point_ledger.recover()
+    if recovered:
+        print(f"已補寫 {recovered} 位使用者未寫入的扣點")
+    atexit.register(point_ledger.flush)
+    threading.Thread(target=point_ledger.run, args=(LEDGER_FLUSH_INTERVAL,), daemon=True).start()
     threading.Thread(target=start_upstream_sync, daemon=True).start()
     threading.Thread(target=ws_billing_task, daemon=True).start()
     try:
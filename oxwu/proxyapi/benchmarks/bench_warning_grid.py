@@ -0,0 +1,77 @@
+"""Warning enrichment cost: per-town scalar loop vs NumPy grid, cold and per cached revision.
+
+Usage: python benchmarks/bench_warning_grid.py [rounds]
+"""
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+PROXYAPI_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROXYAPI_DIR))
+
+from warning_grid import TownGrid, build_arrival_times_scalar
+
+TOWN_ID_PATH = PROXYAPI_DIR.parent / "town_id.json"
+S_WAVE_SPEED_KMPS = 4.0
+
+
+def load_towns():
+    with TOWN_ID_PATH.open("r", encoding="utf-8") as fp:
+        raw = json.load(fp)
+    return {
+        town_id: {"latitude": info.get("latitude"), "longitude": info.get("longitude")}
+        for town_id, info in raw.items()
+        if isinstance(info, dict)
+    }
+
+
+def make_warnings(count):
+    rng = random.Random(1)
+    warnings = []
+    for index in range(count):
+        warnings.append({
+            "ok": True,
+            "time": f"2026-01-01 00:{index // 60:02d}:{index % 60:02d}",
+            "location": {"latitude": rng.uniform(21.5, 25.5), "longitude": rng.uniform(119.5, 122.5)},
+            "depth": rng.uniform(5, 80),
+            "magnitude": rng.uniform(4.0, 7.5),
+            "maxIntensity": rng.choice([None, "4級", "5弱", "6強"]),
+        })
+    return warnings
+
+
+def measure(func, calls):
+    start = time.perf_counter()
+    for args in calls:
+        func(*args)
+    return (time.perf_counter() - start) / len(calls) * 1000
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    towns = load_towns()
+    warnings = make_warnings(20)
+    # an active warning is re-enriched on every update with the same hypocenter
+    calls = [(warnings[i % len(warnings)], (i % 30) * 0.5) for i in range(rounds)]
+
+    mismatches = 0
+    grid = TownGrid(towns, S_WAVE_SPEED_KMPS, cache_size=0)
+    for warning, elapsed in calls[:len(warnings)]:
+        if grid.arrival_times(warning, elapsed) != build_arrival_times_scalar(warning, towns, S_WAVE_SPEED_KMPS, elapsed):
+            mismatches += 1
+
+    cached = TownGrid(towns, S_WAVE_SPEED_KMPS, cache_size=len(warnings))
+    results = {
+        "scalar loop": measure(lambda w, e: build_arrival_times_scalar(w, towns, S_WAVE_SPEED_KMPS, e), calls),
+        "numpy (cold)": measure(grid.arrival_times, calls),
+        "numpy (cached)": measure(cached.arrival_times, calls),
+    }
+    print(f"{len(grid)} towns, {rounds} enrichments, {mismatches} mismatching results")
+    for name, ms in results.items():
+        print(f"{name:16} {ms:8.3f} ms/enrichment")
+
+
+if __name__ == "__main__":
+    main()
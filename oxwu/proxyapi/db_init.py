@@ -14,6 +14,10 @@ def init_db(db_path: str = "database.db"):
         );
         CREATE TABLE IF NOT EXISTS whitelist (
             discord_id TEXT PRIMARY KEY
+        );
+        CREATE TABLE IF NOT EXISTS ledger_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            applied_seq INTEGER NOT NULL
         )
         '''
     )
@@ -0,0 +1,300 @@
+"""API key lookups and point deductions without a SQLite write per request.
+
+``ApiKeyCache`` remembers which user (and whitelist state) an API key maps
+to for ``ttl`` seconds, unknown keys included.
+
+``PointLedger`` keeps each user's balance in memory and reserves charges
+against it, so a request is refused (402) exactly when its cost exceeds
+what is left after the charges not yet written. Before refusing, the
+balance is re-read from the database, so points added by the Discord bot
+count immediately. Pending deductions are written by ``flush`` in a single
+transaction.
+
+The Discord bot is a separate process and can also lower a balance, which
+the cached copy does not see until it is re-read (at most ``balance_ttl``
+seconds, or the next flush for users who were charged). ``flush`` therefore
+never takes a balance below zero: it deducts at most what is there, prints
+the shortfall and refreshes the cached balances from what it wrote.
+
+Every charge is first appended to a journal file with a sequence number.
+``flush`` stores the last applied sequence number in ``ledger_state`` in the
+same transaction as the deductions, and ``recover`` replays whatever a crash
+left in the journal past that number. A charge is therefore applied exactly
+once even if the process dies between the commit and the journal cleanup.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional
+
+KEY_CACHE_TTL = 30.0
+BALANCE_TTL = 10.0
+FLUSH_INTERVAL = 1.0
+
+
+class ApiKeyCache:
+    def __init__(self, loader: Callable[[str], Optional[dict]], ttl: float = KEY_CACHE_TTL, max_size: int = 4096):
+        self.loader = loader
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: dict[str, tuple] = {}  # api_key -> (expires_at, user or None)
+        self._lock = threading.Lock()
+
+    def get(self, api_key: str) -> Optional[dict]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(api_key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+
+        user = self.loader(api_key)
+        with self._lock:
+            if len(self._entries) >= self.max_size:
+                self._entries = {key: value for key, value in self._entries.items() if value[0] > now}
+                if len(self._entries) >= self.max_size:
+                    self._entries.clear()
+            self._entries[api_key] = (now + self.ttl, user)
+        return user
+
+    def invalidate(self, api_key: Optional[str] = None):
+        with self._lock:
+            if api_key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(api_key, None)
+
+
+class _Account:
+    __slots__ = ("points", "pending", "loaded_at")
+
+    def __init__(self, points: float, pending: float, loaded_at: float):
+        self.points = points  # balance in the database when last read or flushed
+        self.pending = pending  # charged but not in that balance yet
+        self.loaded_at = loaded_at
+
+    @property
+    def available(self) -> float:
+        return self.points - self.pending
+
+
+class PointLedger:
+    def __init__(self, db_path: str, journal_path: Optional[str] = None, balance_ttl: float = BALANCE_TTL):
+        self.db_path = db_path
+        self.journal_path = journal_path or f"{db_path}.ledger"
+        self.flushing_path = f"{self.journal_path}.flushing"
+        self.balance_ttl = balance_ttl
+        self.flushes = 0
+        self._accounts: dict[str, _Account] = {}
+        self._pending: dict[str, float] = {}
+        # 正在寫入的那批，與寫完後 ledger_state 會記下的序號
+        self._inflight: dict[str, float] = {}
+        self._inflight_seq = 0
+        self._seq = 0
+        self._journal = None
+        self._state_ready = False
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path)
+
+    @staticmethod
+    def _ensure_state(db):
+        db.execute("CREATE TABLE IF NOT EXISTS ledger_state (id INTEGER PRIMARY KEY CHECK (id = 1), applied_seq INTEGER NOT NULL)")
+        row = db.execute("SELECT applied_seq FROM ledger_state WHERE id = 1").fetchone()
+        return row[0] if row else 0
+
+    def _read_journal(self, path: str, applied_seq: int) -> dict:
+        totals = {}
+        try:
+            with open(path, "r", encoding="utf-8") as fp:
+                for line in fp:
+                    parts = line.rstrip("\n").split("\t")
+                    if not line.endswith("\n") or len(parts) != 3:
+                        continue  # 寫到一半就中斷的最後一行
+                    seq, discord_id, amount = int(parts[0]), parts[1], float(parts[2])
+                    self._seq = max(self._seq, seq)
+                    if seq > applied_seq:
+                        totals[discord_id] = totals.get(discord_id, 0.0) + amount
+        except FileNotFoundError:
+            pass
+        return totals
+
+    def recover(self) -> int:
+        """Apply charges a previous run journaled but never flushed; returns how many users were charged"""
+        with self._flush_lock, self._lock:
+            db = self._connect()
+            try:
+                applied_seq = self._ensure_state(db)
+                self._seq = applied_seq
+                totals = {}
+                for path in (self.flushing_path, self.journal_path):
+                    for discord_id, amount in self._read_journal(path, applied_seq).items():
+                        totals[discord_id] = totals.get(discord_id, 0.0) + amount
+                self._write(db, totals, self._seq)
+            finally:
+                db.close()
+            for path in (self.flushing_path, self.journal_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._accounts.clear()
+            return len(totals)
+
+    @staticmethod
+    def _write(db, totals: dict, seq: int) -> dict:
+        """Deduct ``totals`` without going below zero; returns each user's new balance"""
+        balances = {}
+        with db:
+            # 先鎖住資料庫再讀餘額，讀到寫之間 bot 改不了點數
+            db.execute("BEGIN IMMEDIATE")
+            for discord_id, amount in totals.items():
+                row = db.execute("SELECT points FROM users WHERE discord_id = ?", (discord_id,)).fetchone()
+                if row is None:
+                    continue
+                points = float(row[0])
+                if amount > points:
+                    print(f"使用者 {discord_id} 的點數不足，少扣 {amount - points:g} 點")
+                balances[discord_id] = max(points - amount, 0.0)
+            db.executemany(
+                "UPDATE users SET points = MAX(points - ?, 0), updated_at = CURRENT_TIMESTAMP WHERE discord_id = ?",
+                [(totals[discord_id], discord_id) for discord_id in balances],
+            )
+            db.execute(
+                "INSERT INTO ledger_state (id, applied_seq) VALUES (1, ?) "
+                "ON CONFLICT(id) DO UPDATE SET applied_seq = excluded.applied_seq",
+                (seq,),
+            )
+        return balances
+
+    def _read_points(self, discord_id: str) -> Optional[tuple]:
+        """(points, applied_seq) from one snapshot, or None for an unknown user"""
+        db = self._connect()
+        try:
+            if not self._state_ready:
+                with db:
+                    self._ensure_state(db)
+                self._state_ready = True
+            row = db.execute(
+                "SELECT points, (SELECT applied_seq FROM ledger_state WHERE id = 1) FROM users WHERE discord_id = ?",
+                (discord_id,),
+            ).fetchone()
+        finally:
+            db.close()
+        return (float(row[0]), row[1] or 0) if row else None
+
+    def _load(self, discord_id: str, now: float, force: bool = False) -> Optional[_Account]:
+        """Called with the lock held"""
+        account = self._accounts.get(discord_id)
+        if account is None or force or now - account.loaded_at > self.balance_ttl:
+            row = self._read_points(discord_id)
+            if row is None:
+                self._accounts.pop(discord_id, None)
+                return None
+            points, applied_seq = row
+            pending = self._pending.get(discord_id, 0.0)
+            if applied_seq < self._inflight_seq:
+                pending += self._inflight.get(discord_id, 0.0)  # 正在寫入的那批還沒提交
+            if account is None:
+                account = self._accounts[discord_id] = _Account(points, pending, now)
+            else:
+                account.points = points
+                account.pending = pending
+                account.loaded_at = now
+        return account
+
+    def balance(self, discord_id: str) -> Optional[float]:
+        """Balance including charges not yet flushed"""
+        with self._lock:
+            account = self._load(discord_id, time.monotonic())
+            return account.available if account else None
+
+    def charge(self, discord_id: str, amount: float) -> bool:
+        """Reserve ``amount`` points; False when the balance is insufficient"""
+        with self._lock:
+            now = time.monotonic()
+            account = self._load(discord_id, now)
+            if account is not None and account.available < amount:
+                # 可能剛被加點，拒絕前再讀一次資料庫
+                account = self._load(discord_id, now, force=True)
+            if account is None or account.available < amount:
+                return False
+
+            self._seq += 1
+            if self._journal is None:
+                self._journal = open(self.journal_path, "a", encoding="utf-8")
+            self._journal.write(f"{self._seq}\t{discord_id}\t{amount!r}\n")
+            self._journal.flush()
+            account.pending += amount
+            self._pending[discord_id] = self._pending.get(discord_id, 0.0) + amount
+            return True
+
+    def _rotate_journal(self):
+        """Called with the lock held: move the journal aside so new charges start a fresh file"""
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if not os.path.exists(self.journal_path):
+            return
+        if os.path.exists(self.flushing_path):
+            # 上一次寫入失敗，把新的紀錄接在後面一起重試
+            with open(self.journal_path, "r", encoding="utf-8") as src, open(self.flushing_path, "a", encoding="utf-8") as dst:
+                dst.write(src.read())
+            os.remove(self.journal_path)
+        else:
+            os.replace(self.journal_path, self.flushing_path)
+
+    def flush(self) -> int:
+        """Write every pending deduction in one transaction; returns how many users were charged"""
+        with self._flush_lock:
+            with self._lock:
+                totals = self._pending
+                if not totals:
+                    return 0
+                self._pending = {}
+                seq = self._seq
+                self._rotate_journal()
+                self._inflight = totals
+                self._inflight_seq = seq
+
+            try:
+                db = self._connect()
+                try:
+                    balances = self._write(db, totals, seq)
+                finally:
+                    db.close()
+            except Exception:
+                with self._lock:
+                    self._inflight = {}
+                    self._inflight_seq = 0
+                    for discord_id, amount in totals.items():
+                        self._pending[discord_id] = self._pending.get(discord_id, 0.0) + amount
+                raise
+
+            os.remove(self.flushing_path)
+            with self._lock:
+                self._inflight = {}
+                self._inflight_seq = 0
+                now = time.monotonic()
+                # 用剛寫入的餘額對帳，bot 那邊改過的點數也會算進來
+                for discord_id in totals:
+                    account = self._accounts.get(discord_id)
+                    if account is None:
+                        continue
+                    if discord_id in balances:
+                        account.points = balances[discord_id]
+                        account.pending = self._pending.get(discord_id, 0.0)
+                        account.loaded_at = now
+                    else:
+                        self._accounts.pop(discord_id)
+            self.flushes += 1
+            return len(totals)
+
+    def run(self, interval: float = FLUSH_INTERVAL):
+        while True:
+            time.sleep(interval)
+            try:
+                self.flush()
+            except Exception as exc:
+                print(f"寫入點數紀錄失敗: {exc}")
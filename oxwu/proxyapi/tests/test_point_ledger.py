@@ -0,0 +1,161 @@
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+from contextlib import closing
+from pathlib import Path
+from unittest.mock import patch
+
+
+PROXYAPI_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROXYAPI_DIR))
+
+from db_init import init_db
+from point_ledger import PointLedger
+
+
+class PointLedgerTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = str(Path(self.tmp.name) / "database.db")
+        with patch("builtins.print"):
+            init_db(self.db_path)
+        self._set_points("1", 10.0)
+        self.ledger = self._ledger()
+
+    def tearDown(self):
+        for ledger in getattr(self, "_ledgers", []):
+            if ledger._journal is not None:
+                ledger._journal.close()
+        self.tmp.cleanup()
+
+    def _ledger(self, **kwargs) -> PointLedger:
+        ledger = PointLedger(self.db_path, **kwargs)
+        self._ledgers = getattr(self, "_ledgers", []) + [ledger]
+        return ledger
+
+    def _set_points(self, discord_id, points):
+        # 模擬 Discord bot（另一個行程）直接改資料庫
+        with closing(sqlite3.connect(self.db_path)) as conn, conn:
+            conn.execute(
+                "INSERT INTO users (discord_id, points) VALUES (?, ?) "
+                "ON CONFLICT(discord_id) DO UPDATE SET points = excluded.points",
+                (discord_id, points),
+            )
+
+    def _points(self, discord_id):
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            return conn.execute("SELECT points FROM users WHERE discord_id = ?", (discord_id,)).fetchone()[0]
+
+    def test_charge_is_refused_when_points_run_out(self):
+        self.assertTrue(self.ledger.charge("1", 6))
+        self.assertFalse(self.ledger.charge("1", 6))
+        self.assertEqual(self.ledger.balance("1"), 4.0)
+        self.assertFalse(self.ledger.charge("unknown", 1))
+
+    def test_refusal_rereads_points_added_by_the_bot(self):
+        self.assertTrue(self.ledger.charge("1", 10))
+        self._set_points("1", 25.0)
+        self.assertTrue(self.ledger.charge("1", 5))
+        self.assertEqual(self.ledger.balance("1"), 10.0)
+
+    def test_flush_writes_pending_deductions_once(self):
+        for _ in range(3):
+            self.ledger.charge("1", 2)
+        self.assertEqual(self._points("1"), 10.0)
+        self.assertEqual(self.ledger.flush(), 1)
+        self.assertEqual(self._points("1"), 4.0)
+        self.assertEqual(self.ledger.flush(), 0)
+        self.assertEqual(self._points("1"), 4.0)
+        self.assertFalse(os.path.exists(self.ledger.journal_path))
+        self.assertFalse(os.path.exists(self.ledger.flushing_path))
+
+    def test_flush_never_takes_points_below_zero(self):
+        self._set_points("1", 99.0)
+        self.assertEqual(self.ledger.balance("1"), 99.0)
+        self._set_points("1", 0.0)  # 快取還沒過期
+        self.ledger.charge("1", 5)
+        with patch("builtins.print") as printed:
+            self.ledger.flush()
+        self.assertEqual(self._points("1"), 0.0)
+        self.assertIn("少扣", printed.call_args[0][0])
+        # flush 後快取已經對帳，不會繼續放行
+        self.assertEqual(self.ledger.balance("1"), 0.0)
+        self.assertFalse(self.ledger.charge("1", 5))
+
+    def test_reload_during_flush_counts_the_batch_exactly_once(self):
+        ledger = self._ledger(balance_ttl=0)
+        ledger.charge("1", 4)
+        balances = []
+        write = PointLedger._write
+
+        def observed_write(db, totals, seq):
+            balances.append(ledger.balance("1"))  # 還沒提交
+            result = write(db, totals, seq)
+            balances.append(ledger.balance("1"))  # 已提交，還沒更新快取
+            return result
+
+        with patch.object(PointLedger, "_write", side_effect=observed_write):
+            ledger.flush()
+        self.assertEqual(balances, [6.0, 6.0])
+        self.assertEqual(ledger.balance("1"), 6.0)
+
+    def test_recover_replays_charges_that_were_never_flushed(self):
+        self.ledger.charge("1", 3)
+        self.ledger.charge("1", 2)
+        self.ledger._journal.close()
+        self.ledger._journal = None
+
+        restarted = self._ledger()
+        self.assertEqual(restarted.recover(), 1)
+        self.assertEqual(self._points("1"), 5.0)
+        self.assertFalse(os.path.exists(restarted.journal_path))
+        self.assertEqual(restarted.recover(), 0)
+        self.assertEqual(self._points("1"), 5.0)
+
+    def test_recover_skips_charges_committed_before_a_crash(self):
+        self.ledger.charge("1", 3)
+        saved = f"{self.ledger.journal_path}.saved"
+        shutil.copy(self.ledger.journal_path, saved)
+        self.ledger.flush()
+        # 當作提交後、刪除 .flushing 檔之前就當掉
+        os.replace(saved, self.ledger.flushing_path)
+
+        restarted = self._ledger()
+        restarted.recover()
+        self.assertEqual(self._points("1"), 7.0)
+        self.assertTrue(restarted.charge("1", 1))
+        restarted.flush()
+        self.assertEqual(self._points("1"), 6.0)
+
+    def test_failed_flush_keeps_the_batch_for_the_next_one(self):
+        self.ledger.charge("1", 3)
+        with patch.object(self.ledger, "_connect", side_effect=sqlite3.OperationalError("database is locked")):
+            with self.assertRaises(sqlite3.OperationalError):
+                self.ledger.flush()
+        self.assertTrue(os.path.exists(self.ledger.flushing_path))
+        self.assertEqual(self.ledger.balance("1"), 7.0)
+        self.ledger.charge("1", 2)
+
+        # 在重試之前當掉：兩個檔案的紀錄都要補寫
+        restarted = self._ledger()
+        self.ledger._journal.close()
+        self.ledger._journal = None
+        self.assertEqual(restarted.recover(), 1)
+        self.assertEqual(self._points("1"), 5.0)
+
+    def test_failed_flush_succeeds_on_retry(self):
+        self.ledger.charge("1", 3)
+        with patch.object(self.ledger, "_connect", side_effect=sqlite3.OperationalError("database is locked")):
+            with self.assertRaises(sqlite3.OperationalError):
+                self.ledger.flush()
+        self.ledger.charge("1", 2)
+        self.assertEqual(self.ledger.flush(), 1)
+        self.assertEqual(self._points("1"), 5.0)
+        self.assertFalse(os.path.exists(self.ledger.flushing_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+"""Asyncio client for the upstream OXWU renderer.
+
+The Flask app runs in threads, so ``UpstreamClient`` owns an event loop in
+a background thread. Threads call it through ``run``. Every upstream
+request goes through a single aiohttp session (one connection pool).
+
+Concurrent fetches of the same thing are coalesced: callers asking for the
+same info type or the same screenshot while a fetch is in flight all await
+that one fetch.
+
+Info payloads are versioned by the upstream ETag when it sends one, and by
+a hash of the body otherwise. A screenshot remembers the info version it
+was taken at. It is reused until that version changes or it is older than
+``screenshot_max_age``, so a burst of screenshot requests costs at most one
+navigation + capture.
+
+The upstream has a single renderer, so navigation and capture hold one lock
+across both types, and a report capture can never land on the warning page.
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from typing import Optional
+
+import aiohttp
+
+NAVIGATION_ENDPOINTS = {
+    "report": "/gotoReport",
+    "warning": "/gotoWarning",
+}
+
+
+class UpstreamError(Exception):
+    pass
+
+
+class _Screenshot:
+    __slots__ = ("data", "version", "taken_at")
+
+    def __init__(self, data: bytes, version, taken_at: float):
+        self.data = data
+        self.version = version
+        self.taken_at = taken_at
+
+
+class UpstreamClient:
+    def __init__(self, base_url: str, info_endpoints: dict, timeout: float = 5.0, navigation_delay: float = 0.2,
+                 screenshot_max_age: float = 60.0):
+        self.base_url = base_url.rstrip("/")
+        self.info_endpoints = info_endpoints
+        self.timeout = timeout
+        self.navigation_delay = navigation_delay
+        self.screenshot_max_age = screenshot_max_age
+        self.stats = {"info_requests": 0, "info_not_modified": 0, "screenshot_requests": 0, "coalesced": 0}
+        self.versions: dict[str, str] = {}
+        self._etags: dict[str, str] = {}
+        self._payloads: dict[str, dict] = {}
+        self._screenshots: dict[str, _Screenshot] = {}
+        self._inflight: dict[tuple, asyncio.Future] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._renderer_lock: Optional[asyncio.Lock] = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="upstream-client", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def run(self, coro, timeout: Optional[float] = None):
+        """Run a coroutine on the client's loop from any thread and wait for the result"""
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+        return future.result(timeout)
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(limit=4),
+            )
+            self._renderer_lock = asyncio.Lock()
+        return self._session
+
+    async def _coalesce(self, key: tuple, factory):
+        pending = self._inflight.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(factory())
+            self._inflight[key] = pending
+            pending.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.stats["coalesced"] += 1
+        return await asyncio.shield(pending)
+
+    async def fetch_info(self, type_: str) -> tuple[dict, bool]:
+        """(payload, changed since the previous fetch)"""
+        if type_ not in self.info_endpoints:
+            raise UpstreamError(f"未知快取類型 ({type_})")
+        return await self._coalesce(("info", type_), lambda: self._fetch_info(type_))
+
+    async def _fetch_info(self, type_: str) -> tuple[dict, bool]:
+        session = await self._get_session()
+        headers = {}
+        if type_ in self._etags and type_ in self._payloads:
+            headers["If-None-Match"] = self._etags[type_]
+
+        self.stats["info_requests"] += 1
+        async with session.get(f"{self.base_url}{self.info_endpoints[type_]}", headers=headers) as response:
+            if response.status == 304:
+                self.stats["info_not_modified"] += 1
+                return self._payloads[type_], False
+            if response.status != 200:
+                raise UpstreamError(f"HTTP {response.status}")
+            body = await response.read()
+            etag = response.headers.get("ETag")
+
+        payload = json.loads(body)
+        version = etag or hashlib.sha1(body).hexdigest()
+        changed = self.versions.get(type_) != version
+        if etag:
+            self._etags[type_] = etag
+        self.versions[type_] = version
+        self._payloads[type_] = payload
+        return payload, changed
+
+    def cached_screenshot(self, type_: str) -> Optional[bytes]:
+        shot = self._screenshots.get(type_)
+        return shot.data if shot else None
+
+    def _is_fresh(self, shot: Optional[_Screenshot], type_: str) -> bool:
+        return (
+            shot is not None
+            and shot.version == self.versions.get(type_)
+            and time.monotonic() - shot.taken_at < self.screenshot_max_age
+        )
+
+    async def screenshot(self, type_: str, force: bool = False) -> bytes:
+        """Screenshot for the current info version; only one capture per type is ever in flight"""
+        if type_ not in NAVIGATION_ENDPOINTS:
+            raise UpstreamError(f"未知截圖類型 ({type_})")
+        shot = self._screenshots.get(type_)
+        if not force and self._is_fresh(shot, type_):
+            return shot.data
+        return await self._coalesce(("screenshot", type_), lambda: self._capture(type_))
+
+    async def _capture(self, type_: str) -> bytes:
+        session = await self._get_session()
+        async with self._renderer_lock:
+            version = self.versions.get(type_)
+            self.stats["screenshot_requests"] += 1
+            async with session.get(f"{self.base_url}{NAVIGATION_ENDPOINTS[type_]}") as response:
+                await response.read()
+            await asyncio.sleep(self.navigation_delay)
+            async with session.get(f"{self.base_url}/screenshot") as response:
+                if response.status != 200:
+                    raise UpstreamError(f"HTTP {response.status}")
+                data = await response.read()
+
+        self._screenshots[type_] = _Screenshot(data, version, time.monotonic())
+        return data
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
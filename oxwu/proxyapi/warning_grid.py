@@ -0,0 +1,296 @@
+"""Per-town S-wave arrival times and intensity estimates for warnings.
+
+``TownGrid`` keeps town coordinates in NumPy arrays, so distances, travel
+times and PGA-to-intensity labels for every town come from one vectorized
+pass. The result depends only on the warning's origin, position, depth,
+magnitude and official max intensity. It is therefore cached per warning
+revision, and each enrichment only subtracts the elapsed time.
+
+``build_arrival_times_scalar`` is the original per-town loop. It is kept as
+the fallback when NumPy is not installed and as the benchmark baseline.
+"""
+
+import math
+import threading
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+EARTH_RADIUS_KM = 6371.0
+REVISION_CACHE_SIZE = 8
+
+INTENSITY_LABELS = [
+    "0\u7d1a",
+    "1\u7d1a",
+    "2\u7d1a",
+    "3\u7d1a",
+    "4\u7d1a",
+    "5\u5f31",
+    "5\u5f37",
+    "6\u5f31",
+    "6\u5f37",
+    "7\u7d1a",
+]
+INTENSITY_TO_RANK = {label: rank for rank, label in enumerate(INTENSITY_LABELS)}
+INTENSITY_ALIASES = {
+    "0": "0\u7d1a",
+    "1": "1\u7d1a",
+    "2": "2\u7d1a",
+    "3": "3\u7d1a",
+    "4": "4\u7d1a",
+    "5-": "5\u5f31",
+    "5+": "5\u5f37",
+    "6-": "6\u5f31",
+    "6+": "6\u5f37",
+    "7": "7\u7d1a",
+}
+# Lower PGA bound (gal) of each intensity rank from 1 upwards
+PGA_THRESHOLDS = (0.8, 2.5, 8.0, 25.0, 80.0, 140.0, 250.0, 440.0, 800.0)
+
+
+def normalize_intensity_label(label):
+    if label is None:
+        return None
+
+    text = str(label).strip()
+    if not text:
+        return None
+    if text in INTENSITY_TO_RANK:
+        return text
+    if text in INTENSITY_ALIASES:
+        return INTENSITY_ALIASES[text]
+
+    compact = text.replace(" ", "")
+    if compact in INTENSITY_TO_RANK:
+        return compact
+    if compact in INTENSITY_ALIASES:
+        return INTENSITY_ALIASES[compact]
+    if compact.endswith("\u7d1a") and compact[:-1].isdigit():
+        return f"{int(compact[:-1])}\u7d1a"
+    if compact.isdigit():
+        return f"{int(compact)}\u7d1a"
+    return None
+
+
+def intensity_rank_to_label(rank: int) -> str:
+    rank = max(0, min(rank, len(INTENSITY_LABELS) - 1))
+    return INTENSITY_LABELS[rank]
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1_rad = math.radians(lat1)
+    lon1_rad = math.radians(lon1)
+    lat2_rad = math.radians(lat2)
+    lon2_rad = math.radians(lon2)
+
+    dlat = lat2_rad - lat1_rad
+    dlon = lon2_rad - lon1_rad
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * math.asin(math.sqrt(a))
+
+
+def estimate_intensity_label(magnitude: float, depth_km: float, hypocenter_distance_km: float) -> str:
+    # Preview estimate only. The old version was too conservative for towns near
+    # the epicenter, so this uses a stronger source term before we anchor to the
+    # upstream max intensity.
+    source_term = 0.58 * magnitude + 0.0038 * depth_km - 0.05
+    attenuation = math.log10(
+        hypocenter_distance_km + 0.0028 * (10 ** (0.5 * magnitude))
+    ) + 0.002 * hypocenter_distance_km
+    pga = 10 ** (source_term - attenuation)
+
+    if pga < 0.8:
+        return "0\u7d1a"
+    if pga < 2.5:
+        return "1\u7d1a"
+    if pga < 8.0:
+        return "2\u7d1a"
+    if pga < 25.0:
+        return "3\u7d1a"
+    if pga < 80.0:
+        return "4\u7d1a"
+    if pga < 140.0:
+        return "5\u5f31"
+    if pga < 250.0:
+        return "5\u5f37"
+    if pga < 440.0:
+        return "6\u5f31"
+    if pga < 800.0:
+        return "6\u5f37"
+    return "7\u7d1a"
+
+
+def calibrate_estimated_intensities(estimated_intensities: dict, warning_data: dict) -> dict:
+    official_max_label = normalize_intensity_label(warning_data.get("maxIntensity"))
+    if not official_max_label or not estimated_intensities:
+        return estimated_intensities
+
+    official_max_rank = INTENSITY_TO_RANK[official_max_label]
+    current_max_rank = max(
+        INTENSITY_TO_RANK.get(normalize_intensity_label(label) or "0\u7d1a", 0)
+        for label in estimated_intensities.values()
+    )
+    delta = official_max_rank - current_max_rank
+    if delta <= 0:
+        return estimated_intensities
+
+    adjusted = {}
+    for town_id, label in estimated_intensities.items():
+        normalized = normalize_intensity_label(label) or "0\u7d1a"
+        adjusted_rank = INTENSITY_TO_RANK[normalized] + delta
+        adjusted[town_id] = intensity_rank_to_label(adjusted_rank)
+    return adjusted
+
+
+def parse_warning_source(warning_data: dict):
+    """(latitude, longitude, depth_km, magnitude), or None when the warning has no usable hypocenter"""
+    try:
+        return (
+            float(warning_data["location"]["latitude"]),
+            float(warning_data["location"]["longitude"]),
+            float(warning_data["depth"]),
+            float(warning_data["magnitude"]),
+        )
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def warning_revision(warning_data: dict, source: tuple) -> tuple:
+    return (warning_data.get("time"), *source, normalize_intensity_label(warning_data.get("maxIntensity")))
+
+
+def build_arrival_times_scalar(warning_data: dict, town_locations: dict, s_wave_speed_kmps: float,
+                               elapsed_seconds: float):
+    source = parse_warning_source(warning_data) if warning_data else None
+    if source is None:
+        return {}, {}
+    epicenter_lat, epicenter_lon, depth_km, magnitude = source
+
+    arrival_times = {}
+    raw_estimated_intensities = {}
+    for town_id, info in town_locations.items():
+        latitude = info.get("latitude")
+        longitude = info.get("longitude")
+        if latitude is None or longitude is None:
+            continue
+
+        horizontal_distance_km = haversine_km(epicenter_lat, epicenter_lon, latitude, longitude)
+        hypocenter_distance_km = math.sqrt(horizontal_distance_km ** 2 + depth_km ** 2)
+        travel_seconds = hypocenter_distance_km / s_wave_speed_kmps
+        remaining_seconds = max(0, math.ceil(travel_seconds - elapsed_seconds))
+        raw_estimated_intensities[town_id] = estimate_intensity_label(
+            magnitude,
+            depth_km,
+            hypocenter_distance_km,
+        )
+
+        if remaining_seconds > 0:
+            arrival_times[town_id] = remaining_seconds
+
+    calibrated_estimated_intensities = calibrate_estimated_intensities(
+        raw_estimated_intensities,
+        warning_data,
+    )
+    estimated_intensities = {
+        town_id: level
+        for town_id, level in calibrated_estimated_intensities.items()
+        if level != "0\u7d1a"
+    }
+    return arrival_times, estimated_intensities
+
+
+class TownGrid:
+    """Town coordinates as arrays; requires NumPy"""
+
+    def __init__(self, town_locations: dict, s_wave_speed_kmps: float, cache_size: int = REVISION_CACHE_SIZE):
+        ids, latitudes, longitudes = [], [], []
+        for town_id, info in town_locations.items():
+            latitude = info.get("latitude")
+            longitude = info.get("longitude")
+            if latitude is None or longitude is None:
+                continue
+            ids.append(town_id)
+            latitudes.append(latitude)
+            longitudes.append(longitude)
+
+        self.town_ids = np.array(ids, dtype=object)
+        self.lat_rad = np.radians(np.array(latitudes, dtype=np.float64))
+        self.lon_rad = np.radians(np.array(longitudes, dtype=np.float64))
+        self.cos_lat = np.cos(self.lat_rad)
+        self.s_wave_speed_kmps = s_wave_speed_kmps
+        self.cache_size = cache_size
+        self._revisions: OrderedDict[tuple, tuple] = OrderedDict()  # revision -> (travel_seconds, estimated_intensities)
+        # estimate runs on the Socket.IO threads and the polling thread at once
+        self._revisions_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.town_ids)
+
+    def hypocenter_distances(self, latitude: float, longitude: float, depth_km: float):
+        lat_rad = math.radians(latitude)
+        lon_rad = math.radians(longitude)
+        a = (
+            np.sin((self.lat_rad - lat_rad) / 2) ** 2
+            + math.cos(lat_rad) * self.cos_lat * np.sin((self.lon_rad - lon_rad) / 2) ** 2
+        )
+        horizontal = EARTH_RADIUS_KM * 2 * np.arcsin(np.sqrt(a))
+        return np.sqrt(horizontal ** 2 + depth_km ** 2)
+
+    @staticmethod
+    def intensity_ranks(magnitude: float, depth_km: float, hypocenter_distances):
+        # same formula as estimate_intensity_label, for every town at once
+        source_term = 0.58 * magnitude + 0.0038 * depth_km - 0.05
+        attenuation = np.log10(
+            hypocenter_distances + 0.0028 * (10 ** (0.5 * magnitude))
+        ) + 0.002 * hypocenter_distances
+        pga = 10 ** (source_term - attenuation)
+        return np.searchsorted(PGA_THRESHOLDS, pga, side="right")
+
+    def _compute(self, warning_data: dict, source: tuple) -> tuple:
+        latitude, longitude, depth_km, magnitude = source
+        distances = self.hypocenter_distances(latitude, longitude, depth_km)
+        ranks = self.intensity_ranks(magnitude, depth_km, distances)
+
+        official_max_label = normalize_intensity_label(warning_data.get("maxIntensity"))
+        if official_max_label and len(ranks):
+            delta = INTENSITY_TO_RANK[official_max_label] - int(ranks.max())
+            if delta > 0:
+                ranks = np.minimum(ranks + delta, len(INTENSITY_LABELS) - 1)
+
+        felt = np.flatnonzero(ranks)
+        estimated_intensities = {
+            town_id: INTENSITY_LABELS[rank]
+            for town_id, rank in zip(self.town_ids[felt].tolist(), ranks[felt].tolist())
+        }
+        return distances / self.s_wave_speed_kmps, estimated_intensities
+
+    def estimate(self, warning_data: dict, source: tuple) -> tuple:
+        """(travel_seconds, estimated_intensities) for one warning revision, cached"""
+        revision = warning_revision(warning_data, source)
+        with self._revisions_lock:
+            cached = self._revisions.get(revision)
+            if cached is not None:
+                self._revisions.move_to_end(revision)
+                return cached
+        # computed outside the lock; if two threads race on a new revision the first result is kept
+        computed = self._compute(warning_data, source)
+        with self._revisions_lock:
+            cached = self._revisions.setdefault(revision, computed)
+            self._revisions.move_to_end(revision)
+            while len(self._revisions) > self.cache_size:
+                self._revisions.popitem(last=False)
+        return cached
+
+    def arrival_times(self, warning_data: dict, elapsed_seconds: float):
+        source = parse_warning_source(warning_data) if warning_data else None
+        if source is None:
+            return {}, {}
+
+        travel_seconds, estimated_intensities = self.estimate(warning_data, source)
+        remaining = np.ceil(travel_seconds - elapsed_seconds)
+        pending = np.flatnonzero(remaining > 0)
+        arrival_times = dict(zip(self.town_ids[pending].tolist(), remaining[pending].astype(int).tolist()))
+        return arrival_times, dict(estimated_intensities)